@@ -0,0 +1,788 @@
+#!/usr/bin/env python
+
+"""
+check_equivalence.py
+====================
+
+Description: This script checks on small synthetic inputs (synthetic_inputs.py) that the extraction engines and run
+modes return the same statistics, so that a change to one path is caught when it no longer matches the others:
+
+    engine       - zonal_engine statistics of the 1ha zones against rasterstats (the extraction before zonal_engine).
+    pool         - step1_8.main_routine per site csv files byte identical between the serial run and the pooled runs
+                   sharing the zone index through shared memory (shm) and a memory mapped file (mmap).
+    window_cache - the same against a window cache run, which builds the site window stack and a second run, which
+                   reads the windows from the stack.
+    mirror       - the same against pooled and window cache runs reading a raster mirror with a disk budget of a few
+                   images (the copies are evicted while the run reads them).
+    queue        - the same against work queue runs (with and without nested scales), and a stale queue lease broken
+                   by one of several workers at once.
+    multi_scale  - the nested scale statistics (multi_scale) against rasterstats with the zones of each scale, and the
+                   rows of an all no data image skipped from its stored statistics against the rows of a read.
+    labels       - the label raster statistics of polygons (label_engine) against rasterstats.
+    watch_landsat - Landsat watch batches (watch_mode, step1_9 over the sites routed to the tile) merged into the per
+                    site series against one step1_9 run of every image over the tile shapefile.
+    routing      - step1_9 from the command line with a routing index (a tile with routed sites and a tile with
+                   none) against the tile shapefile run.
+    fallback     - the tile selection round trip on two overlapping tiles: the selected routing index extracted by
+                   step1_9, then the sparse series re-routed by the fallback index to the other tile, which fills
+                   them.
+    quick        - the quick look of a grid without a declared no data value (the fill value is not averaged into
+                   the decimated pixels) and every nth image sampled in date order from an unordered image list.
+    quick_landsat - the step1_9 quick look: every nth image of an unordered tile image list in date order and the
+                    quick report error of every band against the full resolution calibration image.
+
+Each check prints ok or FAILED with its first differences; the exit code is 1 when a check fails. The inputs are
+generated in a temporary directory, or in a check_equivalence sub-directory of --work_dir (only that sub-directory is
+removed at completion unless --keep is used).
+
+Example:
+    python benchmark/check_equivalence.py --checks engine
+
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import sys
+import glob
+import random
+import argparse
+import tempfile
+import warnings
+import threading
+from contextlib import redirect_stdout
+
+warnings.filterwarnings("ignore")
+
+# the pipeline scripts import each other by module name from the code directory.
+code_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code")
+if code_dir not in sys.path:
+    sys.path.insert(0, code_dir)
+
+import synthetic_inputs
+import run_benchmark
+
+check_list = ["engine", "pool", "window_cache", "mirror", "queue", "multi_scale", "labels", "watch_landsat", "routing",
+              "fallback", "quick", "quick_landsat"]
+
+# sub-directory of a --work_dir the inputs are generated in.
+check_dir_name = "check_equivalence"
+
+# qld_dict entry of the synthetic series (step1_1 format: [..., null_data, ..., out_name]).
+qld_dict = {"daily_rain": [0, "mm", "daily_rain", 0.1, -32767.0, 3276.5, "dlyrn"]}
+
+date_s, date_e = -19, -11
+
+# synthetic Landsat tile (step1_9 checks) and its mosaic size (pixels).
+landsat_tile = "098075"
+landsat_size = 200
+
+# largest absolute difference accepted between floating point statistics.
+tolerance = 1e-6
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(description='''Check the extraction engines and run modes against each other on
+    synthetic inputs.''')
+
+    p.add_argument('-c', '--checks', help='Comma separated list of checks ({0}).'.format(', '.join(check_list)),
+                   default=','.join(check_list))
+
+    p.add_argument('-n', '--n_months', type=int, help='Number of monthly SILO images.', default=12)
+
+    p.add_argument('-w', '--work_dir', help='Directory to generate the synthetic inputs in (default: temp dir).',
+                   default=None)
+
+    p.add_argument('-k', '--keep', action='store_true', help='Keep the synthetic inputs and outputs.')
+
+    cmd_args = p.parse_args()
+
+    return cmd_args
+
+
+def inputs_fn(work_dir, n_months):
+    """ Generate the synthetic SILO series, the 1ha site shapefile and a polygon shapefile.
+
+    @return inputs: dictionary object {"work_dir", "image_dir", "images", "csv_list", "shapefile", "polygons"}.
+    """
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    image_dir, images = synthetic_inputs.silo_series_fn(os.path.join(work_dir, "met_analysis"), "dlyrn", n_months,
+                                                        date_s=date_s, date_e=date_e)
+    site_csv = synthetic_inputs.site_csv_fn(os.path.join(work_dir, "sites.csv"), 24,
+                                            synthetic_inputs.silo_extent_gda94_fn(), repeat_visits=1,
+                                            cluster_size=4)
+    buffer_dir = os.path.join(work_dir, "buffer")
+    os.makedirs(buffer_dir)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        geo_df = run_benchmark.geometry_stage_fn(site_csv, work_dir, buffer_dir)
+    shapefile = os.path.join(work_dir, "zones.shp")
+    geo_df.to_file(shapefile, driver="ESRI Shapefile")
+
+    # property like polygons (several hundred pixels each, not overlapping) across the grid.
+    west, south, east, north = synthetic_inputs.silo_extent_gda94_fn()
+    step = (east - west) / 4.0
+    boxes = [box(west + i * step, south, west + (i + 0.8) * step, south + (north - south) * 0.4) for i in range(4)]
+    boxes += [box(west + i * step, south + (north - south) * 0.5, west + (i + 0.6) * step, north) for i in range(4)]
+    polygons = os.path.join(work_dir, "polygons.shp")
+    gpd.GeoDataFrame({"PROP_TAG": ["P{0}".format(i) for i in range(len(boxes))],
+                      "PROPERTY": ["PROPERTY {0}".format(i) for i in range(len(boxes))]},
+                     geometry=boxes, crs="EPSG:4283").to_file(polygons, driver="ESRI Shapefile")
+
+    csv_list = os.path.join(work_dir, "image_list.csv")
+    with open(csv_list, "w") as output:
+        output.write("".join(image + "\n" for image in images))
+
+    return {"work_dir": work_dir, "image_dir": image_dir, "images": images, "csv_list": csv_list,
+            "shapefile": shapefile, "polygons": polygons}
+
+
+def compare_fn(label, expected, actual, failures):
+    """ Compare two statistics (None, or numbers within tolerance) and record a failure. """
+    if expected is None or actual is None:
+        same = expected is None and actual is None
+    else:
+        same = abs(float(expected) - float(actual)) <= tolerance * max(1.0, abs(float(expected)))
+    if not same:
+        failures.append("{0}: expected {1}, got {2}".format(label, expected, actual))
+
+
+def engine_check_fn(inputs):
+    """ zonal_engine statistics of the 1ha zones against rasterstats (the extraction before zonal_engine). """
+    import rasterio
+    from rasterstats import zonal_stats
+    import zonal_engine
+    import geometry_provider
+
+    failures = []
+    zone_cache = {}
+    for image_s in inputs["images"]:
+        with rasterio.open(image_s) as srci:
+            array = srci.read(1)
+            zone_index = geometry_provider.zone_index_fn(srci, inputs["shapefile"], "uid", zone_cache)
+            geometries = geometry_provider.zone_geometries_fn(zone_cache["zones"], srci.crs)
+            expected = zonal_stats(geometries, array, affine=srci.transform, nodata=srci.nodata,
+                                   stats=zonal_engine.stats_list, all_touched=True)
+        actual = zonal_engine.zone_stats_fn(array, zone_index, srci.nodata, stats=zonal_engine.stats_list)
+        for z, (zone_expected, zone_actual) in enumerate(zip(expected, actual)):
+            for stat in zonal_engine.stats_list:
+                compare_fn("{0} zone {1} {2}".format(os.path.basename(image_s), z, stat), zone_expected[stat],
+                           zone_actual[stat], failures)
+
+    return failures
+
+
+def run_fn(inputs, out_dir, **kwargs):
+    """ Run step1_8.main_routine over the series into out_dir and return {file name: bytes} of the site csv files. """
+    import step1_8_qld_grid_zonal_stats as step1_8
+
+    os.makedirs(out_dir)
+    step1_8.main_routine(inputs["image_dir"], out_dir, kwargs.pop("csv_list", inputs["csv_list"]), "cor",
+                         inputs["work_dir"], qld_dict, None, "daily_rain", inputs["shapefile"], date_s, date_e,
+                         **kwargs)
+
+    return csv_files_fn(out_dir)
+
+
+def csv_files_fn(out_dir):
+    """ Return {file name: bytes} of the csv files of a directory. """
+    files = {}
+    for path in sorted(glob.glob(os.path.join(out_dir, "*.csv"))):
+        with open(path, "rb") as csv_file:
+            files[os.path.basename(path)] = csv_file.read()
+
+    return files
+
+
+def compare_files_fn(label, expected, actual, failures):
+    """ Record a failure when the csv files of two runs are not byte identical. """
+    if sorted(expected) != sorted(actual):
+        failures.append("{0}: {1} csv files, expected {2}".format(label, len(actual), len(expected)))
+        return
+    differ = [name for name in expected if expected[name] != actual[name]]
+    if differ:
+        failures.append("{0}: {1} csv files differ (i.e. {2})".format(label, len(differ), differ[0]))
+
+
+def serial_fn(inputs):
+    """ Return the csv files of the serial run (run once, shared by the run mode checks). """
+    if "serial" not in inputs:
+        inputs["serial"] = run_fn(inputs, os.path.join(inputs["work_dir"], "serial"))
+
+    return inputs["serial"]
+
+
+def pool_check_fn(inputs):
+    """ Per site csv files of the serial run against the pooled runs (shm and mmap zone index). """
+    failures = []
+    runs_dir = os.path.join(inputs["work_dir"], "pool")
+    compare_files_fn("pool shm", serial_fn(inputs), run_fn(inputs, os.path.join(runs_dir, "shm"), workers=3),
+                     failures)
+    compare_files_fn("pool mmap", serial_fn(inputs), run_fn(inputs, os.path.join(runs_dir, "mmap"), workers=3,
+                                                            share_mode="mmap"), failures)
+
+    return failures
+
+
+def window_cache_check_fn(inputs):
+    """ Per site csv files of the serial run against a window cache run building the stack and one reading it. """
+    failures = []
+    runs_dir = os.path.join(inputs["work_dir"], "window_cache")
+    window_cache = os.path.join(runs_dir, "stack")
+    for label in ["build", "reuse"]:
+        compare_files_fn("window cache {0}".format(label), serial_fn(inputs),
+                         run_fn(inputs, os.path.join(runs_dir, label), window_cache=window_cache), failures)
+
+    return failures
+
+
+def mirror_check_fn(inputs):
+    """ Per site csv files of the serial run against pooled and window cache runs reading a raster mirror with a disk
+    budget of a few images, so that the copies are evicted while the run reads them. """
+    import raster_mirror
+
+    failures = []
+    runs_dir = os.path.join(inputs["work_dir"], "mirror")
+    image_gb = os.path.getsize(inputs["images"][0]) / 1073741824.0
+    for label, kwargs in [("mirror pool", {"workers": 3}),
+                          ("mirror window cache", {"window_cache": os.path.join(runs_dir, "window_cache")})]:
+        name = label.replace(" ", "_")
+        raster_mirror.configure_fn(os.path.join(runs_dir, name), budget_gb=3.5 * image_gb)
+        try:
+            compare_files_fn(label, serial_fn(inputs), run_fn(inputs, os.path.join(runs_dir, name + "_out"),
+                                                              **kwargs), failures)
+        except Exception as err:
+            failures.append("{0}: {1}".format(label, err))
+        finally:
+            raster_mirror.unconfigure_fn()
+
+    return failures
+
+
+def queue_run_fn(inputs, queue_dir, scales=None):
+    """ Enqueue the series, process it with one worker, merge it and return {file name: bytes} of the csv files. """
+    import work_queue
+
+    out_dir = queue_dir + "_out"
+    work_queue.enqueue_fn(queue_dir, [{"csv_list": inputs["csv_list"], "in_dir": inputs["image_dir"],
+                                       "out_dir": out_dir, "data_type": "cor", "datesplit_s": date_s,
+                                       "datesplit_e": date_e, "default_nodata": qld_dict["daily_rain"][-3]}],
+                          inputs["shapefile"], "uid", chunk_size=5, scales=scales)
+    work_queue.worker_fn(queue_dir, poll=0.1)
+    os.makedirs(out_dir)
+    work_queue.merge_fn(queue_dir, "cor", out_dir)
+
+    return csv_files_fn(out_dir)
+
+
+def queue_check_fn(inputs):
+    """ Per site csv files of the serial run against work queue runs (with and without nested scales), and a stale
+    lease claimed by several workers at once. """
+    import work_queue
+    import multi_scale
+
+    failures = []
+    runs_dir = os.path.join(inputs["work_dir"], "queue")
+    compare_files_fn("work queue", serial_fn(inputs), queue_run_fn(inputs, os.path.join(runs_dir, "queue")),
+                     failures)
+    scales = multi_scale.scales_fn("25ha,1km,5km")
+    compare_files_fn("work queue scales", run_fn(inputs, os.path.join(runs_dir, "serial_scales"), scales=scales),
+                     queue_run_fn(inputs, os.path.join(runs_dir, "queue_scales"), scales), failures)
+
+    # workers breaking the same stale lease at once: one creates the next generation.
+    queue_dir = os.path.join(runs_dir, "queue")
+    os.utime(work_queue.claim_fn(queue_dir, "lease_check", 60.0), (1, 1))
+    claims = []
+    threads = [threading.Thread(target=lambda: claims.append(work_queue.claim_fn(queue_dir, "lease_check", 60.0)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if len([c for c in claims if c]) != 1:
+        failures.append("stale lease: {0} of 8 workers claimed it".format(len([c for c in claims if c])))
+
+    return failures
+
+
+def multi_scale_check_fn(inputs):
+    """ The nested scale statistics against rasterstats with the zones of each scale, and the rows of an all no data
+    image skipped from its stored statistics against the rows of the same image read. """
+    import numpy as np
+    import rasterio
+    from rasterstats import zonal_stats
+    import multi_scale
+    import geometry_provider
+    import step1_8_qld_grid_zonal_stats as step1_8
+
+    failures = []
+    scales = multi_scale.scales_fn("25ha,1km,5km")
+    zone_cache = {}
+    for image_s in inputs["images"][:3]:
+        with rasterio.open(image_s) as srci:
+            array = srci.read(1)
+            nested_index = multi_scale.nested_index_fn(srci, inputs["shapefile"], "uid", zone_cache, scales)
+            scale_zones = multi_scale.scale_geometries_fn(zone_cache["zones"], scales)
+            expected = dict((scale, zonal_stats(geometry_provider.zone_geometries_fn(scale_zones[scale], srci.crs),
+                                                array, affine=srci.transform, nodata=srci.nodata,
+                                                stats=["count", "mean", "median"], all_touched=True))
+                            for scale in scales)
+        actual = multi_scale.nested_stats_fn(array, nested_index, srci.nodata, stats=["count", "mean", "median"])
+        for z, zone_actual in enumerate(actual):
+            for scale in scales:
+                for stat in ["count", "mean", "median"]:
+                    compare_fn("{0} zone {1} {2} {3}".format(os.path.basename(image_s), z, scale, stat),
+                               expected[scale][z][stat], zone_actual[scale][stat], failures)
+
+    # an all no data image, read and skipped (STATISTICS_VALID_PERCENT 0 stored in the file).
+    empty_dir = os.path.join(inputs["work_dir"], "multi_scale")
+    rows = {}
+    for label in ["read", "skipped"]:
+        empty = os.path.join(empty_dir, label, os.path.basename(inputs["images"][0]))
+        os.makedirs(os.path.dirname(empty))
+        with rasterio.open(inputs["images"][0]) as srci:
+            profile = srci.profile.copy()
+            array = np.full((srci.count, srci.height, srci.width), srci.nodata, dtype=srci.dtypes[0])
+        with rasterio.open(empty, "w", **profile) as output:
+            output.write(array)
+            if label == "skipped":
+                output.update_tags(1, STATISTICS_VALID_PERCENT="0")
+        rows[label] = [row[:2] + row[3:] for row in step1_8.apply_zonal_stats_fn(
+            empty, inputs["shapefile"], "uid", date_s, date_e, {}, qld_dict["daily_rain"][-3], scales)]
+    if rows["read"] != rows["skipped"]:
+        failures.append("all no data rows: skipped {0}, read {1}".format(rows["skipped"][:1], rows["read"][:1]))
+
+    return failures
+
+
+def labels_check_fn(inputs):
+    """ The label raster statistics of the polygons against rasterstats (integer data, exact percentiles). """
+    import fiona
+    import rasterio
+    from rasterstats import zonal_stats
+    import zonal_engine
+    import label_engine
+
+    failures = []
+    with fiona.open(inputs["polygons"]) as src:
+        geometries = [feature["geometry"] for feature in src]
+    label_cache = {}
+    for image_s in inputs["images"][:3]:
+        rows = label_engine.image_stats_fn(image_s, inputs["polygons"], "PROP_TAG", "PROPERTY", label_cache,
+                                           stats=zonal_engine.stats_list)
+        with rasterio.open(image_s) as srci:
+            expected = zonal_stats(geometries, srci.read(1), affine=srci.transform, nodata=srci.nodata,
+                                   stats=zonal_engine.stats_list)
+        for row, polygon_expected in zip(rows, expected):
+            for stat in zonal_engine.stats_list:
+                compare_fn("{0} {1} {2}".format(os.path.basename(image_s), row["uid"], stat), polygon_expected[stat],
+                           row[stat], failures)
+
+    return failures
+
+
+def landsat_inputs_fn(inputs):
+    """ Generate the synthetic Landsat inputs of the step1_9 checks (once): the 9 band images of a tile, the sites
+    within the mosaic ({tile}_by_tile.shp), a tile grid (the tile over the mosaic and a second tile beside it with no
+    sites) and the routing index.
+
+    @return landsat: dictionary object {"dir", "images", "ready_dir", "shapefile", "tile_grid", "index"}.
+    """
+    import geopandas as gpd
+    from shapely.geometry import box
+    import tile_routing
+
+    if "landsat" in inputs:
+        return inputs["landsat"]
+
+    landsat_dir = os.path.join(inputs["work_dir"], "landsat")
+    images = synthetic_inputs.landsat_mosaic_fn(os.path.join(landsat_dir, "images"), landsat_tile, landsat_size, 4)
+    site_csv = synthetic_inputs.site_csv_fn(os.path.join(landsat_dir, "sites.csv"), 8,
+                                            synthetic_inputs.landsat_extent_gda94_fn(landsat_size), seed=1)
+    buffer_dir = os.path.join(landsat_dir, "buffer")
+    os.makedirs(buffer_dir)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        geo_df = run_benchmark.geometry_stage_fn(site_csv, landsat_dir, buffer_dir)
+    ready_dir = os.path.join(landsat_dir, "ready")
+    os.makedirs(ready_dir)
+    shapefile = os.path.join(ready_dir, "{0}_by_tile.shp".format(landsat_tile))
+    geo_df.to_file(shapefile, driver="ESRI Shapefile")
+
+    west, north = synthetic_inputs.landsat_dict["west"], synthetic_inputs.landsat_dict["north"]
+    extent = landsat_size * synthetic_inputs.landsat_dict["res"]
+    tile_grid = os.path.join(landsat_dir, "wrs2_tiles.shp")
+    gpd.GeoDataFrame({"PATH": [int(landsat_tile[:3]), int(landsat_tile[:3]) + 1], "ROW": [int(landsat_tile[3:])] * 2},
+                     geometry=[box(west, north - extent, west + extent, north),
+                               box(west + extent, north - extent, west + 2 * extent, north)],
+                     crs="EPSG:{0}".format(synthetic_inputs.landsat_dict["epsg"])).to_file(tile_grid,
+                                                                                          driver="ESRI Shapefile")
+
+    inputs["landsat"] = {"dir": landsat_dir, "images": images, "ready_dir": ready_dir, "shapefile": shapefile,
+                         "tile_grid": tile_grid, "index": tile_routing.build_fn(geo_df, tile_grid)}
+
+    return inputs["landsat"]
+
+
+def landsat_list_fn(list_dir, tile, images):
+    """ Write the image list of a tile and return its path (step1_9 slices the tile code from the list name:
+    {path}_{row} followed by 26 characters). """
+    if not os.path.isdir(list_dir):
+        os.makedirs(list_dir)
+    list_path = os.path.join(list_dir, "{0}_{1}_zonal_landsat_imagery.csv".format(tile[:3], tile[3:]))
+    with open(list_path, "w") as output:
+        output.write("".join(image + "\n" for image in images))
+
+    return list_path
+
+
+def compare_series_fn(label, expected_path, actual_path, failures):
+    """ Record a failure when two per site series csv files differ (rows in image order, numbers within tolerance). """
+    import pandas as pd
+
+    if not os.path.exists(actual_path):
+        failures.append("{0}: {1} missing".format(label, os.path.basename(actual_path)))
+        return
+    frames = [pd.read_csv(path, dtype={"ref_image": str}).sort_values(["uid", "ref_image"]).reset_index(drop=True)
+              for path in (expected_path, actual_path)]
+    try:
+        pd.testing.assert_frame_equal(frames[0], frames[1], check_dtype=False, rtol=tolerance)
+    except AssertionError as err:
+        failures.append("{0}: {1}".format(label, " ".join(str(err).split())))
+
+
+def watch_landsat_check_fn(inputs):
+    """ Landsat watch batches (watch_mode, the sites routed to the tile) merged into the per site series against one
+    step1_9 run over the tile shapefile, and the last band of that run against rasterstats. """
+    import fiona
+    import rasterio
+    from rasterstats import zonal_stats
+    import pandas as pd
+    import watch_mode
+    import step1_9_reflectance_zonal_stats as step1_9
+
+    failures = []
+    landsat = landsat_inputs_fn(inputs)
+    images = landsat["images"]
+    no_data = synthetic_inputs.landsat_dict["no_data"]
+    check_dir = os.path.join(inputs["work_dir"], "watch_landsat")
+    expected_dir = os.path.join(check_dir, "expected")
+    os.makedirs(expected_dir)
+    step1_9.main_routine(expected_dir, landsat["ready_dir"], no_data,
+                         landsat_list_fn(expected_dir, landsat_tile, images), expected_dir)
+    expected = sorted(glob.glob(os.path.join(expected_dir, "*_fpc_zonal_stats.csv")))
+    if not expected:
+        return ["step1_9: no site csv files"]
+
+    # the b9 columns hold band 9 (the band csv files are joined in band order).
+    first = pd.read_csv(expected[0], dtype={"ref_image": str}).iloc[0]
+    with fiona.open(landsat["shapefile"]) as src:
+        geometries = [feature["geometry"] for feature in src if feature["properties"]["uid"] == first["uid"]]
+    with rasterio.open(images[0]) as srci:
+        band = srci.count
+        zone = zonal_stats(geometries, srci.read(band), affine=srci.transform, nodata=no_data, stats=["mean"])[0]
+    compare_fn("step1_9 b{0}_ref_mean".format(band), zone["mean"], first["b{0}_ref_mean".format(band)], failures)
+
+    # two batches: the second merges the later images into the series of the first.
+    watch_dir = os.path.join(check_dir, "watch")
+    context = {"watch_dir": watch_dir, "temp_dir": os.path.join(watch_dir, "temp"), "no_data": no_data,
+               "routing_index": landsat["index"], "replace_series": False}
+    for batch in (images[:2], images[2:]):
+        failed = watch_mode.extract_fn(dict((image, "landsat") for image in batch), context)
+        if failed:
+            failures.append("watch batch of {0} images: {1} failed".format(len(batch), ", ".join(failed)))
+    for path in expected:
+        name = os.path.basename(path)
+        compare_series_fn("watch {0}".format(name), path, os.path.join(watch_dir, "landsat", name), failures)
+
+    return failures
+
+
+def routing_check_fn(inputs):
+    """ step1_9 from the command line with a routing index (a tile with routed sites and a tile with none) against the
+    tile shapefile run: the same per site csv files, and nothing for the tile with no sites. """
+    import subprocess
+    import tile_routing
+
+    failures = []
+    landsat = landsat_inputs_fn(inputs)
+    check_dir = os.path.join(inputs["work_dir"], "routing")
+    empty_tile = "{0:03d}{1}".format(int(landsat_tile[:3]) + 1, landsat_tile[3:])
+    empty_images = synthetic_inputs.landsat_mosaic_fn(os.path.join(check_dir, "images"), empty_tile, landsat_size, 2)
+    lists = [landsat_list_fn(os.path.join(check_dir, "lists"), landsat_tile, landsat["images"]),
+             landsat_list_fn(os.path.join(check_dir, "lists"), empty_tile, empty_images)]
+    index_path = os.path.join(check_dir, "routing_index.json")
+    tile_routing.save_fn(landsat["index"], index_path)
+    if landsat["index"]["tiles"].get(empty_tile) or not landsat["index"]["tiles"].get(landsat_tile):
+        failures.append("routing index: expected sites on {0} only, got {1}".format(landsat_tile,
+                                                                                   sorted(landsat["index"]["tiles"])))
+
+    script = os.path.join(code_dir, "step1_9_reflectance_zonal_stats.py")
+    runs = {}
+    for label, args in [("tile shapefile", ["--zonal_stats_ready_dir", landsat["ready_dir"]]),
+                        ("routing index", ["--routing_index", index_path])]:
+        out_dir = os.path.join(check_dir, label.replace(" ", "_"))
+        command = [sys.executable, script, "--lists"] + lists + args + ["--output", out_dir, "--quiet"]
+        if subprocess.call(command, cwd=code_dir):
+            failures.append("{0}: step1_9 failed ({1})".format(label, " ".join(command)))
+        runs[label] = csv_files_fn(out_dir)
+
+    if not runs["tile shapefile"]:
+        failures.append("tile shapefile: no site csv files")
+    if any(empty_tile in name for name in runs["routing index"]):
+        failures.append("routing index: site csv files written for {0}".format(empty_tile))
+    compare_files_fn("routing index", runs["tile shapefile"], runs["routing index"], failures)
+
+    return failures
+
+
+def fallback_check_fn(inputs):
+    """ The tile selection round trip on two overlapping tiles: the selected routing index extracted by step1_9, the
+    sparse series counted (record_counts_fn) and re-routed by the fallback index to the other tile, which fills
+    them. """
+    import rasterio
+    import geopandas as gpd
+    from shapely.geometry import box
+    import tile_routing
+    import tile_selection
+    import step1_9_reflectance_zonal_stats as step1_9
+
+    failures = []
+    landsat = landsat_inputs_fn(inputs)
+    check_dir = os.path.join(inputs["work_dir"], "fallback")
+    other_tile = "{0:03d}{1}".format(int(landsat_tile[:3]) + 1, landsat_tile[3:])
+    no_data = synthetic_inputs.landsat_dict["no_data"]
+    min_records = 3
+
+    # the first tile scores higher (four images to three) from its first image, the only one sampled, but the left
+    # half of its other images is no data: the sites there are sparse on it.
+    images = {}
+    for tile, n_images, seed in [(landsat_tile, 4, 0), (other_tile, min_records, 1)]:
+        images[tile] = synthetic_inputs.landsat_mosaic_fn(os.path.join(check_dir, "images", tile), tile,
+                                                          landsat_size, n_images, seed=seed)
+    for image_path in images[landsat_tile][1:]:
+        with rasterio.open(image_path, "r+") as dst:
+            for band in range(1, dst.count + 1):
+                data = dst.read(band)
+                data[:, :landsat_size // 2] = no_data
+                dst.write(data, band)
+    lists = dict((tile, landsat_list_fn(os.path.join(check_dir, "lists"), tile, images[tile])) for tile in images)
+
+    # both tiles cover the mosaic, so every site is routed to both.
+    west, north = synthetic_inputs.landsat_dict["west"], synthetic_inputs.landsat_dict["north"]
+    extent = landsat_size * synthetic_inputs.landsat_dict["res"]
+    tile_grid = os.path.join(check_dir, "wrs2_overlap.shp")
+    gpd.GeoDataFrame({"PATH": [int(tile[:3]) for tile in sorted(images)], "ROW": [int(landsat_tile[3:])] * 2},
+                     geometry=[box(west, north - extent, west + extent, north)] * 2,
+                     crs="EPSG:{0}".format(synthetic_inputs.landsat_dict["epsg"])).to_file(tile_grid,
+                                                                                          driver="ESRI Shapefile")
+    index = tile_routing.build_fn(landsat["shapefile"], tile_grid)
+
+    tile_metadata = tile_selection.tile_metadata_fn(tile_selection.tile_images_fn(sorted(lists.values())), no_data,
+                                                    sample_images=1)
+    selection = tile_selection.select_fn(index, tile_metadata)
+    selected = tile_selection.selected_index_fn(index, selection)
+    if sorted(selected["tiles"]) != [landsat_tile]:
+        failures.append("selected: tiles {0}, expected {1}".format(sorted(selected["tiles"]), [landsat_tile]))
+
+    results_dir = os.path.join(check_dir, "results")
+    temp_dir = os.path.join(check_dir, "temp")
+    for path in [results_dir, temp_dir]:
+        os.makedirs(path)
+    step1_9.tiles_fn([lists[tile] for tile in sorted(selected["tiles"])], temp_dir, None, no_data, results_dir,
+                     selected)
+    record_counts = tile_selection.record_counts_fn(results_dir)
+    sparse = sorted(site for site, count in record_counts.items() if count < min_records)
+    if len(record_counts) != len(index["sites"]) or not sparse or len(sparse) == len(record_counts):
+        failures.append("selected: {0} sparse of {1} site series ({2} sites), expected some".format(
+            len(sparse), len(record_counts), len(index["sites"])))
+
+    fallback, affected = tile_selection.fallback_index_fn(index, selection, selected, record_counts, min_records)
+    rerouted = sorted(entry["site"] for entry in fallback["sites"].values())
+    if affected != [other_tile] or rerouted != sparse:
+        failures.append("fallback: {0} sites re-routed to {1}, expected the {2} sparse sites to {3}".format(
+            len(rerouted), affected, len(sparse), [other_tile]))
+
+    step1_9.tiles_fn([lists[tile] for tile in affected], temp_dir, None, no_data, results_dir, fallback)
+    record_counts = tile_selection.record_counts_fn(results_dir)
+    still_sparse = [site for site in sparse if record_counts.get(site, 0) < min_records]
+    if still_sparse:
+        failures.append("fallback: {0} sites still sparse (i.e. {1})".format(len(still_sparse), still_sparse[0]))
+
+    return failures
+
+
+def quick_check_fn(inputs):
+    """ The quick look: no data excluded from the decimated pixels of a grid that does not declare it, and every nth
+    image sampled in date order from an unordered image list. """
+    import numpy as np
+    import rasterio
+    import quick_look
+    import step1_8_qld_grid_zonal_stats as step1_8
+
+    failures = []
+    quick_dir = os.path.join(inputs["work_dir"], "quick")
+    os.makedirs(quick_dir)
+
+    # the first image written without a declared no data value (the qld_dict default is used), with no data
+    # pixels scattered through every decimated pixel.
+    undeclared = os.path.join(quick_dir, os.path.basename(inputs["images"][0]))
+    with rasterio.open(inputs["images"][0]) as srci:
+        profile = srci.profile.copy()
+        array = srci.read()
+    rows, cols = np.indices(array.shape[1:])
+    array[:, (rows + cols) % 7 == 0] = srci.nodata
+    profile.update(nodata=None)
+    with rasterio.open(undeclared, "w", **profile) as output:
+        output.write(array)
+
+    quick = quick_look.quick_fn(4, 1, 0, os.path.join(quick_dir, "cache"))
+    rows = step1_8.apply_zonal_stats_fn(undeclared, inputs["shapefile"], "uid", date_s, date_e, {},
+                                        qld_dict["daily_rain"][-3], quick=quick)
+    negative = [row[3] for row in rows if row[3] is not None and row[3] < 0]
+    if negative:
+        failures.append("quick no data: {0} zone means below 0 (i.e. {1})".format(len(negative), negative[0]))
+
+    # every third image of a shuffled image list.
+    shuffled = list(inputs["images"])
+    random.Random(0).shuffle(shuffled)
+    csv_list = os.path.join(quick_dir, "shuffled_list.csv")
+    with open(csv_list, "w") as output:
+        output.write("".join(image + "\n" for image in shuffled))
+    quick = quick_look.quick_fn(1, 3, 0)
+    files = run_fn(inputs, os.path.join(quick_dir, "every"), csv_list=csv_list, quick=quick)
+    expected = sorted(os.path.basename(image)[date_s:date_e] for image in inputs["images"])[::3]
+    dates = sorted(set(line.split(b",")[2].decode("utf-8") for content in files.values()
+                       for line in content.splitlines()[1:]))
+    if dates != expected:
+        failures.append("quick every 3: dates {0}, expected {1}".format(dates, expected))
+
+    return failures
+
+
+def quick_landsat_check_fn(inputs):
+    """ The step1_9 quick look: every nth image of an unordered tile image list sampled in date order and read at the
+    decimation, and the {tile}_quick_report.json error of every band against the full resolution calibration image. """
+    import json
+    import pandas as pd
+    import quick_look
+    import step1_9_reflectance_zonal_stats as step1_9
+
+    failures = []
+    landsat = landsat_inputs_fn(inputs)
+    quick_dir = os.path.join(inputs["work_dir"], "quick_landsat")
+    temp_dir = os.path.join(quick_dir, "temp")
+    out_dir = os.path.join(quick_dir, "out")
+    for path in [temp_dir, out_dir]:
+        os.makedirs(path)
+
+    shuffled = list(landsat["images"])
+    random.Random(0).shuffle(shuffled)
+    quick = quick_look.quick_fn(2, 2, 1, os.path.join(quick_dir, "cache"))
+    no_data = synthetic_inputs.landsat_dict["no_data"]
+    step1_9.tiles_fn([landsat_list_fn(quick_dir, landsat_tile, shuffled)], temp_dir, landsat["ready_dir"], no_data,
+                     out_dir, quick=quick)
+
+    # step1_9 slices the date at [-27:-19] of the image path.
+    sampled = sorted(landsat["images"], key=lambda image: image[-27:-19])[::2]
+    expected = [image[-27:-19] for image in sampled]
+    site_files = sorted(glob.glob(os.path.join(out_dir, "*_fpc_zonal_stats.csv")))
+    if not site_files:
+        return ["quick landsat: no site csv files"]
+    for path in site_files:
+        site_df = pd.read_csv(path, dtype={"year": str, "month": str, "day": str})
+        dates = sorted(site_df["year"] + site_df["month"] + site_df["day"])
+        if dates != expected:
+            failures.append("quick landsat {0}: dates {1}, expected {2}".format(os.path.basename(path), dates,
+                                                                                expected))
+
+    report_path = os.path.join(out_dir, "{0}_quick_report.json".format(landsat_tile))
+    if not os.path.exists(report_path):
+        return failures + ["quick landsat: no {0}".format(os.path.basename(report_path))]
+    with open(report_path, "r") as report_file:
+        report = json.load(report_file)
+    calibration = quick_look.calibration_images_fn(sampled, 1)
+    if [report["images_total"], report["images_sampled"], report["calibration_images"]] != [
+            len(shuffled), len(sampled), calibration]:
+        failures.append("quick landsat report: {0} of {1} images, calibration {2}, expected {3} of {4}, {5}".format(
+            report["images_sampled"], report["images_total"], report["calibration_images"], len(sampled),
+            len(shuffled), calibration))
+    bands = synthetic_inputs.landsat_dict["bands"]
+    for band in range(1, bands + 1):
+        error = report["errors"].get("b{0}_mean".format(band), {})
+        if error.get("n", 0) + error.get("missing", 0) != len(site_files):
+            failures.append("quick landsat report: b{0}_mean error over {1} zone images, expected {2}".format(
+                band, error.get("n", 0) + error.get("missing", 0), len(site_files)))
+
+    return failures
+
+
+def main_routine():
+    cmd_args = get_cmd_args_fn()
+    checks = [c.strip() for c in cmd_args.checks.split(",") if c.strip()]
+    for check in checks:
+        if check not in check_list:
+            print("Unknown check: ", check, " - select from: ", check_list)
+            sys.exit(1)
+
+    import pipeline_logging
+    pipeline_logging.setup_logging_fn(True, False, None)
+
+    work_dir = cmd_args.work_dir or tempfile.mkdtemp(prefix="zonal_check_")
+    created = not cmd_args.work_dir or not os.path.exists(work_dir)
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
+
+    failed = 0
+    try:
+        inputs = inputs_fn(run_benchmark.make_sub_dir_fn(work_dir, check_dir_name), cmd_args.n_months)
+        for check in checks:
+            failures = globals()["{0}_check_fn".format(check)](inputs)
+            print("{0:>12}: {1}".format(check, "FAILED" if failures else "ok"))
+            for failure in failures[:10]:
+                print("    ", failure)
+            if len(failures) > 10:
+                print("     ... {0} more".format(len(failures) - 10))
+            failed += bool(failures)
+    finally:
+        if not cmd_args.keep:
+            run_benchmark.remove_work_dir_fn(work_dir, created, [check_dir_name])
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main_routine()
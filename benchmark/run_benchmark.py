@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+
+"""
+run_benchmark.py
+================
+
+Description: This script benchmarks the zonal statistics pipeline against synthetic inputs (synthetic_inputs.py) at
+several scales and emits the results as json, optionally compared against a stored baseline json.
+
+This script:
+
+1. Generates a SILO-like monthly series, Landsat-like multi-band mosaics and a step1_3 format site csv per scale
+within a temporary directory (deleted at completion unless --keep is used). With --work_dir the inputs are generated
+in a sub-directory per scale, marked as created by the benchmark; only the marked sub-directories are replaced or
+removed, never the --work_dir itself or anything else in it.
+
+2. Times each stage of the pipeline:
+    catalog - step1_1.find_directories_with_file_type and step1_2 image listing / csv output.
+    geometry_prep - step1_3 projection, 1ha square buffer and site attribution.
+    extraction_silo - step1_8.apply_zonal_stats_fn per SILO image.
+    extraction_landsat - step1_9.apply_zonal_stats_fn per Landsat image and band.
+    output_writing - step1_8.clean_data_frame_fn per site csv export.
+
+3. Writes a json result file and, when --baseline is supplied, reports the ratio of each stage against the baseline
+and returns a non-zero exit code when a stage is slower than the baseline by more than --tolerance.
+
+Example:
+    python benchmark/run_benchmark.py --scales small,medium --output bench.json --baseline baseline.json
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import warnings
+from contextlib import redirect_stdout
+
+warnings.filterwarnings("ignore")
+
+# the pipeline scripts import each other by module name from the code directory.
+code_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code")
+if code_dir not in sys.path:
+    sys.path.insert(0, code_dir)
+
+import synthetic_inputs
+
+# dictionary {scale: [n_sites, n_months, mosaic_size, n_mosaics]}
+scale_dict = {"tiny": [10, 12, 256, 2],
+              "small": [50, 60, 512, 4],
+              "medium": [250, 240, 1024, 8],
+              "large": [1000, 480, 2048, 12],
+              }
+
+stage_list = ["catalog", "geometry_prep", "extraction_silo", "extraction_landsat", "output_writing"]
+
+# marker file of the sub-directories created by the benchmark (the only ones removed from a --work_dir).
+marker_name = ".zonal_bench"
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(description='''Benchmark the zonal stats pipeline against synthetic inputs.''')
+
+    p.add_argument('-s', '--scales', help='Comma separated list of scales ({0}).'.format(', '.join(scale_dict)),
+                   default='tiny,small')
+
+    p.add_argument('-o', '--output', help='Path of the output json results file.', default='bench_output.json')
+
+    p.add_argument('-b', '--baseline', help='Path of a stored baseline json results file to compare against.',
+                   default=None)
+
+    p.add_argument('-t', '--tolerance', type=float,
+                   help='Allowed slow down against the baseline as a fraction (i.e. 0.2 = 20 percent).', default=0.2)
+
+    p.add_argument('-r', '--repeats', type=int, help='Number of repeats per stage (the fastest is reported).',
+                   default=1)
+
+    p.add_argument('-w', '--work_dir', help='Directory to generate the synthetic inputs in, a sub-directory per scale '
+                                            '(default: temp dir).', default=None)
+
+    p.add_argument('-k', '--keep', action='store_true', help='Keep the synthetic inputs and outputs.')
+
+    cmd_args = p.parse_args()
+
+    return cmd_args
+
+
+def time_stage_fn(function, repeats, *args):
+    """ Run function(*args) repeats times (stdout suppressed) and return the fastest wall time and the last result.
+
+    @param function: function object to be timed.
+    @param repeats: integer object containing the number of times the function is run.
+    @return best: float object containing the fastest wall time in seconds.
+    @return result: the object returned by the last call of function.
+    """
+    best = None
+    result = None
+    for _ in range(max(1, repeats)):
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            start = time.perf_counter()
+            result = function(*args)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, result
+
+
+def catalog_stage_fn(met_analysis, out_name, temp_dir_path):
+    """ Locate the directories containing tif files and write an image list csv per directory (step1_1 / step1_2).
+
+    @return csv_list: list object containing the image list csv path for each located directory.
+    """
+    import step1_1_initiate_fractional_cover_zonal_stats_pipeline as step1_1
+    import step1_2_list_of_qld_grid_images as step1_2
+
+    directories = step1_1.find_directories_with_file_type(os.path.join(met_analysis, "nt", out_name), ".tif")
+    csv_list = []
+    for n, directory in enumerate(sorted(directories)):
+        csv_list.append(step1_2.main_routine(directory, None, "dir{0}".format(n), "tif", temp_dir_path))
+
+    return csv_list
+
+
+def geometry_stage_fn(site_csv, export_dir_path, prime_temp_buffer_dir):
+    """ Project the site csv to Albers, apply the 1ha square buffer and attribute each site (step1_3).
+
+    step1_3.main_routine concatenates using Windows path separators; the concatenation is reproduced here with
+    os.path.join so the benchmark runs on any platform.
+
+    @return geo_df: geo-dataframe object containing the attributed 1ha site polygons with a uid feature.
+    """
+    import pandas as pd
+    import geopandas as gpd
+    import step1_3_project_buffer as step1_3
+
+    df = pd.read_csv(site_csv)
+    site_list = []
+    for i in df.site:
+        n = i.replace("_", "")
+        site_list.append(n[:-4] + "." + n[-4:])
+    df["site"] = site_list
+
+    gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df.lon_gda94, df.lat_gda94)).set_crs(epsg=4283)
+    geo_df2 = gdf.drop_duplicates(keep="first")
+
+    crs_name, crs_output, projected_df = step1_3.projection_file_name_fn(3577, geo_df2)
+    buffer_temp_dir = step1_3.square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
+    step1_3.add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name)
+
+    list_df = [gpd.read_file(f) for f in sorted(glob.glob(os.path.join(prime_temp_buffer_dir, "1ha_attribute",
+                                                                       crs_name, "*.shp")))]
+    geo_df = gpd.GeoDataFrame(pd.concat(list_df, ignore_index=True), crs=list_df[0].crs)
+    geo_df.reset_index(drop=True, inplace=True)
+    geo_df["uid"] = geo_df.index + 1
+
+    return geo_df
+
+
+def silo_extraction_fn(image_list, shapefile_path, date_s, date_e):
+    """ Run step1_8.apply_zonal_stats_fn over each SILO image.
+
+    @return output_list: list object containing the zonal stats records for every image.
+    """
+    import step1_8_qld_grid_zonal_stats as step1_8
+
+    output_list = []
+    zone_cache = {}
+    for image_s in image_list:
+        output_list.extend(step1_8.apply_zonal_stats_fn(image_s, shapefile_path, "uid", date_s, date_e, zone_cache))
+
+    return output_list
+
+
+def landsat_extraction_fn(image_list, shapefile_path, bands):
+    """ Run step1_9.apply_zonal_stats_fn over each Landsat image and band.
+
+    @return n_records: integer object containing the number of zonal stats records produced.
+    """
+    import step1_9_reflectance_zonal_stats as step1_9
+
+    n_records = 0
+    for band in range(1, bands + 1):
+        for image_s in image_list:
+            final_results, site_name = step1_9.apply_zonal_stats_fn(
+                image_s, synthetic_inputs.landsat_dict["no_data"], band, shapefile_path, "uid")
+            n_records += len(final_results)
+
+    return n_records
+
+
+def output_stage_fn(output_list, out_dir, data_type):
+    """ Export the per site csv files (step1_8.clean_data_frame_fn). """
+    import step1_8_qld_grid_zonal_stats as step1_8
+
+    return step1_8.clean_data_frame_fn(output_list, out_dir, data_type)
+
+
+def make_sub_dir_fn(work_dir, name):
+    """ Create a fresh sub-directory of the work directory, marked as created by the benchmark (a marked sub-directory
+    of an earlier run is replaced, any other existing path is refused).
+
+    @param work_dir: string object containing the work directory.
+    @param name: string object containing the sub-directory name.
+    @return sub_dir: string object containing the sub-directory path.
+    """
+    sub_dir = os.path.join(work_dir, name)
+    if os.path.exists(sub_dir):
+        if not os.path.isfile(os.path.join(sub_dir, marker_name)):
+            raise ValueError("{0} exists and was not created by the benchmark - choose another --work_dir".format(
+                sub_dir))
+        shutil.rmtree(sub_dir)
+    os.makedirs(sub_dir)
+    open(os.path.join(sub_dir, marker_name), "w").close()
+
+    return sub_dir
+
+
+def remove_work_dir_fn(work_dir, created, names):
+    """ Remove the work directory when the script created it, otherwise only its marked sub-directories.
+
+    @param work_dir: string object containing the work directory.
+    @param created: boolean object, True when the work directory was created by the script (i.e. mkdtemp).
+    @param names: list object containing the sub-directory names created in a supplied work directory.
+    """
+    if created:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return
+
+    for name in names:
+        sub_dir = os.path.join(work_dir, name)
+        if os.path.isfile(os.path.join(sub_dir, marker_name)):
+            shutil.rmtree(sub_dir, ignore_errors=True)
+
+
+def run_scale_fn(scale, work_dir, repeats):
+    """ Generate the synthetic inputs for a scale and time each stage.
+
+    @param scale: string object containing the scale name (key of scale_dict).
+    @param work_dir: string object containing the directory the scale sub-directory is created in.
+    @param repeats: integer object containing the number of repeats per stage.
+    @return scale_results: dictionary object containing the inputs and stage timings for the scale.
+    """
+    n_sites, n_months, mosaic_size, n_mosaics = scale_dict[scale]
+    scale_dir = make_sub_dir_fn(work_dir, scale)
+
+    met_analysis = os.path.join(scale_dir, "met_analysis")
+    out_name = "dlyrn"
+    date_s, date_e = -19, -11
+    image_dir, silo_images = synthetic_inputs.silo_series_fn(met_analysis, out_name, n_months,
+                                                             date_s=date_s, date_e=date_e)
+    landsat_images = synthetic_inputs.landsat_mosaic_fn(os.path.join(scale_dir, "landsat"), "098075",
+                                                        mosaic_size, n_mosaics)
+
+    # half of the sites are located within the Landsat mosaic, the remainder across the SILO extent.
+    silo_csv = synthetic_inputs.site_csv_fn(os.path.join(scale_dir, "silo_sites.csv"), n_sites,
+                                            synthetic_inputs.silo_extent_gda94_fn(), repeat_visits=1,
+                                            cluster_size=4)
+    landsat_csv = synthetic_inputs.site_csv_fn(os.path.join(scale_dir, "landsat_sites.csv"), max(1, n_sites // 2),
+                                               synthetic_inputs.landsat_extent_gda94_fn(mosaic_size), seed=1)
+
+    temp_dir_path = os.path.join(scale_dir, "temp")
+    export_dir_path = os.path.join(scale_dir, "export")
+    for path in [temp_dir_path, export_dir_path]:
+        os.makedirs(path)
+
+    timings = {}
+
+    # catalog
+    timings["catalog"], csv_list = time_stage_fn(catalog_stage_fn, repeats, met_analysis, out_name, temp_dir_path)
+
+    # geometry preparation (a fresh buffer directory per repeat).
+    buffer_dirs = []
+
+    def geometry_fn():
+        buffer_dir = os.path.join(temp_dir_path, "temp_1ha_buffer_{0}".format(len(buffer_dirs)))
+        buffer_dirs.append(buffer_dir)
+        os.makedirs(buffer_dir)
+        return geometry_stage_fn(silo_csv, export_dir_path, buffer_dir)
+
+    timings["geometry_prep"], geo_df = time_stage_fn(geometry_fn, repeats)
+
+    # the SILO zones are written in Albers (as step1_1 does); step1_8 reprojects them to the SILO grid crs.
+    silo_shp = os.path.join(temp_dir_path, "silo_zones.shp")
+    geo_df.to_file(silo_shp, driver="ESRI Shapefile")
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        landsat_df = geometry_stage_fn(landsat_csv, export_dir_path, os.path.join(temp_dir_path, "landsat_buffer"))
+    landsat_shp = os.path.join(temp_dir_path, "landsat_zones.shp")
+    landsat_df.to_file(landsat_shp, driver="ESRI Shapefile")
+
+    # extraction
+    timings["extraction_silo"], output_list = time_stage_fn(silo_extraction_fn, repeats, silo_images, silo_shp,
+                                                            date_s, date_e)
+    bands = synthetic_inputs.landsat_dict["bands"]
+    timings["extraction_landsat"], n_records = time_stage_fn(landsat_extraction_fn, repeats, landsat_images,
+                                                             landsat_shp, bands)
+
+    # output writing
+    out_dir = os.path.join(export_dir_path, "cor")
+    os.makedirs(out_dir)
+    timings["output_writing"], _ = time_stage_fn(output_stage_fn, repeats, output_list, out_dir, "cor")
+
+    scale_results = {
+        "inputs": {"n_sites": len(geo_df.index), "n_silo_images": len(silo_images),
+                   "silo_shape": [synthetic_inputs.silo_dict["height"], synthetic_inputs.silo_dict["width"]],
+                   "n_landsat_sites": len(landsat_df.index), "n_landsat_images": len(landsat_images),
+                   "landsat_shape": [bands, mosaic_size, mosaic_size], "n_image_lists": len(csv_list)},
+        "seconds": timings,
+        "seconds_per_image": {"extraction_silo": timings["extraction_silo"] / len(silo_images),
+                              "extraction_landsat": timings["extraction_landsat"] / (len(landsat_images) * bands)},
+        "records": {"silo": len(output_list), "landsat": n_records},
+    }
+
+    return scale_results
+
+
+def compare_baseline_fn(results, baseline, tolerance):
+    """ Compare the stage timings of results against the baseline.
+
+    @param results: dictionary object containing the current benchmark results.
+    @param baseline: dictionary object containing the stored baseline results.
+    @param tolerance: float object containing the allowed slow down as a fraction.
+    @return comparison: dictionary object {scale: {stage: ratio}} (current / baseline).
+    @return regressions: list object containing the [scale, stage, ratio] exceeding the tolerance.
+    """
+    comparison = {}
+    regressions = []
+    for scale, scale_results in results["scales"].items():
+        base_scale = baseline.get("scales", {}).get(scale)
+        if base_scale is None:
+            continue
+
+        comparison[scale] = {}
+        for stage, seconds in scale_results["seconds"].items():
+            base_seconds = base_scale["seconds"].get(stage)
+            if not base_seconds:
+                continue
+
+            ratio = seconds / base_seconds
+            comparison[scale][stage] = round(ratio, 3)
+            if ratio > 1.0 + tolerance:
+                regressions.append([scale, stage, round(ratio, 3)])
+
+    return comparison, regressions
+
+
+def main_routine():
+    cmd_args = get_cmd_args_fn()
+    scales = [s.strip() for s in cmd_args.scales.split(",") if s.strip()]
+    for scale in scales:
+        if scale not in scale_dict:
+            print("Unknown scale: ", scale, " - select from: ", list(scale_dict))
+            sys.exit(1)
+
+    work_dir = cmd_args.work_dir or tempfile.mkdtemp(prefix="zonal_bench_")
+    created = not cmd_args.work_dir or not os.path.exists(work_dir)
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
+
+    import numpy
+    import rasterio
+    import rasterstats
+    import pandas
+    import geopandas
+
+    results = {"meta": {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                        "platform": platform.platform(), "numpy": numpy.__version__,
+                        "rasterio": rasterio.__version__, "rasterstats": rasterstats.__version__,
+                        "pandas": pandas.__version__, "geopandas": geopandas.__version__,
+                        "repeats": cmd_args.repeats},
+               "scales": {}}
+
+    try:
+        for scale in scales:
+            print("-" * 30)
+            print("Benchmarking scale: ", scale, scale_dict[scale])
+            results["scales"][scale] = run_scale_fn(scale, work_dir, cmd_args.repeats)
+            for stage in stage_list:
+                print("{0:>20}: {1:.3f} s".format(stage, results["scales"][scale]["seconds"][stage]))
+
+    finally:
+        if not cmd_args.keep:
+            remove_work_dir_fn(work_dir, created, scales)
+
+    exit_code = 0
+    if cmd_args.baseline:
+        with open(cmd_args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+
+        comparison, regressions = compare_baseline_fn(results, baseline, cmd_args.tolerance)
+        results["baseline"] = {"path": cmd_args.baseline, "tolerance": cmd_args.tolerance,
+                               "ratio": comparison, "regressions": regressions}
+        for scale, stage, ratio in regressions:
+            print("REGRESSION: {0} {1} is {2}x the baseline.".format(scale, stage, ratio))
+        exit_code = 1 if regressions else 0
+
+    with open(cmd_args.output, "w") as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+    print("Benchmark results: ", cmd_args.output)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main_routine()
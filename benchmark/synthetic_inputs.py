@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+"""
+synthetic_inputs.py
+===================
+
+Description: This script generates realistic synthetic inputs for the benchmark suite, entirely offline:
+
+1. SILO-like 0.05 degree single band GeoTIFF monthly series (int16, scale 0.1, no data -32767) laid out in a
+met_analysis style directory tree (met_analysis/nt/<out_name>/<period>/cor).
+
+2. Multi-band 30 m Landsat-like mosaics (Albers, 9 bands) of a configurable size.
+
+3. A site csv in the format read by step1_3_project_buffer.main_routine (site, lon_gda94, lat_gda94, date) with N
+sites, optionally including repeat visits and dense clusters of neighbouring sites.
+
+File names are constructed so that the date slices used by step1_1 (datesplit_s, datesplit_e) and step1_9 (image and
+date slices) return the image date, i.e. the synthetic data is read by the pipeline exactly as the real data is.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import csv
+import warnings
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+warnings.filterwarnings("ignore")
+
+# SILO grid definition (0.05 degree) clipped to a Queensland / Northern Territory extent.
+silo_dict = {"west": 129.0, "north": -10.0, "res": 0.05, "width": 500, "height": 380, "epsg": 4283,
+             "scale": 0.1, "no_data": -32767, "add_offset": 0.0}
+
+# Landsat mosaic definition (Albers 30 m) - the origin is located within the silo extent above.
+landsat_dict = {"west": -200000.0, "north": -1800000.0, "res": 30.0, "epsg": 3577, "bands": 9, "no_data": 0}
+
+
+def date_file_name_fn(prefix, date, date_s, date_e, extension):
+    """ Build a file name so that file_name[date_s:date_e] returns the date string.
+
+    @param prefix: string object containing the start of the file name.
+    @param date: string object containing the image date (i.e. YYYYMMDD or YYYYMM).
+    @param date_s: integer object containing the (negative) start index of the date within the file name.
+    @param date_e: integer object containing the (negative) end index of the date within the file name.
+    @param extension: string object containing the file extension including the dot (i.e. '.tif').
+    @return file_name: string object containing the constructed file name.
+    """
+    if date_e - date_s != len(date):
+        raise ValueError("Date {0} does not fit the slice [{1}:{2}]".format(date, date_s, date_e))
+
+    # the number of characters required after the date (padded with 'x' before the extension).
+    trailing = -date_e
+    padding = trailing - len(extension) - 1
+    if padding < 0:
+        raise ValueError("Extension {0} does not fit after the slice [{1}:{2}]".format(extension, date_s, date_e))
+
+    file_name = "{0}_{1}_{2}{3}".format(prefix, date, "x" * padding, extension)
+
+    return file_name
+
+
+def monthly_dates_fn(start_year, n_months):
+    """ Return a list of month start dates (YYYYMMDD) beginning in January of start_year.
+
+    @param start_year: integer object containing the first year of the series.
+    @param n_months: integer object containing the number of months in the series.
+    @return date_list: list object containing the date strings.
+    """
+    date_list = []
+    for i in range(n_months):
+        year = start_year + i // 12
+        month = i % 12 + 1
+        date_list.append("{0}{1:02d}01".format(year, month))
+
+    return date_list
+
+
+def silo_series_fn(met_analysis, out_name, n_months, start_year=1990, seed=0, period="1990_2020",
+                   product="cor", date_s=-19, date_e=-11):
+    """ Write a SILO-like monthly GeoTIFF series into a met_analysis style directory tree.
+
+    @param met_analysis: string object containing the root of the synthetic met_analysis directory.
+    @param out_name: string object containing the variable output name (i.e. 'dlyrn' - qld_dict[-1]).
+    @param n_months: integer object containing the number of monthly images to create.
+    @param start_year: integer object containing the first year of the series.
+    @param seed: integer object used to seed the random number generator.
+    @param period: string object containing the sub-directory between the variable and the product directories.
+    @param product: string object containing the product directory name (i.e. 'cor').
+    @param date_s: integer object containing the date slice start used for the product by step1_1.
+    @param date_e: integer object containing the date slice end used for the product by step1_1.
+    @return image_dir: string object containing the path to the directory housing the series.
+    @return image_list: list object containing the path to each image created.
+    """
+    image_dir = os.path.join(met_analysis, "nt", out_name, period, product)
+    if not os.path.exists(image_dir):
+        os.makedirs(image_dir)
+
+    rng = np.random.default_rng(seed)
+    height, width = silo_dict["height"], silo_dict["width"]
+    transform = from_origin(silo_dict["west"], silo_dict["north"], silo_dict["res"], silo_dict["res"])
+
+    # smooth spatial field (north-south rainfall gradient) with a seasonal cycle and noise.
+    gradient = np.linspace(1.0, 0.2, height, dtype=np.float32)[:, None] * np.ones((1, width), dtype=np.float32)
+
+    # mask the ocean in the north west corner to produce realistic no data areas.
+    rows, cols = np.indices((height, width))
+    ocean = (rows < height // 8) & (cols < width // 6)
+
+    image_list = []
+    for i, date in enumerate(monthly_dates_fn(start_year, n_months)):
+        month = int(date[4:6])
+        season = 1.0 + np.cos((month - 1) / 12.0 * 2 * np.pi)
+        values = 150.0 * gradient * season + rng.gamma(2.0, 10.0, size=(height, width)).astype(np.float32)
+        stored = np.round((values - silo_dict["add_offset"]) / silo_dict["scale"]).astype(np.int16)
+        stored[ocean] = silo_dict["no_data"]
+
+        file_name = date_file_name_fn("nt_" + out_name, date, date_s, date_e, ".tif")
+        image_path = os.path.join(image_dir, file_name)
+        with rasterio.open(image_path, "w", driver="GTiff", height=height, width=width, count=1,
+                           dtype="int16", crs="EPSG:{0}".format(silo_dict["epsg"]), transform=transform,
+                           nodata=silo_dict["no_data"]) as dst:
+            dst.write(stored, 1)
+            dst.scales = (silo_dict["scale"],)
+            dst.offsets = (silo_dict["add_offset"],)
+
+        image_list.append(image_path)
+
+    return image_dir, image_list
+
+
+def landsat_mosaic_fn(landsat_dir, tile, size, n_images, start_year=2000, seed=0):
+    """ Write multi-band (9 band) 30 m Landsat-like mosaics of size x size pixels.
+
+    @param landsat_dir: string object containing the output directory.
+    @param tile: string object containing the Landsat tile label (path + row, i.e. '098075').
+    @param size: integer object containing the number of rows and columns of each mosaic.
+    @param n_images: integer object containing the number of images (dates) to create.
+    @param start_year: integer object containing the first year of the series.
+    @param seed: integer object used to seed the random number generator.
+    @return image_list: list object containing the path to each image created.
+    """
+    if not os.path.exists(landsat_dir):
+        os.makedirs(landsat_dir)
+
+    rng = np.random.default_rng(seed)
+    transform = from_origin(landsat_dict["west"], landsat_dict["north"], landsat_dict["res"], landsat_dict["res"])
+    bands = landsat_dict["bands"]
+
+    image_list = []
+    for i, date in enumerate(monthly_dates_fn(start_year, n_images)):
+        # step1_9 slices the date at [-27:-19] of the image path.
+        file_name = date_file_name_fn("l8olre_{0}_m".format(tile), date, -27, -19, ".tif")
+        image_path = os.path.join(landsat_dir, file_name)
+        with rasterio.open(image_path, "w", driver="GTiff", height=size, width=size, count=bands, dtype="uint16",
+                           crs="EPSG:{0}".format(landsat_dict["epsg"]), transform=transform,
+                           nodata=landsat_dict["no_data"], tiled=True, blockxsize=256, blockysize=256) as dst:
+            for band in range(1, bands + 1):
+                data = rng.integers(100, 5000, size=(size, size), dtype=np.uint16)
+                dst.write(data, band)
+
+        image_list.append(image_path)
+
+    return image_list
+
+
+def site_csv_fn(csv_path, n_sites, extent, repeat_visits=0, cluster_size=1, seed=0):
+    """ Write a site csv in the step1_3 format (site, lon_gda94, lat_gda94, date).
+
+    Site names are written as NAME_YYYY so that step1_3 converts them to NAME.YYYY.
+
+    @param csv_path: string object containing the path of the output csv.
+    @param n_sites: integer object containing the number of site locations.
+    @param extent: list object containing [west, south, east, north] in GDA94 decimal degrees.
+    @param repeat_visits: integer object containing the number of additional visits per site (same location).
+    @param cluster_size: integer object containing the number of neighbouring sites (within ~1 km) per cluster.
+    @param seed: integer object used to seed the random number generator.
+    @return csv_path: string object containing the path of the output csv.
+    """
+    rng = np.random.default_rng(seed)
+    west, south, east, north = extent
+    n_clusters = max(1, int(np.ceil(n_sites / float(cluster_size))))
+    centre_lon = rng.uniform(west, east, n_clusters)
+    centre_lat = rng.uniform(south, north, n_clusters)
+
+    with open(csv_path, "w") as output:
+        writer = csv.writer(output, lineterminator="\n")
+        writer.writerow(["site", "lon_gda94", "lat_gda94", "date"])
+        for i in range(n_sites):
+            cluster = i // cluster_size
+            lon = centre_lon[cluster] + rng.uniform(-0.01, 0.01) * (cluster_size > 1)
+            lat = centre_lat[cluster] + rng.uniform(-0.01, 0.01) * (cluster_size > 1)
+            for visit in range(repeat_visits + 1):
+                year = 2015 + visit
+                site = "SYN{0:05d}_{1}".format(i + 1, year)
+                writer.writerow([site, round(lon, 6), round(lat, 6), "15/07/{0}".format(year)])
+
+    return csv_path
+
+
+def landsat_extent_gda94_fn(size):
+    """ Return the GDA94 extent [west, south, east, north] of a synthetic Landsat mosaic (inset by 5 %).
+
+    @param size: integer object containing the number of rows and columns of the mosaic.
+    @return extent: list object containing the extent in decimal degrees.
+    """
+    from pyproj import Transformer
+
+    res = landsat_dict["res"]
+    inset = size * res * 0.05
+    west = landsat_dict["west"] + inset
+    north = landsat_dict["north"] - inset
+    east = landsat_dict["west"] + size * res - inset
+    south = landsat_dict["north"] - size * res + inset
+
+    transformer = Transformer.from_crs("EPSG:{0}".format(landsat_dict["epsg"]), "EPSG:4283", always_xy=True)
+    lon, lat = transformer.transform([west, east, east, west], [north, north, south, south])
+
+    return [max(lon[0], lon[3]), max(lat[2], lat[3]), min(lon[1], lon[2]), min(lat[0], lat[1])]
+
+
+def silo_extent_gda94_fn():
+    """ Return the GDA94 extent [west, south, east, north] of the synthetic silo grid (inset by 10 %).
+
+    @return extent: list object containing the extent in decimal degrees.
+    """
+    width = silo_dict["width"] * silo_dict["res"]
+    height = silo_dict["height"] * silo_dict["res"]
+    west = silo_dict["west"] + 0.1 * width
+    north = silo_dict["north"] - 0.1 * height
+
+    return [west, north - 0.8 * height, west + 0.8 * width, north]
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+"""
+antecedent_windows.py
+=====================
+
+Description: This script derives the antecedent window features (i.e. 3, 6, 12 and 24 month rainfall totals or mean
+temperatures) ending at each site's visit date from the extracted monthly (cor) series, as a single model ready table.
+
+1. windows_fn parses the --windows command argument (comma separated months, none for no windows).
+
+2. window_fn pivots the monthly zone means into a site x month matrix on a continuous monthly axis and computes every
+window for every site by cumulative sum differencing (vectorised over all sites and windows):
+    sum(window) = cumsum[visit month] - cumsum[visit month - window]
+A window covers the visit month and the preceding (window - 1) months. The window sum and mean are NaN when the
+window starts before the series or the visit month is after the series; n_{window}m holds the number of months with
+a value (the mean is calculated from those months).
+
+3. main_routine writes the table to the cor output directory ({data_type}_antecedent_windows.csv), a row per site:
+    site, visit_date, {variable}_sum_{window}m, {variable}_mean_{window}m, n_{window}m ...
+
+The visit dates are parsed from the site csv by step1_3_project_buffer.visit_dates_fn.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import warnings
+import lazy_imports
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("antecedent")
+
+pd = lazy_imports.lazy_module_fn("pandas")
+np = lazy_imports.lazy_module_fn("numpy")
+
+
+def windows_fn(windows):
+    """ Parse the --windows command argument.
+
+    @param windows: string object containing comma separated window lengths in months (i.e. '3,6,12,24') or 'none'.
+    @return window_list: list object containing the sorted window lengths (integers), empty for no windows.
+    """
+    if windows.strip().lower() == "none":
+        return []
+
+    try:
+        window_list = sorted(set(int(w) for w in windows.split(",") if w.strip()))
+    except ValueError:
+        raise ValueError("Unknown windows: {0} (i.e. 3,6,12,24 or none)".format(windows))
+
+    if not window_list or window_list[0] < 1:
+        raise ValueError("The windows must be one or more months: {0}".format(windows))
+
+    return window_list
+
+
+def month_number_fn(dates):
+    """ Return a continuous month number (year * 12 + month - 1) for a datetime series. """
+    return dates.dt.year * 12 + dates.dt.month - 1
+
+
+def window_fn(output_df, visit_df, window_list, variable):
+    """ Compute the antecedent window sums and means ending at each site's visit date.
+
+    @param output_df: dataframe object containing the step1_8 output (ident, site, im_date (YYYYMMDD), mean).
+    @param visit_df: dataframe object containing the site_name and visit_date of each site.
+    @param window_list: list object containing the window lengths in months.
+    @param variable: string object containing the variable name used in the feature names (i.e. dlyrn).
+    @return window_df: dataframe object containing a row per site.
+    """
+    dates = pd.to_datetime(output_df["im_date"].astype(str), format="%Y%m%d", errors="coerce")
+    series_df = pd.DataFrame({"site": output_df["site"].values, "month": month_number_fn(dates).values,
+                              "value": pd.to_numeric(output_df["mean"], errors="coerce").values})
+    series_df = series_df[dates.notnull().values]
+
+    # site x month matrix on a continuous monthly axis (missing months are NaN).
+    first_month = int(series_df["month"].min())
+    n_months = int(series_df["month"].max()) - first_month + 1
+    matrix_df = series_df.pivot_table(index="site", columns="month", values="value", aggfunc="mean")
+    matrix_df = matrix_df.reindex(columns=range(first_month, first_month + n_months))
+    values = matrix_df.values
+
+    # cumulative sums padded with a leading zero column: sum of months [a, b) = csum[:, b] - csum[:, a].
+    csum = np.zeros((values.shape[0], n_months + 1))
+    ccount = np.zeros((values.shape[0], n_months + 1))
+    csum[:, 1:] = np.cumsum(np.nan_to_num(values), axis=1)
+    ccount[:, 1:] = np.cumsum(~np.isnan(values), axis=1)
+
+    window_df = visit_df.rename(columns={"site_name": "site"})
+    window_df = window_df[window_df["site"].isin(matrix_df.index)].reset_index(drop=True)
+    rows = matrix_df.index.get_indexer(window_df["site"])
+    visit_month = month_number_fn(pd.to_datetime(window_df["visit_date"]))
+    end = (visit_month - first_month + 1).values  # exclusive end column of the window in csum
+    valid_visit = window_df["visit_date"].notnull().values & (end >= 1) & (end <= n_months)
+    end = np.where(valid_visit, end, 0).astype(int)
+
+    for window in window_list:
+        start = end - window
+        in_series = valid_visit & (start >= 0)
+        start = np.where(in_series, start, 0)
+        total = csum[rows, end] - csum[rows, start]
+        count = ccount[rows, end] - ccount[rows, start]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            window_df["{0}_sum_{1}m".format(variable, window)] = np.where(in_series & (count > 0), total, np.nan)
+            window_df["{0}_mean_{1}m".format(variable, window)] = np.where(in_series & (count > 0), total / count,
+                                                                           np.nan)
+        window_df["n_{0}m".format(window)] = np.where(in_series, count, 0).astype(int)
+
+    return window_df
+
+
+def main_routine(output_df, visit_df, out_dir, data_type, window_list, variable):
+    """ Derive the antecedent windows from the monthly (cor) series and export the model ready table.
+
+    @param output_df: dataframe object containing the step1_8 output of a cor directory.
+    @param visit_df: dataframe object containing the site_name and visit_date of each site (step1_3).
+    @param out_dir: string object containing the output directory of the cor directory.
+    @param data_type: string object containing the directory name used in the output file name.
+    @param window_list: list object containing the window lengths in months.
+    @param variable: string object containing the variable name used in the feature names (i.e. dlyrn).
+    @return window_df: dataframe object containing the antecedent windows per site.
+    """
+    window_df = window_fn(output_df, visit_df, window_list, variable)
+
+    incomplete = int((window_df["n_{0}m".format(window_list[-1])] < window_list[-1]).sum())
+    if incomplete:
+        logger.warning("%s: %d sites have an incomplete %d month window", data_type, incomplete, window_list[-1])
+
+    out_path = os.path.join(out_dir, "{0}_antecedent_windows.csv".format(data_type))
+    window_df.to_csv(out_path, index=False, date_format="%Y-%m-%d")
+    logger.info("%s: antecedent windows (%s months) for %d sites: %s", data_type,
+                ",".join(str(w) for w in window_list), len(window_df.index), out_path)
+
+    return window_df
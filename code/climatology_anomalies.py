@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""
+climatology_anomalies.py
+========================
+
+Description: This script derives the monthly climatology and anomalies per site from the extracted monthly (cor)
+series, in place of extracting the long-term monthly average and median rasters (mavg and mmed directories) and
+joining them back to the series.
+
+1. base_period_fn parses the --base_period command argument (i.e. 1991-2020, all for the whole extracted series or none
+to extract the mavg and mmed rasters instead).
+
+2. anomaly_fn computes in a single pass (vectorised over all sites and months):
+    clim_mean / clim_median - the mean and median of the site and calendar month over the base period.
+    n_base - the number of base period values of the site and calendar month.
+    anomaly - value - clim_mean.
+    anomaly_pct - 100 * (value - clim_mean) / clim_mean (NaN when clim_mean is 0).
+    pct_rank - the percentage of base period values of the site and calendar month less than or equal to the value.
+
+3. main_routine writes the anomalies to a csv per site in the cor output directory ({site}_{data_type}_anomalies.csv).
+
+derived_product_list holds the products that are replaced by this stage; step1_1 does not read those directories
+unless --base_period none is selected.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import warnings
+import lazy_imports
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("anomalies")
+
+pd = lazy_imports.lazy_module_fn("pandas")
+np = lazy_imports.lazy_module_fn("numpy")
+
+# products derived by this stage (the climatology rasters are not read).
+derived_product_list = ["mavg", "mmed"]
+
+
+def base_period_fn(base_period):
+    """ Parse the --base_period command argument.
+
+    @param base_period: string object containing the base period (i.e. '1991-2020'), 'all' or 'none'.
+    @return period: list object [first year, last year] ([None, None] for all years) or None for no anomalies.
+    """
+    base_period = base_period.strip().lower()
+    if base_period == "none":
+        return None
+    if base_period == "all":
+        return [None, None]
+
+    try:
+        first_year, last_year = [int(y) for y in base_period.split("-")]
+    except ValueError:
+        raise ValueError("Unknown base period: {0} (i.e. 1991-2020, all or none)".format(base_period))
+
+    if first_year > last_year:
+        raise ValueError("The base period starts after it ends: {0}".format(base_period))
+
+    return [first_year, last_year]
+
+
+def anomaly_fn(output_df, period):
+    """ Compute the monthly climatology, absolute and percentage anomalies and percentile ranks per site.
+
+    @param output_df: dataframe object containing the step1_8 output (ident, site, im_date (YYYYMMDD), mean).
+    @param period: list object [first year, last year] returned by base_period_fn.
+    @return anomaly_df: dataframe object containing a row per site and image (ident, site, im_date, month, value,
+        clim_mean, clim_median, n_base, anomaly, anomaly_pct, pct_rank).
+    """
+    dates = pd.to_datetime(output_df["im_date"].astype(str), format="%Y%m%d", errors="coerce")
+    anomaly_df = pd.DataFrame({"ident": output_df["ident"].values, "site": output_df["site"].values,
+                               "im_date": output_df["im_date"].values, "month": dates.dt.month.values,
+                               "value": pd.to_numeric(output_df["mean"], errors="coerce").values})
+    anomaly_df = anomaly_df[dates.notnull().values].reset_index(drop=True)
+    years = dates[dates.notnull()].dt.year.values
+
+    base = anomaly_df["value"].notnull().values
+    if period[0] is not None:
+        base = base & (years >= period[0]) & (years <= period[1])
+
+    # climatology of each site and calendar month over the base period.
+    keys = ["ident", "month"]
+    base_df = anomaly_df.loc[base, keys + ["value"]]
+    clim_df = base_df.groupby(keys)["value"].agg(["mean", "median", "count"])
+    clim_df.columns = ["clim_mean", "clim_median", "n_base"]
+    anomaly_df = anomaly_df.join(clim_df, on=keys)
+    anomaly_df["n_base"] = anomaly_df["n_base"].fillna(0).astype(int)
+
+    anomaly_df["anomaly"] = anomaly_df["value"] - anomaly_df["clim_mean"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        anomaly_df["anomaly_pct"] = 100.0 * anomaly_df["anomaly"] / anomaly_df["clim_mean"].replace(0, np.nan)
+
+    # percentile rank: sort the base values and the values together by site, month and value (base values first on
+    # ties), so the running count of base values within each group is the number of base values <= each value.
+    rank_df = pd.concat([base_df.assign(is_base=1, row=-1),
+                         anomaly_df[keys + ["value"]].assign(is_base=0, row=np.arange(len(anomaly_df.index)))],
+                        ignore_index=True)
+    rank_df = rank_df[rank_df["value"].notnull()]
+    rank_df = rank_df.sort_values(keys + ["value", "is_base"], ascending=[True, True, True, False], kind="mergesort")
+    rank_df["n_le"] = rank_df.groupby(keys)["is_base"].cumsum()
+    rank_df = rank_df[rank_df["is_base"] == 0]
+
+    n_le = np.full(len(anomaly_df.index), np.nan)
+    n_le[rank_df["row"].values] = rank_df["n_le"].values
+    with np.errstate(invalid="ignore", divide="ignore"):
+        anomaly_df["pct_rank"] = np.where(anomaly_df["n_base"] > 0, 100.0 * n_le / anomaly_df["n_base"], np.nan)
+
+    return anomaly_df
+
+
+def main_routine(output_df, out_dir, data_type, period):
+    """ Derive the monthly climatology anomalies from the monthly (cor) series and export a csv per site.
+
+    @param output_df: dataframe object containing the step1_8 output of a cor directory.
+    @param out_dir: string object containing the output directory of the cor directory.
+    @param data_type: string object containing the directory name used in the output file names.
+    @param period: list object [first year, last year] returned by base_period_fn.
+    @return anomaly_df: dataframe object containing the anomalies.
+    """
+    anomaly_df = anomaly_fn(output_df, period)
+    anomaly_df["d_type"] = data_type
+
+    missing = int((anomaly_df["n_base"] == 0).sum())
+    if missing:
+        logger.warning("%s: %d records have no base period values (base period %s)", data_type, missing,
+                       "{0}-{1}".format(*period) if period[0] is not None else "all")
+
+    sites = anomaly_df["site"].unique()
+    logger.info("%s: anomalies for %d records and %d sites", data_type, len(anomaly_df.index), len(sites))
+
+    for site, site_df in anomaly_df.groupby("site", sort=False):
+        out_path = os.path.join(out_dir, "{0}_{1}_anomalies.csv".format(str(site), data_type))
+        site_df.to_csv(out_path, index=False)
+        logger.debug("out_path: %s", out_path)
+
+    return anomaly_df
@@ -0,0 +1,483 @@
+#!/usr/bin/env python
+
+"""
+extract_api.py
+==============
+
+Description: This script is the in process extraction API: catalog, geometry preparation and zonal statistics run in
+memory and the results are returned as a pandas DataFrame (or an array cube), with no temporary directories,
+shapefiles or csv files, so that notebooks and model training jobs avoid the step1_1 process start up and
+intermediate files.
+
+    import extract_api
+    extract_api.configure_fn(met_analysis="/data/met_analysis")
+    df = extract_api.extract_fn(sites_gdf, "dlyrn", products=["cor"], start="2015", end="2020", stats=["mean"])
+
+1. extract_fn takes a GeoDataFrame of sites (a 'site' or 'site_name' column, an optional 'uid' column and a crs); point
+sites are buffered to the 1ha square used by step1_3 (50 m each side of the point).
+
+2. The module caches are kept across calls (and shared with extraction_service):
+    catalog - the image catalog per variable directory (image_catalog.catalog_fn, listed again after catalog_ttl).
+    zones - the zones of each site set (geometries in the crs of each grid and the zone index per window).
+    windows - the raster windows covering the sites (least recently used, bounded by cache_mb).
+
+3. Only the window covering the sites is read from each image; the window is aligned to the pixel grid so the
+statistics match the full image extraction (zonal_engine).
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import time
+import hashlib
+import warnings
+import threading
+import collections
+import lazy_imports
+import run_metrics
+import zonal_engine
+import image_catalog
+import raster_metadata
+import pipeline_logging
+import geometry_provider
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("api")
+
+np = lazy_imports.lazy_module_fn("numpy")
+pd = lazy_imports.lazy_module_fn("pandas")
+rasterio = lazy_imports.lazy_module_fn("rasterio")
+rasterio_windows = lazy_imports.lazy_module_fn("rasterio.windows")
+
+# crs used to apply the 1ha square buffer to point sites (Australian Albers, metres).
+buffer_crs = "EPSG:3577"
+
+# settings shared by every call in the process (configure_fn).
+api_dict = {"met_analysis": None, "catalog_ttl": 300.0, "max_zone_sets": 32}
+
+# dictionary {variable directory: [load time, catalog]}.
+catalog_dict = {}
+
+# dictionary {zone set key: zone cache} (least recently used first).
+zone_set_dict = collections.OrderedDict()
+
+lock = threading.Lock()
+
+
+class WindowCache(object):
+    """ Least recently used cache of raster windows, bounded by the total bytes of the cached arrays. """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            array = self.items.get(key)
+            if array is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        run_metrics.cache_fn("window", array is not None)
+
+        return array
+
+    def put(self, key, array):
+        if array.nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            previous = self.items.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self.items[key] = array
+            self.nbytes += array.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def status(self):
+        with self.lock:
+            return {"windows": len(self.items), "mb": round(self.nbytes / 1048576.0, 2),
+                    "max_mb": round(self.max_bytes / 1048576.0, 2), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+
+window_cache = WindowCache(512 * 1048576)
+
+
+def configure_fn(met_analysis=None, cache_mb=None, catalog_ttl=None, max_zone_sets=None):
+    """ Set the met_analysis directory and the cache limits used by every call in the process.
+
+    @param met_analysis: string object containing the directory housing met_analysis/nt/{variable}.
+    @param cache_mb: float object containing the memory budget of the raster window cache in MB.
+    @param catalog_ttl: float object containing the seconds before a variable directory is listed again.
+    @param max_zone_sets: integer object containing the number of site sets kept in memory.
+    """
+    if met_analysis is not None:
+        api_dict["met_analysis"] = met_analysis
+    if cache_mb is not None:
+        window_cache.max_bytes = int(cache_mb * 1048576)
+    if catalog_ttl is not None:
+        api_dict["catalog_ttl"] = catalog_ttl
+    if max_zone_sets is not None:
+        api_dict["max_zone_sets"] = max_zone_sets
+
+
+def catalog_fn(variable, met_analysis=None):
+    """ Return the image catalog of a variable directory (listed once and kept for catalog_ttl seconds).
+
+    @param variable: string object containing the variable directory name (met_analysis/nt/{variable}).
+    @param met_analysis: string object containing the met_analysis directory (default: configure_fn).
+    @return catalog: list object (image_catalog.catalog_fn).
+    """
+    met_analysis = met_analysis or api_dict["met_analysis"]
+    if not met_analysis:
+        raise ValueError("The met_analysis directory is not set (configure_fn or the met_analysis argument).")
+
+    root_directory = os.path.join(met_analysis, "nt", variable)
+    if os.path.basename(root_directory) != variable or not os.path.isdir(root_directory):
+        raise ValueError("Unknown variable: {0} (no directory {1})".format(variable, root_directory))
+
+    with lock:
+        entry = catalog_dict.get(root_directory)
+        hit = entry is not None and time.time() - entry[0] < api_dict["catalog_ttl"]
+        run_metrics.cache_fn("catalog", hit)
+        if not hit:
+            entry = [time.time(), image_catalog.catalog_fn(root_directory)]
+            catalog_dict[root_directory] = entry
+            logger.info("catalog listed: %s (%d directories)", variable, len(entry[1]))
+
+    return entry[1]
+
+
+def make_zones_fn(geometries, sites, uids, crs):
+    """ Return the zones (geometry_provider.read_zones_fn format) of a list of site geometries.
+
+    Point sites are buffered to the 1ha square used by step1_3 (50 m each side of the point).
+
+    @param geometries: list object containing shapely geometries.
+    @param sites: list object containing the site names.
+    @param uids: list object containing the site identifiers.
+    @param crs: crs of the geometries (wkt, 'EPSG:4283' or crs object).
+    @return zones: dictionary object {"geometries", "uid", "site", "crs_wkt", "projected"}.
+    """
+    crs_wkt = geometry_provider.pyproj.CRS.from_user_input(crs).to_wkt()
+    buffer_wkt = geometry_provider.pyproj.CRS.from_user_input(buffer_crs).to_wkt()
+    to_buffer = geometry_provider.transformer_fn(crs_wkt, buffer_wkt).transform
+    from_buffer = geometry_provider.transformer_fn(buffer_wkt, crs_wkt).transform
+
+    zones = {"geometries": [], "uid": list(uids), "site": [str(s) for s in sites], "crs_wkt": crs_wkt,
+             "projected": {}}
+    for geometry in geometries:
+        if geometry is not None and geometry.geom_type == "Point":
+            projected = geometry_provider.shapely_ops.transform(to_buffer, geometry).buffer(50, cap_style=3)
+            geometry = geometry_provider.shapely_ops.transform(from_buffer, projected)
+        zones["geometries"].append(geometry)
+
+    return zones
+
+
+def zone_cache_fn(geometries, sites, uids, crs):
+    """ Return the zone cache of a site set (the zones, and a window and zone index per grid), reused by every
+    call for the same sites.
+
+    @param geometries: list object containing shapely geometries.
+    @param sites: list object containing the site names.
+    @param uids: list object containing the site identifiers.
+    @param crs: crs of the geometries (wkt, 'EPSG:4283' or crs object).
+    @return zone_cache: dictionary object {"zones", grid signature: (window, zone index)}.
+    """
+    digest = hashlib.sha1(str(crs).encode("utf-8"))
+    for geometry, site, uid in zip(geometries, sites, uids):
+        digest.update(geometry.wkb if geometry is not None else b"")
+        digest.update("|{0}|{1}|".format(site, uid).encode("utf-8"))
+    key = digest.hexdigest()
+
+    with lock:
+        zone_cache = zone_set_dict.get(key)
+        run_metrics.cache_fn("zone_set", zone_cache is not None)
+        if zone_cache is not None:
+            zone_set_dict.move_to_end(key)
+            return zone_cache
+
+    zone_cache = {"zones": make_zones_fn(geometries, sites, uids, crs)}
+    with lock:
+        zone_set_dict[key] = zone_cache
+        while len(zone_set_dict) > api_dict["max_zone_sets"]:
+            zone_set_dict.popitem(last=False)
+
+    return zone_cache
+
+
+def window_fn(geometries, transform, width, height):
+    """ Return the pixel window (col_off, row_off, width, height) covering the zone geometries (one pixel margin,
+    clipped to the grid) or None when no zone overlaps the grid. """
+    bounds = [g.bounds for g in geometries if g is not None and not g.is_empty]
+    if not bounds:
+        return None
+
+    bounds = np.array(bounds)
+    inverse = ~transform
+    corners = [inverse * (x, y) for x in (bounds[:, 0].min(), bounds[:, 2].max())
+               for y in (bounds[:, 1].min(), bounds[:, 3].max())]
+    cols, rows = zip(*corners)
+    col_off = max(int(np.floor(min(cols))) - 1, 0)
+    row_off = max(int(np.floor(min(rows))) - 1, 0)
+    col_end = min(int(np.ceil(max(cols))) + 1, width)
+    row_end = min(int(np.ceil(max(rows))) + 1, height)
+    if col_end <= col_off or row_end <= row_off:
+        return None
+
+    return col_off, row_off, col_end - col_off, row_end - row_off
+
+
+def window_index_fn(srci, zone_cache):
+    """ Return the window of the zones and the zone index built on the window grid (once per grid signature).
+
+    @param srci: open rasterio dataset.
+    @param zone_cache: dictionary object returned by zone_cache_fn.
+    @return window, zone_index: tuple object (None, None when the zones are outside the grid).
+    """
+    signature = zonal_engine.grid_signature_fn(srci)
+    entry = zone_cache.get(signature)
+    run_metrics.cache_fn("zone_index", entry is not None)
+    if entry is None:
+        zones = zone_cache["zones"]
+        geometries = geometry_provider.zone_geometries_fn(zones, srci.crs, srci.name)
+        window = window_fn(geometries, srci.transform, srci.width, srci.height)
+        zone_index = None
+        if window is not None:
+            window_transform = rasterio_windows.transform(rasterio_windows.Window(*window), srci.transform)
+            zone_index = zonal_engine.build_zone_index_fn(geometries, zones["uid"], zones["site"], window_transform,
+                                                          window[2], window[3], signature=signature + window)
+        entry = (window, zone_index)
+        zone_cache[signature] = entry
+
+    return entry
+
+
+def read_window_fn(image_path, metadata, srci, window):
+    """ Return the band 1 pixels of a window (from the window cache, read and cached when missing). """
+    key = (image_path, tuple(metadata["key"] or ()), window)
+    array = window_cache.get(key)
+    if array is None:
+        array = srci.read(1, window=rasterio_windows.Window(*window))
+        array.flags.writeable = False
+        window_cache.put(key, array)
+
+    return array
+
+
+def image_stats_fn(image_path, zone_cache, stats, default_nodata=None):
+    """ Return the statistics of each zone for an image (None when the image is all no data or the zones are
+    outside the grid).
+
+    @param image_path: string object containing the image path.
+    @param zone_cache: dictionary object returned by zone_cache_fn.
+    @param stats: list object containing the statistics (zonal_engine.stats_list names).
+    @param default_nodata: no data value used when the file does not define one.
+    @return zs: list object containing a statistics dictionary per zone, or None.
+    """
+    metadata = raster_metadata.metadata_fn(image_path)
+    no_data = raster_metadata.nodata_fn(metadata, default_nodata)
+    if raster_metadata.all_nodata_fn(metadata, default_nodata):
+        return None
+
+    with rasterio.open(image_path) as srci:
+        window, zone_index = window_index_fn(srci, zone_cache)
+        if window is None:
+            return None
+        array = read_window_fn(image_path, metadata, srci, window)
+
+    return zonal_engine.zone_stats_fn(array, zone_index, no_data, stats=stats)
+
+
+def date_bound_fn(value):
+    """ Return a date bound as a YYYY[MM[DD]] string (a string, integer or date / datetime object). """
+    if value is None:
+        return ""
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y%m%d")
+
+    return str(value).replace("-", "")
+
+
+def stats_fn(stats):
+    """ Return the list of statistics, checked against zonal_engine.stats_list (default ['mean'], a single statistic
+    may be given as a string). """
+    if isinstance(stats, str):
+        stats = [stats]
+    stats = list(stats) if stats else ["mean"]
+    unknown = [s for s in stats if s not in zonal_engine.stats_list]
+    if unknown:
+        raise ValueError("Unknown stats: {0} (choose from {1})".format(unknown, zonal_engine.stats_list))
+
+    return stats
+
+
+def request_images_fn(catalog, products, start, end):
+    """ Return the (image path, date, product) of the catalog images of the products within start - end. """
+    images = []
+    for entry in catalog:
+        if entry["product"] not in products:
+            continue
+        for image_path in entry["images"]:
+            img_date = image_catalog.image_date_fn(image_path, entry["datesplit_s"], entry["datesplit_e"])
+            # compare the common prefix, so that a year or month bound covers the whole year or month.
+            if start and img_date[:len(start)] < start[:len(img_date)]:
+                continue
+            if end and img_date[:len(end)] > end[:len(img_date)]:
+                continue
+            images.append((image_path, img_date, entry["product"]))
+
+    images.sort(key=lambda image: (image[2], image[1], image[0]))
+
+    return images
+
+
+def extract_rows_fn(zone_cache, images, stats, nodata=None):
+    """ Yield the result rows (a dictionary per zone) of each image in turn.
+
+    @param zone_cache: dictionary object returned by zone_cache_fn.
+    @param images: list object returned by request_images_fn.
+    @param stats: list object containing the statistics.
+    @param nodata: no data value used when a file does not define one.
+    @return: generator object yielding a dictionary per site and image.
+    """
+    zones = zone_cache["zones"]
+    for image_path, img_date, product in images:
+        zs = image_stats_fn(image_path, zone_cache, stats, nodata)
+        file_name = image_path.replace("\\", "/").rsplit("/", 1)[-1]
+        for z in range(len(zones["uid"])):
+            row = {"uid": zones["uid"][z], "site": zones["site"][z], "product": product, "im_date": img_date,
+                   "im_name": file_name}
+            for stat in stats:
+                value = zs[z].get(stat) if zs is not None else None
+                row[stat] = value.item() if hasattr(value, "item") else value
+            yield row
+
+
+def sites_fn(sites_gdf):
+    """ Return the geometries, site names, uids and crs of a GeoDataFrame of sites.
+
+    @param sites_gdf: geopandas GeoDataFrame object (a 'site' or 'site_name' column, optional 'uid' column).
+    @return geometries, sites, uids, crs: tuple object.
+    """
+    if sites_gdf.crs is None:
+        raise ValueError("sites_gdf has no crs - the crs can not be confirmed to match the rasters.")
+
+    site_column = "site" if "site" in sites_gdf.columns else "site_name"
+    if site_column not in sites_gdf.columns:
+        raise ValueError("sites_gdf needs a 'site' or 'site_name' column.")
+
+    sites = sites_gdf[site_column].tolist()
+    uids = sites_gdf["uid"].tolist() if "uid" in sites_gdf.columns else list(range(1, len(sites) + 1))
+
+    return list(sites_gdf.geometry), sites, uids, sites_gdf.crs.to_wkt()
+
+
+def extract_fn(sites_gdf, variable, products=None, start=None, end=None, stats=None, met_analysis=None,
+               nodata=None, cube=False):
+    """ Extract the zonal statistics of the sites from the catalog images, in memory.
+
+    @param sites_gdf: geopandas GeoDataFrame object containing the sites (points are buffered to 1ha).
+    @param variable: string object containing the variable directory name (i.e. 'dlyrn').
+    @param products: list object containing the products (default ['cor']).
+    @param start: first image date (inclusive, 'YYYY', 'YYYYMM', 'YYYYMMDD' or a date object; None for no bound).
+    @param end: last image date (inclusive, as start).
+    @param stats: list object containing the statistics (zonal_engine.stats_list names, default ['mean']), or a
+    single statistic string.
+    @param met_analysis: string object containing the met_analysis directory (default: configure_fn).
+    @param nodata: no data value used when a file does not define one.
+    @param cube: boolean object, True to return cube_fn of the results rather than the DataFrame.
+    @return output_df: pandas DataFrame object (uid, site, product, im_date, im_name and a column per statistic).
+    """
+    stats = stats_fn(stats)
+    catalog = catalog_fn(variable, met_analysis)
+    geometries, sites, uids, crs = sites_fn(sites_gdf)
+    zone_cache = zone_cache_fn(geometries, sites, uids, crs)
+    images = request_images_fn(catalog, list(products or ["cor"]), date_bound_fn(start), date_bound_fn(end))
+
+    start_time = time.time()
+    output_df = pd.DataFrame.from_records(list(extract_rows_fn(zone_cache, images, stats, nodata)),
+                                          columns=["uid", "site", "product", "im_date", "im_name"] + stats)
+    logger.info("%d images x %d sites extracted in %.2f s", len(images), len(sites), time.time() - start_time)
+
+    return cube_fn(output_df, stats) if cube else output_df
+
+
+def cube_fn(output_df, stats):
+    """ Return the results as an array cube (site x image x statistic).
+
+    @param output_df: pandas DataFrame object returned by extract_fn.
+    @param stats: list object containing the statistics.
+    @return cube: dictionary object {"values" (numpy float array), "uid", "site", "product", "im_date", "im_name",
+        "stats"}.
+    """
+    n_images = output_df[["product", "im_name"]].drop_duplicates().shape[0]
+    n_sites = len(output_df) // n_images if n_images else 0
+    values = output_df[stats].to_numpy(dtype=float).reshape(n_images, n_sites, len(stats)).transpose(1, 0, 2)
+    first = output_df.iloc[::max(n_sites, 1)]
+
+    return {"values": values, "uid": output_df["uid"].iloc[:n_sites].tolist(),
+            "site": output_df["site"].iloc[:n_sites].tolist(), "product": first["product"].tolist(),
+            "im_date": first["im_date"].tolist(), "im_name": first["im_name"].tolist(), "stats": stats}
+
+
+def status_fn():
+    """ Return the cache status (catalogs, site sets, metadata, windows and the cache hit counts). """
+    with lock:
+        status = {"catalogs": sorted(catalog_dict), "zone_sets": len(zone_set_dict),
+                  "metadata": len(raster_metadata.metadata_dict)}
+    status["window_cache"] = window_cache.status()
+    status["caches"] = dict((name, list(counts)) for name, counts in run_metrics.cache_dict.items())
+
+    return status
+
+
+def refresh_fn():
+    """ Drop the cached catalogs so new images are listed on the next call. """
+    with lock:
+        catalog_dict.clear()
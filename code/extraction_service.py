@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+
+"""
+extraction_service.py
+=====================
+
+Description: This script runs a long running local extraction service that answers ad hoc site questions (i.e.
+rainfall at 20 new sites over 2015 - 2020) in seconds, without a step1_1 run (temporary directories, directory walk,
+shapefiles and rasterising every image). The service keeps warm in memory:
+    catalog - the image catalog per variable directory (image_catalog.catalog_fn, refreshed after --catalog_ttl).
+    zones - the zone set of each site request (geometries in the crs of each grid and the zone index per window).
+    windows - the raster windows covering the requested sites (LRU, bounded by --cache_mb).
+
+Requests (json, on a local HTTP port or a Unix socket):
+
+    POST /extract
+        {"sites": GeoJSON FeatureCollection (a 'site' property per feature; points are buffered to the 1ha square
+                  used by step1_3),
+         "crs": "EPSG:4283" (crs of the site coordinates, default GDA94),
+         "variable": "dlyrn" (the met_analysis/nt/{variable} directory),
+         "products": ["cor"], "start": "20150101", "end": "20201231" (inclusive, YYYYMM[DD]),
+         "stats": ["mean"] (zonal_engine.stats_list, or a single statistic "mean")}
+        The results are streamed back as json lines (one per site and image) as each image is processed, followed by
+        a summary line {"done": true, ...}. A request that can not be parsed (json, sites, crs or stats) is answered
+        with 400 {"error": message}; a failure of the first image with 500.
+
+    GET /status     - the cache sizes, hit ratios and request counts.
+    POST /refresh   - drop the cached catalogs (new images are listed on the next request).
+
+The extraction and its caches are those of the in process API (extract_api): only the window covering the requested
+sites is read from each image, and the zone index is resolved once per grid window, so repeat questions about the
+same sites are answered from memory.
+
+    python extraction_service.py --met_analysis /data/met_analysis --port 8765
+    curl -X POST --data @request.json http://127.0.0.1:8765/extract
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import json
+import time
+import signal
+import argparse
+import warnings
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import lazy_imports
+import extract_api
+import raster_metadata
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("service")
+
+shapely_geometry = lazy_imports.lazy_module_fn("shapely.geometry")
+
+# crs of the request coordinates when the request does not name one (GDA94 geographic).
+default_crs = "EPSG:4283"
+
+# service state shared by the request threads.
+service_dict = {"started": None, "requests": 0, "errors": 0, "rows": 0}
+
+lock = threading.Lock()
+
+
+def request_zone_cache_fn(sites, crs):
+    """ Return the zone cache (extract_api.zone_cache_fn) of the GeoJSON sites of a request.
+
+    @param sites: dictionary object containing a GeoJSON FeatureCollection (a 'site' property per feature, an
+    optional 'uid' property).
+    @param crs: string object containing the crs of the coordinates.
+    @return zone_cache: dictionary object.
+    """
+    features = sites.get("features") if isinstance(sites, dict) else None
+    if not features:
+        raise ValueError("sites must be a GeoJSON FeatureCollection with at least one feature.")
+
+    geometries, site_list, uids = [], [], []
+    for n, feature in enumerate(features):
+        properties = feature.get("properties") or {}
+        if "site" not in properties:
+            raise ValueError("feature {0} has no 'site' property.".format(n))
+        geometries.append(shapely_geometry.shape(feature["geometry"]))
+        site_list.append(properties["site"])
+        uids.append(properties.get("uid", n + 1))
+
+    return extract_api.zone_cache_fn(geometries, site_list, uids, crs)
+
+
+def extract_fn(request):
+    """ Return the result rows of an extraction request, image by image.
+
+    @param request: dictionary object (see the module description).
+    @return: generator object yielding a dictionary per site and image.
+    """
+    stats = extract_api.stats_fn(request.get("stats"))
+    if "sites" not in request or "variable" not in request:
+        raise ValueError("A request needs sites and a variable.")
+
+    catalog = extract_api.catalog_fn(request["variable"])
+    zone_cache = request_zone_cache_fn(request["sites"], request.get("crs", default_crs))
+    images = extract_api.request_images_fn(catalog, request.get("products") or ["cor"],
+                                           extract_api.date_bound_fn(request.get("start")),
+                                           extract_api.date_bound_fn(request.get("end")))
+
+    return extract_api.extract_rows_fn(zone_cache, images, stats, request.get("nodata"))
+
+
+def status_fn():
+    """ Return the service status (request counts, cache sizes and hit ratios). """
+    with lock:
+        status = {"uptime": round(time.time() - service_dict["started"], 1) if service_dict["started"] else 0,
+                  "requests": service_dict["requests"], "errors": service_dict["errors"],
+                  "rows": service_dict["rows"]}
+    status.update(extract_api.status_fn())
+
+    return status
+
+
+class ExtractionHandler(BaseHTTPRequestHandler):
+    """ Request handler of the extraction service (json requests, json lines results). """
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def address_string(self):
+        # a Unix socket client has no (host, port) address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+    def send_json_fn(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/status":
+            self.send_json_fn(200, status_fn())
+        else:
+            self.send_json_fn(404, {"error": "unknown path: {0}".format(self.path)})
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path == "/refresh":
+            extract_api.refresh_fn()
+            self.send_json_fn(200, {"refreshed": True})
+            return
+        if path != "/extract":
+            self.send_json_fn(404, {"error": "unknown path: {0}".format(self.path)})
+            return
+
+        with lock:
+            service_dict["requests"] += 1
+        start = time.time()
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+            rows = extract_fn(request)
+        except Exception as err:
+            # bad request content (json, geometry, crs or stats) - shapely and pyproj raise their own errors.
+            logger.warning("extract: bad request (%s: %s)", type(err).__name__, err)
+            with lock:
+                service_dict["errors"] += 1
+            self.send_json_fn(400, {"error": "{0}: {1}".format(type(err).__name__, err)})
+            return
+
+        try:
+            first = next(rows, None)
+        except Exception as err:
+            logger.exception("extraction failed before the first row")
+            with lock:
+                service_dict["errors"] += 1
+            self.send_json_fn(500, {"error": "{0}: {1}".format(type(err).__name__, err)})
+            return
+
+        # stream the rows as json lines (the end of the response is the end of the connection).
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        n = 0
+        try:
+            if first is not None:
+                self.wfile.write((json.dumps(first) + "\n").encode("utf-8"))
+                n = 1
+            for row in rows:
+                self.wfile.write((json.dumps(row) + "\n").encode("utf-8"))
+                n += 1
+            self.wfile.write((json.dumps({"done": True, "rows": n, "seconds": round(time.time() - start, 3)})
+                              + "\n").encode("utf-8"))
+        except Exception as err:
+            logger.exception("extraction failed after %d rows", n)
+            with lock:
+                service_dict["errors"] += 1
+            try:
+                self.wfile.write((json.dumps({"done": False, "rows": n, "error": str(err)}) + "\n").encode("utf-8"))
+            except OSError:
+                pass
+        with lock:
+            service_dict["rows"] += n
+        logger.info("extract: %d rows in %.2f s", n, time.time() - start)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ Threading HTTP server listening on a Unix socket. """
+    daemon_threads = True
+
+
+def serve_fn(host, port, socket_path):
+    """ Serve requests until interrupted (a Unix socket when socket_path is set, otherwise host:port). """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, ExtractionHandler)
+        logger.info("extraction service listening on %s", socket_path)
+    else:
+        server = ThreadingHTTPServer((host, port), ExtractionHandler)
+        server.daemon_threads = True
+        logger.info("extraction service listening on http://%s:%d", host, server.server_address[1])
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("extraction service stopped")
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description="Run a local extraction service holding the catalog, zones and raster windows in memory.")
+
+    p.add_argument("-m", "--met_analysis", help="Directory housing the met_analysis data (met_analysis/nt/{variable}).",
+                   required=True)
+    p.add_argument("--host", help="Address to listen on (default: 127.0.0.1).", default="127.0.0.1")
+    p.add_argument("--port", help="Port to listen on (default: 8765).", type=int, default=8765)
+    p.add_argument("--socket", help="Listen on this Unix socket instead of a port.", default=None)
+    p.add_argument("--cache_mb", help="Memory budget of the raster window cache in MB (default: 512).", type=float,
+                   default=512.0)
+    p.add_argument("--zone_sets", help="Number of site sets kept in memory (default: 32).", type=int, default=32)
+    p.add_argument("--catalog_ttl", help="Seconds before a variable directory is listed again (default: 300).",
+                   type=float, default=300.0)
+    p.add_argument("--metadata_cache", help="Path of the raster metadata cache file (default: {0}, 'off' for no "
+                                            "cache file).".format(raster_metadata.default_cache_path),
+                   default=raster_metadata.default_cache_path)
+    p.add_argument('-l', '--log_file', help="The path of an optional log file (written in addition to the console)",
+                   default=None)
+
+    pipeline_logging.add_logging_args_fn(p)
+
+    cmd_args = p.parse_args()
+
+    if not os.path.isdir(cmd_args.met_analysis):
+        p.error("--met_analysis is not a directory: {0}".format(cmd_args.met_analysis))
+    if cmd_args.cache_mb <= 0:
+        p.error("--cache_mb must be greater than 0.")
+
+    return cmd_args
+
+
+def main_routine():
+    """ Run the extraction service. """
+    cmd_args = get_cmd_args_fn()
+    pipeline_logging.setup_logging_fn(cmd_args.quiet, cmd_args.verbose, cmd_args.log_file)
+
+    extract_api.configure_fn(met_analysis=cmd_args.met_analysis, cache_mb=cmd_args.cache_mb,
+                             catalog_ttl=cmd_args.catalog_ttl, max_zone_sets=cmd_args.zone_sets)
+    service_dict["started"] = time.time()
+    if cmd_args.metadata_cache != "off":
+        raster_metadata.load_cache_fn(cmd_args.metadata_cache)
+
+    # stop cleanly (remove the socket, save the metadata cache) when the service is terminated.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        serve_fn(cmd_args.host, cmd_args.port, cmd_args.socket)
+    finally:
+        raster_metadata.save_cache_fn()
+
+
+if __name__ == "__main__":
+    main_routine()
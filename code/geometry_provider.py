@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+"""
+geometry_provider.py
+====================
+
+Description: This script provides the zone geometries and zone indexes to the extraction stage in the crs of each
+raster grid, so that one site shapefile (projected to Albers by step1_3) can be used against rasters in any crs (SILO
+GDA94 geographic grids, Landsat Albers and UTM tiles).
+
+1. read_zones_fn reads the zone geometries, uid and site_name attributes and the shapefile crs once per run.
+
+2. zone_geometries_fn compares the raster crs with the zone crs once per crs; when they differ the zones are
+reprojected with a cached pyproj transformer (transformer_fn, one per crs pair) and the reprojected geometries are
+memoised for every other image in that crs. A shapefile or raster without a crs is refused (ValueError) - the crs
+can not be confirmed to match.
+
+3. zone_index_fn resolves the zone index (zonal_engine.build_zone_index_fn) once per grid signature (crs, transform,
+width, height) and reuses it for every image on that grid.
+
+The cache hits and misses are published through run_metrics (caches 'transformer', 'zone_geometry', 'zone_index').
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import warnings
+import lazy_imports
+import run_metrics
+import zonal_engine
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("geometry")
+
+fiona = lazy_imports.lazy_module_fn("fiona")
+pyproj = lazy_imports.lazy_module_fn("pyproj")
+shapely_geometry = lazy_imports.lazy_module_fn("shapely.geometry")
+shapely_ops = lazy_imports.lazy_module_fn("shapely.ops")
+
+# dictionary {(source crs wkt, destination crs wkt): pyproj.Transformer} shared by every run in the process.
+transformer_dict = {}
+
+
+def crs_wkt_fn(crs, label):
+    """ Return the wkt of a crs (rasterio / fiona crs object, wkt string or None).
+
+    @param crs: crs object or wkt string.
+    @param label: string object naming the data set (used in the error message).
+    @return wkt: string object containing the crs wkt.
+    """
+    if crs is None or crs == "" or crs == {}:
+        raise ValueError("{0} has no crs - the crs can not be confirmed to match the zones.".format(label))
+
+    return crs if isinstance(crs, str) else crs.to_wkt()
+
+
+def transformer_fn(src_wkt, dst_wkt):
+    """ Return the cached pyproj transformer between two crs (x/y axis order).
+
+    @param src_wkt: string object containing the source crs wkt.
+    @param dst_wkt: string object containing the destination crs wkt.
+    @return transformer: pyproj.Transformer object.
+    """
+    key = (src_wkt, dst_wkt)
+    transformer = transformer_dict.get(key)
+    run_metrics.cache_fn("transformer", transformer is not None)
+    if transformer is None:
+        transformer = pyproj.Transformer.from_crs(pyproj.CRS.from_wkt(src_wkt), pyproj.CRS.from_wkt(dst_wkt),
+                                                  always_xy=True)
+        transformer_dict[key] = transformer
+
+    return transformer
+
+
+def read_zones_fn(shape_path, uid):
+    """ Read the zone geometries, uid and site_name attributes and the crs from the 1ha site shapefile.
+
+    @param shape_path: string object containing the path to the 1ha site shapefile.
+    @param uid: ODK 1ha dataframe feature (unique numeric identifier)
+    @return zones: dictionary object {"geometries", "uid", "site" (shapefile order), "crs_wkt", "projected"}.
+    """
+    zones = {"geometries": [], "uid": [], "site": [], "projected": {}}
+    with fiona.open(shape_path) as src:
+        zones["crs_wkt"] = crs_wkt_fn(src.crs_wkt, shape_path)
+        for i in src:
+            table_attributes = i['properties']  # reads in the attribute table for each record
+            geometry = i['geometry']
+            zones["geometries"].append(shapely_geometry.shape(geometry) if geometry is not None else None)
+            zones["uid"].append(table_attributes[uid])
+            zones["site"].append(table_attributes['site_name'])
+
+    return zones
+
+
+def zone_geometries_fn(zones, raster_crs, label="raster"):
+    """ Return the zone geometries in the raster crs (reprojected once per crs and memoised).
+
+    @param zones: dictionary object returned by read_zones_fn.
+    @param raster_crs: crs object (or wkt string) of the raster.
+    @param label: string object naming the raster (used in the error message).
+    @return geometries: list object containing the zone geometries in the raster crs.
+    """
+    raster_wkt = crs_wkt_fn(raster_crs, label)
+    geometries = zones["projected"].get(raster_wkt)
+    run_metrics.cache_fn("zone_geometry", geometries is not None)
+    if geometries is not None:
+        return geometries
+
+    if pyproj.CRS.from_wkt(raster_wkt) == pyproj.CRS.from_wkt(zones["crs_wkt"]):
+        geometries = zones["geometries"]
+    else:
+        transform = transformer_fn(zones["crs_wkt"], raster_wkt).transform
+        geometries = [shapely_ops.transform(transform, g) if g is not None else None for g in zones["geometries"]]
+        logger.info("%d zones reprojected to %s", len(geometries), pyproj.CRS.from_wkt(raster_wkt).name)
+
+    zones["projected"][raster_wkt] = geometries
+
+    return geometries
+
+
+def zones_fn(shape_path, uid, zone_cache):
+    """ Return the zones of the run (read_zones_fn, read once and kept in zone_cache).
+
+    A pooled worker (zone_cache["shared"] holds a shared_zone_index handle) decodes the zones from shared memory
+    rather than reading the shapefile.
+    """
+    zones = zone_cache.get("zones")
+    if zones is None and "shared" in zone_cache:
+        import shared_zone_index
+        zones = shared_zone_index.attach_zones_fn(zone_cache["shared"])
+        zone_cache["zones"] = zones
+    if zones is None:
+        zones = read_zones_fn(shape_path, uid)
+        zone_cache["zones"] = zones
+
+    return zones
+
+
+def zone_index_fn(srci, shape_path, uid, zone_cache, all_touched=True):
+    """ Return the zone index (unique pixel footprints) for the grid of an open raster.
+
+    @param srci: open rasterio dataset.
+    @param shape_path: string object containing the path to the 1ha site shapefile.
+    @param uid: ODK 1ha dataframe feature (unique numeric identifier)
+    @param zone_cache: dictionary object reused across the images of a run (zones and a zone index per grid).
+    @param all_touched: boolean object passed to the rasterisation.
+    @return zone_index: dictionary object (zonal_engine.build_zone_index_fn).
+    """
+    zones = zones_fn(shape_path, uid, zone_cache)
+
+    signature = zonal_engine.grid_signature_fn(srci)
+    zone_index = zone_cache.get(signature)
+    run_metrics.cache_fn("zone_index", zone_index is not None)
+    if zone_index is None:
+        geometries = zone_geometries_fn(zones, srci.crs, srci.name)
+        zone_index = zonal_engine.build_zone_index_fn(geometries, zones["uid"], zones["site"], srci.transform,
+                                                      srci.width, srci.height, all_touched=all_touched,
+                                                      signature=signature)
+        zone_cache[signature] = zone_index
+        logger.info("%d zones resolved to %d unique footprints", zone_index["n_zones"], zone_index["n_footprints"])
+
+    return zone_index
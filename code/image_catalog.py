@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+"""
+image_catalog.py
+================
+
+Description: This script builds the image catalog for a met variable - the directories housing images (located by
+file extension), the product each directory holds (cor, siav, simd, mavg, mmed, msum, ssav, ssmd), the image paths
+and the image dates - using a single directory walk and the standard library only (no GDAL stack), so it can be used
+by the --plan mode as well as by step1_1.
+
+product_dict holds the date slice of each product file name [datesplit_s, datesplit_e] used by step1_8.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# dictionary {product (directory suffix): [datesplit_s, datesplit_e]}
+product_dict = {"cor": [-19, -11],
+                "siav": [-23, -17],
+                "simd": [-23, -17],
+                "mavg": [-23, -17],
+                "mmed": [-23, -17],
+                "msum": [-23, -17],
+                "ssav": [-23, -17],
+                "ssmd": [-23, -17],
+                }
+
+
+def product_fn(directory):
+    """ Return the product of a directory (the product_dict key the directory name ends with) or None.
+
+    @param directory: string object containing the directory path.
+    @return product: string object containing the product or None if the directory is not processed.
+    """
+    for product in product_dict:
+        if directory.endswith(product):
+            return product
+
+    return None
+
+
+def image_date_fn(image_path, datesplit_s, datesplit_e):
+    """ Return the date string sliced from the image file name (as step1_8.apply_zonal_stats_fn does).
+
+    @param image_path: string object containing the image path.
+    @param datesplit_s: integer object containing the start of the date slice.
+    @param datesplit_e: integer object containing the end of the date slice.
+    @return img_date: string object containing the image date.
+    """
+    file_name = image_path.replace("\\", "/").rsplit("/", 1)[-1]
+
+    return file_name[datesplit_s:datesplit_e]
+
+
+def catalog_fn(root_directory, extension=".tif"):
+    """ Walk root_directory once and return a catalog entry for each product directory housing images.
+
+    @param root_directory: string object containing the variable directory (i.e. met_analysis/nt/dlyrn).
+    @param extension: string object containing the image file extension.
+    @return catalog: list object containing a dictionary per directory (sorted by directory):
+        {"in_dir", "product", "datesplit_s", "datesplit_e", "images" (sorted paths), "dates" (sorted date strings)}.
+    """
+    catalog = []
+    for dirpath, dirnames, filenames in os.walk(root_directory):
+        images = sorted(os.path.join(dirpath, f) for f in filenames if f.endswith(extension))
+        if not images:
+            continue
+
+        product = product_fn(dirpath)
+        if product is None:
+            continue
+
+        datesplit_s, datesplit_e = product_dict[product]
+        dates = sorted(image_date_fn(i, datesplit_s, datesplit_e) for i in images)
+        catalog.append({"in_dir": dirpath, "product": product, "datesplit_s": datesplit_s,
+                        "datesplit_e": datesplit_e, "images": images, "dates": dates})
+
+    catalog.sort(key=lambda entry: entry["in_dir"])
+
+    return catalog
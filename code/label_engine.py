@@ -0,0 +1,553 @@
+#!/usr/bin/env python
+
+"""
+label_engine.py
+===============
+
+Description: This script computes the zonal statistics of large polygons (Pastoral Estate properties, paddocks) that
+cover thousands of square kilometres and tens of millions of 30 m pixels, where a masked array per polygon (rasterstats,
+or the flat pixel indices of zonal_engine) would be slow and memory bound.
+
+1. build_label_raster_fn rasterises the polygon set once per grid into an integer label raster (polygon n has label
+n + 1, 0 is outside every polygon) covering the bounding window of the polygons only. Where polygons overlap the
+later polygon keeps the pixel (the overlapping pixel count is logged). label_index_fn keeps the label raster per grid
+signature for every image on that grid and, with label_dir, on disk between runs:
+    {label_dir}/{key}.npy    - the label raster (memory mapped when loaded).
+    {label_dir}/{key}.json   - the window offsets and polygon count.
+The key is a hash of the polygon file (modification time and size), the id field, the grid signature and all_touched.
+
+2. label_stats_fn reads each image in row blocks of the label window and reduces every polygon with one np.bincount
+per block (count, sum and sum of squares about a shift, np.minimum.at / np.maximum.at for min and max), so the pixels
+are never gathered per polygon. The median and percentiles come from a histogram per polygon filled in the same pass,
+kept sparse: the occupied (polygon, bin) cells of each block are counted with np.unique and merged, so the memory
+follows the distinct values of each polygon rather than polygons x bins:
+    exact    - integer data whose value range fits exact_bins (unit width bins); the percentiles equal np.percentile.
+    binned   - other data, bins equal width bins over the value range; a percentile is interpolated within its bin and
+               is within one bin width of np.percentile.
+The value range is the exact GDAL statistics stored with the band (STATISTICS_MINIMUM / _MAXIMUM, not approximate),
+otherwise a min / max pass over the window before the histogram pass.
+
+The statistics dictionaries use the zonal_engine names and order. The property summaries of a list of images can be
+written from the command line:
+
+    python label_engine.py --polygons pastoral_estate.shp --images image_list.csv --output property_stats.csv
+
+The label raster cache hits and misses are published through run_metrics (cache 'label_raster').
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import json
+import hashlib
+import argparse
+import warnings
+import lazy_imports
+import run_metrics
+import zonal_engine
+import raster_mirror
+import raster_metadata
+import pipeline_logging
+import geometry_provider
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("labels")
+
+np = lazy_imports.lazy_module_fn("numpy")
+pd = lazy_imports.lazy_module_fn("pandas")
+fiona = lazy_imports.lazy_module_fn("fiona")
+rasterio = lazy_imports.lazy_module_fn("rasterio")
+rasterio_enums = lazy_imports.lazy_module_fn("rasterio.enums")
+rasterio_windows = lazy_imports.lazy_module_fn("rasterio.windows")
+rasterio_features = lazy_imports.lazy_module_fn("rasterio.features")
+shapely_geometry = lazy_imports.lazy_module_fn("shapely.geometry")
+
+# largest integer value range histogrammed with unit width bins (exact percentiles).
+exact_bins = 16384
+
+
+def read_polygons_fn(shape_path, id_field, name_field=None):
+    """ Read the polygons, id and name attributes and the crs of a polygon shapefile (i.e. the Pastoral Estate).
+
+    @param shape_path: string object containing the path to the polygon shapefile.
+    @param id_field: string object containing the polygon id attribute (i.e. PROP_TAG).
+    @param name_field: string object containing the polygon name attribute (i.e. PROPERTY), None to use the id.
+    @return polygons: dictionary object in the geometry_provider.read_zones_fn format ("site" holds the names).
+    """
+    polygons = {"geometries": [], "uid": [], "site": [], "projected": {}}
+    with fiona.open(shape_path) as src:
+        polygons["crs_wkt"] = geometry_provider.crs_wkt_fn(src.crs_wkt, shape_path)
+        for i in src:
+            table_attributes = i['properties']
+            geometry = i['geometry']
+            polygons["geometries"].append(shapely_geometry.shape(geometry) if geometry is not None else None)
+            polygons["uid"].append(table_attributes[id_field])
+            polygons["site"].append(table_attributes[name_field if name_field else id_field])
+
+    return polygons
+
+
+def label_window_fn(geometries, transform, width, height):
+    """ Return the window of the grid covering the bounds of the geometries (None when they are off the grid). """
+    bounds = [g.bounds for g in geometries if g is not None and not g.is_empty]
+    if not bounds:
+        return None
+
+    left, bottom = min(b[0] for b in bounds), min(b[1] for b in bounds)
+    right, top = max(b[2] for b in bounds), max(b[3] for b in bounds)
+    window = rasterio_windows.from_bounds(left, bottom, right, top, transform=transform)
+    window = window.round_offsets(op="floor").round_lengths(op="ceil")
+    try:
+        window = window.intersection(rasterio_windows.Window(0, 0, width, height))
+    except rasterio_windows.WindowError:
+        return None
+
+    return window if window.width > 0 and window.height > 0 else None
+
+
+def build_label_raster_fn(geometries, transform, width, height, all_touched=False, signature=None):
+    """ Rasterise the polygons once into an integer label raster over their bounding window of the grid.
+
+    @param geometries: list object containing the polygon geometries (grid crs).
+    @param transform: affine transform of the grid.
+    @param width: integer object containing the number of grid columns.
+    @param height: integer object containing the number of grid rows.
+    @param all_touched: boolean object passed to the rasterisation.
+    @param signature: tuple object containing the grid signature (stored with the label index).
+    @return label_index: dictionary object {"labels", "row_off", "col_off", "n_labels", "overlap", "signature"}.
+    """
+    n_labels = len(geometries)
+    dtype = np.uint16 if n_labels < np.iinfo(np.uint16).max else np.uint32
+    window = label_window_fn(geometries, transform, width, height)
+    label_index = {"labels": np.zeros((0, 0), dtype=dtype), "row_off": 0, "col_off": 0, "n_labels": n_labels,
+                   "overlap": 0, "signature": signature}
+    if window is None:
+        logger.warning("None of the %d polygons intersect the grid", n_labels)
+        return label_index
+
+    out_shape = (int(window.height), int(window.width))
+    window_transform = rasterio_windows.transform(window, transform)
+    shapes = [(g, i + 1) for i, g in enumerate(geometries) if g is not None and not g.is_empty]
+    labels = rasterio_features.rasterize(shapes, out_shape=out_shape, transform=window_transform, fill=0,
+                                         all_touched=all_touched, dtype=dtype)
+
+    cover = rasterio_features.rasterize(((g, 1) for g, _ in shapes), out_shape=out_shape, transform=window_transform,
+                                        fill=0, all_touched=all_touched, merge_alg=rasterio_enums.MergeAlg.add,
+                                        dtype=np.uint16)
+    overlap = int(np.count_nonzero(cover > 1))
+    if overlap:
+        logger.warning("%d pixels fall in more than one polygon and are labelled with the last polygon", overlap)
+
+    label_index.update({"labels": labels, "row_off": int(window.row_off), "col_off": int(window.col_off),
+                        "overlap": overlap})
+    logger.debug("label raster: %d polygons, %d x %d window at row %d col %d", n_labels, out_shape[0], out_shape[1],
+                 label_index["row_off"], label_index["col_off"])
+
+    return label_index
+
+
+def label_key_fn(shape_path, id_field, signature, all_touched):
+    """ Return the label raster cache key (hash of the polygon file key, id field, grid signature and all_touched). """
+    key = json.dumps([os.path.abspath(shape_path), raster_metadata.file_key_fn(shape_path), id_field,
+                      list(signature), all_touched], default=list)
+
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def load_label_raster_fn(label_dir, key, signature):
+    """ Load a label raster saved by save_label_raster_fn (memory mapped), None when it is not in label_dir. """
+    base = os.path.join(label_dir, key)
+    if not (os.path.isfile(base + ".npy") and os.path.isfile(base + ".json")):
+        return None
+
+    try:
+        with open(base + ".json", "r") as meta_file:
+            label_index = json.load(meta_file)
+        label_index["labels"] = np.load(base + ".npy", mmap_mode="r")
+    except (ValueError, OSError):
+        logger.warning("The cached label raster could not be read and will be rebuilt: %s", base)
+        return None
+
+    label_index["signature"] = signature
+
+    return label_index
+
+
+def save_label_raster_fn(label_index, label_dir, key):
+    """ Save a label raster to label_dir (temporary files + rename). """
+    if not os.path.isdir(label_dir):
+        os.makedirs(label_dir)
+
+    base = os.path.join(label_dir, key)
+    np.save(base + ".tmp.npy", label_index["labels"])
+    with open(base + ".tmp.json", "w") as output:
+        json.dump(dict((k, label_index[k]) for k in ("row_off", "col_off", "n_labels", "overlap")), output)
+    os.replace(base + ".tmp.npy", base + ".npy")
+    os.replace(base + ".tmp.json", base + ".json")
+
+
+def label_index_fn(srci, shape_path, id_field, name_field, label_cache, all_touched=False, label_dir=None):
+    """ Return the label raster of the polygons for the grid of an open raster (kept in label_cache per grid).
+
+    @param srci: open rasterio dataset.
+    @param shape_path: string object containing the path to the polygon shapefile.
+    @param id_field: string object containing the polygon id attribute.
+    @param name_field: string object containing the polygon name attribute (None to use the id).
+    @param label_cache: dictionary object reused across the images of a run (polygons and a label raster per grid).
+    @param all_touched: boolean object passed to the rasterisation.
+    @param label_dir: string object containing the label raster cache directory (None for no cache directory).
+    @return label_index: dictionary object returned by build_label_raster_fn (with the polygon "uid" and "name").
+    """
+    polygons = label_cache.get("polygons")
+    if polygons is None:
+        polygons = read_polygons_fn(shape_path, id_field, name_field)
+        label_cache["polygons"] = polygons
+
+    signature = zonal_engine.grid_signature_fn(srci)
+    key = ("label", signature, all_touched)
+    label_index = label_cache.get(key)
+    run_metrics.cache_fn("label_raster", label_index is not None)
+    if label_index is not None:
+        return label_index
+
+    disk_key = label_key_fn(shape_path, id_field, signature, all_touched) if label_dir else None
+    label_index = load_label_raster_fn(label_dir, disk_key, signature) if label_dir else None
+    if label_index is None:
+        geometries = geometry_provider.zone_geometries_fn(polygons, srci.crs, srci.name)
+        label_index = build_label_raster_fn(geometries, srci.transform, srci.width, srci.height,
+                                            all_touched=all_touched, signature=signature)
+        if label_dir:
+            save_label_raster_fn(label_index, label_dir, disk_key)
+
+    labels = label_index["labels"]
+    label_index.update({"uid": polygons["uid"], "name": polygons["site"],
+                        "rows": labels.any(axis=1) if labels.size else np.zeros(0, dtype=bool)})
+    label_cache[key] = label_index
+    logger.info("%d polygons rasterised to a %d x %d label raster", label_index["n_labels"], labels.shape[0],
+                labels.shape[1])
+
+    return label_index
+
+
+def blocks_fn(srci, label_index, band=1, block_rows=1024):
+    """ Yield the (label raster row slice, raster window) of each row block of the label window holding a label.
+
+    @param srci: open rasterio dataset.
+    @param label_index: dictionary object returned by label_index_fn.
+    @param band: integer object containing the band number.
+    @param block_rows: integer object containing the rows per block (rounded to the raster block height).
+    """
+    labels = label_index["labels"]
+    height, width = labels.shape
+    tile_rows = srci.block_shapes[band - 1][0]
+    step = max(block_rows // tile_rows, 1) * tile_rows
+    rows = label_index["rows"]
+    for start in range(0, height, step):
+        stop = min(start + step, height)
+        if rows[start:stop].any():
+            yield slice(start, stop), rasterio_windows.Window(label_index["col_off"], label_index["row_off"] + start,
+                                                             width, stop - start)
+
+
+def block_values_fn(srci, label_index, rows, window, band, nodata):
+    """ Return the labels and float64 values of the valid labelled pixels of a row block. """
+    values = srci.read(band, window=window).ravel()
+    labels = np.asarray(label_index["labels"][rows]).ravel()
+    valid = labels > 0
+    if nodata is not None:
+        valid &= values != nodata
+    if np.issubdtype(values.dtype, np.floating):
+        valid &= ~np.isnan(values)
+
+    return labels[valid].astype(np.intp), values[valid].astype(np.float64)
+
+
+def value_range_fn(srci, label_index, band=1, nodata=None, block_rows=1024):
+    """ Return the (min, max) of the band for the histogram, None when no labelled pixel is valid.
+
+    The exact statistics stored with the band are used when present, otherwise the labelled pixels are read once.
+    """
+    tags = srci.tags(band)
+    lo = raster_metadata.stat_tag_fn(tags, "STATISTICS_MINIMUM")
+    hi = raster_metadata.stat_tag_fn(tags, "STATISTICS_MAXIMUM")
+    if lo is not None and hi is not None and tags.get("STATISTICS_APPROXIMATE", "NO").upper() != "YES":
+        return lo, hi
+
+    lo, hi = np.inf, -np.inf
+    for rows, window in blocks_fn(srci, label_index, band, block_rows):
+        _, values = block_values_fn(srci, label_index, rows, window, band, nodata)
+        if values.size:
+            lo, hi = min(lo, values.min()), max(hi, values.max())
+
+    return (float(lo), float(hi)) if lo <= hi else None
+
+
+def histogram_bins_fn(value_range, dtype, bins=1024):
+    """ Return the histogram (lower edge, bin width, number of bins, exact) for a value range and band dtype. """
+    lo, hi = value_range
+    if np.issubdtype(np.dtype(dtype), np.integer) and hi - lo + 1 <= exact_bins:
+        return np.floor(lo), 1.0, int(np.floor(hi) - np.floor(lo)) + 1, True
+
+    return lo, ((hi - lo) / bins) or 1.0, bins, False
+
+
+def merge_cells_fn(parts):
+    """ Return the (cells, counts) of a list of (cells, counts) histogram parts, the cells sorted and unique. """
+    cells, inverse = np.unique(np.concatenate([part[0] for part in parts]), return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=np.concatenate([part[1] for part in parts]))
+
+    return cells, counts.astype(np.int64)
+
+
+def sparse_histogram_fn(parts, n_bins, count):
+    """ Return the sparse histogram of the polygons from the occupied cell counts (cell = label x n_bins + bin).
+
+    @param parts: list object containing the (cells, counts) of the blocks.
+    @param n_bins: integer object containing the number of bins per polygon.
+    @param count: numpy array containing the valid pixels of every label.
+    @return histogram: dictionary object {"bins", "counts", "cum" (per occupied cell, in label then bin order),
+    "base" (the cumulative count before each label), "count"}.
+    """
+    cells, counts = merge_cells_fn(parts)
+
+    return {"bins": cells % n_bins, "counts": counts, "cum": np.cumsum(counts),
+            "base": np.cumsum(count) - count, "count": count}
+
+
+def order_value_fn(histogram, rank, lo, width, exact, vmin, vmax):
+    """ Return the value of the rank-th (0 based) sorted pixel of every polygon from the sparse histogram. """
+    rank = np.minimum(rank, np.maximum(histogram["count"] - 1, 0))
+    # the first occupied cell of the polygon holding more than rank pixels of the polygon.
+    cell = np.searchsorted(histogram["cum"], histogram["base"] + rank, side="right")
+    cell = np.minimum(cell, histogram["cum"].size - 1)
+    b = histogram["bins"][cell]
+    if exact:
+        return lo + b
+
+    in_bin = histogram["counts"][cell]
+    before = histogram["cum"][cell] - in_bin - histogram["base"]
+    value = lo + (b + (rank - before + 0.5) / in_bin) * width
+
+    return np.clip(value, vmin, vmax)
+
+
+def label_stats_fn(srci, label_index, band=1, nodata=None, stats=None, block_rows=1024, bins=1024):
+    """ Compute the statistics of every polygon with one bincount pass over the row blocks of the label window.
+
+    @param srci: open rasterio dataset.
+    @param label_index: dictionary object returned by label_index_fn.
+    @param band: integer object containing the band number.
+    @param nodata: no data value (None if the raster has no no data value).
+    @param stats: list object containing the statistics (rasterstats names) - default zonal_engine.stats_list.
+    @param block_rows: integer object containing the rows read per block.
+    @param bins: integer object containing the number of histogram bins of non integer data.
+    @return label_stats: list object containing a statistics dictionary per polygon (polygon order).
+    """
+    stats = zonal_engine.stats_list if stats is None else stats
+    order_stats = [s for s in stats if s == "median" or s.startswith("percentile_")]
+    n = label_index["n_labels"] + 1
+
+    count = np.zeros(n, dtype=np.int64)
+    vsum = np.zeros(n)
+    vsq = np.zeros(n)
+    vmin = np.full(n, np.inf)
+    vmax = np.full(n, -np.inf)
+    parts = None
+    if order_stats:
+        value_range = value_range_fn(srci, label_index, band, nodata, block_rows)
+        if value_range is not None:
+            lo, width, n_bins, exact = histogram_bins_fn(value_range, srci.dtypes[band - 1], bins)
+            parts = []
+            occupied = pending = 0
+            logger.debug("%s band %d: %d %s histogram bins of width %g", srci.name, band, n_bins,
+                         "exact" if exact else "binned", width)
+
+    # sums about a shift (the mean of the first block) keep the sum of squares well conditioned.
+    shift = None
+    for rows, window in blocks_fn(srci, label_index, band, block_rows):
+        labels, values = block_values_fn(srci, label_index, rows, window, band, nodata)
+        if not labels.size:
+            continue
+        if shift is None:
+            shift = values.mean()
+        deviation = values - shift
+        count += np.bincount(labels, minlength=n)
+        vsum += np.bincount(labels, weights=deviation, minlength=n)
+        vsq += np.bincount(labels, weights=deviation * deviation, minlength=n)
+        np.minimum.at(vmin, labels, values)
+        np.maximum.at(vmax, labels, values)
+        if parts is not None:
+            b = np.clip(np.floor((values - lo) / width), 0, n_bins - 1).astype(np.int64)
+            parts.append(np.unique(labels.astype(np.int64) * n_bins + b, return_counts=True))
+            pending += parts[-1][0].size
+            # the parts are merged once they outgrow the merged cells (each cell is merged a few times at most).
+            if pending > max(occupied, 1 << 20):
+                parts = [merge_cells_fn(parts)]
+                occupied, pending = parts[0][0].size, 0
+
+    shift = 0.0 if shift is None else shift
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_deviation = vsum / count
+        mean = shift + mean_deviation
+        std = np.sqrt(np.maximum(vsq / count - mean_deviation ** 2, 0.0))
+    total = vsum + shift * count
+
+    order_values = {}
+    if parts:
+        histogram = sparse_histogram_fn(parts, n_bins, count)
+        for stat in order_stats:
+            q = 50.0 if stat == "median" else float(stat.split("_", 1)[1])
+            # np.percentile 'linear': interpolate between the sorted pixels either side of q (n - 1) / 100.
+            position = q / 100.0 * np.maximum(count - 1, 0)
+            rank = np.floor(position).astype(np.int64)
+            lower = order_value_fn(histogram, rank, lo, width, exact, vmin, vmax)
+            upper = order_value_fn(histogram, rank + 1, lo, width, exact, vmin, vmax)
+            order_values[stat] = lower + (position - rank) * (upper - lower)
+
+    base_stats = [s for s in stats if s not in order_stats]
+    label_stats = []
+    for label in range(1, n):
+        feature_stats = zonal_engine.feature_stats_fn(base_stats, count[label], vmin[label], vmax[label],
+                                                      mean[label], total[label], std[label])
+        for stat in order_stats:
+            feature_stats[stat] = float(order_values[stat][label]) if count[label] and order_values else None
+        label_stats.append(feature_stats)
+
+    return label_stats
+
+
+def image_stats_fn(image_s, shape_path, id_field, name_field, label_cache, band=1, default_nodata=None, stats=None,
+                   all_touched=False, label_dir=None, block_rows=1024, bins=1024):
+    """ Return the rows (one per polygon) of the polygon statistics of an image.
+
+    @param image_s: string object containing the image path.
+    @return rows: list object containing a dictionary per polygon (id, name, im_name, band and the statistics).
+    """
+    stats = zonal_engine.stats_list if stats is None else stats
+    with rasterio.open(raster_mirror.local_path_fn(image_s)) as srci:
+        label_index = label_index_fn(srci, shape_path, id_field, name_field, label_cache, all_touched, label_dir)
+        nodata = srci.nodatavals[band - 1]
+        nodata = default_nodata if nodata is None else nodata
+        label_stats = label_stats_fn(srci, label_index, band, nodata, stats, block_rows, bins)
+
+    im_name = os.path.splitext(os.path.basename(image_s))[0]
+    rows = []
+    for uid, name, feature_stats in zip(label_index["uid"], label_index["name"], label_stats):
+        row = {"uid": uid, "name": name, "im_name": im_name, "band": band}
+        row.update(feature_stats)
+        rows.append(row)
+
+    return rows
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description="Compute the zonal statistics of large polygons (properties, paddocks) from a label raster.")
+
+    p.add_argument('--polygons', help="The path to the polygon shapefile (i.e. the Pastoral Estate).", required=True)
+
+    p.add_argument('--id_field', default="PROP_TAG", help="Enter the polygon id attribute (default PROP_TAG)")
+
+    p.add_argument('--name_field', default="PROPERTY", help="Enter the polygon name attribute ('none' for the id)")
+
+    p.add_argument('--images', nargs="+", required=True,
+                   help="The image list csv file(s) (one image path per line, i.e. the step1_2 lists).")
+
+    p.add_argument('--output', help="The path of the output csv file.", required=True)
+
+    p.add_argument('--band', type=int, default=1, help="Enter the band number (default 1)")
+
+    p.add_argument('--stats', default=",".join(zonal_engine.stats_list),
+                   help="Enter the comma separated statistics (default the zonal_engine statistics)")
+
+    p.add_argument('-n', '--no_data', type=float, default=None,
+                   help="Enter the no data value used when a file does not define one")
+
+    p.add_argument('--all_touched', action='store_true',
+                   help="Label every pixel touched by a polygon (default the pixel centres within the polygon)")
+
+    p.add_argument('--bins', type=int, default=1024,
+                   help="Enter the histogram bins of non integer data (percentiles within one bin width)")
+
+    p.add_argument('--block_rows', type=int, default=1024, help="Enter the rows read per block (default 1024)")
+
+    p.add_argument('--label_dir', default=None,
+                   help="The directory the label rasters are kept in between runs (default no cache directory)")
+
+    p.add_argument('--mirror', default=None,
+                   help="The local raster mirror directory (raster_mirror, default read the source images)")
+
+    p.add_argument('-l', '--log_file', help="The path of an optional log file (written in addition to the console)",
+                   default=None)
+
+    pipeline_logging.add_logging_args_fn(p)
+
+    return p.parse_args()
+
+
+def main_routine():
+    """ Compute the polygon statistics of every listed image and write them to one csv file. """
+    cmd_args = get_cmd_args_fn()
+    pipeline_logging.setup_logging_fn(cmd_args.quiet, cmd_args.verbose, cmd_args.log_file)
+    if cmd_args.mirror:
+        raster_mirror.configure_fn(cmd_args.mirror)
+
+    name_field = None if cmd_args.name_field.lower() == "none" else cmd_args.name_field
+    stats = [s.strip() for s in cmd_args.stats.split(",") if s.strip()]
+    images = []
+    for list_path in cmd_args.images:
+        with open(list_path, "r") as imagery_list:
+            images.extend(image.rstrip() for image in imagery_list if image.strip())
+
+    label_cache = {}
+    rows = []
+    for image_s in images:
+        rows.extend(image_stats_fn(image_s, cmd_args.polygons, cmd_args.id_field, name_field, label_cache,
+                                   cmd_args.band, cmd_args.no_data, stats, cmd_args.all_touched, cmd_args.label_dir,
+                                   cmd_args.block_rows, cmd_args.bins))
+
+    columns = ["uid", "name", "im_name", "band"] + stats
+    output_df = pd.DataFrame(rows, columns=columns)
+    output_df.rename(columns={"uid": cmd_args.id_field, "name": name_field or "name"}, inplace=True)
+    output_df.to_csv(cmd_args.output, index=False)
+    n_polygons = len(label_cache["polygons"]["uid"]) if "polygons" in label_cache else 0
+    logger.info("%d images x %d polygons written to %s", len(images), n_polygons, cmd_args.output)
+    raster_mirror.save_fn()
+
+
+if __name__ == "__main__":
+    main_routine()
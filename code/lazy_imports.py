@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""
+lazy_imports.py
+===============
+
+Description: This script provides lazy loaders for the heavy (GDAL stack) modules - numpy, pandas, geopandas, fiona,
+rasterio and rasterstats. A lazy module is a placeholder that only imports the real module on first attribute access,
+so that the pipeline scripts can be imported (and --help, argument errors and --plan returned) without loading GDAL;
+the import cost is paid when extraction starts.
+
+    rasterio = lazy_imports.lazy_module_fn("rasterio")
+    ...
+    with rasterio.open(image_s) as srci:    # rasterio is imported here
+
+Sub-modules must be requested by their full name (i.e. lazy_module_fn("rasterio.features")).
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import sys
+import types
+import importlib
+import warnings
+
+warnings.filterwarnings("ignore")
+
+heavy_module_list = ["numpy", "pandas", "geopandas", "shapely", "fiona", "rasterio", "rasterstats", "pyproj",
+                     "osgeo"]
+
+
+class LazyModule(types.ModuleType):
+    """ Module placeholder that imports the named module on first attribute access. """
+
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+        self.__dict__["_lazy_name"] = name
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            module = importlib.import_module(self.__dict__["_lazy_name"])
+            self.__dict__["_lazy_module"] = module
+
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return "<lazy module '{0}' ({1})>".format(self.__dict__["_lazy_name"], state)
+
+
+def lazy_module_fn(name):
+    """ Return the module if it has already been imported, otherwise a lazy placeholder.
+
+    @param name: string object containing the full module name (i.e. 'rasterio.features').
+    @return module: module or LazyModule object.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    return LazyModule(name)
+
+
+def loaded_heavy_modules_fn():
+    """ Return the heavy modules that have been imported (used to confirm --plan did not load the GDAL stack).
+
+    @return loaded: list object containing the imported heavy module names.
+    """
+    return [name for name in heavy_module_list if name in sys.modules]
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+"""
+multi_scale.py
+==============
+
+Description: This script computes the zonal statistics of several nested neighbourhoods of every site from a single
+raster read, so that a sensitivity analysis over the zone size (1 ha plot, 25 ha, 1 km and 5 km) does not need a run
+per size.
+
+1. scale_geometries_fn derives the zones of each scale: the first scale is the 1ha zone itself (the step1_3 50 m square
+buffer) and every larger scale is a square of the scale_dict half width around the zone centre (buffered in the zone
+crs when it is projected, otherwise in Australian Albers EPSG:3577). The zones of each scale are reprojected to the
+raster crs once per crs (geometry_provider).
+
+2. build_nested_index_fn resolves the footprints of every scale on a grid once and stores them as rings: the pixels of
+a scale that are not in the next smaller scale (a scale footprint is made to include the inner scales, so the
+footprints are nested). The rings of a zone are stored one after the other, so the footprint of scale k is the first
+k + 1 rings, and zones whose rings are identical share them (neighbouring sites within one SILO cell).
+    offsets      - int64 flat pixel indices of the rings (concatenated).
+    ring_starts  - int64 start of each ring (footprint x scale order, length n_footprints * n_scales + 1).
+    zone_fp      - int32 footprint id of each zone.
+
+3. nested_stats_fn gathers the pixels of every ring once per image, reduces each ring (count, sum, min, max, sum of
+squares) and accumulates the rings over the scales, so the statistics of every scale come from one gather; the median
+and percentiles are computed on the leading rings of each scale. The results match zonal_engine.zone_stats_fn run
+with the zones of each scale.
+
+The statistics of each scale are returned per zone as {scale: statistics}, written by step1_8 as a column family per
+scale (i.e. mean, mean_25ha, mean_1km, mean_5km).
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import warnings
+import lazy_imports
+import run_metrics
+import zonal_engine
+import pipeline_logging
+import geometry_provider
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("scales")
+
+np = lazy_imports.lazy_module_fn("numpy")
+pyproj = lazy_imports.lazy_module_fn("pyproj")
+shapely_ops = lazy_imports.lazy_module_fn("shapely.ops")
+
+# square half width (metres) of each scale - 1ha is the step1_3 zone itself.
+scale_dict = {"1ha": 50.0,
+              "25ha": 250.0,
+              "1km": 500.0,
+              "5km": 2500.0,
+              }
+
+# crs the larger scales are buffered in when the zone crs is geographic.
+buffer_crs = "EPSG:3577"
+
+
+def scales_fn(scales):
+    """ Validate a comma separated scale list (i.e. '25ha,1km,5km' or 'none').
+
+    @param scales: string object containing the scale_dict keys.
+    @return scale_list: list object containing the scales from the smallest ('1ha' first), empty for none.
+    """
+    if scales is None or scales.strip().lower() in ("", "none"):
+        return []
+
+    scale_list = [s.strip() for s in scales.split(",") if s.strip()]
+    unknown = [s for s in scale_list if s not in scale_dict]
+    if unknown:
+        raise ValueError("unknown scales {0} (select from {1})".format(", ".join(unknown), ", ".join(scale_dict)))
+
+    return ["1ha"] + sorted(set(scale_list) - {"1ha"}, key=scale_dict.get)
+
+
+def scale_geometries_fn(zones, scales):
+    """ Return the zones of each scale (geometry_provider.read_zones_fn format), memoised in zones["scales"].
+
+    @param zones: dictionary object returned by geometry_provider.read_zones_fn.
+    @param scales: list object returned by scales_fn.
+    @return scale_zones: dictionary object {scale: zones}.
+    """
+    scale_zones = zones.setdefault("scales", {"1ha": zones})
+    missing = [s for s in scales if s not in scale_zones]
+    if not missing:
+        return scale_zones
+
+    zone_crs = pyproj.CRS.from_wkt(zones["crs_wkt"])
+    if zone_crs.is_projected:
+        buffer_wkt = zones["crs_wkt"]
+        centres = [g.centroid if g is not None else None for g in zones["geometries"]]
+    else:
+        buffer_wkt = pyproj.CRS.from_user_input(buffer_crs).to_wkt()
+        transform = geometry_provider.transformer_fn(zones["crs_wkt"], buffer_wkt).transform
+        centres = [shapely_ops.transform(transform, g).centroid if g is not None else None
+                   for g in zones["geometries"]]
+
+    for scale in missing:
+        geometries = [c.buffer(scale_dict[scale], cap_style=3) if c is not None else None for c in centres]
+        scale_zones[scale] = {"geometries": geometries, "uid": zones["uid"], "site": zones["site"],
+                              "crs_wkt": buffer_wkt, "projected": {}}
+
+    return scale_zones
+
+
+def build_nested_index_fn(scale_geometries, uids, sites, transform, width, height, all_touched=True,
+                          signature=None):
+    """ Resolve the nested footprints of every zone on a grid as rings and group the zones that share them.
+
+    @param scale_geometries: list object containing the zone geometries of each scale (smallest first, grid crs).
+    @param uids: list object containing the uid of each zone.
+    @param sites: list object containing the site_name of each zone.
+    @param transform: affine transform of the grid.
+    @param width: integer object containing the number of grid columns.
+    @param height: integer object containing the number of grid rows.
+    @param all_touched: boolean object passed to the rasterisation.
+    @param signature: tuple object containing the grid signature (stored with the index).
+    @return nested_index: dictionary object (see the module description).
+    """
+    n_scales = len(scale_geometries)
+    n_zones = len(uids)
+    footprint_dict = {}
+    footprint_list = []
+    zone_fp = np.zeros(n_zones, dtype=np.int32)
+    for z in range(n_zones):
+        rings = []
+        inner = np.zeros(0, dtype=np.int64)
+        for geometries in scale_geometries:
+            indices = zonal_engine.zone_footprint_fn(geometries[z], transform, width, height, all_touched)
+            rings.append(np.setdiff1d(indices, inner, assume_unique=True))
+            inner = np.union1d(inner, indices)
+
+        key = b"|".join(ring.tobytes() for ring in rings)
+        fp = footprint_dict.get(key)
+        if fp is None:
+            fp = len(footprint_list)
+            footprint_dict[key] = fp
+            footprint_list.append(rings)
+        zone_fp[z] = fp
+
+    ring_list = [ring for rings in footprint_list for ring in rings]
+    ring_starts = np.zeros(len(ring_list) + 1, dtype=np.int64)
+    ring_starts[1:] = np.cumsum([ring.size for ring in ring_list])
+    offsets = np.concatenate(ring_list).astype(np.int64) if ring_list else np.zeros(0, dtype=np.int64)
+
+    nested_index = {"offsets": offsets, "ring_starts": ring_starts, "zone_fp": zone_fp, "uid": np.asarray(uids),
+                    "site": np.asarray(sites), "n_zones": n_zones, "n_footprints": len(footprint_list),
+                    "n_scales": n_scales, "width": width, "height": height, "signature": signature}
+    logger.debug("nested index: %d zones x %d scales resolved to %d unique footprints (%d pixels)", n_zones,
+                 n_scales, len(footprint_list), offsets.size)
+
+    return nested_index
+
+
+def nested_index_fn(srci, shape_path, uid, zone_cache, scales, all_touched=True):
+    """ Return the nested index of the scales for the grid of an open raster (kept in zone_cache per grid).
+
+    @param srci: open rasterio dataset.
+    @param shape_path: string object containing the path to the 1ha site shapefile.
+    @param uid: ODK 1ha dataframe feature (unique numeric identifier)
+    @param zone_cache: dictionary object reused across the images of a run (geometry_provider zones).
+    @param scales: list object returned by scales_fn.
+    @param all_touched: boolean object passed to the rasterisation.
+    @return nested_index: dictionary object returned by build_nested_index_fn.
+    """
+    zones = geometry_provider.zones_fn(shape_path, uid, zone_cache)
+
+    signature = zonal_engine.grid_signature_fn(srci)
+    key = ("nested", signature, tuple(scales))
+    nested_index = zone_cache.get(key)
+    run_metrics.cache_fn("zone_index", nested_index is not None)
+    if nested_index is None:
+        scale_zones = scale_geometries_fn(zones, scales)
+        scale_geometries = [geometry_provider.zone_geometries_fn(scale_zones[s], srci.crs, srci.name) for s in scales]
+        nested_index = build_nested_index_fn(scale_geometries, zones["uid"], zones["site"], srci.transform,
+                                             srci.width, srci.height, all_touched=all_touched, signature=signature)
+        nested_index["scales"] = list(scales)
+        zone_cache[key] = nested_index
+        logger.info("%d zones x %d scales (%s) resolved to %d unique footprints", nested_index["n_zones"],
+                    len(scales), ", ".join(scales), nested_index["n_footprints"])
+
+    return nested_index
+
+
+def nested_stats_fn(array, nested_index, nodata, stats=None):
+    """ Compute the statistics of every scale from one gather of the ring pixels and fan them out to every zone.
+
+    @param array: 2D numpy array containing the raster band.
+    @param nested_index: dictionary object returned by nested_index_fn.
+    @param nodata: no data value (None if the raster has no no data value).
+    @param stats: list object containing the statistics (rasterstats names) - default zonal_engine.stats_list.
+    @return zs: list object containing a {scale: statistics dictionary} per zone (zone order, read only).
+    """
+    stats = zonal_engine.stats_list if stats is None else stats
+    n_fp, n_scales = nested_index["n_footprints"], nested_index["n_scales"]
+    if n_fp == 0:
+        return []
+
+    ring_starts = nested_index["ring_starts"]
+    values = array.ravel()[nested_index["offsets"]]
+    valid = np.ones(values.size, dtype=bool)
+    if nodata is not None:
+        valid &= values != nodata
+    if np.issubdtype(values.dtype, np.floating):
+        valid &= ~np.isnan(values)
+
+    # each ring reduced once (empty rings excluded from reduceat), then accumulated over the scales.
+    lengths = np.diff(ring_starts)
+    non_empty = lengths > 0
+    seg_starts = ring_starts[:-1][non_empty]
+    values_f = np.where(valid, values.astype(np.float64), 0.0)
+    n_rings = n_fp * n_scales
+
+    count = np.zeros(n_rings, dtype=np.int64)
+    vsum = np.zeros(n_rings)
+    vmin = np.full(n_rings, np.inf)
+    vmax = np.full(n_rings, -np.inf)
+    if seg_starts.size:
+        count[non_empty] = np.add.reduceat(valid.astype(np.int64), seg_starts)
+        vsum[non_empty] = np.add.reduceat(values_f, seg_starts)
+        vmin[non_empty] = np.minimum.reduceat(np.where(valid, values_f, np.inf), seg_starts)
+        vmax[non_empty] = np.maximum.reduceat(np.where(valid, values_f, -np.inf), seg_starts)
+    count = count.reshape(n_fp, n_scales).cumsum(axis=1)
+    vsum = vsum.reshape(n_fp, n_scales).cumsum(axis=1)
+    vmin = np.minimum.accumulate(vmin.reshape(n_fp, n_scales), axis=1)
+    vmax = np.maximum.accumulate(vmax.reshape(n_fp, n_scales), axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = vsum / count
+        std = np.zeros((n_fp, n_scales))
+        if "std" in stats and seg_starts.size:
+            # sums of squares about the mean of the largest scale (shift), corrected to the mean of each scale.
+            shift = np.nan_to_num(mean[:, -1])
+            deviation = np.where(valid, values_f - np.repeat(np.repeat(shift, n_scales), lengths), 0.0)
+            vsq = np.zeros(n_rings)
+            vsq[non_empty] = np.add.reduceat(deviation * deviation, seg_starts)
+            vsq = vsq.reshape(n_fp, n_scales).cumsum(axis=1)
+            std = np.sqrt(np.maximum(vsq / count - (mean - shift[:, None]) ** 2, 0.0))
+
+    order_stats = [s for s in stats if s == "median" or s.startswith("percentile_")]
+    scales = nested_index.get("scales") or list(range(n_scales))
+    fp_stats = []
+    for fp in range(n_fp):
+        scale_stats = {}
+        for k, scale in enumerate(scales):
+            compressed = None
+            if order_stats and count[fp, k]:
+                segment = slice(ring_starts[fp * n_scales], ring_starts[fp * n_scales + k + 1])
+                compressed = values[segment][valid[segment]]
+            scale_stats[scale] = zonal_engine.feature_stats_fn(stats, count[fp, k], vmin[fp, k], vmax[fp, k],
+                                                               mean[fp, k], vsum[fp, k], std[fp, k], compressed)
+        fp_stats.append(scale_stats)
+
+    return [fp_stats[fp] for fp in nested_index["zone_fp"]]
+
+
+def empty_stats_fn(scales, stats):
+    """ Return the {scale: statistics} of a zone without valid pixels (an all no data image). """
+    empty = dict((stat, 0 if stat == "count" else None) for stat in stats)
+
+    return dict((scale, empty) for scale in scales)
+
+
+def column_names_fn(scales, stats):
+    """ Return the output columns of the scales after the first ({stat}_{scale}, one column family per scale). """
+    return ["{0}_{1}".format(stat, scale) for scale in scales[1:] for stat in stats]
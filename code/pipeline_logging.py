@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""
+pipeline_logging.py
+===================
+
+Description: This script provides the levelled logging used by the pipeline scripts in place of print statements.
+
+1. setup_logging_fn configures the root pipeline logger ('zonal') from the --quiet / --verbose command arguments:
+    --quiet     WARNING and above.
+    (default)   INFO and above - stage summaries.
+    --verbose   DEBUG and above - per image, per zone and DataFrame payloads.
+
+2. get_logger_fn returns a per stage logger (i.e. 'zonal.step1_8') so the level of a single stage can be changed.
+
+3. RateLimitedSummary accumulates per zone / per image counts on the hot path and emits a single INFO summary at most
+once every interval seconds, in place of the per zone console dumps.
+
+Debug payloads must be passed as logger arguments (logger.debug('Results: %s', result)) so they are only formatted when
+the DEBUG level is enabled; expensive payloads (i.e. building a DataFrame to display) are guarded with
+logger.isEnabledFor(logging.DEBUG).
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import sys
+import time
+import logging
+import warnings
+
+warnings.filterwarnings("ignore")
+
+root_name = "zonal"
+
+
+def add_logging_args_fn(p):
+    """ Add the mutually exclusive --quiet / --verbose command arguments to an argparse parser.
+
+    @param p: argparse.ArgumentParser object.
+    """
+    group = p.add_mutually_exclusive_group()
+    group.add_argument('-q', '--quiet', action='store_true', help='Only output warnings and errors.')
+    group.add_argument('-v', '--verbose', action='store_true',
+                       help='Output debug information (per image and per zone results).')
+
+
+def setup_logging_fn(quiet=False, verbose=False, log_file=None):
+    """ Configure the pipeline logger level and handlers.
+
+    @param quiet: boolean object, if True only warnings and errors are output.
+    @param verbose: boolean object, if True debug messages are output.
+    @param log_file: string object containing an optional log file path (written in addition to stdout).
+    @return logger: logging.Logger object for the pipeline root ('zonal').
+    """
+    if quiet:
+        level = logging.WARNING
+    elif verbose:
+        level = logging.DEBUG
+    else:
+        level = logging.INFO
+
+    logger = logging.getLogger(root_name)
+    logger.setLevel(level)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    formatter = logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S")
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+    logger.addHandler(stream_handler)
+
+    if log_file:
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setFormatter(formatter)
+        logger.addHandler(file_handler)
+
+    return logger
+
+
+def get_logger_fn(stage):
+    """ Return the logger for a pipeline stage (i.e. 'step1_8' -> 'zonal.step1_8').
+
+    @param stage: string object containing the stage name.
+    @return logger: logging.Logger object.
+    """
+    return logging.getLogger("{0}.{1}".format(root_name, stage))
+
+
+class RateLimitedSummary(object):
+    """ Accumulate hot path counts and log a single summary at most once every interval seconds.
+
+    @param logger: logging.Logger object the summary is written to.
+    @param label: string object prefixed to each summary (i.e. 'tile 098075').
+    @param interval: float object containing the minimum number of seconds between summaries.
+    @param level: integer object containing the logging level of the summary (default INFO).
+    """
+
+    def __init__(self, logger, label, interval=30.0, level=logging.INFO):
+        self.logger = logger
+        self.label = label
+        self.interval = interval
+        self.level = level
+        self.counts = {}
+        self.start = time.time()
+        self.next_emit = self.start + interval
+
+    def add(self, **counts):
+        """ Add to the named counters (i.e. add(images=1, zones=250)) and emit a summary when due. """
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+        if time.time() >= self.next_emit:
+            self.emit()
+
+    def emit(self):
+        """ Log the running totals. """
+        if self.logger.isEnabledFor(self.level):
+            elapsed = time.time() - self.start
+            totals = ", ".join("{0} {1}".format(v, k) for k, v in sorted(self.counts.items()))
+            self.logger.log(self.level, "%s: %s (%.0f s)", self.label, totals, elapsed)
+
+        self.next_emit = time.time() + self.interval
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""
+preflight_check.py
+==================
+
+Description: This script checks the image catalog before extraction starts by opening only the raster headers (no
+pixels are read), in parallel, so that missing months and corrupt rasters are found in minutes rather than after hours
+of extraction. The headers are read through raster_metadata, which keeps the metadata table used by the extraction
+(no data values and stored statistics) - the headers are read once per file.
+
+Each product directory is checked for:
+    unreadable - the raster header can not be opened.
+    grid - the grid signature (crs, transform, width, height) differs from the directory majority.
+    dtype / nodata - the data type or no data value differs from the directory majority.
+    duplicate - more than one image has the same date (the first image in path order is kept).
+    gap - months are missing between the first and last date (series products only).
+    image_count - fewer valid images than --image_count (series products only).
+
+The checks are returned as a report; step1_1 either excludes the offending images and directories (--preflight
+exclude, the default) or fails before any extraction on any issue (--preflight fail). unreadable, grid, dtype, nodata
+and duplicate images are excluded; directories with an image_count issue are excluded; gaps are reported only.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import json
+import collections
+import warnings
+import image_catalog
+import raster_metadata
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("preflight")
+
+# products holding a continuous monthly series (checked for gaps and the minimum image count).
+series_product_list = ["cor"]
+
+# issue types that exclude the image (the remaining types are reported only, or exclude the directory).
+exclude_issue_list = ["unreadable", "grid", "dtype", "nodata", "duplicate"]
+
+
+def month_number_fn(date):
+    """ Return the continuous month number (year * 12 + month - 1) of a YYYYMM[DD] date string, or None. """
+    if len(date) < 6 or not date[:6].isdigit() or not 1 <= int(date[4:6]) <= 12:
+        return None
+
+    return int(date[:4]) * 12 + int(date[4:6]) - 1
+
+
+def majority_fn(headers, key):
+    """ Return the most common value of a header key (json encoded, so lists and NaN no data values compare). """
+    counts = collections.Counter(json.dumps(h[key]) for h in headers)
+
+    return counts.most_common(1)[0][0]
+
+
+def check_directory_fn(entry, header_dict, image_count):
+    """ Check the images of a catalog entry.
+
+    @param entry: dictionary object (image_catalog.catalog_fn entry).
+    @param header_dict: dictionary object {image path: header (raster_metadata.read_metadata_fn with the image)}.
+    @param image_count: integer object containing the minimum number of images of a series directory.
+    @return result: dictionary object {"in_dir", "product", "images", "valid", "issues", "excluded_images",
+        "excluded"}.
+    """
+    in_dir = entry["in_dir"]
+    issues = []
+
+    def issue_fn(issue, image=None, detail=None):
+        issues.append({"type": issue, "in_dir": in_dir, "image": image, "detail": detail})
+
+    headers = [header_dict[i] for i in entry["images"]]
+    readable = [h for h in headers if h["ok"]]
+    for h in headers:
+        if not h["ok"]:
+            issue_fn("unreadable", h["image"], h["error"])
+
+    if readable:
+        for key, issue in [("signature", "grid"), ("dtype", "dtype"), ("nodata", "nodata")]:
+            expected = majority_fn(readable, key)
+            for h in readable:
+                if json.dumps(h[key]) != expected:
+                    issue_fn(issue, h["image"], "{0} (expected {1})".format(json.dumps(h[key]), expected))
+
+    # dates in image path order (catalog_fn returns the sorted paths).
+    seen = set()
+    months = set()
+    for image in entry["images"]:
+        date = image_catalog.image_date_fn(image, entry["datesplit_s"], entry["datesplit_e"])
+        if date in seen:
+            issue_fn("duplicate", image, date)
+        seen.add(date)
+        month = month_number_fn(date)
+        if month is not None:
+            months.add(month)
+
+    excluded_images = sorted(set(i["image"] for i in issues if i["type"] in exclude_issue_list))
+    valid = len(entry["images"]) - len(excluded_images)
+    excluded = False
+
+    if entry["product"] in series_product_list:
+        if months:
+            missing = sorted(set(range(min(months), max(months) + 1)) - months)
+            if missing:
+                issue_fn("gap", detail="{0} missing months: {1}".format(
+                    len(missing), ", ".join("{0}{1:02d}".format(m // 12, m % 12 + 1) for m in missing[:24])))
+        if valid < image_count:
+            issue_fn("image_count", detail="{0} valid images (minimum {1})".format(valid, image_count))
+            excluded = True
+
+    return {"in_dir": in_dir, "product": entry["product"], "images": len(entry["images"]), "valid": valid,
+            "issues": issues, "excluded_images": excluded_images, "excluded": excluded}
+
+
+def preflight_fn(catalog, image_count, workers=8, cache_path=None):
+    """ Read every raster header in parallel (filling the raster_metadata table) and check each catalog entry.
+
+    @param catalog: list object containing the image_catalog.catalog_fn entries to be checked.
+    @param image_count: integer object containing the minimum number of images of a series directory.
+    @param workers: integer object containing the number of header reading threads.
+    @param cache_path: string object containing the path of the raster metadata cache file.
+    @return report: dictionary object {"directories", "issues", "excluded_images", "excluded_directories"}.
+    """
+    images = [i for entry in catalog for i in entry["images"]]
+    metadata = raster_metadata.build_fn(images, cache_path, workers)
+    header_dict = dict((i, dict(metadata[i], image=i)) for i in images)
+
+    directory_list = [check_directory_fn(entry, header_dict, image_count) for entry in catalog]
+    report = {"images": len(images),
+              "directories": directory_list,
+              "issues": [i for d in directory_list for i in d["issues"]],
+              "excluded_images": [i for d in directory_list for i in d["excluded_images"]],
+              "excluded_directories": [d["in_dir"] for d in directory_list if d["excluded"]]}
+
+    return report
+
+
+def main_routine(catalog, image_count, report_path, workers=8, cache_path=None):
+    """ Run the pre-flight checks, log the issues and write the json report.
+
+    @param catalog: list object containing the image_catalog.catalog_fn entries to be checked.
+    @param image_count: integer object containing the minimum number of images of a series directory.
+    @param report_path: string object containing the path of the json report.
+    @param workers: integer object containing the number of header reading threads.
+    @param cache_path: string object containing the path of the raster metadata cache file.
+    @return report: dictionary object (preflight_fn).
+    """
+    report = preflight_fn(catalog, image_count, workers, cache_path)
+
+    with open(report_path, "w") as output:
+        json.dump(report, output, indent=2)
+
+    counts = collections.Counter(i["type"] for i in report["issues"])
+    for issue in report["issues"]:
+        logger.debug("%s: %s %s %s", issue["type"], issue["in_dir"], issue["image"] or "", issue["detail"] or "")
+    for d in report["directories"]:
+        if d["issues"]:
+            logger.warning("%s: %d of %d images valid, issues: %s%s", d["in_dir"], d["valid"], d["images"],
+                           ", ".join(sorted(set(i["type"] for i in d["issues"]))),
+                           " (directory excluded)" if d["excluded"] else "")
+
+    logger.info("pre-flight: %d images in %d directories checked, %d issues (%s): %s", report["images"],
+                len(report["directories"]), len(report["issues"]),
+                ", ".join("{0} {1}".format(v, k) for k, v in sorted(counts.items())) or "none", report_path)
+
+    return report
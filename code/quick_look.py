@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+
+"""
+quick_look.py
+=============
+
+Description: This script implements the --quick mode of the extraction: an approximate pass over every site that reads
+the images at a decimated resolution (and optionally every nth date only), so that a rough picture of a run can be had
+in minutes before the full resolution run is committed to. The error of the approximation is estimated against full
+resolution on a small calibration subset of the images and reported with the results.
+
+1. quick_fn validates the quick settings:
+    factor       - the decimation factor (i.e. 4 reads one pixel per 4 x 4 block, 16 times fewer pixels).
+    every        - every nth image of each image list is extracted (sorted by the date sliced from the file name,
+                   as the image lists are not date ordered).
+    calibration  - the number of images (evenly spaced over the sampled list) also extracted at full resolution.
+    cache_dir    - the directory the decimated copies are kept in.
+
+2. open_fn opens an image at the decimated resolution:
+    overview     - the image (or its local raster mirror copy, which has internal overviews with --mirror_cog) has an
+                   overview of the factor: the overview is opened as the dataset (rasterio overview_level).
+    cache        - otherwise a decimated copy (average resampling, the no data value excluded) is written once to
+                   {cache_dir}/{source directory and no data hash}_x{factor}/{file name} (the file name is kept, so the
+                   dates and image names sliced from the path are unchanged) and reused until the source is modified.
+                   The no data value is passed by the caller (nodata) when the file does not declare one.
+The zone footprints are resolved on the decimated grid (a separate grid signature), so a zone covers fewer, larger
+pixels that take in its surroundings; a zone smaller than a decimated pixel can be left without a value where the
+extraction uses the pixel centres only (step1_9, counted as missing in the report).
+
+3. error_summary_fn compares the quick and full resolution statistics of the calibration images zone by zone (bias,
+mean, 95th percentile and maximum absolute error per statistic) and write_report_fn writes them to a quick report json
+beside the results (i.e. {out_dir}/{data_type}_quick_report.json) and logs the error bounds.
+
+The overview and cache hits and misses are published through run_metrics (cache 'quick_overview').
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import json
+import hashlib
+import warnings
+import lazy_imports
+import run_metrics
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("quick")
+
+np = lazy_imports.lazy_module_fn("numpy")
+rasterio = lazy_imports.lazy_module_fn("rasterio")
+rasterio_vrt = lazy_imports.lazy_module_fn("rasterio.vrt")
+rasterio_enums = lazy_imports.lazy_module_fn("rasterio.enums")
+
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".zonal_pipeline_quick")
+
+
+def quick_fn(factor=0, every=1, calibration=4, cache_dir=None):
+    """ Validate the quick settings.
+
+    @param factor: integer object containing the decimation factor (0 or 1 for full resolution).
+    @param every: integer object, every nth image of each image list is extracted (1 for every image).
+    @param calibration: integer object containing the number of images also extracted at full resolution.
+    @param cache_dir: string object containing the decimated copy cache directory (default default_cache_dir).
+    @return quick: dictionary object {"factor", "every", "calibration", "cache_dir"}, None when nothing is skipped.
+    """
+    factor, every, calibration = int(factor or 0), int(every or 1), int(calibration or 0)
+    if factor < 0:
+        raise ValueError("the decimation factor must be 0 (off) or greater: {0}".format(factor))
+    if every < 1:
+        raise ValueError("every must be 1 (every image) or greater: {0}".format(every))
+    if calibration < 0:
+        raise ValueError("the number of calibration images must be 0 or greater: {0}".format(calibration))
+    if factor <= 1 and every == 1:
+        return None
+
+    return {"factor": max(factor, 1), "every": every, "calibration": calibration if factor > 1 else 0,
+            "cache_dir": cache_dir or default_cache_dir}
+
+
+def date_key_fn(date_s, date_e):
+    """ Return a function slicing the date from the file name of an image path (the step1_1 date slices). """
+    return lambda image_s: image_s.rstrip().replace("\\", "/").rsplit("/", 1)[-1][date_s:date_e]
+
+
+def sample_fn(images, quick, date_fn):
+    """ Return every nth image of an image list in date order (the list unchanged when quick is None).
+
+    @param images: list object containing the image paths (in any order, i.e. os.walk order).
+    @param quick: dictionary object returned by quick_fn.
+    @param date_fn: function object returning the date string of an image path (date_key_fn).
+    @return images: list object containing the sampled image paths (date order).
+    """
+    return sorted(images, key=date_fn)[::quick["every"]] if quick else images
+
+
+def calibration_images_fn(images, count):
+    """ Return count images evenly spaced over a list (first and last included). """
+    if count <= 0 or not images:
+        return []
+    if count >= len(images):
+        return list(images)
+    if count == 1:
+        return [images[len(images) // 2]]
+
+    positions = sorted(set(int(round(i * (len(images) - 1) / (count - 1))) for i in range(count)))
+
+    return [images[p] for p in positions]
+
+
+def cache_path_fn(image_s, factor, cache_dir, nodata=None):
+    """ Return the decimated copy path of an image ({cache_dir}/{source directory and no data hash}_x{factor}/{file
+    name}), so that the copies built with another no data value are not reused. """
+    source = image_s.replace("\\", "/")
+    directory, file_name = source.rsplit("/", 1) if "/" in source else ("", source)
+    digest = hashlib.sha1("{0}|{1!r}".format(directory, nodata).encode("utf-8")).hexdigest()[:12]
+
+    return os.path.join(cache_dir, "{0}_x{1}".format(digest, factor), file_name)
+
+
+def overview_level_fn(srci, factor):
+    """ Return the overview level of an open raster with the decimation factor (all bands), None when missing. """
+    levels = [srci.overviews(band) for band in srci.indexes]
+    if levels and all(factor in overviews for overviews in levels):
+        return levels[0].index(factor)
+
+    return None
+
+
+def build_decimated_fn(image_s, out_path, factor, nodata=None):
+    """ Write a decimated copy of an image (average resampling of every band, no data excluded).
+
+    @param image_s: string object containing the image path.
+    @param out_path: string object containing the decimated copy path.
+    @param factor: integer object containing the decimation factor.
+    @param nodata: no data value used when the file does not define one (None to keep the file value).
+    """
+    out_dir = os.path.dirname(out_path)
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    with rasterio.open(image_s) as srci:
+        width = max(1, -(-srci.width // factor))
+        height = max(1, -(-srci.height // factor))
+        file_nodata = srci.nodata if srci.nodata is not None else nodata
+        profile = srci.profile.copy()
+        profile.update(driver="GTiff", width=width, height=height, nodata=file_nodata, tiled=False,
+                       transform=srci.transform * rasterio.Affine.scale(srci.width / width, srci.height / height))
+        for key in ("blockxsize", "blockysize", "compress", "photometric", "interleave"):
+            profile.pop(key, None)
+        out_shape = (srci.count, height, width)
+        if srci.nodata is None and nodata is not None:
+            # the no data value is declared on a virtual raster so the averages exclude it.
+            with rasterio_vrt.WarpedVRT(srci, src_nodata=nodata, nodata=nodata) as vrt:
+                array = vrt.read(out_shape=out_shape, resampling=rasterio_enums.Resampling.average)
+        else:
+            array = srci.read(out_shape=out_shape, resampling=rasterio_enums.Resampling.average)
+
+    temp_path = out_path + ".tmp.tif"
+    with rasterio.open(temp_path, "w", **profile) as output:
+        output.write(array)
+    os.replace(temp_path, out_path)
+
+
+def open_fn(image_s, quick=None, **kwargs):
+    """ Open an image at the quick decimation (an overview of the factor, otherwise the cached decimated copy).
+
+    @param image_s: string object containing the image path.
+    @param quick: dictionary object returned by quick_fn (None or factor 1 opens the image at full resolution).
+    @param kwargs: passed to rasterio.open (i.e. nodata).
+    @return srci: open rasterio dataset.
+    """
+    if not quick or quick["factor"] <= 1:
+        return rasterio.open(image_s, **kwargs)
+
+    factor = quick["factor"]
+    with rasterio.open(image_s) as srci:
+        level = overview_level_fn(srci, factor)
+    if level is not None:
+        run_metrics.cache_fn("quick_overview", True)
+        return rasterio.open(image_s, overview_level=level, **kwargs)
+
+    cache_path = cache_path_fn(image_s, factor, quick["cache_dir"], kwargs.get("nodata"))
+    hit = os.path.isfile(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(image_s)
+    run_metrics.cache_fn("quick_overview", hit)
+    if not hit:
+        build_decimated_fn(image_s, cache_path, factor, kwargs.get("nodata"))
+        logger.debug("decimated copy (x%d): %s", factor, cache_path)
+
+    return rasterio.open(cache_path, **kwargs)
+
+
+def error_summary_fn(quick_values, full_values):
+    """ Return the error of the quick statistics against full resolution per statistic.
+
+    @param quick_values: dictionary object {(zone, image): {statistic: value}} of the quick extraction.
+    @param full_values: dictionary object {(zone, image): {statistic: value}} of the full resolution extraction.
+    @return errors: dictionary object {statistic: {"n", "bias", "mean_abs", "p95_abs", "max_abs", "missing"}} - missing
+    counts the zone images with a full resolution value and no quick value (the zone has no valid decimated pixel).
+    """
+    differences = {}
+    missing = {}
+    for key, full_stats in full_values.items():
+        quick_stats = quick_values.get(key, {})
+        for stat, full in full_stats.items():
+            if full is None or (isinstance(full, float) and np.isnan(full)):
+                continue
+            value = quick_stats.get(stat)
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                missing[stat] = missing.get(stat, 0) + 1
+                continue
+            differences.setdefault(stat, []).append(float(value) - float(full))
+
+    errors = {}
+    for stat in sorted(set(differences) | set(missing)):
+        difference = np.asarray(differences.get(stat, []), dtype=np.float64)
+        absolute = np.abs(difference)
+        errors[stat] = {"n": int(difference.size),
+                        "bias": float(difference.mean()) if difference.size else None,
+                        "mean_abs": float(absolute.mean()) if difference.size else None,
+                        "p95_abs": float(np.percentile(absolute, 95)) if difference.size else None,
+                        "max_abs": float(absolute.max()) if difference.size else None,
+                        "missing": missing.get(stat, 0)}
+
+    return errors
+
+
+def write_report_fn(report_path, quick, images_total, images_sampled, calibration, errors):
+    """ Write the quick report json (settings, image counts and error bounds) and log the error bounds.
+
+    @param report_path: string object containing the report path.
+    @param quick: dictionary object returned by quick_fn.
+    @param images_total: integer object containing the number of images listed.
+    @param images_sampled: integer object containing the number of images extracted.
+    @param calibration: list object containing the calibration image paths.
+    @param errors: dictionary object returned by error_summary_fn.
+    """
+    report = {"factor": quick["factor"], "every": quick["every"], "images_total": images_total,
+              "images_sampled": images_sampled, "calibration_images": calibration, "errors": errors}
+    with open(report_path, "w") as output:
+        json.dump(report, output, indent=1)
+
+    logger.warning("quick look (x%d, every %d image(s), %d of %d images): approximate results", quick["factor"],
+                   quick["every"], images_sampled, images_total)
+    for stat, error in errors.items():
+        if error["n"]:
+            logger.info("quick %s error over %d zone images: bias %.4g, mean |error| %.4g, 95%% |error| %.4g, "
+                        "max |error| %.4g (%d without a quick value)", stat, error["n"], error["bias"],
+                        error["mean_abs"], error["p95_abs"], error["max_abs"], error["missing"])
+    logger.info("quick report: %s", report_path)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+"""
+raster_metadata.py
+==================
+
+Description: This script reads the raster metadata once per file (header only, no pixels) and keeps it in a metadata
+table cached on disk between runs, so that the extraction uses the no data value of each file rather than a hard coded
+value and skips images that hold no valid pixels.
+
+1. read_metadata_fn reads the metadata of band 1:
+    nodata, scale, offset, dtype, the grid signature (crs, transform, width, height) and the statistics stored in the
+    file (GDAL STATISTICS_MINIMUM / _MAXIMUM / _MEAN / _VALID_PERCENT tags, None when not stored).
+
+2. build_fn fills the metadata table for a list of images in parallel (called when the catalog is checked by
+preflight_check); metadata_fn returns the metadata of a single image (read on demand when it is not in the table).
+The table is keyed by the image path and validated against the file modification time and size, so a replaced file is
+re-read.
+
+3. nodata_fn returns the no data value used for masking (the file no data value, otherwise the variable default) and
+all_nodata_fn returns True when the stored statistics show that every pixel is no data (valid percent 0, or the
+minimum and maximum equal the no data value).
+
+The cache hits and misses are published through run_metrics (cache 'metadata').
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import json
+import math
+import warnings
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import lazy_imports
+import run_metrics
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("metadata")
+
+rasterio = lazy_imports.lazy_module_fn("rasterio")
+
+default_cache_path = os.path.join(os.path.expanduser("~"), ".zonal_pipeline_metadata.json")
+
+# metadata table {image path: metadata} and the cache file it is saved to.
+metadata_dict = {}
+cache_dict = {"path": None, "dirty": False}
+lock = threading.Lock()
+
+
+def file_key_fn(image_path):
+    """ Return the modification time and size of a file (used to validate the cached metadata). """
+    stat = os.stat(image_path)
+
+    return [stat.st_mtime, stat.st_size]
+
+
+def stat_tag_fn(tags, name):
+    """ Return a float GDAL statistics tag (i.e. STATISTICS_MINIMUM) or None when it is not stored. """
+    value = tags.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def read_metadata_fn(image_path):
+    """ Read the header metadata of a raster (band 1, no pixels are read).
+
+    @param image_path: string object containing the image path.
+    @return metadata: dictionary object {"ok", "error", "key", "signature", "dtype", "nodata", "scale", "offset",
+        "stats" {"min", "max", "mean", "valid_percent"}}.
+    """
+    metadata = {"ok": False, "error": None, "key": None, "signature": None, "dtype": None, "nodata": None,
+                "scale": None, "offset": None, "stats": None}
+    try:
+        metadata["key"] = file_key_fn(image_path)
+        with rasterio.open(image_path) as srci:
+            tags = srci.tags(1)
+            crs = srci.crs.to_wkt() if srci.crs else ""
+            metadata.update({"ok": True, "signature": [crs, list(srci.transform)[:6], srci.width, srci.height],
+                             "dtype": srci.dtypes[0], "nodata": srci.nodata, "scale": srci.scales[0],
+                             "offset": srci.offsets[0],
+                             "stats": {"min": stat_tag_fn(tags, "STATISTICS_MINIMUM"),
+                                       "max": stat_tag_fn(tags, "STATISTICS_MAXIMUM"),
+                                       "mean": stat_tag_fn(tags, "STATISTICS_MEAN"),
+                                       "valid_percent": stat_tag_fn(tags, "STATISTICS_VALID_PERCENT")}})
+    except Exception as err:
+        metadata["error"] = str(err)
+
+    return metadata
+
+
+def load_cache_fn(cache_path):
+    """ Load the metadata table from the cache file (once per process). """
+    if cache_dict["path"] == cache_path:
+        return
+
+    cache_dict["path"] = cache_path
+    if cache_path and os.path.isfile(cache_path):
+        try:
+            with open(cache_path, "r") as cache_file:
+                metadata_dict.update(json.load(cache_file))
+        except ValueError:
+            logger.warning("The metadata cache could not be read and will be rebuilt: %s", cache_path)
+
+
+def save_cache_fn():
+    """ Write the metadata table to the cache file (temporary file + rename) when it has changed. """
+    cache_path = cache_dict["path"]
+    if not cache_path or not cache_dict["dirty"]:
+        return
+
+    temp_path = cache_path + ".tmp"
+    with lock:
+        with open(temp_path, "w") as output:
+            json.dump(metadata_dict, output)
+        cache_dict["dirty"] = False
+    os.replace(temp_path, cache_path)
+
+
+def metadata_fn(image_path):
+    """ Return the metadata of an image from the metadata table (read and added when missing or out of date).
+
+    @param image_path: string object containing the image path.
+    @return metadata: dictionary object (read_metadata_fn).
+    """
+    metadata = metadata_dict.get(image_path)
+    try:
+        hit = metadata is not None and metadata["key"] == file_key_fn(image_path)
+    except OSError:
+        hit = False
+
+    run_metrics.cache_fn("metadata", hit)
+    if not hit:
+        metadata = read_metadata_fn(image_path)
+        # unreadable files are not cached so they are re-checked on the next run.
+        if metadata["ok"]:
+            with lock:
+                metadata_dict[image_path] = metadata
+                cache_dict["dirty"] = True
+
+    return metadata
+
+
+def build_fn(images, cache_path=None, workers=8):
+    """ Fill the metadata table for a list of images (header reads in parallel) and save the cache file.
+
+    @param images: list object containing the image paths.
+    @param cache_path: string object containing the path of the metadata cache file (None for no cache file).
+    @param workers: integer object containing the number of header reading threads.
+    @return metadata: dictionary object {image path: metadata}.
+    """
+    load_cache_fn(cache_path)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        metadata = dict(zip(images, executor.map(metadata_fn, images)))
+    save_cache_fn()
+
+    return metadata
+
+
+def nodata_fn(metadata, default=None):
+    """ Return the no data value used for masking (the file no data value, otherwise the default). """
+    nodata = metadata.get("nodata") if metadata else None
+
+    return default if nodata is None else nodata
+
+
+def all_nodata_fn(metadata, default=None):
+    """ Return True when the statistics stored in the file show that every pixel is no data.
+
+    @param metadata: dictionary object (read_metadata_fn).
+    @param default: no data value used when the file does not define one.
+    @return all_nodata: boolean object.
+    """
+    stats = metadata.get("stats") if metadata else None
+    if not stats:
+        return False
+
+    if stats.get("valid_percent") is not None:
+        return stats["valid_percent"] == 0
+
+    nodata = nodata_fn(metadata, default)
+    if nodata is None or stats.get("min") is None or stats.get("max") is None:
+        return False
+    if isinstance(nodata, float) and math.isnan(nodata):
+        return False
+
+    return stats["min"] == nodata and stats["max"] == nodata
@@ -0,0 +1,491 @@
+#!/usr/bin/env python
+
+"""
+raster_mirror.py
+================
+
+Description: This script keeps an optional local mirror of the rasters read from the network share (met_analysis and
+the Landsat tiles), so that step1_8 and step1_9 read each image from a local disk rather than over the share, and a
+second run (or the nine band passes of step1_9) does not transfer the image again.
+
+1. local_path_fn returns the local copy of a source image, copying it into the mirror directory on first use:
+    {mirror_dir}/{source directory hash}/{file name}   - the file name is kept, so the dates and image names sliced
+                                                         from the path are unchanged.
+    {mirror_dir}/mirror.json                           - the mirror index (source path, local path, source file key,
+                                                         size, sha1 and last use per entry).
+With cog the copy is converted to a tiled, deflate compressed GeoTIFF with internal overviews (the GDAL COG driver);
+the full resolution pixels are unchanged (lossless) and the overviews serve decimated reads.
+
+2. An entry is validated against the source before use:
+    size   - the source file size is unchanged.
+    mtime  - the source modification time and size are unchanged (default).
+    hash   - as mtime, and the local copy is checked once per process against the sha1 recorded when it was copied.
+An invalid entry is copied again. When the copy fails (disk full, share error) the source path is returned.
+
+3. The least recently used entries are evicted after each copy to keep the mirror under its disk budget (the entry just
+copied, the copies in progress and the leased entries are kept). A path returned by local_path_fn with lease=True is
+not evicted until release_fn is called for its source, so that the paths handed out ahead of the reads (a process pool
+or the window stack) remain on disk until they are read; the mirror may exceed its budget by the leased copies. Files
+left in the mirror directory without an index entry (an interrupted run) are removed when the mirror is configured.
+
+4. prefetch_fn copies the images of a planned run in background threads ahead of the extraction (up to the disk
+budget); local_path_fn waits for a copy in progress. The mirror can also be filled before a run:
+
+    python raster_mirror.py --mirror D:/raster_mirror --budget_gb 200 --root Z:/met_analysis/nt/dlyrn
+
+unconfigure_fn waits for the prefetch copies, saves the index and disables the mirror again for the process (i.e.
+between the runs of a check).
+
+The cache hits and misses are published through run_metrics (cache 'mirror').
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import warnings
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import lazy_imports
+import run_metrics
+import image_catalog
+import raster_metadata
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("mirror")
+
+rasterio_shutil = lazy_imports.lazy_module_fn("rasterio.shutil")
+
+validate_list = ["size", "mtime", "hash"]
+
+# mirror settings (configure_fn), the mirror index {source path: entry}, the copies in progress {source: future}
+# and the leased entries {source: number of leases}.
+mirror_dict = {"dir": None, "budget": 0, "validate": "mtime", "cog": False, "workers": 4, "executor": None,
+               "dirty": False}
+entry_dict = {}
+pending_dict = {}
+lease_dict = {}
+checked_set = set()
+lock = threading.RLock()
+
+
+def index_path_fn():
+    """ Return the path of the mirror index file. """
+    return os.path.join(mirror_dict["dir"], "mirror.json")
+
+
+def local_name_fn(source):
+    """ Return the mirror path of a source image ({mirror_dir}/{source directory hash}/{file name}). """
+    directory, file_name = ([""] + source.replace("\\", "/").rsplit("/", 1))[-2:]
+    key = hashlib.sha1(directory.encode("utf-8")).hexdigest()[:12]
+
+    return os.path.join(mirror_dict["dir"], key, file_name)
+
+
+def hash_fn(path):
+    """ Return the sha1 of a file (read in 1 MB blocks). """
+    digest = hashlib.sha1()
+    with open(path, "rb") as data:
+        for block in iter(lambda: data.read(1048576), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def load_fn():
+    """ Load the mirror index and remove the mirror files without an index entry (an interrupted run). """
+    entry_dict.clear()
+    checked_set.clear()
+    if os.path.isfile(index_path_fn()):
+        try:
+            with open(index_path_fn(), "r") as index_file:
+                entry_dict.update(json.load(index_file))
+        except ValueError:
+            logger.warning("The mirror index could not be read and will be rebuilt: %s", index_path_fn())
+
+    for source in [s for s, entry in entry_dict.items() if not os.path.isfile(entry["local"])]:
+        del entry_dict[source]
+
+    indexed = set(os.path.normcase(entry["local"]) for entry in entry_dict.values())
+    removed = 0
+    for name in os.listdir(mirror_dict["dir"]):
+        sub_dir = os.path.join(mirror_dict["dir"], name)
+        if not os.path.isdir(sub_dir):
+            continue
+        for file_name in os.listdir(sub_dir):
+            path = os.path.join(sub_dir, file_name)
+            if os.path.normcase(path) not in indexed:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+    if removed:
+        logger.info("mirror: %d files without an index entry removed", removed)
+
+
+def save_fn():
+    """ Write the mirror index (temporary file + rename) when it has changed. """
+    if not mirror_dict["dir"] or not mirror_dict["dirty"]:
+        return
+
+    temp_path = index_path_fn() + ".tmp"
+    with lock:
+        with open(temp_path, "w") as output:
+            json.dump(entry_dict, output)
+        mirror_dict["dirty"] = False
+    os.replace(temp_path, index_path_fn())
+
+
+def configure_fn(mirror_dir, budget_gb=100.0, validate="mtime", cog=False, workers=4):
+    """ Enable the mirror for this process (local_path_fn returns the source paths until it is configured).
+
+    @param mirror_dir: string object containing the local mirror directory (created when missing).
+    @param budget_gb: float object containing the disk budget of the mirror in GB.
+    @param validate: string object containing the entry validation (validate_list).
+    @param cog: boolean object, True to convert the copies to tiled and compressed GeoTIFF with overviews.
+    @param workers: integer object containing the number of prefetch threads.
+    """
+    if validate not in validate_list:
+        raise ValueError("Unknown mirror validation: {0} (select from {1})".format(validate, ", ".join(validate_list)))
+
+    if not os.path.isdir(mirror_dir):
+        os.makedirs(mirror_dir)
+
+    mirror_dict.update({"dir": os.path.abspath(mirror_dir), "budget": int(budget_gb * 1073741824),
+                        "validate": validate, "cog": cog, "workers": max(1, workers), "dirty": False})
+    load_fn()
+    logger.info("mirror: %s (%d files, %.1f of %.1f GB)", mirror_dict["dir"], len(entry_dict),
+                mirror_bytes_fn() / 1073741824.0, budget_gb)
+
+
+def unconfigure_fn():
+    """ Disable the mirror for this process: wait for the prefetch copies, save the index and forget the mirror
+    (local_path_fn returns the source paths again). """
+    if not mirror_dict["dir"]:
+        return
+
+    wait_fn()
+    save_fn()
+    if mirror_dict["executor"] is not None:
+        mirror_dict["executor"].shutdown(wait=True)
+    with lock:
+        entry_dict.clear()
+        pending_dict.clear()
+        lease_dict.clear()
+        checked_set.clear()
+        mirror_dict.update({"dir": None, "budget": 0, "validate": "mtime", "cog": False, "workers": 4,
+                            "executor": None, "dirty": False})
+    logger.debug("mirror disabled")
+
+
+def mirror_bytes_fn():
+    """ Return the disk space used by the mirror entries (bytes). """
+    with lock:
+        return sum(entry["size"] for entry in entry_dict.values())
+
+
+def valid_fn(source, entry):
+    """ Return True when a mirror entry is a valid copy of the source (mirror_dict validate). """
+    if not os.path.isfile(entry["local"]):
+        return False
+    try:
+        key = raster_metadata.file_key_fn(source)
+    except OSError:
+        return False
+
+    if mirror_dict["validate"] == "size":
+        return key[1] == entry["key"][1]
+
+    valid = key == entry["key"]
+    if valid and mirror_dict["validate"] == "hash" and source not in checked_set:
+        valid = entry.get("sha1") is not None and hash_fn(entry["local"]) == entry["sha1"]
+        checked_set.add(source)
+
+    return valid
+
+
+def copy_fn(source, temp_path):
+    """ Copy a source image to temp_path (converted to a tiled, compressed GeoTIFF with overviews when cog). """
+    if mirror_dict["cog"]:
+        rasterio_shutil.copy(source, temp_path, driver="COG", BLOCKSIZE=256, COMPRESS="DEFLATE", PREDICTOR="YES",
+                             OVERVIEW_RESAMPLING="AVERAGE", BIGTIFF="IF_SAFER")
+    else:
+        shutil.copyfile(source, temp_path)
+
+
+def evict_fn(keep=None):
+    """ Remove the least recently used entries until the mirror is under its disk budget.
+
+    @param keep: string object containing a source path that is not evicted (the entry just copied).
+    @return removed: integer object containing the number of entries removed.
+    """
+    removed = 0
+    with lock:
+        total = mirror_bytes_fn()
+        busy = set(pending_dict)
+        busy.update(lease_dict)
+        busy.add(keep)
+        for source, entry in sorted(entry_dict.items(), key=lambda item: item[1]["used"]):
+            if total <= mirror_dict["budget"]:
+                break
+            if source in busy:
+                continue
+            try:
+                os.remove(entry["local"])
+            except OSError:
+                # open by a reader (Windows) - evicted on a later pass.
+                continue
+            total -= entry["size"]
+            del entry_dict[source]
+            removed += 1
+        if removed:
+            mirror_dict["dirty"] = True
+
+    if removed:
+        logger.debug("mirror: %d least recently used files evicted", removed)
+
+    return removed
+
+
+def fetch_fn(source):
+    """ Copy a source image into the mirror and add its index entry.
+
+    @param source: string object containing the source image path.
+    @return local: string object containing the mirror path, or None when the copy failed.
+    """
+    local = local_name_fn(source)
+    temp_path = local + ".tmp"
+    start = time.time()
+    try:
+        key = raster_metadata.file_key_fn(source)
+        if not os.path.isdir(os.path.dirname(local)):
+            os.makedirs(os.path.dirname(local))
+        copy_fn(source, temp_path)
+        entry = {"local": local, "key": key, "size": os.path.getsize(temp_path), "used": time.time(),
+                 "sha1": hash_fn(temp_path) if mirror_dict["validate"] == "hash" else None}
+        os.replace(temp_path, local)
+    except Exception as err:
+        logger.warning("mirror copy failed, the source is read: %s (%s)", source, err)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+    with lock:
+        entry_dict[source] = entry
+        checked_set.add(source)
+        mirror_dict["dirty"] = True
+    logger.debug("mirror: %s copied (%.1f MB, %.2f s)", source, key[1] / 1048576.0, time.time() - start)
+    evict_fn(keep=source)
+
+    return local
+
+
+def prefetch_worker_fn(source):
+    """ Copy a prefetched image (prefetch thread) and release its pending entry. """
+    try:
+        return fetch_fn(source)
+    finally:
+        with lock:
+            pending_dict.pop(source, None)
+
+
+def local_path_fn(source, lease=False):
+    """ Return the path an image is read from: the mirror copy (copied on first use), otherwise the source path.
+
+    @param source: string object containing the source image path.
+    @param lease: boolean object, True to keep the copy from eviction until release_fn is called for the source.
+    @return path: string object containing the path to open.
+    """
+    if not mirror_dict["dir"]:
+        return source
+
+    with lock:
+        if lease:
+            # leased before the copy, so that no other copy evicts it before it is read.
+            lease_dict[source] = lease_dict.get(source, 0) + 1
+        future = pending_dict.get(source)
+        entry = entry_dict.get(source)
+    if future is None and entry is not None and valid_fn(source, entry):
+        run_metrics.cache_fn("mirror", True)
+        entry["used"] = time.time()
+        return entry["local"]
+
+    run_metrics.cache_fn("mirror", False)
+    with lock:
+        future = pending_dict.get(source)
+        owner = future is None
+        if owner:
+            # copied by this thread - registered so that a prefetch does not copy the same file.
+            future = Future()
+            pending_dict[source] = future
+    if owner:
+        try:
+            future.set_result(fetch_fn(source))
+        finally:
+            with lock:
+                pending_dict.pop(source, None)
+
+    return future.result() or source
+
+
+def release_fn(source):
+    """ Release a lease taken by local_path_fn (the copy can be evicted again once every lease is released). """
+    with lock:
+        count = lease_dict.pop(source, 0) - 1
+        if count > 0:
+            lease_dict[source] = count
+
+
+def prefetch_fn(sources):
+    """ Copy the images of a planned run into the mirror in background threads (in order, up to the disk budget).
+
+    @param sources: list object containing the source image paths in the order they will be read.
+    @return queued: integer object containing the number of copies started.
+    """
+    if not mirror_dict["dir"]:
+        return 0
+
+    if mirror_dict["executor"] is None:
+        mirror_dict["executor"] = ThreadPoolExecutor(max_workers=mirror_dict["workers"])
+
+    planned = 0
+    queued = 0
+    for source in sources:
+        with lock:
+            if source in pending_dict:
+                continue
+            entry = entry_dict.get(source)
+        try:
+            planned += os.path.getsize(source)
+        except OSError:
+            continue
+        if planned > mirror_dict["budget"]:
+            logger.info("mirror prefetch stopped at the disk budget (%d files queued)", queued)
+            break
+        if entry is not None and valid_fn(source, entry):
+            # a planned image is marked as used, so that it is not evicted before the run reads it.
+            entry["used"] = time.time()
+            continue
+        with lock:
+            pending_dict[source] = mirror_dict["executor"].submit(prefetch_worker_fn, source)
+        queued += 1
+
+    if queued:
+        logger.info("mirror prefetch: %d files queued", queued)
+
+    return queued
+
+
+def wait_fn():
+    """ Wait for the prefetch copies in progress. """
+    with lock:
+        futures = list(pending_dict.values())
+    wait(futures)
+
+
+def status_fn():
+    """ Return the mirror status {"dir", "files", "bytes", "budget", "pending"}. """
+    with lock:
+        return {"dir": mirror_dict["dir"], "files": len(entry_dict), "bytes": mirror_bytes_fn(),
+                "budget": mirror_dict["budget"], "pending": len(pending_dict)}
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description="Copy the images of a planned run into the local raster mirror.")
+
+    p.add_argument('--mirror', help="The local raster mirror directory.", required=True)
+
+    p.add_argument('--budget_gb', type=float, default=100.0, help="Enter the disk budget of the mirror in GB")
+
+    p.add_argument('--validate', choices=validate_list, default="mtime",
+                   help="Validate the mirror entries by the source size, modification time (and size) or the sha1 "
+                        "of the local copy")
+
+    p.add_argument('--cog', action='store_true',
+                   help="Convert the copies to tiled, compressed GeoTIFF with internal overviews")
+
+    p.add_argument('--root', default=None,
+                   help="The variable directory of the planned run (i.e. met_analysis/nt/dlyrn)")
+
+    p.add_argument('--products', default=None, help="Comma separated products copied from --root (default: all)")
+
+    p.add_argument('--lists', nargs='*', default=[], help="Image list csv files of the planned run (step1_2)")
+
+    p.add_argument('--workers', type=int, default=4, help="Enter the number of copy threads")
+
+    p.add_argument('-l', '--log_file', help="The path of an optional log file (written in addition to the console)",
+                   default=None)
+
+    pipeline_logging.add_logging_args_fn(p)
+
+    return p.parse_args()
+
+
+def main_routine():
+    """ Fill the mirror with the images of a planned run (--root catalog and --lists) and report its usage. """
+    cmd_args = get_cmd_args_fn()
+    pipeline_logging.setup_logging_fn(cmd_args.quiet, cmd_args.verbose, cmd_args.log_file)
+    configure_fn(cmd_args.mirror, cmd_args.budget_gb, cmd_args.validate, cmd_args.cog, cmd_args.workers)
+
+    sources = []
+    if cmd_args.root:
+        products = cmd_args.products.split(",") if cmd_args.products else None
+        for entry in image_catalog.catalog_fn(cmd_args.root, ".tif"):
+            if products is None or entry["product"] in products:
+                sources.extend(entry["images"])
+    for list_path in cmd_args.lists:
+        with open(list_path, "r") as imagery_list:
+            sources.extend(image.rstrip() for image in imagery_list if image.strip())
+
+    start = time.time()
+    prefetch_fn(sources)
+    wait_fn()
+    save_fn()
+    status = status_fn()
+    logger.info("mirror: %d files, %.1f of %.1f GB (%.1f s)", status["files"], status["bytes"] / 1073741824.0,
+                status["budget"] / 1073741824.0, time.time() - start)
+
+
+if __name__ == "__main__":
+    main_routine()
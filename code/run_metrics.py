@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+"""
+run_metrics.py
+==============
+
+Description: This script publishes live progress counters for the long-running extraction loops (step1_8 and
+step1_9) to a metrics file in the Prometheus textfile format, so that the local node exporter (textfile collector) can
+scrape the progress of a run:
+
+    zonal_pipeline_images_total / _images_done_total / _images_remaining - run wide image counts.
+    zonal_pipeline_rate_images_per_second / _eta_seconds - rate and estimated time to completion.
+    zonal_pipeline_directory_info{directory=...} / _directory_images_done / _directory_images_total - current directory.
+    zonal_pipeline_queue_depth{queue=...} - queue depths (directories and images waiting).
+    zonal_pipeline_cache_hits_total{cache=...} / _cache_misses_total / _cache_hit_ratio - cache hit ratios.
+
+The file is rewritten atomically (temporary file + rename) at most once every interval seconds; the per image hot path
+(image_done_fn) only increments counters and compares the clock against the next write time. When start_fn has not
+been called the functions only update the in memory counters.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import time
+import warnings
+
+warnings.filterwarnings("ignore")
+
+prefix = "zonal_pipeline"
+
+# live state - {key: value} populated by start_fn and the extraction loops.
+metrics_dict = {"path": None, "interval": 15.0, "next_write": 0.0, "start": None, "running": 0,
+                "images_total": 0, "images_done": 0, "directory": "", "directory_total": 0, "directory_done": 0}
+
+# {queue name: depth}
+queue_dict = {}
+
+# {cache name: [hits, misses]}
+cache_dict = {}
+
+
+def start_fn(metrics_path, interval=15.0):
+    """ Start publishing the metrics file.
+
+    @param metrics_path: string object containing the path of the metrics file (i.e. textfile_dir/zonal.prom).
+    @param interval: float object containing the minimum number of seconds between rewrites of the metrics file.
+    """
+    metrics_dict["path"] = metrics_path
+    metrics_dict["interval"] = float(interval)
+    metrics_dict["start"] = time.time()
+    metrics_dict["running"] = 1
+    write_fn()
+
+
+def set_total_fn(images_total):
+    """ Set the number of images (image bands for multi-band products) to be processed by the run. """
+    metrics_dict["images_total"] = int(images_total)
+
+
+def begin_directory_fn(directory, images):
+    """ Record the start of a directory (step1_8) or tile (step1_9).
+
+    @param directory: string object containing the directory / data type being processed.
+    @param images: integer object containing the number of images to be processed in the directory.
+    """
+    metrics_dict["directory"] = str(directory)
+    metrics_dict["directory_total"] = int(images)
+    metrics_dict["directory_done"] = 0
+    queue_dict["images"] = int(images)
+
+    # a caller that has not set the run total (i.e. step1_9 run directly) is counted per directory.
+    if metrics_dict["images_total"] < metrics_dict["images_done"] + int(images):
+        metrics_dict["images_total"] = metrics_dict["images_done"] + int(images)
+
+    write_fn()
+
+
+def image_done_fn(n=1):
+    """ Record n processed images (called on the per image hot path). """
+    metrics_dict["images_done"] += n
+    metrics_dict["directory_done"] += n
+    if metrics_dict["path"] is not None and time.time() >= metrics_dict["next_write"]:
+        queue_dict["images"] = metrics_dict["directory_total"] - metrics_dict["directory_done"]
+        write_fn()
+
+
+def set_queue_fn(queue, depth):
+    """ Set the depth of a named queue (i.e. 'directories'). """
+    queue_dict[queue] = int(depth)
+
+
+def cache_fn(cache, hit, n=1):
+    """ Record a cache hit (hit=True) or miss (hit=False) for a named cache. """
+    counts = cache_dict.setdefault(cache, [0, 0])
+    counts[0 if hit else 1] += n
+
+
+def escape_label_fn(value):
+    """ Escape a label value (backslashes, double quotes and new lines) for the text exposition format. """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def metrics_text_fn():
+    """ Return the current metrics in the Prometheus text exposition format.
+
+    @return text: string object containing the metrics.
+    """
+    now = time.time()
+    elapsed = now - metrics_dict["start"] if metrics_dict["start"] else 0.0
+    done = metrics_dict["images_done"]
+    remaining = max(0, metrics_dict["images_total"] - done)
+    rate = done / elapsed if elapsed > 0 else 0.0
+    eta = remaining / rate if rate > 0 else -1
+
+    lines = []
+
+    def metric_fn(name, metric_type, help_text, samples):
+        lines.append("# HELP {0}_{1} {2}".format(prefix, name, help_text))
+        lines.append("# TYPE {0}_{1} {2}".format(prefix, name, metric_type))
+        for labels, value in samples:
+            label_text = ",".join('{0}="{1}"'.format(k, escape_label_fn(v)) for k, v in labels)
+            label_text = "{" + label_text + "}" if label_text else ""
+            lines.append("{0}_{1}{2} {3}".format(prefix, name, label_text, value))
+
+    metric_fn("running", "gauge", "1 while the extraction is running.", [([], metrics_dict["running"])])
+    metric_fn("start_timestamp_seconds", "gauge", "Unix time the run started.", [([], metrics_dict["start"] or 0)])
+    metric_fn("last_update_timestamp_seconds", "gauge", "Unix time the metrics were written.", [([], round(now, 3))])
+    metric_fn("images_total", "gauge", "Images to be processed by the run.", [([], metrics_dict["images_total"])])
+    metric_fn("images_done_total", "counter", "Images processed.", [([], done)])
+    metric_fn("images_remaining", "gauge", "Images waiting to be processed.", [([], remaining)])
+    metric_fn("rate_images_per_second", "gauge", "Mean images processed per second.", [([], round(rate, 4))])
+    metric_fn("eta_seconds", "gauge", "Estimated seconds to completion (-1 when unknown).", [([], round(eta, 1))])
+    metric_fn("directory_info", "gauge", "The directory currently being processed.",
+              [([("directory", metrics_dict["directory"])], 1)])
+    metric_fn("directory_images_total", "gauge", "Images in the current directory.",
+              [([], metrics_dict["directory_total"])])
+    metric_fn("directory_images_done", "gauge", "Images processed in the current directory.",
+              [([], metrics_dict["directory_done"])])
+    if queue_dict:
+        metric_fn("queue_depth", "gauge", "Items waiting in each queue.",
+                  [([("queue", k)], v) for k, v in sorted(queue_dict.items())])
+    if cache_dict:
+        metric_fn("cache_hits_total", "counter", "Cache hits.", [([("cache", k)], v[0])
+                                                                 for k, v in sorted(cache_dict.items())])
+        metric_fn("cache_misses_total", "counter", "Cache misses.", [([("cache", k)], v[1])
+                                                                     for k, v in sorted(cache_dict.items())])
+        metric_fn("cache_hit_ratio", "gauge", "Cache hits / lookups.",
+                  [([("cache", k)], round(v[0] / float(v[0] + v[1]), 4) if (v[0] + v[1]) else 0)
+                   for k, v in sorted(cache_dict.items())])
+
+    return "\n".join(lines) + "\n"
+
+
+def write_fn():
+    """ Rewrite the metrics file atomically (the textfile collector must never read a partial file). """
+    metrics_path = metrics_dict["path"]
+    if metrics_path is None:
+        return
+
+    temp_path = metrics_path + ".{0}.tmp".format(os.getpid())
+    with open(temp_path, "w") as output:
+        output.write(metrics_text_fn())
+    os.replace(temp_path, metrics_path)
+
+    metrics_dict["next_write"] = time.time() + metrics_dict["interval"]
+
+
+def finish_fn():
+    """ Write the final metrics (running = 0). """
+    metrics_dict["running"] = 0
+    queue_dict["images"] = 0
+    write_fn()
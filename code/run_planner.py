@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+"""
+run_planner.py
+==============
+
+Description: This script implements the --plan (dry run) mode of step1_1. Using the standard library only (the GDAL
+stack is never imported, which is confirmed in the log with lazy_imports.loaded_heavy_modules_fn) it lists what a run
+will do:
+
+1. The directories and products to be processed (image_catalog.catalog_fn), with the image count and date range of
+each directory.
+
+2. The number of sites in the site csv (unique rows, as step1_3 drops duplicates).
+
+3. An estimated runtime from calibrated per image costs, modelled as:
+    seconds per image = read_s + zone_s * sites
+read_s (raster open / read) and zone_s (per zone statistics) are fitted from the json run reports written by
+run_profiler (--calibrate) and stored in a calibration json file.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import csv
+import json
+import time
+import warnings
+import image_catalog
+import lazy_imports
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("planner")
+
+default_calibration_path = os.path.join(os.path.expanduser("~"), ".zonal_pipeline_calibration.json")
+
+# default per image costs (seconds) used until a calibration has been written.
+default_calibration_dict = {"read_s": 0.05, "zone_s": 0.0005, "fixed_s": 10.0, "reports": []}
+
+
+def count_sites_fn(data):
+    """ Return the number of unique rows in the site csv (step1_3 drops duplicate rows before buffering).
+
+    @param data: string object containing the path to the site csv.
+    @return site_count: integer object containing the number of sites.
+    """
+    with open(data, "r") as site_file:
+        reader = csv.reader(site_file)
+        next(reader, None)
+        rows = set(tuple(row) for row in reader if row)
+
+    return len(rows)
+
+
+def load_calibration_fn(calibration_path):
+    """ Return the calibration dictionary (the defaults if the calibration file does not exist). """
+    calibration = dict(default_calibration_dict)
+    if calibration_path and os.path.isfile(calibration_path):
+        with open(calibration_path, "r") as calibration_file:
+            calibration.update(json.load(calibration_file))
+
+    return calibration
+
+
+def calibrate_fn(report_paths, calibration_path):
+    """ Fit read_s and zone_s from run_profiler run reports and write the calibration file.
+
+    Each extraction stage (step1_8:*) with a 'sites' attribute provides a point (sites, seconds per image); the costs
+    are fitted by least squares when the reports cover at least two site counts, otherwise zone_s is fitted with
+    the current read_s.
+
+    @param report_paths: list object containing the paths of run_report.json files.
+    @param calibration_path: string object containing the path of the calibration file to write.
+    @return calibration: dictionary object containing the fitted calibration.
+    """
+    calibration = load_calibration_fn(calibration_path)
+    points = []
+    fixed = []
+    for report_path in report_paths:
+        with open(report_path, "r") as report_file:
+            report = json.load(report_file)
+
+        extraction_s = 0.0
+        for stage in report.get("stages", []):
+            if stage["stage"].startswith("step1_8:") and stage.get("images") and stage.get("sites"):
+                points.append([float(stage["sites"]), stage["wall_s"] / stage["images"]])
+                extraction_s += stage["wall_s"]
+
+        total_s = report.get("totals", {}).get("wall_s")
+        if total_s is not None and extraction_s:
+            fixed.append(max(0.0, total_s - extraction_s))
+
+    if not points:
+        raise ValueError("The run reports do not contain any step1_8 extraction stages with a site count.")
+
+    sites = [p[0] for p in points]
+    costs = [p[1] for p in points]
+    if len(set(sites)) >= 2:
+        n = float(len(points))
+        mean_x = sum(sites) / n
+        mean_y = sum(costs) / n
+        sxx = sum((x - mean_x) ** 2 for x in sites)
+        sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(sites, costs))
+        zone_s = max(0.0, sxy / sxx)
+        read_s = max(0.0, mean_y - zone_s * mean_x)
+    else:
+        read_s = min(calibration["read_s"], min(costs))
+        zone_s = max(0.0, (sum(costs) / len(costs) - read_s) / sites[0])
+
+    calibration.update({"read_s": round(read_s, 6), "zone_s": round(zone_s, 8),
+                        "fixed_s": round(sum(fixed) / len(fixed), 2) if fixed else calibration["fixed_s"],
+                        "reports": list(report_paths), "calibrated": time.strftime("%Y-%m-%dT%H:%M:%S")})
+
+    with open(calibration_path, "w") as output:
+        json.dump(calibration, output, indent=2)
+
+    logger.info("Calibration written: %s (read_s %.4f, zone_s %.6f)", calibration_path, read_s, zone_s)
+
+    return calibration
+
+
+def estimate_seconds_fn(images, sites, calibration):
+    """ Return the estimated extraction seconds for a number of images and sites. """
+    return images * (calibration["read_s"] + calibration["zone_s"] * sites)
+
+
+def plan_fn(root_directory, data, calibration, extension=".tif", skip_products=None):
+    """ Build the run plan.
+
+    @param root_directory: string object containing the variable directory (i.e. met_analysis/nt/dlyrn).
+    @param data: string object containing the path to the site csv.
+    @param calibration: dictionary object containing the per image costs (load_calibration_fn).
+    @param extension: string object containing the image file extension.
+    @param skip_products: list object containing products that will not be read (i.e. derived by aggregation).
+    @return plan: dictionary object containing the plan.
+    """
+    skip_products = skip_products or []
+    site_count = count_sites_fn(data)
+    catalog = image_catalog.catalog_fn(root_directory, extension)
+
+    directory_list = []
+    for entry in catalog:
+        seconds = 0.0 if entry["product"] in skip_products else estimate_seconds_fn(len(entry["images"]),
+                                                                                     site_count, calibration)
+        directory_list.append({"in_dir": entry["in_dir"], "product": entry["product"],
+                               "images": len(entry["images"]), "first_date": entry["dates"][0],
+                               "last_date": entry["dates"][-1], "skipped": entry["product"] in skip_products,
+                               "estimated_s": round(seconds, 1)})
+
+    estimated_s = calibration["fixed_s"] + sum(d["estimated_s"] for d in directory_list)
+    plan = {"root_directory": root_directory, "data": data, "sites": site_count,
+            "images": sum(d["images"] for d in directory_list if not d["skipped"]),
+            "directories": directory_list, "estimated_s": round(estimated_s, 1), "calibration": calibration}
+
+    return plan
+
+
+def print_plan_fn(plan):
+    """ Output the plan as a table (stdout). """
+    print("Plan: {0}".format(plan["root_directory"]))
+    print("Sites: {0} ({1})".format(plan["sites"], plan["data"]))
+    print("{0:<8} {1:>7} {2:>10} {3:>10} {4:>10}  {5}".format("product", "images", "first", "last", "est_min",
+                                                               "directory"))
+    for d in plan["directories"]:
+        estimate = "skipped" if d["skipped"] else "{0:.1f}".format(d["estimated_s"] / 60.0)
+        print("{0:<8} {1:>7} {2:>10} {3:>10} {4:>10}  {5}".format(d["product"], d["images"], d["first_date"],
+                                                                   d["last_date"], estimate, d["in_dir"]))
+
+    calibration = plan["calibration"]
+    print("Images to process: {0}".format(plan["images"]))
+    print("Estimated runtime: {0:.1f} minutes (read_s {1}, zone_s {2}, {3})".format(
+        plan["estimated_s"] / 60.0, calibration["read_s"], calibration["zone_s"],
+        "calibrated " + calibration["calibrated"] if calibration.get("calibrated") else "default costs"))
+
+
+def main_routine(root_directory, data, calibration_path, skip_products=None):
+    """ Build and output the plan (called by step1_1 --plan).
+
+    @return plan: dictionary object containing the plan.
+    """
+    calibration = load_calibration_fn(calibration_path)
+    plan = plan_fn(root_directory, data, calibration, skip_products=skip_products)
+    print_plan_fn(plan)
+
+    # the plan reads directory listings and the site csv only: a heavy module imported here is a regression.
+    loaded = lazy_imports.loaded_heavy_modules_fn()
+    if loaded:
+        logger.warning("--plan imported the heavy modules: %s", ", ".join(loaded))
+    else:
+        logger.info("--plan: no GDAL stack module imported")
+
+    return plan
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+"""
+run_profiler.py
+===============
+
+Description: This script provides the instrumentation layer used to profile a pipeline run. Each stage of the
+pipeline (directory discovery, step1_2 listing, step1_3 buffering, each step1_8 / step1_9 directory and the output
+writes) is wrapped with stage_fn, which records:
+
+    wall_s - wall time in seconds.
+    cpu_s - process CPU time in seconds.
+    bytes_read - raster bytes read (reported by the zonal stats scripts through record_read_fn).
+    images - images read (image bands for the multi-band products).
+    images_per_s - images processed per second.
+    peak_rss_mb - peak resident set size of the process at the end of the stage.
+
+Once start_fn has been called, a machine-readable json run report is written at exit (including failed runs), and an
+optional cProfile dump (pstats format) is written for the stages opened with profile=True (the extraction stages).
+
+The profiler is module level so that the step scripts can report raster reads without a profiler object being passed
+through every function; when start_fn has not been called the stages are still timed but no report is written.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import sys
+import json
+import time
+import atexit
+import platform
+import warnings
+import pipeline_logging
+from contextlib import contextmanager
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("profiler")
+
+# run state - {key: value} populated by start_fn and the stages.
+run_dict = {"started": False, "report_path": None, "profile_path": None, "start_time": None, "start_wall": None,
+            "start_cpu": None, "argv": [], "status": "running", "stages": []}
+
+# running counters incremented by the step scripts (read by the stages as deltas).
+counter_dict = {"bytes_read": 0, "images": 0}
+
+# cProfile.Profile object (created by start_fn when a profile path is supplied).
+profile_list = []
+
+# names of the currently open stages (used to record the parent of nested stages).
+open_stage_list = []
+
+
+def peak_rss_mb_fn():
+    """ Return the peak resident set size of the current process in megabytes (None if it cannot be determined).
+
+    @return peak_rss: float object containing the peak rss in megabytes.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and kilobytes on Linux.
+        divisor = 1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0
+        return round(peak / divisor, 1)
+
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+        memory = psutil.Process().memory_info()
+        # peak_wset is the peak working set on Windows.
+        return round(getattr(memory, "peak_wset", memory.rss) / (1024.0 * 1024.0), 1)
+
+    except ImportError:
+        return None
+
+
+def record_read_fn(nbytes, images=1):
+    """ Record a raster read (called by the zonal stats scripts after each array is read).
+
+    @param nbytes: integer object containing the number of bytes read (i.e. array.nbytes).
+    @param images: integer object containing the number of images (or image bands) read.
+    """
+    counter_dict["bytes_read"] += int(nbytes)
+    counter_dict["images"] += images
+
+
+@contextmanager
+def stage_fn(name, profile=False, **attributes):
+    """ Context manager that times a pipeline stage and appends the stage record to the run report.
+
+    @param name: string object containing the stage name (i.e. 'step1_8:cor').
+    @param profile: boolean object, if True the stage is included in the cProfile dump.
+    @param attributes: additional key word arguments stored with the stage record (i.e. in_dir, image_count).
+    @return record: dictionary object containing the stage record (yielded, attributes may be added to it).
+    """
+    record = {"stage": name, "parent": open_stage_list[-1] if open_stage_list else None, "status": "running"}
+    record.update(attributes)
+    open_stage_list.append(name)
+
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    start_bytes = counter_dict["bytes_read"]
+    start_images = counter_dict["images"]
+
+    profiler = profile_list[0] if (profile and profile_list) else None
+    if profiler is not None:
+        profiler.enable()
+
+    try:
+        yield record
+        record["status"] = "completed"
+
+    except BaseException as error:
+        record["status"] = "failed"
+        record["error"] = repr(error)
+        raise
+
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+        open_stage_list.pop()
+        wall = time.perf_counter() - start_wall
+        images = counter_dict["images"] - start_images
+        record["wall_s"] = round(wall, 4)
+        record["cpu_s"] = round(time.process_time() - start_cpu, 4)
+        record["bytes_read"] = counter_dict["bytes_read"] - start_bytes
+        record["images"] = images
+        record["images_per_s"] = round(images / wall, 3) if wall > 0 else None
+        record["peak_rss_mb"] = peak_rss_mb_fn()
+        run_dict["stages"].append(record)
+
+
+def start_fn(report_path, profile_path=None, argv=None):
+    """ Start the run report: the report (and optional cProfile dump) are written when the interpreter exits.
+
+    @param report_path: string object containing the path of the json run report.
+    @param profile_path: string object containing the path of the cProfile dump (None to disable).
+    @param argv: list object containing the command arguments recorded in the report.
+    """
+    run_dict["started"] = True
+    run_dict["report_path"] = report_path
+    run_dict["profile_path"] = profile_path
+    run_dict["start_time"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    run_dict["start_wall"] = time.perf_counter()
+    run_dict["start_cpu"] = time.process_time()
+    run_dict["argv"] = list(sys.argv if argv is None else argv)
+
+    if profile_path:
+        import cProfile
+        del profile_list[:]
+        profile_list.append(cProfile.Profile())
+
+    atexit.register(write_report_fn)
+
+
+def finish_fn(status="completed"):
+    """ Mark the run status (runs that exit without calling finish_fn are reported as 'failed'). """
+    run_dict["status"] = status
+
+
+def report_fn():
+    """ Return the run report as a dictionary (stage records plus run totals).
+
+    @return report: dictionary object containing the run report.
+    """
+    wall = time.perf_counter() - run_dict["start_wall"] if run_dict["start_wall"] is not None else None
+    cpu = time.process_time() - run_dict["start_cpu"] if run_dict["start_cpu"] is not None else None
+
+    report = {"start_time": run_dict["start_time"],
+              "end_time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "status": run_dict["status"],
+              "argv": run_dict["argv"],
+              "host": platform.node(),
+              "python": platform.python_version(),
+              "pid": os.getpid(),
+              "totals": {"wall_s": round(wall, 4) if wall is not None else None,
+                         "cpu_s": round(cpu, 4) if cpu is not None else None,
+                         "bytes_read": counter_dict["bytes_read"],
+                         "images": counter_dict["images"],
+                         "images_per_s": round(counter_dict["images"] / wall, 3) if wall else None,
+                         "peak_rss_mb": peak_rss_mb_fn()},
+              "stages": run_dict["stages"],
+              "profile_path": run_dict["profile_path"]}
+
+    return report
+
+
+def write_report_fn():
+    """ Write the json run report and the optional cProfile dump (registered with atexit by start_fn). """
+    if not run_dict["started"]:
+        return
+
+    run_dict["started"] = False
+    if run_dict["status"] == "running":
+        run_dict["status"] = "failed"
+
+    if profile_list and run_dict["profile_path"]:
+        profile_list[0].dump_stats(run_dict["profile_path"])
+
+    report_path = run_dict["report_path"]
+    report_dir = os.path.dirname(report_path)
+    if report_dir and not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+
+    with open(report_path, "w") as output:
+        json.dump(report_fn(), output, indent=2)
+
+    logger.info("Run report: %s", report_path)
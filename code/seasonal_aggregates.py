@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+seasonal_aggregates.py
+======================
+
+Description: This script derives the seasonal and annual aggregates per site from the extracted monthly (cor) series,
+in place of extracting the precomputed seasonal rasters (ssav and ssmd directories) from disk.
+
+1. season_dict defines the months of each season:
+    wet - October to April (the season year is the year of the October start, i.e. 1990 = 199010 to 199104).
+    dry - May to September.
+    ann - January to December.
+
+2. aggregate_fn groups the monthly zone means by site and season year over the time axis (one pandas groupby per
+season) and returns the sum, mean and median with the number of months (n_months), the number of valid months
+(n_valid) and a complete flag (every month of the season has a value).
+
+3. main_routine writes the aggregates to a csv per site in the cor output directory
+({site}_{data_type}_seasonal_stats.csv).
+
+derived_product_list holds the products that are replaced by this stage; step1_1 does not read those directories
+unless --season none is selected.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import warnings
+import lazy_imports
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("seasonal")
+
+pd = lazy_imports.lazy_module_fn("pandas")
+
+# dictionary {season: [months in season order]} - the first month starts the season year.
+season_dict = {"wet": [10, 11, 12, 1, 2, 3, 4],
+               "dry": [5, 6, 7, 8, 9],
+               "ann": [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],
+               }
+
+# products derived by this stage (the precomputed seasonal rasters are not read).
+derived_product_list = ["ssav", "ssmd"]
+
+
+def seasons_fn(season):
+    """ Return the list of seasons from the --season command argument (comma separated, 'none' for no seasons).
+
+    @param season: string object containing the --season command argument (i.e. 'ann,wet,dry').
+    @return seasons: list object containing the season_dict keys.
+    """
+    seasons = [s.strip().lower() for s in season.split(",") if s.strip()]
+    if seasons == ["none"]:
+        return []
+
+    for s in seasons:
+        if s not in season_dict:
+            raise ValueError("Unknown season: {0} (select from {1} or none)".format(s, ", ".join(season_dict)))
+
+    return seasons
+
+
+def aggregate_fn(output_df, seasons):
+    """ Aggregate the monthly zone means by site and season year.
+
+    @param output_df: dataframe object containing the step1_8 output (ident, site, im_date (YYYYMMDD), mean).
+    @param seasons: list object containing the season_dict keys to aggregate.
+    @return season_df: dataframe object containing a row per site, season and season year
+        (ident, site, season, s_year, start, end, n_months, n_valid, complete, sum, mean, median).
+    """
+    dates = pd.to_datetime(output_df["im_date"].astype(str), format="%Y%m%d", errors="coerce")
+    monthly_df = pd.DataFrame({"ident": output_df["ident"].values, "site": output_df["site"].values,
+                               "value": pd.to_numeric(output_df["mean"], errors="coerce").values,
+                               "year": dates.dt.year.values, "month": dates.dt.month.values})
+    monthly_df = monthly_df[dates.notnull().values]
+
+    season_list = []
+    for season in seasons:
+        months = season_dict[season]
+        season_df = monthly_df[monthly_df["month"].isin(months)]
+        # months before the first month of the season belong to the season that started the previous year.
+        s_year = (season_df["year"] - (season_df["month"] < months[0]).astype(int)).astype(int).rename("s_year")
+
+        grouped = season_df.groupby([season_df["ident"], season_df["site"], s_year])["value"]
+        agg_df = grouped.agg(["size", "count", "sum", "mean", "median"]).reset_index()
+        agg_df.rename(columns={"size": "n_months", "count": "n_valid"}, inplace=True)
+        agg_df.insert(2, "season", season)
+        end_year = agg_df["s_year"] + int(months[-1] < months[0])
+        agg_df.insert(4, "start", agg_df["s_year"].astype(str) + "{0:02d}".format(months[0]))
+        agg_df.insert(5, "end", end_year.astype(str) + "{0:02d}".format(months[-1]))
+        agg_df.insert(8, "complete", agg_df["n_valid"] == len(months))
+        season_list.append(agg_df)
+
+    if not season_list:
+        return pd.DataFrame()
+
+    return pd.concat(season_list, ignore_index=True)
+
+
+def main_routine(output_df, out_dir, data_type, seasons):
+    """ Derive the seasonal and annual aggregates from the monthly (cor) series and export a csv per site.
+
+    @param output_df: dataframe object containing the step1_8 output of a cor directory.
+    @param out_dir: string object containing the output directory of the cor directory.
+    @param data_type: string object containing the directory name used in the output file names.
+    @param seasons: list object containing the season_dict keys to aggregate.
+    @return season_df: dataframe object containing the aggregates.
+    """
+    season_df = aggregate_fn(output_df, seasons)
+    if season_df.empty:
+        logger.warning("%s: no seasonal aggregates derived", data_type)
+        return season_df
+
+    season_df["d_type"] = data_type
+    sites = season_df["site"].unique()
+    logger.info("%s: %d seasonal aggregates (%s) for %d sites", data_type, len(season_df.index), ", ".join(seasons),
+                len(sites))
+
+    for site, site_df in season_df.groupby("site", sort=False):
+        out_path = os.path.join(out_dir, "{0}_{1}_seasonal_stats.csv".format(str(site), data_type))
+        site_df.to_csv(out_path, index=False)
+        logger.debug("out_path: %s", out_path)
+
+    return season_df
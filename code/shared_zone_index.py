@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+"""
+shared_zone_index.py
+====================
+
+Description: This script places a zone index (zonal_engine.build_zone_index_fn) and the zone geometries once in
+shared memory, so that pooled extraction workers attach to it without copying, pickling or re-reading the site
+shapefile - the start up time and memory of each worker stay constant whatever the number of sites.
+
+1. publish_fn copies the zone index arrays (offsets, starts, weights, zone_fp, uid, site) and the zone geometries
+(WKB bytes and their offsets, with the zone crs) into a single block:
+    mode 'shm'  - multiprocessing.shared_memory (the default).
+    mode 'mmap' - a memory mapped file (i.e. on /dev/shm or a local disk), for platforms or schedulers where shared
+                  memory blocks are not available.
+and returns a small picklable handle (block name or path, and the offset, dtype and shape of each array) that is
+passed to the workers (i.e. the multiprocessing.Pool initializer).
+
+2. attach_fn returns the zone index as numpy views on the shared block (zero copy); attach_zones_fn returns the zones
+(geometry_provider.read_zones_fn format) decoded from the shared WKB, for a worker that meets a grid the published
+zone index does not cover.
+
+3. release_fn closes the block and, in the publishing process, removes it.
+
+Text and object arrays are stored as fixed width unicode arrays.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import uuid
+import tempfile
+import warnings
+import lazy_imports
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("shared")
+
+np = lazy_imports.lazy_module_fn("numpy")
+shapely_wkb = lazy_imports.lazy_module_fn("shapely.wkb")
+
+# the zone index arrays placed in the shared block.
+index_array_list = ["offsets", "starts", "weights", "zone_fp", "uid", "site"]
+
+# the zone index scalars passed in the handle.
+index_scalar_list = ["n_zones", "n_footprints", "width", "height", "signature"]
+
+# {block name: SharedMemory or numpy memmap object} held open by this process.
+block_dict = {}
+
+alignment = 64
+
+
+def shareable_fn(array):
+    """ Return an array that can be placed in a shared block (object arrays as fixed width unicode). """
+    array = np.asarray(array)
+    if array.dtype == object:
+        array = array.astype(str)
+
+    return np.ascontiguousarray(array)
+
+
+def layout_fn(arrays):
+    """ Return the aligned layout {name: [offset, dtype, shape]} and the block size of a dictionary of arrays. """
+    layout = {}
+    size = 0
+    for name, array in arrays.items():
+        size = (size + alignment - 1) // alignment * alignment
+        layout[name] = [size, array.dtype.str, list(array.shape)]
+        size += array.nbytes
+
+    return layout, max(size, 1)
+
+
+def zone_arrays_fn(zones):
+    """ Return the zone geometries (WKB bytes and offsets) as arrays. """
+    wkb_list = [g.wkb if g is not None else b"" for g in zones["geometries"]]
+    wkb_offsets = np.zeros(len(wkb_list) + 1, dtype=np.int64)
+    wkb_offsets[1:] = np.cumsum([len(w) for w in wkb_list])
+
+    return {"wkb": np.frombuffer(b"".join(wkb_list) or b"\0", dtype=np.uint8), "wkb_offsets": wkb_offsets,
+            "zone_uid": shareable_fn(zones["uid"]), "zone_site": shareable_fn(zones["site"])}
+
+
+def publish_fn(zone_index, zones=None, mode="shm", directory=None):
+    """ Place a zone index (and optionally the zones) in a shared block.
+
+    @param zone_index: dictionary object returned by zonal_engine.build_zone_index_fn.
+    @param zones: dictionary object returned by geometry_provider.read_zones_fn (None to share the index only).
+    @param mode: string object 'shm' (multiprocessing.shared_memory) or 'mmap' (memory mapped file).
+    @param directory: string object containing the directory of the memory mapped file (mode 'mmap').
+    @return handle: dictionary object (picklable) used by attach_fn and release_fn.
+    """
+    arrays = dict((name, shareable_fn(zone_index[name])) for name in index_array_list)
+    if zones is not None:
+        arrays.update(zone_arrays_fn(zones))
+    layout, size = layout_fn(arrays)
+
+    if mode == "shm":
+        from multiprocessing import shared_memory
+        block = shared_memory.SharedMemory(create=True, size=size)
+        name = block.name
+        buffer = block.buf
+    elif mode == "mmap":
+        name = os.path.join(directory or tempfile.gettempdir(), "zone_index_{0}.bin".format(uuid.uuid4().hex))
+        block = np.memmap(name, dtype=np.uint8, mode="w+", shape=(size,))
+        buffer = block
+    else:
+        raise ValueError("Unknown shared zone index mode: {0} (shm or mmap)".format(mode))
+
+    for array_name, array in arrays.items():
+        offset, dtype, shape = layout[array_name]
+        np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)[...] = array
+    if mode == "mmap":
+        block.flush()
+    block_dict[name] = block
+
+    handle = {"mode": mode, "name": name, "size": size, "layout": layout, "owner": os.getpid(),
+              "scalars": dict((key, zone_index[key]) for key in index_scalar_list),
+              "crs_wkt": zones["crs_wkt"] if zones is not None else None}
+    logger.info("zone index shared (%s, %.1f MB): %d zones, %d footprints", mode, size / 1048576.0,
+                zone_index["n_zones"], zone_index["n_footprints"])
+
+    return handle
+
+
+def block_fn(handle):
+    """ Return the buffer of the shared block of a handle (attached once per process). """
+    block = block_dict.get(handle["name"])
+    if block is None:
+        if handle["mode"] == "shm":
+            from multiprocessing import shared_memory
+            try:
+                block = shared_memory.SharedMemory(name=handle["name"], track=False)
+            except TypeError:
+                # python < 3.13: stop the resource tracker of the worker removing the block of the publisher.
+                from multiprocessing import resource_tracker
+                block = shared_memory.SharedMemory(name=handle["name"])
+                resource_tracker.unregister(block._name, "shared_memory")
+        else:
+            block = np.memmap(handle["name"], dtype=np.uint8, mode="r", shape=(handle["size"],))
+        block_dict[handle["name"]] = block
+
+    return block.buf if handle["mode"] == "shm" else block
+
+
+def array_fn(handle, name):
+    """ Return a read only numpy view of a shared array (zero copy). """
+    offset, dtype, shape = handle["layout"][name]
+    array = np.ndarray(shape, dtype=dtype, buffer=block_fn(handle), offset=offset)
+    array.flags.writeable = False
+
+    return array
+
+
+def attach_fn(handle):
+    """ Return the zone index as views on the shared block (the zonal_engine zone index format).
+
+    @param handle: dictionary object returned by publish_fn.
+    @return zone_index: dictionary object.
+    """
+    zone_index = dict((name, array_fn(handle, name)) for name in index_array_list)
+    zone_index.update(handle["scalars"])
+
+    return zone_index
+
+
+def attach_zones_fn(handle):
+    """ Return the zones (geometry_provider.read_zones_fn format) decoded from the shared WKB.
+
+    @param handle: dictionary object returned by publish_fn with zones.
+    @return zones: dictionary object or None when the zones were not shared.
+    """
+    if "wkb" not in handle["layout"]:
+        return None
+
+    wkb = array_fn(handle, "wkb")
+    wkb_offsets = array_fn(handle, "wkb_offsets")
+    geometries = []
+    for z in range(len(wkb_offsets) - 1):
+        start, end = wkb_offsets[z], wkb_offsets[z + 1]
+        geometries.append(shapely_wkb.loads(wkb[start:end].tobytes()) if end > start else None)
+
+    return {"geometries": geometries, "uid": array_fn(handle, "zone_uid").tolist(),
+            "site": array_fn(handle, "zone_site").tolist(), "crs_wkt": handle["crs_wkt"], "projected": {}}
+
+
+def release_fn(handle):
+    """ Close the shared block of a handle (and remove it in the publishing process). """
+    block = block_dict.pop(handle["name"], None)
+    owner = handle["owner"] == os.getpid()
+    if handle["mode"] == "shm":
+        if block is not None:
+            block.close()
+            if owner:
+                block.unlink()
+    else:
+        del block
+        if owner and os.path.isfile(handle["name"]):
+            os.remove(handle["name"])
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+"""
+site_attribution.py
+===================
+
+Description: This script tags every site with its property name, property tag (PROP_TAG), pastoral district and
+Landsat tiles in one indexed spatial join against the Pastoral Estate and tile grid layers, in place of a property name
+look up per site (step1_3.prop_code_extraction_fn, exact upper case names only).
+
+1. attribute_fn joins the sites with the layers once per run (geopandas sjoin, which queries the spatial index of the
+layer):
+    Pastoral Estate  - the polygon containing a point within each site (representative point, so a site straddling
+                       a boundary takes one property); the estate_fields attributes are copied (blank when the site
+                       is outside the estate, or the layer has no such field).
+    tile grid        - the WRS2 tiles each site intersects (tile_routing.join_fn), comma separated.
+
+2. The joined attributes are cached in the attribution cache file by the sha1 of each layer (the shapefile and its
+side car files, hashed again only when a file changes), so a repeat run over the same layers reads no layer and
+joins only the new sites:
+    {"version", "layers": {path: {"key": [mtime, size], "hash"}},
+     "joins": {"{estate hash}:{grid hash}:{site crs hash}": {site point wkb sha1: [attributes]}}}
+
+    python site_attribution.py --sites hectare_sites_albers.shp --pastoral_estate pastoral_estate.shp
+        --tile_grid wrs2_descending.shp --output site_attributes.csv
+
+The cache hits and misses are published through run_metrics (cache 'attribution', one per site).
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import glob
+import json
+import hashlib
+import argparse
+import warnings
+import lazy_imports
+import run_metrics
+import tile_routing
+import raster_metadata
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("attribution")
+
+gpd = lazy_imports.lazy_module_fn("geopandas")
+pd = lazy_imports.lazy_module_fn("pandas")
+
+default_cache_path = os.path.join(os.path.expanduser("~"), ".zonal_pipeline_attribution.json")
+
+cache_version = 1
+
+# output column: Pastoral Estate attribute.
+estate_fields = {"PROPERTY": "PROPERTY",
+                 "PROP_TAG": "PROP_TAG",
+                 "DISTRICT": "DISTRICT",
+                 }
+
+tile_column = "TILES"
+
+# side car files hashed with a shapefile (a layer in a single file format is hashed alone).
+side_car_list = [".shp", ".shx", ".dbf", ".prj", ".cpg"]
+
+# joins kept in the cache file (the least recently used layer versions are dropped).
+max_joins = 4
+
+
+def new_cache_fn():
+    """ Return an empty attribution cache. """
+    return {"version": cache_version, "layers": {}, "joins": {}}
+
+
+def load_cache_fn(cache_path):
+    """ Load the attribution cache file (an empty cache when it is missing, unreadable or of another version). """
+    if not cache_path or not os.path.isfile(cache_path):
+        return new_cache_fn()
+
+    try:
+        with open(cache_path, "r") as cache_file:
+            cache = json.load(cache_file)
+    except ValueError:
+        logger.warning("The attribution cache could not be read and will be rebuilt: %s", cache_path)
+        return new_cache_fn()
+
+    return cache if cache.get("version") == cache_version else new_cache_fn()
+
+
+def save_cache_fn(cache, cache_path):
+    """ Write the attribution cache file (temporary file + rename). """
+    if not cache_path:
+        return
+
+    while len(cache["joins"]) > max_joins:
+        cache["joins"].pop(next(iter(cache["joins"])))
+
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, "w") as output:
+        json.dump(cache, output)
+    os.replace(temp_path, cache_path)
+
+
+def layer_files_fn(layer_path):
+    """ Return the files of a layer (a shapefile and its side car files, otherwise the file itself). """
+    stem, extension = os.path.splitext(layer_path)
+    if extension.lower() != ".shp":
+        return [layer_path]
+
+    return sorted(f for f in glob.glob(stem + ".*") if os.path.splitext(f)[1].lower() in side_car_list)
+
+
+def layer_hash_fn(layer_path, cache):
+    """ Return the sha1 of the files of a layer (re-hashed only when a file modification time or size changed).
+
+    @param layer_path: string object containing the path to the layer (i.e. a shapefile).
+    @param cache: dictionary object returned by load_cache_fn (the layer hashes are recorded in cache["layers"]).
+    @return layer_hash: string object containing the sha1 hex digest.
+    """
+    files = layer_files_fn(layer_path)
+    key = [raster_metadata.file_key_fn(f) for f in files]
+    entry = cache["layers"].get(os.path.abspath(layer_path))
+    if entry is not None and entry["key"] == key:
+        return entry["hash"]
+
+    digest = hashlib.sha1()
+    for file_path in files:
+        digest.update(os.path.splitext(file_path)[1].lower().encode("utf-8"))
+        with open(file_path, "rb") as layer_file:
+            for chunk in iter(lambda: layer_file.read(1 << 20), b""):
+                digest.update(chunk)
+    layer_hash = digest.hexdigest()
+    cache["layers"][os.path.abspath(layer_path)] = {"key": key, "hash": layer_hash}
+
+    return layer_hash
+
+
+def site_keys_fn(points):
+    """ Return the cache key of each site (sha1 of the wkb of its representative point). """
+    return [hashlib.sha1(p.wkb).hexdigest() if p is not None else "" for p in points]
+
+
+def read_estate_fn(pastoral_estate):
+    """ Return the Pastoral Estate as a GeoDataFrame of the estate_fields (missing fields blank). """
+    estate_gdf = gpd.read_file(pastoral_estate)
+    if estate_gdf.crs is None:
+        raise ValueError("{0} has no crs - the crs can not be confirmed to match the sites.".format(pastoral_estate))
+
+    missing = [field for field in estate_fields.values() if field not in estate_gdf.columns]
+    if missing:
+        logger.warning("%s has no %s attribute(s) - left blank", pastoral_estate, ", ".join(missing))
+    columns = dict((column, estate_gdf[field].astype(str) if field in estate_gdf.columns else "")
+                   for column, field in estate_fields.items())
+
+    return gpd.GeoDataFrame(columns, geometry=estate_gdf.geometry, crs=estate_gdf.crs)
+
+
+def join_estate_fn(points_gdf, estate_gdf):
+    """ Return {site row: [estate attributes]} of the points within the estate (first polygon where they overlap). """
+    joined = gpd.sjoin(points_gdf.to_crs(estate_gdf.crs), estate_gdf, how="inner", predicate="within")
+    joined = joined[~joined.index.duplicated(keep="first")]
+
+    return dict(zip(joined.index, joined[list(estate_fields)].values.tolist()))
+
+
+def attribute_fn(sites_gdf, pastoral_estate=None, tile_grid=None, cache_path=default_cache_path):
+    """ Return the property, property tag, district and tile attributes of every site.
+
+    @param sites_gdf: GeoDataFrame object containing the site zones (i.e. the step1_3 1ha buffers).
+    @param pastoral_estate: string object containing the path to the Pastoral Estate layer (None to skip).
+    @param tile_grid: string object containing the path to the WRS2 tile grid layer (None to skip).
+    @param cache_path: string object containing the path of the attribution cache file (None for no cache file).
+    @return attribute_df: Pandas dataframe (sites_gdf index) containing the estate_fields and TILES columns.
+    """
+    if sites_gdf.crs is None:
+        raise ValueError("The sites have no crs - the crs can not be confirmed to match the layers.")
+
+    columns = (list(estate_fields) if pastoral_estate else []) + ([tile_column] if tile_grid else [])
+    if not columns:
+        return pd.DataFrame(index=sites_gdf.index)
+
+    cache = load_cache_fn(cache_path)
+    estate_hash = layer_hash_fn(pastoral_estate, cache) if pastoral_estate else ""
+    grid_hash = layer_hash_fn(tile_grid, cache) if tile_grid else ""
+    crs_hash = hashlib.sha1(sites_gdf.crs.to_wkt().encode("utf-8")).hexdigest()
+    join_key = "{0}:{1}:{2}".format(estate_hash, grid_hash, crs_hash)
+    joined = cache["joins"].pop(join_key, {})
+    cache["joins"][join_key] = joined
+
+    points = sites_gdf.geometry.representative_point()
+    keys = site_keys_fn(points)
+    rows = [row for row, key in enumerate(keys) if key not in joined]
+    for key in keys:
+        run_metrics.cache_fn("attribution", key in joined)
+
+    if rows:
+        # only the sites missing from the cache are joined (and the layers read).
+        points_gdf = gpd.GeoDataFrame(geometry=points.iloc[rows].values, crs=sites_gdf.crs)
+        estate = join_estate_fn(points_gdf, read_estate_fn(pastoral_estate)) if pastoral_estate else {}
+        tiles = {}
+        if tile_grid:
+            zones_gdf = gpd.GeoDataFrame({"uid": rows}, geometry=sites_gdf.geometry.iloc[rows].values,
+                                         crs=sites_gdf.crs)
+            tiles = tile_routing.join_fn(zones_gdf, tile_routing.read_grid_fn(tile_grid))
+        for i, row in enumerate(rows):
+            values = estate.get(i, [""] * len(estate_fields)) if pastoral_estate else []
+            joined[keys[row]] = values + ([",".join(tiles.get(str(row), []))] if tile_grid else [])
+        logger.info("%d sites joined to the layers (%d from the attribution cache)", len(rows),
+                    len(keys) - len(rows))
+
+        save_cache_fn(cache, cache_path)
+
+    attribute_df = pd.DataFrame([joined.get(key, [""] * len(columns)) for key in keys], columns=columns,
+                                index=sites_gdf.index)
+    if pastoral_estate:
+        outside = int((attribute_df["PROP_TAG"] == "").sum())
+        if outside:
+            logger.warning("%d sites are outside the Pastoral Estate (no property attributes)", outside)
+
+    return attribute_df
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description="Tag the sites with their property, property tag, district and Landsat tiles (spatial join).")
+
+    p.add_argument('--sites', help="The path to the site shapefile (i.e. the step1_3 1ha buffers).", required=True)
+
+    p.add_argument('--pastoral_estate', default=None, help="The path to the Pastoral Estate layer.")
+
+    p.add_argument('--tile_grid', default=None, help="The path to the WRS2 tile grid layer.")
+
+    p.add_argument('--output', help="The path of the site attribute csv file.", required=True)
+
+    p.add_argument('--cache', default=default_cache_path,
+                   help="The path of the attribution cache file ('off' for no cache file)")
+
+    p.add_argument('-l', '--log_file', help="The path of an optional log file (written in addition to the console)",
+                   default=None)
+
+    pipeline_logging.add_logging_args_fn(p)
+
+    return p.parse_args()
+
+
+def main_routine():
+    """ Attribute the sites and write the site attribute csv file. """
+    cmd_args = get_cmd_args_fn()
+    pipeline_logging.setup_logging_fn(cmd_args.quiet, cmd_args.verbose, cmd_args.log_file)
+    if not cmd_args.pastoral_estate and not cmd_args.tile_grid:
+        raise ValueError("Enter --pastoral_estate and/or --tile_grid")
+
+    sites_gdf = gpd.read_file(cmd_args.sites)
+    attribute_df = attribute_fn(sites_gdf, cmd_args.pastoral_estate, cmd_args.tile_grid,
+                                None if cmd_args.cache == "off" else cmd_args.cache)
+    site_columns = [c for c in ("uid", "site_name") if c in sites_gdf.columns]
+    pd.concat([sites_gdf[site_columns], attribute_df], axis=1).to_csv(cmd_args.output, index=False)
+    logger.info("%d site attributes written to %s", len(attribute_df.index), cmd_args.output)
+
+
+if __name__ == "__main__":
+    main_routine()
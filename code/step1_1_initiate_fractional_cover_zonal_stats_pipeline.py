@@ -78,8 +78,9 @@ NOTE2: the folder created is titled (YYYYMMDD_TIME) to avoid the accidental dele
 conventions.
 
 --image_count
-integer object that contains the minimum number of Landsat images (per tile) required for the fractional cover
-zonal stats -- default value set to 800.
+integer object that contains the minimum number of valid images of a monthly series (cor) directory, checked by the
+pre-flight checks (a shorter series is reported and, with --preflight exclude, not extracted) -- default value set to
+0 (no minimum).
 
 --landsat_dir: str
 string object containing the path to the Landsat Directory -- default value set to r'Z:\Landsat\wrs2'.
@@ -115,11 +116,27 @@ import shutil
 import sys
 import warnings
 import glob
-import pandas as pd
-import geopandas
+import run_profiler
+import run_metrics
+import pipeline_logging
+import image_catalog
+import run_planner
+import seasonal_aggregates
+import climatology_anomalies
+import antecedent_windows
+import preflight_check
+import raster_metadata
+import work_queue
+import raster_mirror
+import watch_mode
+import multi_scale
+import site_attribution
+import quick_look
 
 warnings.filterwarnings("ignore")
 
+logger = pipeline_logging.get_logger_fn("step1_1")
+
 
 def get_cmd_args_fn():
     p = argparse.ArgumentParser(
@@ -132,8 +149,61 @@ def get_cmd_args_fn():
                    default=r'C:\Users\robot\projects\outputs\qld_silo')
 
     p.add_argument('-i', '--image_count', type=int,
-                   help='Enter the minimum amount of Landsat images required per tile as an integer (i.e. 950).',
-                   default=100)
+                   help='Enter the minimum number of valid images of a monthly series (cor) directory (i.e. 360): a '
+                        'shorter series is reported by the pre-flight checks and excluded with --preflight exclude '
+                        '(default 0, no minimum).',
+                   default=0)
+
+    p.add_argument('--preflight', choices=['fail', 'exclude', 'off'], default='exclude',
+                   help="Check the raster headers (grid, dtype, no data, date gaps, duplicates, unreadable files and "
+                        "--image_count) before extraction: exclude the offending images and directories (default, "
+                        "gaps are reported only), fail the run on any issue, or off")
+
+    p.add_argument('-pw', '--preflight_workers', type=int, default=8,
+                   help="Enter the number of threads reading raster headers for the pre-flight checks")
+
+    p.add_argument('--metadata_cache', default=raster_metadata.default_cache_path,
+                   help="The path of the raster metadata cache file (no data, scale, offset, dtype and statistics "
+                        "per image, re-read when an image changes)")
+
+    p.add_argument('--queue', default=None,
+                   help="The work queue directory (on a file system shared by the workers): the extraction is split "
+                        "into work units processed by work_queue.py workers on any host and merged in order. The "
+                        "images and the export directory must be readable by every worker")
+
+    p.add_argument('--queue_workers', type=int, default=0,
+                   help="Enter the number of local worker processes started on the --queue (0 for external workers "
+                        "only)")
+
+    p.add_argument('-iw', '--image_workers', type=int, default=1,
+                   help="Enter the number of worker processes extracting the images of a directory (the zone index "
+                        "is shared with the workers in shared memory)")
+
+    p.add_argument('--share_mode', choices=['shm', 'mmap'], default='shm',
+                   help="Share the zone index with the --image_workers through shared memory (shm) or a memory "
+                        "mapped file (mmap)")
+
+    p.add_argument('--chunk_size', type=int, default=50, help="Enter the number of images per --queue work unit")
+
+    p.add_argument('--window_cache', default=None,
+                   help="The path of a local site-window extract cache directory: the site windows of each image are "
+                        "stored once in a memory mapped stack (read by --image_workers threads) and later runs read "
+                        "them from the stack")
+
+    p.add_argument('--mirror', default=None,
+                   help="The path of a local raster mirror directory: the images are copied from the share on first "
+                        "use (prefetched ahead of the extraction) and later runs read the local copies (not "
+                        "accepted with --queue: the mirror index is kept by a single process)")
+
+    p.add_argument('--mirror_gb', type=float, default=100.0,
+                   help="Enter the disk budget of the --mirror in GB (least recently used files are evicted)")
+
+    p.add_argument('--mirror_validate', choices=raster_mirror.validate_list, default="mtime",
+                   help="Validate the --mirror copies by the source size, modification time (and size) or the sha1 "
+                        "of the local copy")
+
+    p.add_argument('--mirror_cog', action='store_true',
+                   help="Convert the --mirror copies to tiled, compressed GeoTIFF with internal overviews")
 
     p.add_argument('-ma', '--met_analysis', help="The path to the met analysis directory",
                    default=r"C:\Users\robot\projects\development\met_analysis")
@@ -141,19 +211,153 @@ def get_cmd_args_fn():
     p.add_argument('-n', '--no_data', help="Enter the Landsat Fractional Cover no data value (i.e. -1)",
                    default=-1)
 
-    p.add_argument('-s', '--season', help="Enter the season (i.e. annual, wet, dry)",
-                   default="ann")
+    p.add_argument('-s', '--season', help="Enter the seasons derived from the monthly (cor) series, comma separated "
+                                          "(ann, wet, dry) or none to extract the seasonal (ssav, ssmd) rasters",
+                   default="ann,wet,dry")
+
+    p.add_argument('-bp', '--base_period', help="Enter the climatology base period used to derive the monthly "
+                                                "anomalies from the monthly (cor) series (i.e. 1991-2020), all for "
+                                                "the whole series or none to extract the climatology (mavg, mmed) "
+                                                "rasters", default="all")
+
+    p.add_argument('-w', '--windows', help="Enter the antecedent windows (months ending at each site visit date) "
+                                           "derived from the monthly (cor) series, comma separated (i.e. 3,6,12,24) "
+                                           "or none", default="3,6,12,24")
+
+    p.add_argument('--scales', default="none",
+                   help="Enter the larger nested zones extracted with the 1ha zone from the same read, comma "
+                        "separated (25ha, 1km, 5km) or none - written as a column family per scale (i.e. "
+                        "mean_5km)")
+
+    p.add_argument('--quick', type=int, default=0,
+                   help="Enter a decimation factor (i.e. 4) for an approximate quick look: the images are read from "
+                        "overviews of the factor (decimated copies are cached where an image has none) and the "
+                        "error against full resolution is written to {data_type}_quick_report.json (not used with "
+                        "--queue)")
+
+    p.add_argument('--quick_every', type=int, default=1,
+                   help="Enter n to extract every nth image (date) only in a quick look (the seasonal, anomaly and "
+                        "window products are then read, not derived)")
+
+    p.add_argument('--quick_calibration', type=int, default=4,
+                   help="Enter the number of images also extracted at full resolution to estimate the --quick error")
+
+    p.add_argument('--quick_cache', default=quick_look.default_cache_dir,
+                   help="The directory the --quick decimated copies are cached in")
+
+    p.add_argument('--pastoral_estate', default=None,
+                   help="The path to the Pastoral Estate layer: every site is tagged with its property, property tag "
+                        "and district (spatial join, written to export_dir/site_attributes.csv)")
+
+    p.add_argument('--tile_grid', default=None,
+                   help="The path to the WRS2 tile grid layer: every site is tagged with the Landsat tiles it "
+                        "intersects")
+
+    p.add_argument('--attribute_cache', default=site_attribution.default_cache_path,
+                   help="The path of the site attribution cache file (joins cached by layer hash, 'off' for no "
+                        "cache file)")
 
     p.add_argument('-m', '--met_ver', help="Enter the met variable (i.e. daily_rain, rh_tmax)",
                    default="daily_rain")
 
+    p.add_argument('-r', '--report', help="The path of the json run report (default: export_dir/run_report.json)",
+                   default=None)
+
+    p.add_argument('-p', '--profile', help="The path of an optional cProfile dump of the extraction stages",
+                   default=None)
+
+    p.add_argument('-pm', '--metrics', help="The path of a live progress metrics file (Prometheus textfile format, "
+                                            "i.e. node_exporter_textfile_dir/zonal_pipeline.prom)",
+                   default=None)
+
+    p.add_argument('-mi', '--metrics_interval', type=float,
+                   help="The minimum number of seconds between rewrites of the metrics file", default=15.0)
+
+    p.add_argument('-l', '--log_file', help="The path of an optional log file (written in addition to the console)",
+                   default=None)
+
+    p.add_argument('--plan', action='store_true',
+                   help="List the directories, products, image counts, date ranges and site count to be processed "
+                        "with an estimated runtime, then exit (the GDAL stack is not imported)")
+
+    p.add_argument('--calibration', help="The path of the per image cost calibration file used by --plan",
+                   default=run_planner.default_calibration_path)
+
+    p.add_argument('--calibrate', help="Comma separated run_report.json paths used to fit the --calibration file",
+                   default=None)
+
+    p.add_argument('--watch', action='store_true',
+                   help="Stay resident and extract the new images landing under the met_analysis (and --watch_landsat) "
+                        "root for the affected sites, merging them into export_dir/watch_{met_ver}")
+
+    p.add_argument('--watch_interval', type=float, default=60.0, help="Enter the seconds between --watch polls")
+
+    p.add_argument('--watch_settle', type=float, default=120.0,
+                   help="Enter the seconds a new image must keep its size and modification time before it is read")
+
+    p.add_argument('--watch_batch', type=float, default=300.0,
+                   help="Enter the seconds without a new arrival before a --watch batch is extracted")
+
+    p.add_argument('--watch_landsat', default=None,
+                   help="The Landsat root also watched by --watch (new images extracted by step1_9 for the sites "
+                        "routed to their tile)")
+
+    p.add_argument('--landsat_extension', default=".img", help="Enter the file extension of the --watch_landsat images")
+
+    p.add_argument('--routing_index', default=None,
+                   help="The path to the routing index json file (tile_routing) used by --watch_landsat")
+
+    pipeline_logging.add_logging_args_fn(p)
+
     cmd_args = p.parse_args()
 
+    if cmd_args.calibrate:
+        run_planner.calibrate_fn(cmd_args.calibrate.split(","), cmd_args.calibration)
+
+        sys.exit()
+
     if cmd_args.data is None:
         p.print_help()
 
         sys.exit()
 
+    # fail before any directories are created or heavy modules are imported.
+    if not os.path.isfile(cmd_args.data):
+        p.error("--data: site csv file not found: {0}".format(cmd_args.data))
+
+    try:
+        seasonal_aggregates.seasons_fn(cmd_args.season)
+    except ValueError as err:
+        p.error("--season: {0}".format(err))
+
+    try:
+        climatology_anomalies.base_period_fn(cmd_args.base_period)
+    except ValueError as err:
+        p.error("--base_period: {0}".format(err))
+
+    try:
+        antecedent_windows.windows_fn(cmd_args.windows)
+    except ValueError as err:
+        p.error("--windows: {0}".format(err))
+
+    try:
+        multi_scale.scales_fn(cmd_args.scales)
+    except ValueError as err:
+        p.error("--scales: {0}".format(err))
+
+    if cmd_args.queue and cmd_args.mirror:
+        p.error("--mirror can not be used with --queue (the queue workers read the images from the share)")
+
+    try:
+        quick_look.quick_fn(cmd_args.quick, cmd_args.quick_every, cmd_args.quick_calibration)
+    except ValueError as err:
+        p.error("--quick: {0}".format(err))
+
+    for layer_arg in ("pastoral_estate", "tile_grid"):
+        layer_path = getattr(cmd_args, layer_arg)
+        if layer_path and not os.path.isfile(layer_path):
+            p.error("--{0}: layer not found: {1}".format(layer_arg, layer_path))
+
     return cmd_args
 
 
@@ -181,7 +385,7 @@ def temporary_dir_fn():
         shutil.rmtree(temp_dir_path)
 
     except:
-        print('The following temporary directory will be created: ', temp_dir_path)
+        logger.info('The following temporary directory will be created: %s', temp_dir_path)
         pass
     # create folder a temporary folder titled (titled 'tempFolder'
     os.makedirs(temp_dir_path)
@@ -242,7 +446,7 @@ def export_file_path_fn(export_dir, final_user):
         shutil.rmtree(export_dir_path)
 
     except:
-        print('The following export directory will be created: ', export_dir_path)
+        logger.info('The following export directory will be created: %s', export_dir_path)
         pass
 
     # create folder.
@@ -272,7 +476,7 @@ def export_dir_folders_list_fn(export_dir_path, met_ver, sub_dir_list):
     for i in sub_dir_list:
         i_output_dir = (os.path.join(met_dir, i))
         #os.mkdir(i_output_dir)
-        print(f"Created: {i_output_dir}")
+        logger.debug("Created: %s", i_output_dir)
         ex_dir_path_list.append(i_output_dir)
 
     return ex_dir_path_list
@@ -292,7 +496,7 @@ def export_dir_folders_fn(out):
     ex_dir_path_list = []
     for i in out:
         os.mkdir(i)
-        print(f"Created: {i}")
+        logger.debug("Created: %s", i)
         ex_dir_path_list.append(i)
 
 
@@ -337,10 +541,21 @@ def main_routine():
     # tile_grid = cmd_args.tile_grid
     export_dir = cmd_args.export_dir
     met_analysis = cmd_args.met_analysis
-    season = cmd_args.season
+    seasons = seasonal_aggregates.seasons_fn(cmd_args.season)
+    base_period = climatology_anomalies.base_period_fn(cmd_args.base_period)
+    window_list = antecedent_windows.windows_fn(cmd_args.windows)
+    scales = multi_scale.scales_fn(cmd_args.scales)
+    quick = None if cmd_args.queue else quick_look.quick_fn(cmd_args.quick, cmd_args.quick_every,
+                                                            cmd_args.quick_calibration, cmd_args.quick_cache)
+    if quick and quick["every"] > 1:
+        # a monthly series sampled every nth month can not be aggregated, so the products are read instead.
+        seasons, base_period, window_list = [], None, []
     met_ver = cmd_args.met_ver
     no_data = int(cmd_args.no_data)
     image_count = int(cmd_args.image_count)
+    pipeline_logging.setup_logging_fn(cmd_args.quiet, cmd_args.verbose, cmd_args.log_file)
+    if cmd_args.queue and (cmd_args.quick > 1 or cmd_args.quick_every > 1):
+        logger.warning("--quick is not used with --queue (the work units are extracted at full resolution)")
 
     # dictionary {varable: [string_val, unit, variable, scale, null_data, add_offset, out_name]
     qld_dict = {"rh_tmax": [-20, "%", "rh_tmax", 0.1, -32767.0, 3276.5, "rhmax"],
@@ -364,7 +579,34 @@ def main_routine():
                 }
 
     dict_values = qld_dict.get(met_ver)
-    print("variable: ", dict_values)
+    if dict_values is None:
+        logger.error("Unknown met variable: %s (select from %s)", met_ver, ", ".join(qld_dict))
+        sys.exit(1)
+    logger.info("variable: %s", dict_values)
+
+    # the seasonal and climatology rasters are not read when they are derived from the monthly (cor) series.
+    skip_products = []
+    if seasons:
+        skip_products.extend(seasonal_aggregates.derived_product_list)
+    if base_period:
+        skip_products.extend(climatology_anomalies.derived_product_list)
+
+    # dry run: list what the run will do and exit without importing the GDAL stack or creating directories.
+    if cmd_args.plan:
+        run_planner.main_routine(os.path.join(met_analysis, "nt", dict_values[-1]), data, cmd_args.calibration,
+                                 skip_products)
+
+        sys.exit()
+
+    if cmd_args.watch:
+        if cmd_args.mirror:
+            raster_mirror.configure_fn(cmd_args.mirror, cmd_args.mirror_gb, cmd_args.mirror_validate,
+                                       cmd_args.mirror_cog)
+        watch_mode.main_routine(cmd_args, qld_dict, skip_products, seasons, base_period, window_list,
+                                lambda directory: split_path_at_4th_dir(directory)[1].replace("\\", "_"))
+
+        sys.exit()
+
     # call the temporaryDir function.
     temp_dir_path, final_user = temporary_dir_fn()
     # call the tempDirFolders function.
@@ -372,28 +614,59 @@ def main_routine():
     # call the exportFilepath function.
     export_dir_path = export_file_path_fn(export_dir, final_user)
 
+    # write a run report (per stage timings, bytes read and peak rss) at exit.
+    report_path = cmd_args.report or os.path.join(export_dir_path, "run_report.json")
+    run_profiler.start_fn(report_path, cmd_args.profile)
+
+    # publish live progress counters (images done / remaining, rate and eta) for the node exporter.
+    if cmd_args.metrics:
+        run_metrics.start_fn(cmd_args.metrics, cmd_args.metrics_interval)
+
+    # the raster metadata (no data values, stored statistics) cached from previous runs.
+    raster_metadata.load_cache_fn(cmd_args.metadata_cache)
+
     nt_path = os.path.join(met_analysis, "nt", dict_values[-1])
-    print("nt_path: ", nt_path)
+    logger.info("nt_path: %s", nt_path)
 
     # Begin finding directory paths
     root_directory = nt_path
     extension = '.tif'  # Change this to the file extension you're looking for
-    directories = find_directories_with_file_type(root_directory, extension)
+    with run_profiler.stage_fn("directory_discovery", root_directory=root_directory):
+        directories = find_directories_with_file_type(root_directory, extension)
+
+    # check the raster headers of every directory to be read before any extraction starts.
+    exclude_images = set()
+    exclude_directories = set()
+    if cmd_args.preflight != "off":
+        with run_profiler.stage_fn("preflight", workers=cmd_args.preflight_workers):
+            catalog = [c for c in image_catalog.catalog_fn(root_directory, extension)
+                       if c["product"] not in skip_products]
+            preflight = preflight_check.main_routine(catalog, image_count,
+                                                     os.path.join(export_dir_path, "preflight_report.json"),
+                                                     cmd_args.preflight_workers, cmd_args.metadata_cache)
+
+        if preflight["issues"] and cmd_args.preflight == "fail":
+            logger.error("pre-flight checks failed with %d issues (see %s); fix the inputs or re-run with "
+                         "--preflight exclude", len(preflight["issues"]),
+                         os.path.join(export_dir_path, "preflight_report.json"))
+            shutil.rmtree(temp_dir_path)
+            sys.exit(1)
+
+        exclude_images = set(preflight["excluded_images"])
+        exclude_directories = set(preflight["excluded_directories"])
 
     # Create a list of all directories that contain tiff files
     list_of_directories = []
     list_of_dir_create = []
     for directory in directories:
         list_of_directories.append(directory)
-        print("-" * 20)
-        print(directory)
+        logger.debug("directory: %s", directory)
 
         first_part, second_part = split_path_at_4th_dir(directory)
 
-        print("First part:", first_part)
-        print("Second part:", second_part)
+        logger.debug("First part: %s Second part: %s", first_part, second_part)
         out_sub_dir = second_part.replace("\\", "_")
-        print("out_sub_dir: ", out_sub_dir)
+        logger.debug("out_sub_dir: %s", out_sub_dir)
         list_of_dir_create.append(out_sub_dir)
 
     #     print(i, n)
@@ -422,119 +695,138 @@ def main_routine():
 
     create_ex_dir = []
     for i, o, d in zip(list_of_directories, ex_dir_path_list, list_of_dir_create):
-        print("i: ", i)
-        print("o:", o)
-        print("d:", d)
+        logger.debug("i: %s o: %s d: %s", i, o, d)
         # import sys
         # sys.exit()
 
-        if i.endswith("cor"):
-            print("-" * 30)
-            print("i cor: ", i)
-            print("o cor:", o)
-            select_o.append(o)
-            select_i.append(i)
-            select_d.append(d)
-            datesplit_s.append(-19)
-            datesplit_e.append(-11)
-            import step1_2_list_of_qld_grid_images
-            export_csv = step1_2_list_of_qld_grid_images.main_routine(i, o, d, "tif", temp_dir_path)
-            select_c.append(export_csv)
-            print("list of files: ", export_csv)
-
-        elif i.endswith("siav") or i.endswith("simd"):
-            print("-" * 30)
-            print("i siav or simd: ", i)
-            print("o siav or simd:", o)
-            select_o.append(o)
-            select_i.append(i)
-            select_d.append(d)
-            datesplit_s.append(-23)
-            datesplit_e.append(-17)
-            import step1_2_list_of_qld_grid_images
-            export_csv = step1_2_list_of_qld_grid_images.main_routine(i, o, d, "tif", temp_dir_path)
-            select_c.append(export_csv)
-            print("list of files: ", export_csv)
-
-
-        elif i.endswith("mavg") or i.endswith("mmed"):
-            print("-" * 30)
-            print("i mavg or mmed: ", i)
-            print("o mavg or mmed:", o)
-            select_o.append(o)
-            select_i.append(i)
-            select_d.append(d)
-            datesplit_s.append(-23)
-            datesplit_e.append(-17)
-            import step1_2_list_of_qld_grid_images
-            export_csv = step1_2_list_of_qld_grid_images.main_routine(i, o, d, "tif", temp_dir_path)
-            select_c.append(export_csv)
-            print("list of files: ", export_csv)
-
-        elif i.endswith("msum"):
-            print("-"*30)
-            print("i msum or msum: ", i)
-            select_o.append(o)
-            select_i.append(i)
-            select_d.append(d)
-            datesplit_s.append(-23)
-            datesplit_e.append(-17)
-            import step1_2_list_of_qld_grid_images
-            export_csv = step1_2_list_of_qld_grid_images.main_routine(i, o, d, "tif", temp_dir_path)
-            select_c.append(export_csv)
-            print("list of files: ", export_csv)
-
-        elif i.endswith("ssav") or i.endswith("ssmd"):
-            print("i ssav or ssav: ", i)
-            print("i ssmd or ssmd: ", i)
+        # the products and their file name date slices are defined in image_catalog.product_dict.
+        product = image_catalog.product_fn(i)
+        if product in skip_products:
+            logger.info("%s: derived from the monthly series, not read", d)
+        elif i in exclude_directories:
+            logger.warning("%s: excluded by the pre-flight checks", d)
+        elif product is not None:
+            logger.debug("i %s: %s o %s: %s", product, i, product, o)
             select_o.append(o)
             select_i.append(i)
             select_d.append(d)
-            datesplit_s.append(-23)
-            datesplit_e.append(-17)
+            date_s, date_e = image_catalog.product_dict[product]
+            datesplit_s.append(date_s)
+            datesplit_e.append(date_e)
             import step1_2_list_of_qld_grid_images
-            export_csv = step1_2_list_of_qld_grid_images.main_routine(i, o, d, "tif", temp_dir_path)
+            with run_profiler.stage_fn("step1_2_listing:{0}".format(d), in_dir=i):
+                export_csv = step1_2_list_of_qld_grid_images.main_routine(i, o, d, "tif", temp_dir_path,
+                                                                          exclude_images)
             select_c.append(export_csv)
-            print("list of files: ", export_csv)
-
-        else:
-            pass
+            logger.info("list of files: %s", export_csv)
 
-    print(export_csv)
     export_dir_folders_fn(select_o)
 
+    if cmd_args.mirror:
+        # the listed images are copied to the local mirror in the background while the sites are buffered.
+        raster_mirror.configure_fn(cmd_args.mirror, cmd_args.mirror_gb, cmd_args.mirror_validate, cmd_args.mirror_cog)
+        planned = []
+        for csv_list, date_s, date_e in zip(select_c, datesplit_s, datesplit_e):
+            with open(csv_list, 'r') as imagery_list:
+                planned.extend(quick_look.sample_fn([image.rstrip() for image in imagery_list], quick,
+                                                    quick_look.date_key_fn(date_s, date_e)))
+        raster_mirror.prefetch_fn(planned)
+
     # import sys
     # sys.exit()
     import step1_3_project_buffer
-    geo_df2, crs_name = step1_3_project_buffer.main_routine(data, export_dir_path, prime_temp_buffer_dir)
+    with run_profiler.stage_fn("step1_3_buffering", data=data):
+        geo_df2, crs_name, visit_df = step1_3_project_buffer.main_routine(data, export_dir_path,
+                                                                          prime_temp_buffer_dir)
 
     geo_df2.reset_index(drop=True, inplace=True)
     geo_df2['uid'] = geo_df2.index + 1
     #geo_df2.to_file(os.path.join(export_dir_path, "biomass_1ha.shp"))
 
-    shapefile_path = os.path.join(export_dir_path, "biomass_1ha_all_sites.shp")
-    geo_df2.to_file(os.path.join(shapefile_path),
-                    driver="ESRI Shapefile")
+    if cmd_args.pastoral_estate or cmd_args.tile_grid:
+        # property, district and tile attributes of every site from one spatial join (cached by layer hash).
+        with run_profiler.stage_fn("site_attribution", sites=len(geo_df2.index)):
+            attribute_df = site_attribution.attribute_fn(
+                geo_df2, cmd_args.pastoral_estate, cmd_args.tile_grid,
+                None if cmd_args.attribute_cache == "off" else cmd_args.attribute_cache)
+        geo_df2 = geo_df2.join(attribute_df)
+        attribute_path = os.path.join(export_dir_path, "site_attributes.csv")
+        geo_df2[["uid", "site_name"] + list(attribute_df.columns)].to_csv(attribute_path, index=False)
+        logger.info("Exported site attributes: %s", attribute_path)
 
-    print("Exported shapefile: ", shapefile_path)
+    shapefile_path = os.path.join(export_dir_path, "biomass_1ha_all_sites.shp")
+    with run_profiler.stage_fn("output_write:shapefile", path=shapefile_path):
+        geo_df2.to_file(os.path.join(shapefile_path),
+                        driver="ESRI Shapefile")
+
+    logger.info("Exported shapefile: %s", shapefile_path)
+
+    # total number of images to be processed (one image path per line of each image list csv).
+    images_total = 0
+    for csv_list, date_s, date_e in zip(select_c, datesplit_s, datesplit_e):
+        with open(csv_list, 'r') as imagery_list:
+            images_total += len(quick_look.sample_fn(imagery_list.readlines(), quick,
+                                                     quick_look.date_key_fn(date_s, date_e)))
+    run_metrics.set_total_fn(images_total)
+    run_metrics.set_queue_fn("directories", len(select_i))
+
+    # sharded extraction: queue the work units, wait for the workers and merge the results per directory below.
+    if cmd_args.queue:
+        directory_list = [{"csv_list": c, "in_dir": i, "out_dir": o, "data_type": d, "datesplit_s": s,
+                           "datesplit_e": e, "default_nodata": dict_values[-3]}
+                          for i, o, c, d, s, e in zip(select_i, select_o, select_c, select_d, datesplit_s, datesplit_e)]
+        with run_profiler.stage_fn("queue_extraction", queue=cmd_args.queue, workers=cmd_args.queue_workers):
+            work_queue.enqueue_fn(cmd_args.queue, directory_list, shapefile_path, 'uid', cmd_args.chunk_size,
+                                  scales=scales)
+            processes = None
+            if cmd_args.queue_workers:
+                processes = work_queue.start_local_workers_fn(cmd_args.queue, cmd_args.queue_workers,
+                                                              cmd_args.verbose)
+            work_queue.wait_fn(cmd_args.queue, processes=processes)
 
     for in_dir, out_dir, csv_list, data_type, date_s, date_e in zip(select_i, select_o, select_c,
                                                                     select_d, datesplit_s, datesplit_e):
 
         import step1_8_qld_grid_zonal_stats
-        step1_8_qld_grid_zonal_stats.main_routine(
-            in_dir, out_dir, csv_list, data_type, temp_dir_path, qld_dict, geo_df2, met_ver, shapefile_path, date_s,
-            date_e)
-
-        print(f"completed: ", out_dir)
+        run_metrics.set_queue_fn("directories", len(select_i) - select_i.index(in_dir) - 1)
+        if cmd_args.queue:
+            with run_profiler.stage_fn("queue_merge:{0}".format(data_type), in_dir=in_dir):
+                output_df = work_queue.merge_fn(cmd_args.queue, data_type, out_dir)
+        else:
+            with run_profiler.stage_fn("step1_8:{0}".format(data_type), profile=True, in_dir=in_dir,
+                                       sites=len(geo_df2.index)):
+                output_df = step1_8_qld_grid_zonal_stats.main_routine(
+                    in_dir, out_dir, csv_list, data_type, temp_dir_path, qld_dict, geo_df2, met_ver,
+                    shapefile_path, date_s, date_e, cmd_args.image_workers, cmd_args.share_mode,
+                    cmd_args.window_cache, scales, quick)
+
+        # derive the seasonal and annual aggregates from the extracted monthly series.
+        if seasons and image_catalog.product_fn(in_dir) == "cor":
+            with run_profiler.stage_fn("seasonal_aggregates:{0}".format(data_type), seasons=seasons):
+                seasonal_aggregates.main_routine(output_df, out_dir, data_type, seasons)
+
+        # derive the monthly climatology anomalies from the extracted monthly series.
+        if base_period and image_catalog.product_fn(in_dir) == "cor":
+            with run_profiler.stage_fn("climatology_anomalies:{0}".format(data_type), base_period=base_period):
+                climatology_anomalies.main_routine(output_df, out_dir, data_type, base_period)
+
+        # derive the antecedent windows ending at each site visit date from the extracted monthly series.
+        if window_list and image_catalog.product_fn(in_dir) == "cor":
+            with run_profiler.stage_fn("antecedent_windows:{0}".format(data_type), windows=window_list):
+                antecedent_windows.main_routine(output_df, visit_df, out_dir, data_type, window_list,
+                                                dict_values[-1])
+
+        raster_mirror.save_fn()
+        logger.info("completed: %s", out_dir)
 
     # ---------------------------------------------------- Clean up ----------------------------------------------------
 
     shutil.rmtree(temp_dir_path)
-    print('Temporary directory and its contents has been deleted from your working drive.')
-    print(' - ', temp_dir_path)
-    print('met zonal stats pipeline is complete.')
-    print('goodbye.')
+    logger.info('Temporary directory and its contents has been deleted from your working drive: %s', temp_dir_path)
+    raster_metadata.save_cache_fn()
+    run_profiler.finish_fn()
+    run_metrics.finish_fn()
+    logger.info('met zonal stats pipeline is complete.')
 
 
 if __name__ == '__main__':
@@ -45,9 +45,13 @@ SOFTWARE.
 import os
 import csv
 import warnings
+import logging
+import pipeline_logging
 
 warnings.filterwarnings("ignore")
 
+logger = pipeline_logging.get_logger_fn("step1_2")
+
 
 def list_dir_fn(rainfall_dir, end_file_name):
     """ Return a list of the rainfall raster images in a directory for the given file extension.
@@ -90,10 +94,18 @@ def output_csv_fn(list_image, temp_dir_path, variable):
     return export_var
 
 
-def main_routine(variable_dir, o, d, end_file_name, temp_dir_path):
+def main_routine(variable_dir, o, d, end_file_name, temp_dir_path, exclude=None):
     # call the list_dir_fn function to return a list of the rainfall raster images.
     list_image = list_dir_fn(variable_dir, end_file_name)
-    print("list_image", list_image)
+    # remove the images excluded by the pre-flight checks.
+    if exclude:
+        n_listed = len(list_image)
+        list_image = [i for i in list_image if i not in exclude]
+        if len(list_image) < n_listed:
+            logger.warning("%s: %d images excluded by the pre-flight checks", d, n_listed - len(list_image))
+    logger.info("%s: %d images listed from %s", d, len(list_image), variable_dir)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("list_image: %s", list_image)
 
     export_csv = output_csv_fn(list_image, temp_dir_path, d)
 
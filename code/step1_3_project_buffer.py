@@ -59,17 +59,21 @@ SOFTWARE.
 # Import modules
 from __future__ import print_function, division
 import os
-from shapely.geometry import Point
-import geopandas as gpd
-from geopandas import GeoDataFrame
-import pandas as pd
 import glob
 import sys
+import lazy_imports
+import pipeline_logging
 
 import warnings
 
 warnings.filterwarnings("ignore")
 
+logger = pipeline_logging.get_logger_fn("step1_3")
+
+# the GDAL stack is imported on first use (when the sites are buffered).
+gpd = lazy_imports.lazy_module_fn("geopandas")
+pd = lazy_imports.lazy_module_fn("pandas")
+
 
 
 def extract_site_fn(file_name):
@@ -160,7 +164,7 @@ def projection_file_name_fn(epsg, allometry_biomass_gdf):
     projected_df = allometry_biomass_gdf.to_crs(epsg)
     #print(projected_df)
 
-    print(crs_name, crs_output)
+    logger.debug("%s %s", crs_name, crs_output)
 
     return crs_name, crs_output, projected_df
 
@@ -262,14 +266,31 @@ def concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name):
 
     else:
 
-        print('There are no shapefiles to concatenate: ', crs_name)
+        logger.error('There are no shapefiles to concatenate: %s', crs_name)
         sys.exit()
-        print('There are no shapefiles to concatenate: ', crs_name)
         comp_geo_df = None
 
     return comp_geo_df, crs_name
 
 
+def visit_dates_fn(df):
+    """ Parse the site visit dates (dd/mm/yyyy) from the site csv.
+
+    @param df: Pandas dataframe containing the site csv (site names cleaned) with a date feature.
+    @return visit_df: Pandas dataframe containing the site_name (as attributed by add_site_attribute_fn) and the
+    visit_date of each site (the first visit when a site is duplicated).
+    """
+    visit_df = pd.DataFrame({"site_name": df["site"].astype(str) + "_1ha",
+                             "visit_date": pd.to_datetime(df["date"], dayfirst=True, errors="coerce")})
+    visit_df = visit_df.drop_duplicates(subset=["site_name"], keep="first").reset_index(drop=True)
+
+    missing = visit_df["visit_date"].isnull().sum()
+    if missing:
+        logger.warning("%d sites have no valid visit date (dd/mm/yyyy)", missing)
+
+    return visit_df
+
+
 def prop_code_extraction_fn(prop, pastoral_estate):
     """ Extract the property tag from the Pastoral Estate shapefile using the property name.
 
@@ -308,6 +329,9 @@ def main_routine(data, export_dir_path, prime_temp_buffer_dir):
         site_list.append(m)
     df["site"] = site_list
 
+    # site visit dates (used by the antecedent window stage).
+    visit_df = visit_dates_fn(df)
+
     gdf = gpd.GeoDataFrame(
         df, geometry=gpd.points_from_xy(df.lon_gda94, df.lat_gda94))
 
@@ -346,10 +370,10 @@ def main_routine(data, export_dir_path, prime_temp_buffer_dir):
     geo_df, crs_name_albers = concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name)
 
     path_ = os.path.join(export_dir_path, "hectare_sites_{0}.shp".format(crs_name))
-    print("vector path_: ", path_)
+    logger.info("vector path_: %s", path_)
     geo_df.to_file(path_, driver="ESRI Shapefile")
 
-    return geo_df, crs_name
+    return geo_df, crs_name, visit_df
 
 if __name__ == '__main__':
     main_routine()
@@ -1,17 +1,39 @@
 #!/usr/bin/env python
 
 from __future__ import print_function, division
-import fiona
-import rasterio
-import pandas as pd
-from rasterstats import zonal_stats
-import geopandas as gpd
 import warnings
 import os
-import numpy as np
+import lazy_imports
+import run_profiler
+import run_metrics
+import zonal_engine
+import geometry_provider
+import raster_metadata
+import shared_zone_index
+import window_stack
+import multi_scale
+import raster_mirror
+import quick_look
+import collections
+import multiprocessing
+import logging
+import pipeline_logging
 
 warnings.filterwarnings("ignore")
 
+logger = pipeline_logging.get_logger_fn("step1_8")
+
+# the GDAL stack is imported on first use (when extraction starts).
+rasterio = lazy_imports.lazy_module_fn("rasterio")
+pd = lazy_imports.lazy_module_fn("pandas")
+np = lazy_imports.lazy_module_fn("numpy")
+
+# the statistics written to the output csv (mean) - only these are computed per footprint.
+output_stats = ['mean']
+
+# per worker process state of the pooled extraction (pool_init_fn).
+worker_dict = {}
+
 '''
 step1_7_monthly_max_temp_zonal_stats.py
 ============================
@@ -68,7 +90,7 @@ def met_correction_fn(output_zonal_stats, var_, variable_values):
     @return: processed dataframe object containing the Landsat tile Fractional Cover zonal stats and
     updated values.
     """
-    print(variable_values)
+    logger.debug("variable_values: %s", variable_values)
 
     output_zonal_stats['{0}_min'.format(var_)] = output_zonal_stats['{0}_min'.format(var_)].replace(0, np.nan)
     #
@@ -147,93 +169,85 @@ def project_shapefile_gcs_wgs84_fn(gcs_wgs84_dir, geo_df):
 #
 #     return
 
-def apply_zonal_stats_fn(image_s, projected_shape_path, uid, datesplit_s, datesplit_e):
+def scale_row_fn(ident, site, img_date, zone, file_name_final, scales):
+    """ Return the output row of a zone with nested scales: the 1ha mean, then the output_stats of each larger scale
+    (multi_scale.column_names_fn order).
+
+    @param zone: dictionary object {scale: statistics} (multi_scale.nested_stats_fn or multi_scale.empty_stats_fn).
+    """
+    return ([ident, site, img_date, zone[scales[0]]["mean"], file_name_final] +
+            [zone[scale][stat] for scale in scales[1:] for stat in output_stats])
+
+
+def apply_zonal_stats_fn(image_s, projected_shape_path, uid, datesplit_s, datesplit_e, zone_cache=None,
+                         default_nodata=None, scales=None, quick=None):
 
     """
     Derive zonal stats for a list of Landsat imagery.
 
+    The statistics are computed once per unique pixel footprint (zonal_engine) and fanned out to every zone sharing
+    that footprint (repeat visits and neighbouring sites within one grid cell). The zones are reprojected to the crs
+    of the raster when the crs differ (geometry_provider). The no data value is read from the file metadata
+    (raster_metadata); an image whose stored statistics show it is all no data is not read.
+
     @param image_s: string object containing the file path to the current max_temp tiff.
     @param projected_shape_path: string object containing the path to the current 1ha shapefile path.
     @param uid: ODK 1ha dataframe feature (unique numeric identifier)
+    @param zone_cache: dictionary object reused across the images of a run (zones and zone index per grid).
+    @param default_nodata: no data value used when the file does not define one (qld_dict null_data).
+    @param scales: list object containing the nested zone scales (multi_scale.scales_fn) - the statistics of the
+    larger scales are computed from the same read and appended to each row (multi_scale.column_names_fn order).
+    @param quick: dictionary object returned by quick_look.quick_fn - the image is read at the quick decimation.
     @return final_results: list object containing the specified zonal statistic values.
     """
-    # create empty lists to write in  zonal stats results 
+    if zone_cache is None:
+        zone_cache = {}
 
-    zone_stats_list = []
-    site_id_list = []
-    image_name_list = []
+    # the no_data value of the silo raster imagery (file metadata, otherwise the variable default).
+    metadata = raster_metadata.metadata_fn(image_s)
+    no_data = raster_metadata.nodata_fn(metadata, default_nodata)
 
-    no_data = -1  #variable_values[3]  # the no_data value for the silo max_temp raster imagery
-
-    #print("*" * 50)
-    #print("no data: ", no_data)
-    with rasterio.open(image_s, nodata=no_data) as srci:
-
-        affine = srci.transform
-        array = srci.read(1)
+    # extract the image name and date from the file name.
+    file_name_final = image_s.replace("\\", "/").rsplit("/", 1)[-1]
+    img_date = file_name_final[datesplit_s:datesplit_e]
 
-        # open the 'GCSWGS84' projected shapefile (1ha sites)
-        with fiona.open(projected_shape_path) as src:
+    if raster_metadata.all_nodata_fn(metadata, default_nodata):
+        logger.debug("all no data (stored statistics), not read: %s", file_name_final)
+        zones = geometry_provider.zones_fn(projected_shape_path, uid, zone_cache)
+        if scales:
+            empty = multi_scale.empty_stats_fn(scales, output_stats)
+            return [scale_row_fn(ident, site, img_date, empty, file_name_final, scales)
+                    for ident, site in zip(zones["uid"], zones["site"])]
+        return [[ident, site, img_date, None, file_name_final] for ident, site in zip(zones["uid"], zones["site"])]
 
-            zs = zonal_stats(src, array, affine=affine, nodata=no_data,
-                             stats=['count', 'min', 'max', 'mean', 'median', 'std', 'percentile_25', 'percentile_50',
-                                    'percentile_75', 'percentile_95', 'percentile_99', 'range'], all_touched=True)
+    with quick_look.open_fn(image_s, quick, nodata=no_data) as srci:
 
-            #https://gis.stackexchange.com/questions/393413/rasterstats-zonal-statistics-does-not-ignore-nodata
-            #print(zs)
-            # using "all_touched=True" will increase the number of pixels used to produce the stats "False" reduces
-            # the number extract the image name from the opened file from the input file read in by rasterio
-            #print(zs)
-            list_a = str(srci).rsplit('\\')
-            #print("list_a: ", list_a)
-            file_name = list_a[-1]
-            #print("file_name: ", file_name)
-            list_b = file_name.rsplit("'")
-            file_name_final = list_b[0]
-            img_date = file_name_final[datesplit_s:datesplit_e]
-            #img_date = file_name_final[-23:-17]
-            #print("img date: ", img_date)
-            #print("ZS: ", zs)
-
-            for zone in zs:
-                zone_stats = zone
-                mean = zone_stats["mean"]
-
-
-                # put the individual results in a list and append them to the zone_stats list
-                result = [mean, ]  #std, med, minimum, maximum, count, percentile_25, percentile_50,
-                # percentile_75, percentile_95, percentile_99, range_]
-
-                #print("Result: ", result)
-                zone_stats_list.append(result)
-
-            # extract out the site number for the polygon
-            for i in src:
-                table_attributes = i['properties']  # reads in the attribute table for each record
-
-                ident = table_attributes[
-                    uid]  # reads in the id field from the attribute table and prints out the selected record
-                site = table_attributes['site_name']
+        array = srci.read(1)
+        run_profiler.record_read_fn(array.nbytes)
 
-                details = [ident, site, img_date]
-                #print("details: ", details)
+        if scales:
+            # the nested footprints of every scale, resolved once per grid signature.
+            nested_index = multi_scale.nested_index_fn(srci, projected_shape_path, uid, zone_cache, scales)
+        else:
+            # zones in the crs of the raster, resolved once per grid signature.
+            zone_index = geometry_provider.zone_index_fn(srci, projected_shape_path, uid, zone_cache)
 
-                site_id_list.append(details)
-                image_used = [file_name_final]
-                image_name_list.append(image_used)
+    if scales:
+        zs = multi_scale.nested_stats_fn(array, nested_index, no_data, stats=output_stats)
+        return [scale_row_fn(ident, site, img_date, zone, file_name_final, scales)
+                for ident, site, zone in zip(nested_index["uid"].tolist(), nested_index["site"].tolist(), zs)]
 
-        # join the elements in each of the lists row by row
-        final_results = [siteid + zoneR + imU for siteid, zoneR, imU in
-                         zip(site_id_list, zone_stats_list, image_name_list)]
+    #https://gis.stackexchange.com/questions/393413/rasterstats-zonal-statistics-does-not-ignore-nodata
+    zs = zonal_engine.zone_stats_fn(array, zone_index, no_data, stats=output_stats)
 
-        # close the vector and raster file 
-        src.close()
-        srci.close()
+    # join the zone attributes, the statistics and the image name row by row
+    final_results = [[ident, site, img_date, zone["mean"], file_name_final] for ident, site, zone in
+                     zip(zone_index["uid"].tolist(), zone_index["site"].tolist(), zs)]
 
     return final_results
 
 
-def clean_data_frame_fn(output_list, max_temp_output_dir, data_type):  #variable, var_, qld_dict):
+def clean_data_frame_fn(output_list, max_temp_output_dir, data_type, scales=None):  #variable, var_, qld_dict):
     """ Create dataframe from output list, clean and export dataframe to a csv to export directory/max_temp sub-directory.
 
     @param output_list: list object created by appending the final results list elements.
@@ -245,8 +259,10 @@ def clean_data_frame_fn(output_list, max_temp_output_dir, data_type):  #variable
 
     # convert the list to a pandas dataframe with a headers
     headers = ['ident', 'site', 'im_date', 'mean', 'im_name']
-    df1 = pd.DataFrame.from_records(output_list)
-    print(df1)
+    if scales:
+        headers += multi_scale.column_names_fn(scales, output_stats)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("output records:\n%s", pd.DataFrame.from_records(output_list))
     output_df = pd.DataFrame.from_records(output_list, columns=headers)
     # print('output_max_temp: ', output_max_temp)
     #variable_values = qld_dict.get(variable)
@@ -256,13 +272,13 @@ def clean_data_frame_fn(output_list, max_temp_output_dir, data_type):  #variable
     output_df["d_type"] = variable
     site = output_df['site'].unique()
 
-    print(list(output_df.columns))
+    logger.debug("columns: %s", list(output_df.columns))
     #print('list of site names: ', site)
 
     # import sys
     # sys.exit()
 
-    print("length of site list: ", len(site))
+    logger.info("%s: writing %d site csv files to %s", variable, len(site), max_temp_output_dir)
     if len(site) >= 1:
         for i in site:
             out_df = output_df[output_df['site'] == i]
@@ -271,7 +287,7 @@ def clean_data_frame_fn(output_list, max_temp_output_dir, data_type):  #variable
                 str(i), variable))
             # export the pandas df to a csv file
             out_df.to_csv(out_path, index=False)
-            print("out_path: ", out_path)
+            logger.debug("out_path: %s", out_path)
 
 
     else:
@@ -279,13 +295,127 @@ def clean_data_frame_fn(output_list, max_temp_output_dir, data_type):  #variable
             str(site), variable))
         # export the pandas df to a csv file
         output_df.to_csv(out_path, index=False)
-        print("out_path: ", out_path)
+        logger.debug("out_path: %s", out_path)
 
     return output_df
 
 
+def shared_handle_fn(image_s, projected_shape_path, uid, zone_cache, share_mode, quick=None, default_nodata=None):
+    """ Build the zone index for the grid of the first image and place it (with the zones) in shared memory.
+
+    @param image_s: string object containing the file path to the first image.
+    @param projected_shape_path: string object containing the path to the current 1ha shapefile path.
+    @param uid: ODK 1ha dataframe feature (unique numeric identifier)
+    @param zone_cache: dictionary object holding the zones and the zone index per grid signature.
+    @param share_mode: string object 'shm' or 'mmap' (shared_zone_index.publish_fn).
+    @param quick: dictionary object returned by quick_look.quick_fn (the zone index of the decimated grid).
+    @param default_nodata: no data value used when the file does not define one (the decimated copy excludes it).
+    @return handle: dictionary object returned by shared_zone_index.publish_fn.
+    """
+    no_data = raster_metadata.nodata_fn(raster_metadata.metadata_fn(image_s), default_nodata)
+    with quick_look.open_fn(image_s, quick, nodata=no_data) as srci:
+        zone_index = geometry_provider.zone_index_fn(srci, projected_shape_path, uid, zone_cache)
+
+    return shared_zone_index.publish_fn(zone_index, zone_cache["zones"], share_mode)
+
+
+def pool_init_fn(handle, projected_shape_path, uid, datesplit_s, datesplit_e, default_nodata, scales=None, quick=None):
+    """ Attach a pooled worker to the shared zone index (zero copy, the shapefile is not read). """
+    zone_index = shared_zone_index.attach_fn(handle)
+    worker_dict["zone_cache"] = {"shared": handle, zone_index["signature"]: zone_index}
+    worker_dict["args"] = (projected_shape_path, uid, datesplit_s, datesplit_e)
+    worker_dict["default_nodata"] = default_nodata
+    worker_dict["scales"] = scales
+    worker_dict["quick"] = quick
+
+
+def pool_image_fn(image_s):
+    """ Derive the zonal stats of an image in a pooled worker (apply_zonal_stats_fn). """
+    projected_shape_path, uid, datesplit_s, datesplit_e = worker_dict["args"]
+
+    return apply_zonal_stats_fn(image_s, projected_shape_path, uid, datesplit_s, datesplit_e,
+                                worker_dict["zone_cache"], worker_dict["default_nodata"], worker_dict["scales"],
+                                worker_dict["quick"])
+
+
+def pool_results_fn(pool, image_list, ahead):
+    """ Yield the results of the pooled extraction in image order, with at most ahead images queued to the workers.
+
+    The image paths are taken from the local raster mirror as they are queued and leased until their results are
+    returned, so that a copy is not evicted (mirror disk budget) before a worker reads it.
+
+    @param pool: multiprocessing pool object initialised with pool_init_fn.
+    @param image_list: list object containing the source image paths.
+    @param ahead: integer object containing the number of images queued ahead of the results.
+    """
+    queued = collections.deque()
+    try:
+        for image_s in image_list:
+            queued.append((image_s, pool.apply_async(pool_image_fn,
+                                                     (raster_mirror.local_path_fn(image_s, lease=True),))))
+            if len(queued) >= ahead:
+                image_s, result = queued[0]
+                yield result.get()
+                queued.popleft()
+                raster_mirror.release_fn(image_s)
+        while queued:
+            image_s, result = queued[0]
+            yield result.get()
+            queued.popleft()
+            raster_mirror.release_fn(image_s)
+    finally:
+        for image_s, _ in queued:
+            raster_mirror.release_fn(image_s)
+
+
+def stack_zonal_stats_fn(stack, image_s, projected_shape_path, uid, datesplit_s, datesplit_e, zone_cache,
+                         default_nodata=None):
+    """ Derive the zonal stats of an image from the window stack (window_stack), reading the image when it is not
+    stored in the stack (apply_zonal_stats_fn). """
+    zs = window_stack.zone_stats_fn(stack, image_s, output_stats)
+    if zs is None:
+        return apply_zonal_stats_fn(image_s, projected_shape_path, uid, datesplit_s, datesplit_e, zone_cache,
+                                    default_nodata)
+
+    file_name_final = image_s.replace("\\", "/").rsplit("/", 1)[-1]
+    img_date = file_name_final[datesplit_s:datesplit_e]
+    zones = zone_cache["zones"]
+
+    return [[ident, site, img_date, zone["mean"], file_name_final] for ident, site, zone in
+            zip(zones["uid"], zones["site"], zs)]
+
+
+def quick_calibration_fn(output_list, image_list, projected_shape_path, uid, datesplit_s, datesplit_e, zone_cache,
+                         default_nodata, scales, quick, report_path, images_total):
+    """ Extract the quick calibration images at full resolution and report the error of the quick results.
+
+    @param output_list: list object containing the quick result rows (apply_zonal_stats_fn).
+    @param image_list: list object containing the sampled image paths.
+    @param quick: dictionary object returned by quick_look.quick_fn.
+    @param report_path: string object containing the path of the quick report json.
+    @param images_total: integer object containing the number of images listed (before the sampling).
+    @return errors: dictionary object returned by quick_look.error_summary_fn.
+    """
+    calibration = quick_look.calibration_images_fn(image_list, quick["calibration"])
+    names = set(image_s.replace("\\", "/").rsplit("/", 1)[-1] for image_s in calibration)
+    stat_names = output_stats + (multi_scale.column_names_fn(scales, output_stats) if scales else [])
+
+    def values_fn(rows):
+        return dict(((row[0], row[4]), dict(zip(stat_names, [row[3]] + row[5:]))) for row in rows if row[4] in names)
+
+    full_list = []
+    for image_s in calibration:
+        full_list.extend(apply_zonal_stats_fn(raster_mirror.local_path_fn(image_s), projected_shape_path, uid,
+                                              datesplit_s, datesplit_e, zone_cache, default_nodata, scales))
+
+    errors = quick_look.error_summary_fn(values_fn(output_list), values_fn(full_list))
+    quick_look.write_report_fn(report_path, quick, images_total, len(image_list), calibration, errors)
+
+    return errors
+
+
 def main_routine(in_dir, out_dir, csv_list, data_type, temp_dir_path, qld_dict, geo_df, met_ver, shapefile_path,
-                 datesplit_s, datesplit_e):
+                 datesplit_s, datesplit_e, workers=1, share_mode="shm", window_cache=None, scales=None, quick=None):
     """ Calculate the zonal statistics for each 1ha site per QLD monthly max_temp image (single band).
     Concatenate and clean final output DataFrame and export to the Export directory/zonal stats.
 
@@ -293,9 +423,9 @@ def main_routine(in_dir, out_dir, csv_list, data_type, temp_dir_path, qld_dict,
 
     uid = 'uid'
     output_list = []
-    print("out_dir: ", out_dir)
+    logger.info("out_dir: %s", out_dir)
     variable_values = qld_dict.get(met_ver)
-    print(variable_values)
+    logger.debug("variable_values: %s", variable_values)
     var_ = variable_values[-1]
     #print('Var_', var_)
     #print("geo df: ", geo_df)
@@ -304,27 +434,88 @@ def main_routine(in_dir, out_dir, csv_list, data_type, temp_dir_path, qld_dict,
 
     # open the list of imagery and read it into memory and call the apply_zonal_stats_fn function
     with open(csv_list, 'r') as imagery_list:
+        image_list = imagery_list.readlines()
+
+    # a quick look extracts every nth image (date) only (quick_look).
+    image_list = [image.rstrip() for image in image_list]
+    images_total = len(image_list)
+    image_list = quick_look.sample_fn(image_list, quick, quick_look.date_key_fn(datesplit_s, datesplit_e))
+
+    # publish the live progress counters for this directory.
+    run_metrics.begin_directory_fn(data_type, len(image_list))
+    summary = pipeline_logging.RateLimitedSummary(logger, data_type)
+
+    # zones and zone index (pixel footprints per grid signature) reused by every image.
+    zone_cache = {}
+    # the images are read from the local raster mirror when one is configured (copied on first use, in image order
+    # as the extraction consumes them).
+    read_iter = (raster_mirror.local_path_fn(image_s) for image_s in image_list)
+
+    # pooled extraction: the zone index is placed once in shared memory and attached by each worker; the results
+    # are returned in image order.
+    pool = None
+    handle = None
+    leased = []
+    if window_cache and scales:
+        logger.warning("%s: the window cache holds the 1ha site windows only, not used with --scales", data_type)
+    if window_cache and quick:
+        logger.warning("%s: the window cache holds full resolution windows, not used with --quick", data_type)
+    if window_cache and not scales and not quick:
+        # site windows stored once in a local memory mapped stack (new images are appended).
+        with run_profiler.stage_fn("window_stack:{0}".format(data_type), in_dir=in_dir):
+            # the mirror copies are leased until the results are returned (read by the stack and its fallback).
+            leased = image_list
+            read_list = [raster_mirror.local_path_fn(image_s, lease=True) for image_s in image_list]
+            stack = window_stack.update_fn(window_cache, in_dir, read_list, shapefile_path, uid, zone_cache,
+                                           variable_values[-3], workers=workers)
+        results_iter = (stack_zonal_stats_fn(stack, image_s, shapefile_path, uid, datesplit_s, datesplit_e,
+                                             zone_cache, variable_values[-3]) for image_s in read_list)
+    elif workers > 1 and len(image_list) > 1:
+        handle = shared_handle_fn(raster_mirror.local_path_fn(image_list[0]), shapefile_path, uid, zone_cache,
+                                  share_mode, quick, variable_values[-3])
+        pool = multiprocessing.Pool(workers, initializer=pool_init_fn,
+                                    initargs=(handle, shapefile_path, uid, datesplit_s, datesplit_e,
+                                              variable_values[-3], scales, quick))
+        results_iter = pool_results_fn(pool, image_list, workers * 4)
+    else:
+        results_iter = (apply_zonal_stats_fn(image_s, shapefile_path, uid, datesplit_s, datesplit_e, zone_cache,
+                                             variable_values[-3], scales, quick)
+                        for image_s in read_iter)  # null_data
 
-        # loop through the list of imagery and input the image into the raster zonal_stats function
-        for image in imagery_list:
-            #print('image: ', image)
-
-            image_s = image.rstrip()
-            #print("image_s: ", image_s)
-
-            final_results = apply_zonal_stats_fn(image_s, shapefile_path, uid, datesplit_s, datesplit_e)
+    # loop through the list of imagery and input the image into the raster zonal_stats function
+    try:
+        for final_results in results_iter:
             #print("final results: ", final_results)
 
             for i in final_results:
                 output_list.append(i)
 
+            run_metrics.image_done_fn()
+            summary.add(images=1, zones=len(final_results))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+            shared_zone_index.release_fn(handle)
+        for image_s in leased:
+            raster_mirror.release_fn(image_s)
+
+    if quick and quick["calibration"]:
+        with run_profiler.stage_fn("quick_calibration:{0}".format(data_type), images=quick["calibration"]):
+            quick_calibration_fn(output_list, image_list, shapefile_path, uid, datesplit_s, datesplit_e, zone_cache,
+                                 variable_values[-3], scales, quick,
+                                 os.path.join(out_dir, "{0}_quick_report.json".format(data_type)), images_total)
+
     #call the clean_data_frame_fn function
-    clean_output_temp = clean_data_frame_fn(output_list, out_dir, data_type)  #variable, var_, dict_)
+    with run_profiler.stage_fn("output_write:{0}".format(data_type), out_dir=out_dir):
+        clean_output_temp = clean_data_frame_fn(output_list, out_dir, data_type, scales)  #variable, var_, dict_)
 
-    print("18 - 354")
+    summary.emit()
     # import sys
     # sys.exit()
 
+    return clean_output_temp
+
 
 if __name__ == "__main__":
     main_routine()
@@ -3,19 +3,38 @@
 # import modules
 from __future__ import print_function, division
 
-import fiona
-import rasterio
-import pandas as pd
-from rasterstats import zonal_stats
 import os
 import shutil
 import glob
-import numpy as np
-import geopandas as gpd
+import argparse
+import tempfile
 import warnings
+import lazy_imports
+import run_profiler
+import run_metrics
+import pipeline_logging
+import geometry_provider
+import raster_mirror
+import quick_look
 
 warnings.filterwarnings("ignore")
 
+logger = pipeline_logging.get_logger_fn("step1_9")
+
+# the GDAL stack is imported on first use (when extraction starts).
+fiona = lazy_imports.lazy_module_fn("fiona")
+rasterio = lazy_imports.lazy_module_fn("rasterio")
+rasterstats = lazy_imports.lazy_module_fn("rasterstats")
+pd = lazy_imports.lazy_module_fn("pandas")
+np = lazy_imports.lazy_module_fn("numpy")
+gpd = lazy_imports.lazy_module_fn("geopandas")
+
+# the zonal statistics of each band (rasterstats names, in the output column order).
+stats_list = ['count', 'min', 'max', 'mean', 'median', 'std', 'percentile_25', 'percentile_50', 'percentile_75',
+              'percentile_95', 'percentile_99', 'range']
+# the output column names of the band statistics (stats_list order, i.e. b1_ref_med).
+ref_stats = ['count', 'min', 'max', 'mean', 'med', 'std', 'p25', 'p50', 'p75', 'p95', 'p99', 'range']
+
 '''
 step1_5_fpc_landsat_list.py
 ================
@@ -62,7 +81,7 @@ SOFTWARE.
 '''
 
 
-def apply_zonal_stats_fn(image_s, no_data, band, shape, uid):
+def apply_zonal_stats_fn(image_s, no_data, band, shape, uid, quick=None):
     """ Collect the zonal statistical information fom a raster file contained within a polygon extend outputting a
     list of results (final_results).
 
@@ -70,8 +89,10 @@ def apply_zonal_stats_fn(image_s, no_data, band, shape, uid):
         cleaned imagery_list_image_results.
         @param no_data: integer object containing the raster no data value.
         @param band: string object containing the current band number being processed.
-        @param shape: open odk shapefile containing the 1ha site polygons.
+        @param shape: open odk shapefile containing the 1ha site polygons, or the zones routed to the tile
+        (tile_routing.tile_zones_fn).
         @param uid: unique identifier number.
+        @param quick: dictionary object returned by quick_look.quick_fn - the image is read at the quick decimation.
         @return final_results: list object containing all of the zonal stats, image and shapefile polygon/site
         information. """
 
@@ -86,59 +107,104 @@ def apply_zonal_stats_fn(image_s, no_data, band, shape, uid):
     image_date = []
     list_band = []
 
-    with rasterio.open(image_s, nodata=no_data) as srci:
+    with quick_look.open_fn(image_s, quick, nodata=no_data) as srci:
         affine = srci.transform
         array = srci.read(band)
-
-        with fiona.open(shape) as src:
-            # using 'all_touched=True' will increase the number of pixels used to produce the stats 'False'
-            # reduces the number define the zonal stats being calculated
-            zs = zonal_stats(src, array, affine=affine, nodata=no_data,
-                             stats=['count', 'min', 'max', 'mean', 'median', 'std', 'percentile_25', 'percentile_50',
-                                    'percentile_75', 'percentile_95', 'percentile_99', 'range'], all_touched=False)
-
-            # extract image name and append to list
-            img_name = str(srci)[-54:-11]
-            list_image_name.append(img_name)
-            # extract image date and append to list
-            img_date = str(srci)[-38:-30]
-            image_date.append(img_date)
-
-            for zone in zs:
-                bands = 'b' + str(band)
-                list_band.append(bands)
-                # extract 'values' as a tuple from a dictionary
-                keys, values = zip(*zone.items())
-                # convert tuple to a list and append to zone_stats
-                result = list(values)
-                print("Results: ", result)
-                zone_stats.append(result)
-
-            for i in src:
-                # extract shapefile records
-                table_attributes = i['properties']
-
-                uid_ = table_attributes[uid]
-                details = [uid_]
-                list_uid.append(details)
-
-                site = table_attributes['site_name']
-                site_ = [site]
-                list_site.append(site_)
+        run_profiler.record_read_fn(array.nbytes)
+
+        if isinstance(shape, dict):
+            # zones routed to the tile in memory (no shapefile), in the crs of the image.
+            src = geometry_provider.zone_geometries_fn(shape, srci.crs, image_s)
+            attribute_list = [{uid: u, 'site_name': s} for u, s in zip(shape["uid"], shape["site"])]
+        else:
+            with fiona.open(shape) as shape_src:
+                src = [i for i in shape_src]
+            attribute_list = [i['properties'] for i in src]
+
+        # using 'all_touched=True' will increase the number of pixels used to produce the stats 'False'
+        # reduces the number define the zonal stats being calculated
+        zs = rasterstats.zonal_stats(src, array, affine=affine, nodata=no_data, stats=stats_list, all_touched=False)
+
+        # extract image name and append to list
+        img_name = str(srci)[-54:-11]
+        list_image_name.append(img_name)
+        # extract image date and append to list
+        img_date = str(srci)[-38:-30]
+        image_date.append(img_date)
+
+        for zone in zs:
+            bands = 'b' + str(band)
+            list_band.append(bands)
+            # the values in stats_list order (the header order; rasterstats orders its dictionary otherwise)
+            result = [zone[stat] for stat in stats_list]
+            logger.debug("Results: %s", result)
+            zone_stats.append(result)
+
+        for table_attributes in attribute_list:
+            # extract shapefile records
+            uid_ = table_attributes[uid]
+            details = [uid_]
+            list_uid.append(details)
+
+            site = table_attributes['site_name']
+            site_ = [site]
+            list_site.append(site_)
 
         # join the elements in each of the lists row by row
         final_results = [list_uid + list_site + zone_stats for
                          list_uid, list_site, zone_stats in
                          zip(list_uid, list_site, zone_stats)]
 
-        # close the vector and raster file 
-        src.close()
+        # close the raster file
         srci.close()
 
-    print("final results:", final_results)
+    logger.debug("final results: %s", final_results)
     return final_results, str(site_[0])
 
 
+def quick_values_fn(values, final_results, image_s, band):
+    """ Add the band statistics of an image to the quick report values {(uid, image): {b{band}_{statistic}: value}}.
+
+    @param values: dictionary object updated in place (quick_look.error_summary_fn input).
+    @param final_results: list object returned by apply_zonal_stats_fn.
+    @param image_s: string object containing the image path.
+    @param band: integer object containing the band number.
+    """
+    for row in final_results:
+        values.setdefault((row[0], image_s), {}).update(
+            ("b{0}_{1}".format(band, stat), value) for stat, value in zip(stats_list, row[2:]))
+
+
+def header_all_fn(num_bands):
+    """ Return the column names of the band csv files concatenated side by side (band order): the first band names
+    the uid, site, image and date columns, the other bands prefix theirs with the band.
+
+    @param num_bands: list object containing the band numbers.
+    @return header_all: list object containing the column names.
+    """
+    header_all = []
+    for band in num_bands:
+        prefix = "b{0}_".format(band)
+        band_stats = [prefix + "ref_" + stat for stat in ref_stats]
+        if band == num_bands[0]:
+            header_all += ['uid', 'site'] + band_stats + ['band', 'ref_image', 'date']
+        else:
+            header_all += [prefix + 'uid', prefix + 'site'] + band_stats + [prefix + 'ref_band', prefix + 'ref_im',
+                                                                             prefix + 'ref_date']
+
+    return header_all
+
+
+def output_columns_fn(num_bands):
+    """ Return the columns of the per site output csv files (the statistics of each band in band order).
+
+    @param num_bands: list object containing the band numbers.
+    @return columns: list object containing the column names.
+    """
+    return ['uid', 'site', 'ref_image', 'year', 'month', 'day'] + [
+        "b{0}_ref_{1}".format(band, stat) for band in num_bands for stat in ref_stats]
+
+
 def time_stamp_fn(output_zonal_stats):
     """Insert a timestamp into feature position 4, convert timestamp into year, month and day strings and append to
     dataframe.
@@ -211,149 +277,172 @@ def landsat_correction_fn(output_zonal_stats):
     return output_zonal_stats
 
 
-def main_routine(temp_dir_path, zonal_stats_ready_dir, no_data, tile, zonal_stats_output):
+def main_routine(temp_dir_path, zonal_stats_ready_dir, no_data, tile, zonal_stats_output, routing_index=None,
+                 quick=None):
     """Restructure ODK 1ha geo-DataFrame to calculate the zonal statistics for each 1ha site per Landsat Fractional
-    Cover image, per band (b1, b2 and b3). Concatenate and clean final output DataFrame and export to the Export
-    directory/zonal stats."""
+    Cover image, per band (num_bands, b1 to b9). Concatenate and clean final output DataFrame and export to the Export
+    directory/zonal stats.
+
+    When a routing index (tile_routing) is given, the tile images are processed against the zones of the sites routed
+    to the tile (in memory) rather than the {complete_tile}_by_tile.shp shapefile.
+
+    With quick (quick_look.quick_fn) every nth image is read at the quick decimation and the error against full
+    resolution of the calibration images is written to {zonal_stats_output}/{complete_tile}_quick_report.json."""
 
     # print('step1_6_fpc_zonal_stats.py INITIATED.'
 
     # strip Landsat tile label from csv file name.
-    print("tile: ", tile)
+    logger.debug("tile: %s", tile)
     tile_begin = tile[-33:-30]
-    print("begin_tile: ", tile_begin)
     tile_end = tile[-29:-26]
-    print("end_tile: ", tile_end)
     complete_tile = tile_begin + tile_end
-    print('=' * 50)
-    print('Working on tile: ', complete_tile)
-    print('=' * 50)
-    print('......')
-
-    shapefile = os.path.join(zonal_stats_ready_dir, "{0}_by_tile.shp".format(complete_tile))
-    df = gpd.read_file(shapefile)
+    logger.info('Working on tile: %s', complete_tile)
+
+    if routing_index is not None:
+        import tile_routing
+        shape = tile_routing.tile_zones_fn(routing_index, complete_tile)
+        if not shape["uid"]:
+            logger.info("tile %s: no sites routed to the tile, skipped", complete_tile)
+            return
+    else:
+        shapefile = os.path.join(zonal_stats_ready_dir, "{0}_by_tile.shp".format(complete_tile))
+        df = gpd.read_file(shapefile)
 
-    shape = shapefile
+        shape = shapefile
     # nodata = int(0)
     uid = 'uid'
     im_list = tile
 
-    # create temporary folders
-    ref_temp_dir_bands = os.path.join(temp_dir_path, 'ref_temp_individual_bands')
-    os.makedirs(ref_temp_dir_bands)
-    band1_dir = os.path.join(ref_temp_dir_bands, 'band1')
-    os.makedirs(band1_dir)
-    band2_dir = os.path.join(ref_temp_dir_bands, 'band2')
-    os.makedirs(band2_dir)
-    band3_dir = os.path.join(ref_temp_dir_bands, 'band3')
-    os.makedirs(band3_dir)
-
-    # specify the number of bands that zonal stats will be derived from (default is three -GDAL numbering)
+    # specify the bands that zonal stats will be derived from (GDAL numbering)
     num_bands = [1, 2, 3, 4, 5, 6, 7, 8, 9]
 
+    # create temporary folders (one per band)
+    ref_temp_dir_bands = os.path.join(temp_dir_path, 'ref_temp_individual_bands')
+    os.makedirs(ref_temp_dir_bands)
     for band in num_bands:
-        # open the list of imagery and read it into memory and call the apply_zonal_stats_fn function
-        with open(im_list, 'r') as imagery_list:
-
-            # Extract each image path from the image list
-            for image in imagery_list:
-
-                # cleans the file pathway (Windows)
-                image_s = image.rstrip()
-                im_name_s = image_s[
-                            -43:-1]  # May need to change these values depending on whether there is a 2 or 3 in the
-                # name.
-                im_name = im_name_s + 'g'
-                # print('Image name: ', im_name)
-                im_date = image_s[
-                          -27:-19]  # May need to change these values depending on whether there is a 2 or 3 in the
-                # name.
-
-                # loops through each image
-                with rasterio.open(image_s, nodata=no_data) as srci:
-                    image_results = 'image_' + im_name + '.csv'
-
-                    # runs the zonal stats function and outputs a csv in a band specific folder
-                    final_results, site_name = apply_zonal_stats_fn(image_s, no_data, band, shape, uid)
-                    print("final_results: ", final_results)
-                    #
-                    # ['count', 'min', 'max', 'mean', 'median', 'std', 'percentile_25', 'percentile_50',
-                    #  'percentile_75', 'percentile_95', 'percentile_99', 'range']
-
-                    header = ["b" + str(band) + '_uid', "b" + str(band) + '_site', "b" + str(band) + '_count',
-                              "b" + str(band) + '_min', "b" + str(band) + '_max',
-                              "b" + str(band) + '_mean',  "b" + str(band) + '_median', "b" + str(band) + '_std',
-                              "b" + str(band) + '_p25', "b" + str(band) + '_p50', "b" + str(band) + '_p75',
-                              "b" + str(band) + '_p95', "b" + str(band) + '_p99', "b" + str(band) + '_range']
-
-                    df = pd.DataFrame.from_records(final_results, columns=header)
-                    df['band'] = band
-                    df['image'] = im_name
-                    df['date'] = im_date
-                    df.to_csv(ref_temp_dir_bands + '//band' + str(band) + '//' + image_results, index=False)
-
-                    #
-                    # if band == 1:
-                    #     df = pd.DataFrame.from_records(final_results, columns=header)
-                    #     df['band'] = band
-                    #     df['image'] = im_name
-                    #     df['date'] = im_date
-                    #     df.to_csv(ref_temp_dir_bands + '//band1//' + image_results, index=False)
-                    # elif band == 2:
-                    #     df = pd.DataFrame.from_records(final_results, columns=header)
-                    #     df['band'] = band
-                    #     df['image'] = im_name
-                    #     df['date'] = im_date
-                    #     df.to_csv(ref_temp_dir_bands + '//band2//' + image_results, index=False)
-                    # elif band == 3:
-                    #     df = pd.DataFrame.from_records(final_results, columns=header)
-                    #     df['band'] = band
-                    #     df['image'] = im_name
-                    #     df['date'] = im_date
-                    #     df.to_csv(ref_temp_dir_bands + '//band3//' + image_results, index=False)
-                    # else:
-                    #     print('There is an error.')
+        os.makedirs(os.path.join(ref_temp_dir_bands, 'band' + str(band)))
+
+    # publish the live progress counters for this tile (one count per image band).
+    with open(im_list, 'r') as imagery_list:
+        image_list = [image.rstrip() for image in imagery_list]
+    images_total = len(image_list)
+    # a quick look extracts every nth image (date) only, the date sliced as below.
+    date_fn = quick_look.date_key_fn(-27, -19)
+    image_list = quick_look.sample_fn(image_list, quick, date_fn)
+    image_count = len(image_list)
+    calibration = quick_look.calibration_images_fn(image_list, quick["calibration"]) if quick else []
+    quick_values = {}
+    # copied to the local raster mirror (when one is configured) ahead of the band passes.
+    raster_mirror.prefetch_fn(image_list)
+    run_metrics.begin_directory_fn(complete_tile, image_count * len(num_bands))
+    summary = pipeline_logging.RateLimitedSummary(logger, "tile {0}".format(complete_tile))
+
+    with run_profiler.stage_fn("step1_9:{0}".format(complete_tile), profile=True, tile=tile):
+        for band in num_bands:
+            # open the list of imagery and read it into memory and call the apply_zonal_stats_fn function
+            with open(im_list, 'r') as imagery_list:
+
+                # Extract each image path from the image list (every nth image of a quick look)
+                for image in quick_look.sample_fn(imagery_list.readlines(), quick, date_fn):
+
+                    # cleans the file pathway (Windows)
+                    image_s = image.rstrip()
+                    im_name_s = image_s[
+                                -43:-1]  # May need to change these values depending on whether there is a 2 or 3 in the
+                    # name.
+                    im_name = im_name_s + 'g'
+                    # print('Image name: ', im_name)
+                    im_date = image_s[
+                              -27:-19]  # May need to change these values depending on whether there is a 2 or 3 in the
+                    # name.
+
+                    # loops through each image (the local raster mirror copy when one is configured)
+                    read_s = raster_mirror.local_path_fn(image_s)
+                    with rasterio.open(read_s, nodata=no_data) as srci:
+                        image_results = 'image_' + im_name + '.csv'
+
+                        # runs the zonal stats function and outputs a csv in a band specific folder
+                        final_results, site_name = apply_zonal_stats_fn(read_s, no_data, band, shape, uid, quick)
+                        summary.add(image_bands=1, zones=len(final_results))
+                        if image_s in calibration:
+                            quick_values_fn(quick_values, final_results, image_s, band)
+                        #
+                        # ['count', 'min', 'max', 'mean', 'median', 'std', 'percentile_25', 'percentile_50',
+                        #  'percentile_75', 'percentile_95', 'percentile_99', 'range']
+
+                        header = ["b" + str(band) + '_uid', "b" + str(band) + '_site', "b" + str(band) + '_count',
+                                  "b" + str(band) + '_min', "b" + str(band) + '_max',
+                                  "b" + str(band) + '_mean',  "b" + str(band) + '_median', "b" + str(band) + '_std',
+                                  "b" + str(band) + '_p25', "b" + str(band) + '_p50', "b" + str(band) + '_p75',
+                                  "b" + str(band) + '_p95', "b" + str(band) + '_p99', "b" + str(band) + '_range']
+
+                        df = pd.DataFrame.from_records(final_results, columns=header)
+                        df['band'] = band
+                        df['image'] = im_name
+                        df['date'] = im_date
+                        df.to_csv(ref_temp_dir_bands + '//band' + str(band) + '//' + image_results, index=False)
+
+                        #
+                        # if band == 1:
+                        #     df = pd.DataFrame.from_records(final_results, columns=header)
+                        #     df['band'] = band
+                        #     df['image'] = im_name
+                        #     df['date'] = im_date
+                        #     df.to_csv(ref_temp_dir_bands + '//band1//' + image_results, index=False)
+                        # elif band == 2:
+                        #     df = pd.DataFrame.from_records(final_results, columns=header)
+                        #     df['band'] = band
+                        #     df['image'] = im_name
+                        #     df['date'] = im_date
+                        #     df.to_csv(ref_temp_dir_bands + '//band2//' + image_results, index=False)
+                        # elif band == 3:
+                        #     df = pd.DataFrame.from_records(final_results, columns=header)
+                        #     df['band'] = band
+                        #     df['image'] = im_name
+                        #     df['date'] = im_date
+                        #     df.to_csv(ref_temp_dir_bands + '//band3//' + image_results, index=False)
+                        # else:
+                        #     print('There is an error.')
+
+                    run_metrics.image_done_fn()
+
+    if calibration:
+        # the calibration images are extracted again at full resolution to bound the quick look error.
+        with run_profiler.stage_fn("quick_calibration:{0}".format(complete_tile), images=len(calibration)):
+            full_values = {}
+            for image_s in calibration:
+                read_s = raster_mirror.local_path_fn(image_s)
+                for band in num_bands:
+                    final_results, _ = apply_zonal_stats_fn(read_s, no_data, band, shape, uid)
+                    quick_values_fn(full_values, final_results, image_s, band)
+            errors = quick_look.error_summary_fn(quick_values, full_values)
+            quick_look.write_report_fn(os.path.join(zonal_stats_output, "{0}_quick_report.json".format(complete_tile)),
+                                       quick, images_total, image_count, calibration, errors)
 
     # -------------------------------------------------- Concatenate csv -----------------------------------------------
 
     # for loops through the band folders and concatenates zonal stat outputs into a complete band specific csv
     for x in num_bands:
         location_output = ref_temp_dir_bands + '//band' + str(x)
-        band_files = glob.glob(os.path.join(location_output,
-                                            '*.csv'))
+        # sorted, so that the rows of every band follow the same image order.
+        band_files = sorted(glob.glob(os.path.join(location_output, '*.csv')))
 
         # advisable to use os.path.join as this makes concatenation OS independent
         df_from_each_band_file = (pd.read_csv(f) for f in band_files)
         concat_band_df = pd.concat(df_from_each_band_file, ignore_index=False, axis=0, sort=False)
-        # export the band specific results to a csv file (i.e. three outputs)
-        print("output csv to: ", ref_temp_dir_bands + '//' + 'Band' + str(x) + '_test.csv')
+        # export the band specific results to a csv file (i.e. one output per band)
+        logger.debug("output csv to: %s", ref_temp_dir_bands + '//' + 'Band' + str(x) + '_test.csv')
         concat_band_df.to_csv(ref_temp_dir_bands + '//' + 'Band' + str(x) + '_test.csv', index=False)
 
-    # ----------------------------------------- Concatenate three bands together ---------------------------------------
-
-    # Concatenate Three bands
-    header_all = ['uid', 'site', 'b1_ref_count', 'b1_ref_min', 'b1_ref_max', 'b1_ref_mean',
-                  'b1_ref_med', 'b1_ref_std', 'b1_ref_p25', 'b1_ref_p50', 'b1_ref_p75', 'b1_ref_p95', 'b1_ref_p99',
-                  'b1_ref_range', 'band', 'ref_image', 'date',
-
-                  'b2_uid', 'b2_site', 'b2_ref_count', 'b2_ref_min', 'b2_ref_max', 'b2_ref_mean',
-                  'b2_ref_med', 'b2_ref_std', 'b2_ref_p25', 'b2_ref_p50', 'b2_ref_p75', 'b2_ref_p95', 'b2_ref_p99',
-                  'b2_ref_range', 'b2_ref_band', 'b2_ref_im', 'b2_ref_date',
-                  
-                  'b3_uid', 'b3_site', 'b3_ref_count', 'b3_ref_min', 'b3_ref_max', 'b3_ref_mean',
-                  'b3_ref_med', 'b3_ref_std', 'b3_ref_p25', 'b3_ref_p50', 'b3_ref_p75', 'b3_ref_p95', 'b3_ref_p99',
-                  'b3_ref_range', 'b3_ref_band', 'b3_ref_im', 'b3_ref_date']
+    # ------------------------------------------- Concatenate the bands together ---------------------------------------
 
-
-    all_files = glob.glob(os.path.join(ref_temp_dir_bands,
-                                       '*.csv'))
-    # advisable to use os.path.join as this makes concatenation OS independent
+    # the band csv files side by side in band order (the column names follow num_bands).
+    header_all = header_all_fn(num_bands)
+    all_files = [ref_temp_dir_bands + '//' + 'Band' + str(x) + '_test.csv' for x in num_bands]
     df_from_each_file = (pd.read_csv(f) for f in all_files)
     output_zonal_stats = pd.concat(df_from_each_file, ignore_index=False, axis=1, sort=False)
-    print("-"*50)
-    print(output_zonal_stats.shape)
-    print(output_zonal_stats.columns)
-
+    summary.emit()
+    logger.debug("output shape: %s columns: %s", output_zonal_stats.shape, list(output_zonal_stats.columns))
 
     output_zonal_stats.columns = header_all
 
@@ -366,41 +455,142 @@ def main_routine(temp_dir_path, zonal_stats_ready_dir, no_data, tile, zonal_stat
     #landsat_correction_fn(output_zonal_stats)
 
     # reshape the final dataframe
-    output_zonal_stats = output_zonal_stats[
-        ['uid', 'site', 'ref_image', 'year', 'month', 'day', 'b1_ref_count', 'b1_ref_min',
-         'b1_ref_max', 'b1_ref_mean', 'b1_ref_med', 'b1_ref_std',
-         'b1_ref_p25', 'b1_ref_p50', 'b1_ref_p75', 'b1_ref_p95', 'b1_ref_p99', 'b1_ref_range',
-         'b2_ref_count', 'b2_ref_min', 'b2_ref_max', 'b2_ref_mean', 'b2_ref_med', 'b2_ref_std',
-         'b2_ref_p25', 'b2_ref_p50', 'b2_ref_p75', 'b2_ref_p95', 'b2_ref_p99',
-         'b2_ref_range', 'b3_ref_count', 'b3_ref_min', 'b3_ref_max', 'b3_ref_mean', 'b3_ref_med',
-         'b3_ref_std', 'b3_ref_p25', 'b3_ref_p50', 'b3_ref_p75', 'b3_ref_p95', 'b3_ref_p99', 'b1_ref_range',
-         ]]
-
-    site_list = output_zonal_stats.site.unique().tolist()
-    print("length of site list: ", len(site_list))
-    if len(site_list) >= 1:
-        for i in site_list:
-            out_df = output_zonal_stats[output_zonal_stats['site'] == i]
-
-            out_path = os.path.join(zonal_stats_output, "{0}_{1}_fpc_zonal_stats.csv".format(str(i), complete_tile))
-            # export the pandas df to a csv file
-            out_df.to_csv(out_path, index=False)
+    output_zonal_stats = output_zonal_stats[output_columns_fn(num_bands)]
 
+    with run_profiler.stage_fn("output_write:{0}".format(complete_tile), out_dir=zonal_stats_output):
+        site_list = output_zonal_stats.site.unique().tolist()
+        logger.info("tile %s: writing %d site csv files", complete_tile, len(site_list))
+        if len(site_list) >= 1:
+            for i in site_list:
+                out_df = output_zonal_stats[output_zonal_stats['site'] == i]
 
-    else:
-        out_path = os.path.join(zonal_stats_output,
-                                "{0}_{1}_fpc_zonal_stats.csv".format(str(site_list[0]), complete_tile))
-        # export the pandas df to a csv file
-        output_zonal_stats.to_csv(out_path, index=False)
+                out_path = os.path.join(zonal_stats_output, "{0}_{1}_fpc_zonal_stats.csv".format(str(i), complete_tile))
+                # export the pandas df to a csv file
+                out_df.to_csv(out_path, index=False)
+
+
+        else:
+            out_path = os.path.join(zonal_stats_output,
+                                    "{0}_{1}_fpc_zonal_stats.csv".format(str(site_list[0]), complete_tile))
+            # export the pandas df to a csv file
+            output_zonal_stats.to_csv(out_path, index=False)
 
     # ----------------------------------------------- Delete temporary files -------------------------------------------
     # remove the temp dir and single band csv files
     shutil.rmtree(ref_temp_dir_bands)
 
-    print('=' * 50)
-
     return output_zonal_stats, complete_tile, tile, ref_temp_dir_bands
 
 
+def tiles_fn(list_paths, temp_dir_path, zonal_stats_ready_dir, no_data, zonal_stats_output, routing_index=None,
+             quick=None):
+    """ Run main_routine over the image list of each tile (in a temporary sub-directory per tile).
+
+    @param list_paths: list object containing the tile image list (csv) paths ({path}_{row} followed by 26
+    characters, i.e. 098_075_zonal_landsat_imagery.csv).
+    @param temp_dir_path: string object containing the temporary directory.
+    @param zonal_stats_ready_dir: string object containing the directory of the {tile}_by_tile.shp shapefiles (not
+    read with a routing index).
+    @param no_data: integer object containing the image no data value.
+    @param zonal_stats_output: string object containing the directory the site csv files are written to.
+    @param routing_index: dictionary object returned by tile_routing.load_fn (None for the tile shapefiles).
+    @param quick: dictionary object returned by quick_look.quick_fn (None for every image at full resolution).
+    @return tiles: list object containing the tiles extracted (the tiles with no sites are skipped).
+    """
+    tiles = []
+    for list_path in list_paths:
+        complete_tile = list_path[-33:-30] + list_path[-29:-26]
+        if routing_index is None and not os.path.exists(
+                os.path.join(zonal_stats_ready_dir, "{0}_by_tile.shp".format(complete_tile))):
+            logger.info("tile %s: no %s_by_tile.shp, skipped", complete_tile, complete_tile)
+            continue
+        # the sub-directory is removed only when it is created here (main_routine removes its band files).
+        tile_temp_dir = os.path.join(temp_dir_path, complete_tile)
+        created = not os.path.isdir(tile_temp_dir)
+        if created:
+            os.makedirs(tile_temp_dir)
+        results = main_routine(tile_temp_dir, zonal_stats_ready_dir, no_data, list_path, zonal_stats_output,
+                               routing_index, quick)
+        if created:
+            shutil.rmtree(tile_temp_dir, ignore_errors=True)
+        if results is not None:
+            tiles.append(complete_tile)
+
+    return tiles
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description="Calculate the zonal statistics of the Landsat tile images for the 1ha sites (a csv file per "
+                    "site and tile).")
+
+    p.add_argument('--lists', nargs="+", required=True,
+                   help="The tile image list csv file(s) (one image path per line, named {path}_{row} followed by "
+                        "26 characters, i.e. 098_075_zonal_landsat_imagery.csv).")
+
+    p.add_argument('--routing_index', default=None,
+                   help="The path to the routing index json file (tile_routing or tile_selection): the sites routed "
+                        "to each tile are extracted in memory")
+
+    p.add_argument('--zonal_stats_ready_dir', default=None,
+                   help="The directory housing the {tile}_by_tile.shp site shapefiles (without --routing_index)")
+
+    p.add_argument('--output', help="The directory the site csv files are written to.", required=True)
+
+    p.add_argument('--temp_dir', default=None,
+                   help="The directory the band csv files are written in (default a temporary directory)")
+
+    p.add_argument('-n', '--no_data', type=int, default=0, help="Enter the image no data value (default 0)")
+
+    p.add_argument('--quick', type=int, default=0,
+                   help="Enter a decimation factor (i.e. 4) for an approximate quick look: the images are read from "
+                        "overviews of the factor (decimated copies are cached where an image has none) and the "
+                        "error against full resolution is written to {tile}_quick_report.json")
+
+    p.add_argument('--quick_every', type=int, default=1,
+                   help="Enter n to extract every nth image (date) of each tile only in a quick look")
+
+    p.add_argument('--quick_calibration', type=int, default=4,
+                   help="Enter the number of images also extracted at full resolution to estimate the --quick error")
+
+    p.add_argument('--quick_cache', default=quick_look.default_cache_dir,
+                   help="The directory the --quick decimated copies are cached in")
+
+    p.add_argument('-l', '--log_file', help="The path of an optional log file (written in addition to the console)",
+                   default=None)
+
+    pipeline_logging.add_logging_args_fn(p)
+
+    return p.parse_args()
+
+
+def tiles_routine():
+    """ Extract the site statistics of every listed tile (the command line entry point). """
+    cmd_args = get_cmd_args_fn()
+    pipeline_logging.setup_logging_fn(cmd_args.quiet, cmd_args.verbose, cmd_args.log_file)
+
+    routing_index = None
+    if cmd_args.routing_index:
+        import tile_routing
+        routing_index = tile_routing.load_fn(cmd_args.routing_index)
+        if routing_index is None:
+            raise ValueError("No routing index: {0}".format(cmd_args.routing_index))
+    elif not cmd_args.zonal_stats_ready_dir:
+        raise ValueError("Enter --routing_index or --zonal_stats_ready_dir (the tile shapefiles)")
+
+    quick = quick_look.quick_fn(cmd_args.quick, cmd_args.quick_every, cmd_args.quick_calibration,
+                                cmd_args.quick_cache)
+    if not os.path.isdir(cmd_args.output):
+        os.makedirs(cmd_args.output)
+    temp_dir_path = cmd_args.temp_dir or tempfile.mkdtemp(prefix="step1_9_")
+    try:
+        tiles = tiles_fn(cmd_args.lists, temp_dir_path, cmd_args.zonal_stats_ready_dir, cmd_args.no_data,
+                         cmd_args.output, routing_index, quick)
+    finally:
+        if not cmd_args.temp_dir:
+            shutil.rmtree(temp_dir_path, ignore_errors=True)
+    logger.info("%d of %d tiles extracted to %s", len(tiles), len(cmd_args.lists), cmd_args.output)
+
+
 if __name__ == '__main__':
-    main_routine()
+    tiles_routine()
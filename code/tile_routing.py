@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+
+"""
+tile_routing.py
+===============
+
+Description: This script builds the site to Landsat tile routing index, so that each tile image list (step1_9) is
+processed against the zones of its own sites only, without the per tile {complete_tile}_by_tile.shp shapefiles.
+
+1. build_fn spatially joins the site polygons (1ha site shapefile or GeoDataFrame: uid and site_name attributes) to
+the WRS2 tile grid shapefile once (geopandas sjoin, intersects) and records for each site its tiles
+('{path:03d}{row:03d}', the tile code step1_9 parses from the image list name) and its geometry (WKB), and for each
+tile its sites. The sites are keyed by site_name (a repeated name takes a '#2', '#3' ... suffix in file order) rather
+than by uid, as step1_1 numbers the uids after sorting the sites: adding a site renumbers the sites after it.
+
+2. update_fn adds, changes or removes sites: only the new or changed sites (site_name or geometry) are joined to the
+tile grid, and only the tiles they touch (before and after the change) are returned as affected; a renumbered uid is
+updated in place. A changed tile grid file (or an index of an earlier version) rebuilds the index.
+
+3. tile_zones_fn returns the zones of a tile in the geometry_provider.read_zones_fn format (decoded from the index),
+which step1_9.main_routine takes in place of the tile shapefile.
+
+The index is a json file:
+    {"version", "tile_grid": [path, mtime, size], "crs_wkt",
+     "sites": {site key: {"uid", "site", "wkb" (hex), "tiles"}}, "tiles": {tile: [site key, ...]}}
+
+    python tile_routing.py --sites sites_1ha.shp --tile_grid wrs2_descending.shp --index tile_routing.json
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import json
+import argparse
+import warnings
+import lazy_imports
+import pipeline_logging
+import geometry_provider
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("routing")
+
+gpd = lazy_imports.lazy_module_fn("geopandas")
+shapely_wkb = lazy_imports.lazy_module_fn("shapely.wkb")
+
+# WRS2 tile grid attributes (USGS WRS2 descending shapefile).
+path_field = "PATH"
+row_field = "ROW"
+
+# routing index format (an index of another version is rebuilt).
+index_version = 2
+
+
+def tile_code_fn(path, row):
+    """ Return the tile code of a WRS2 path and row (i.e. 98, 75 -> '098075'). """
+    return "{0:03d}{1:03d}".format(int(path), int(row))
+
+
+def grid_key_fn(tile_grid):
+    """ Return the path, modification time and size of the tile grid file (a changed grid rebuilds the index). """
+    stat = os.stat(tile_grid)
+
+    return [os.path.abspath(tile_grid), stat.st_mtime, stat.st_size]
+
+
+def site_keys_fn(site_names):
+    """ Return the index key of each site: its site_name, with a '#n' suffix on the nth repeat of a name. """
+    seen = {}
+    keys = []
+    for site in site_names:
+        site = str(site)
+        seen[site] = seen.get(site, 0) + 1
+        keys.append(site if seen[site] == 1 else "{0}#{1}".format(site, seen[site]))
+
+    return keys
+
+
+def read_sites_fn(sites, uid="uid"):
+    """ Return the sites as a GeoDataFrame (key, uid and site_name columns) from a shapefile path or a GeoDataFrame. """
+    sites_gdf = gpd.read_file(sites) if isinstance(sites, str) else sites
+    if sites_gdf.crs is None:
+        raise ValueError("The sites have no crs - the crs can not be confirmed to match the tile grid.")
+
+    sites_gdf = sites_gdf[[uid, "site_name", "geometry"]].rename(columns={uid: "uid"})
+    sites_gdf["key"] = site_keys_fn(sites_gdf["site_name"])
+
+    return sites_gdf
+
+
+def read_grid_fn(tile_grid):
+    """ Return the tile grid as a GeoDataFrame with a tile column ('{path:03d}{row:03d}'). """
+    grid_gdf = gpd.read_file(tile_grid)
+    if grid_gdf.crs is None:
+        raise ValueError("{0} has no crs - the crs can not be confirmed to match the sites.".format(tile_grid))
+
+    grid_gdf["tile"] = [tile_code_fn(p, r) for p, r in zip(grid_gdf[path_field], grid_gdf[row_field])]
+
+    return grid_gdf[["tile", "geometry"]]
+
+
+def join_fn(sites_gdf, grid_gdf, key="uid"):
+    """ Return {key: [tiles]} of the sites intersecting the tile grid (spatial join in the tile grid crs). """
+    joined = gpd.sjoin(sites_gdf.to_crs(grid_gdf.crs), grid_gdf, how="left", predicate="intersects")
+    site_tiles = dict((str(u), []) for u in sites_gdf[key])
+    for u, tile in zip(joined[key], joined["tile"]):
+        if isinstance(tile, str):
+            site_tiles[str(u)].append(tile)
+
+    return dict((u, sorted(set(t))) for u, t in site_tiles.items())
+
+
+def uid_value_fn(u):
+    """ Return a uid as a json value (numpy scalars converted). """
+    return u.item() if hasattr(u, "item") else u
+
+
+def site_entry_fn(u, site, geometry, tiles):
+    """ Return the index entry of a site. """
+    return {"uid": uid_value_fn(u), "site": str(site),
+            "wkb": geometry.wkb_hex if geometry is not None else "", "tiles": tiles}
+
+
+def tiles_fn(index):
+    """ Rebuild the tile -> site key lists from the site entries (keys in index order). """
+    tiles = {}
+    for u, entry in index["sites"].items():
+        for tile in entry["tiles"]:
+            tiles.setdefault(tile, []).append(u)
+
+    index["tiles"] = dict((tile, tiles[tile]) for tile in sorted(tiles))
+
+    return index
+
+
+def build_fn(sites, tile_grid, uid="uid"):
+    """ Build the routing index: join every site to the tile grid once.
+
+    @param sites: string object (1ha site shapefile path) or GeoDataFrame object containing the site polygons.
+    @param tile_grid: string object containing the path to the WRS2 tile grid shapefile.
+    @param uid: string object containing the unique site identifier attribute.
+    @return index: dictionary object (see the module description).
+    """
+    sites_gdf = read_sites_fn(sites, uid)
+    site_tiles = join_fn(sites_gdf, read_grid_fn(tile_grid), "key")
+
+    index = {"version": index_version, "tile_grid": grid_key_fn(tile_grid),
+             "crs_wkt": geometry_provider.crs_wkt_fn(sites_gdf.crs, "sites"), "sites": {}}
+    for key, u, site, geometry in zip(sites_gdf["key"], sites_gdf["uid"], sites_gdf["site_name"], sites_gdf.geometry):
+        index["sites"][key] = site_entry_fn(u, site, geometry, site_tiles[key])
+    tiles_fn(index)
+    logger.info("routing index built: %d sites on %d tiles", len(index["sites"]), len(index["tiles"]))
+
+    return index
+
+
+def update_fn(index, sites, tile_grid, uid="uid"):
+    """ Bring the routing index up to date with the sites (new, changed and removed sites only).
+
+    @param index: dictionary object returned by build_fn (or load_fn).
+    @param sites: string object (1ha site shapefile path) or GeoDataFrame object containing every site.
+    @param tile_grid: string object containing the path to the WRS2 tile grid shapefile.
+    @param uid: string object containing the unique site identifier attribute.
+    @return index, affected: tuple object (the updated index and the sorted list of the tiles to process again).
+    """
+    if index is None or index.get("version") != index_version or index.get("tile_grid") != grid_key_fn(tile_grid):
+        index = build_fn(sites, tile_grid, uid)
+        return index, sorted(index["tiles"])
+
+    sites_gdf = read_sites_fn(sites, uid)
+    sites_gdf = sites_gdf.to_crs(index["crs_wkt"])
+
+    affected = set()
+    current = set()
+    changed = []
+    renumbered = 0
+    for n, (key, u, geometry) in enumerate(zip(sites_gdf["key"], sites_gdf["uid"], sites_gdf.geometry)):
+        current.add(key)
+        entry = index["sites"].get(key)
+        wkb_hex = geometry.wkb_hex if geometry is not None else ""
+        if entry is None or entry["wkb"] != wkb_hex:
+            changed.append(n)
+        elif entry["uid"] != uid_value_fn(u):
+            # the same site under a new uid (sites inserted before it): no tile is affected.
+            entry["uid"] = uid_value_fn(u)
+            renumbered += 1
+
+    removed = [key for key in index["sites"] if key not in current]
+    for key in removed:
+        affected.update(index["sites"].pop(key)["tiles"])
+
+    if changed:
+        changed_gdf = sites_gdf.iloc[changed]
+        site_tiles = join_fn(changed_gdf, read_grid_fn(tile_grid), "key")
+        for key, u, site, geometry in zip(changed_gdf["key"], changed_gdf["uid"], changed_gdf["site_name"],
+                                          changed_gdf.geometry):
+            previous = index["sites"].get(key)
+            if previous is not None:
+                affected.update(previous["tiles"])
+            index["sites"][key] = site_entry_fn(u, site, geometry, site_tiles[key])
+            affected.update(site_tiles[key])
+
+    tiles_fn(index)
+    logger.info("routing index updated: %d sites changed, %d removed, %d renumbered, %d tiles affected",
+                len(changed), len(removed), renumbered, len(affected))
+
+    return index, sorted(affected)
+
+
+def load_fn(index_path):
+    """ Return the routing index saved at index_path (None when there is no index file). """
+    if not os.path.isfile(index_path):
+        return None
+
+    with open(index_path, "r") as index_file:
+        return json.load(index_file)
+
+
+def save_fn(index, index_path):
+    """ Write the routing index (temporary file + rename). """
+    temp_path = index_path + ".tmp"
+    with open(temp_path, "w") as output:
+        json.dump(index, output)
+    os.replace(temp_path, index_path)
+
+
+def tile_zones_fn(index, tile):
+    """ Return the zones of the sites routed to a tile (geometry_provider.read_zones_fn format).
+
+    @param index: dictionary object returned by build_fn, update_fn or load_fn.
+    @param tile: string object containing the tile code (i.e. '098075').
+    @return zones: dictionary object {"geometries", "uid", "site", "crs_wkt", "projected"} (no zones when the tile
+    has no sites).
+    """
+    zones = {"geometries": [], "uid": [], "site": [], "crs_wkt": index["crs_wkt"], "projected": {}}
+    for u in index["tiles"].get(tile, []):
+        entry = index["sites"][u]
+        zones["geometries"].append(shapely_wkb.loads(bytes.fromhex(entry["wkb"])) if entry["wkb"] else None)
+        zones["uid"].append(entry["uid"])
+        zones["site"].append(entry["site"])
+
+    return zones
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description="Build or update the site to Landsat tile routing index used by step1_9.")
+
+    p.add_argument('--sites', help="The path to the 1ha site shapefile (uid and site_name attributes).", required=True)
+
+    p.add_argument('--tile_grid', help="The path to the WRS2 tile grid shapefile.", required=True)
+
+    p.add_argument('--index', help="The path of the routing index json file (updated when it exists).", required=True)
+
+    p.add_argument('--uid', help="The unique site identifier attribute (default: uid).", default="uid")
+
+    p.add_argument('-l', '--log_file', help="The path of an optional log file (written in addition to the console)",
+                   default=None)
+
+    pipeline_logging.add_logging_args_fn(p)
+
+    return p.parse_args()
+
+
+def main_routine():
+    """ Build or update the routing index and print the affected tiles (one per line). """
+    cmd_args = get_cmd_args_fn()
+    pipeline_logging.setup_logging_fn(cmd_args.quiet, cmd_args.verbose, cmd_args.log_file)
+
+    index, affected = update_fn(load_fn(cmd_args.index), cmd_args.sites, cmd_args.tile_grid, cmd_args.uid)
+    save_fn(index, cmd_args.index)
+    for tile in affected:
+        print(tile)
+
+
+if __name__ == "__main__":
+    main_routine()
@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+
+"""
+tile_selection.py
+=================
+
+Description: This script chooses the Landsat tile each site is extracted from before extraction, so that sites in
+the WRS2 overlap zones (routed to two to four tiles by tile_routing) are processed once rather than once per tile,
+and the choice of the tile with the most non null records no longer needs every overlapping tile to be extracted.
+
+1. score_fn scores each candidate tile of a site from cheap reads only (no full resolution image reads):
+    coverage   - the fraction of the site polygon inside the tile image footprint (the grid of the first readable
+                 image, raster_metadata).
+    images     - the number of images in the tile image list.
+    valid      - the valid (not no data) fraction within the site's window: valid_map_fn reads band 1 of up to
+                 sample_images images spread over the series at sample_size pixels (the overviews when the file has
+                 them) and keeps the share of the images valid at each decimated pixel; site_valid_fn averages the
+                 pixels under the site bounds. A site in the no data collar of a scene therefore scores low on that
+                 tile although it lies inside the rectangular footprint.
+The score is the expected number of valid observations: coverage x images x valid.
+
+2. select_fn ranks the candidates of every site (highest score first, the tile code breaks ties) and selected_index_fn
+returns a routing index in which each site is routed to its winning tile only (step1_9.main_routine routing_index).
+A site whose winning tile scores fewer than min_images expected observations is also routed to its runner up.
+
+3. fallback_index_fn re-routes the sites whose extracted series from the winning tile turned out sparse (fewer than
+min_records non null records, counted by record_counts_fn from the step1_9 site csv files) to their next candidate
+tile. The --fallback pass writes the fallback routing index and prints the tiles to process again (one per line),
+which are extracted with the fallback index as the routing index (i.e. step1_1 --watch_landsat --routing_index).
+
+    python tile_selection.py --index tile_routing.json --lists tile_lists_dir --output selected_routing.json
+    python tile_selection.py --index tile_routing.json --fallback selected_routing.json
+        --results zonal_stats_output_dir --min_records 10 --output fallback_routing.json
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import glob
+import json
+import math
+import argparse
+import warnings
+import lazy_imports
+import tile_routing
+import raster_metadata
+import pipeline_logging
+import geometry_provider
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("selection")
+
+np = lazy_imports.lazy_module_fn("numpy")
+pd = lazy_imports.lazy_module_fn("pandas")
+rasterio = lazy_imports.lazy_module_fn("rasterio")
+shapely_geometry = lazy_imports.lazy_module_fn("shapely.geometry")
+shapely_wkb = lazy_imports.lazy_module_fn("shapely.wkb")
+
+# longest side (pixels) of the decimated reads of the valid map.
+sample_size = 256
+
+# step1_9 site csv files and the column that is null when a record has no valid pixel.
+results_pattern = "*_fpc_zonal_stats.csv"
+record_column = "b1_ref_mean"
+
+
+def tile_code_fn(list_path):
+    """ Return the tile code of a tile image list path (the step1_9.main_routine slices, i.e. '098075'). """
+    return list_path[-33:-30] + list_path[-29:-26]
+
+
+def tile_images_fn(list_paths):
+    """ Return {tile: [image paths]} read from the tile image list files.
+
+    @param list_paths: list object containing the tile image list (csv) paths.
+    @return tile_images: dictionary object.
+    """
+    tile_images = {}
+    for list_path in list_paths:
+        with open(list_path, "r") as imagery_list:
+            images = [image.rstrip() for image in imagery_list if image.strip()]
+        tile_images.setdefault(tile_code_fn(list_path), []).extend(images)
+
+    return tile_images
+
+
+def grid_fn(images):
+    """ Return the grid signature [crs wkt, transform, width, height] of the first readable tile image, or None. """
+    for image_path in images:
+        metadata = raster_metadata.metadata_fn(image_path)
+        if metadata["ok"]:
+            return metadata["signature"]
+
+    return None
+
+
+def footprint_fn(signature):
+    """ Return the footprint polygon of a grid signature (raster_metadata). """
+    crs_wkt, transform, width, height = signature
+    a, b, c, d, e, f = transform
+    corners = [(a * col + b * row + c, d * col + e * row + f)
+               for col, row in ((0, 0), (width, 0), (width, height), (0, height))]
+
+    return shapely_geometry.Polygon(corners)
+
+
+def sample_valid_fn(image_path, no_data, shape):
+    """ Return the valid pixels of a decimated read of band 1 (the overviews when present) of the given shape. """
+    with rasterio.open(image_path) as srci:
+        array = srci.read(1, out_shape=shape)
+        nodata = srci.nodata if srci.nodata is not None else no_data
+
+    if nodata is None:
+        return np.ones(shape, dtype=bool)
+
+    return ~np.isnan(array) if np.isnan(nodata) else array != nodata
+
+
+def valid_map_fn(images, signature, no_data=None, sample_images=12):
+    """ Return the valid fraction map of a tile: the share of the sampled images valid at each decimated pixel.
+
+    @param images: list object containing the tile image paths.
+    @param signature: list object containing the tile grid signature (grid_fn); images on another grid are skipped.
+    @param no_data: no data value used when a file does not define one.
+    @param sample_images: integer object containing the number of images read (spread over the series).
+    @return valid_map: dictionary object {"fraction" (array), "transform" (of the decimated grid)}, None when no image
+    could be read.
+    """
+    crs_wkt, transform, width, height = signature
+    scale = max(max(width, height) / float(sample_size), 1.0)
+    shape = (max(1, int(height / scale)), max(1, int(width / scale)))
+
+    picks = sorted(set(np.linspace(0, len(images) - 1, min(sample_images, len(images))).astype(int).tolist()))
+    total = np.zeros(shape, dtype=np.float64)
+    samples = 0
+    for p in picks:
+        if raster_metadata.metadata_fn(images[p])["signature"] != signature:
+            logger.warning("valid fraction not sampled (not on the tile grid): %s", images[p])
+            continue
+        try:
+            total += sample_valid_fn(images[p], no_data, shape)
+            samples += 1
+        except Exception as err:
+            logger.warning("valid fraction not sampled: %s (%s)", images[p], err)
+
+    if not samples:
+        return None
+
+    decimated = rasterio.Affine(*transform) * rasterio.Affine.scale(width / float(shape[1]), height / float(shape[0]))
+
+    return {"fraction": total / samples, "transform": decimated}
+
+
+def site_valid_fn(geometry, valid_map):
+    """ Return the mean valid fraction of the decimated pixels under the bounds of a site (tile crs), 0 outside. """
+    if valid_map is None:
+        return 0.0
+
+    rows, cols = valid_map["fraction"].shape
+    minx, miny, maxx, maxy = geometry.bounds
+    corners = [~valid_map["transform"] * (x, y) for x, y in ((minx, miny), (maxx, maxy))]
+    col_list = sorted(c for c, r in corners)
+    row_list = sorted(r for c, r in corners)
+    col_0, col_1 = max(int(math.floor(col_list[0])), 0), min(int(math.floor(col_list[1])), cols - 1)
+    row_0, row_1 = max(int(math.floor(row_list[0])), 0), min(int(math.floor(row_list[1])), rows - 1)
+    if col_0 > col_1 or row_0 > row_1:
+        return 0.0
+
+    return float(valid_map["fraction"][row_0:row_1 + 1, col_0:col_1 + 1].mean())
+
+
+def tile_metadata_fn(tile_images, no_data=None, sample_images=12):
+    """ Return {tile: {"footprint", "crs_wkt", "images", "valid_map"}} for the tiles with an image list. """
+    tile_metadata = {}
+    for tile, images in tile_images.items():
+        signature = grid_fn(images)
+        tile_metadata[tile] = {"footprint": footprint_fn(signature) if signature else None,
+                               "crs_wkt": signature[0] if signature else None, "images": len(images),
+                               "valid_map": valid_map_fn(images, signature, no_data, sample_images)
+                               if signature else None}
+
+    return tile_metadata
+
+
+def score_fn(geometry, crs_wkt, tile_entry):
+    """ Return the coverage, valid fraction and score (expected valid observations) of a site on a tile.
+
+    @param geometry: shapely geometry object containing the site polygon.
+    @param crs_wkt: string object containing the crs of the site polygon.
+    @param tile_entry: dictionary object (tile_metadata_fn entry).
+    @return coverage, valid, score: tuple object.
+    """
+    if tile_entry is None or tile_entry["footprint"] is None or geometry is None or geometry.is_empty:
+        return 0.0, 0.0, 0.0
+
+    if tile_entry["crs_wkt"] and tile_entry["crs_wkt"] != crs_wkt:
+        transform = geometry_provider.transformer_fn(crs_wkt, tile_entry["crs_wkt"]).transform
+        geometry = geometry_provider.shapely_ops.transform(transform, geometry)
+
+    area = geometry.area
+    coverage = geometry.intersection(tile_entry["footprint"]).area / area if area > 0 else \
+        float(tile_entry["footprint"].intersects(geometry))
+    valid = site_valid_fn(geometry, tile_entry["valid_map"]) if coverage > 0 else 0.0
+
+    return coverage, valid, coverage * tile_entry["images"] * valid
+
+
+def select_fn(index, tile_metadata):
+    """ Rank the candidate tiles of every site.
+
+    @param index: dictionary object (tile_routing routing index).
+    @param tile_metadata: dictionary object returned by tile_metadata_fn.
+    @return selection: dictionary object {site key: [[tile, score, coverage, valid], ...]} (best first).
+    """
+    selection = {}
+    for u, entry in index["sites"].items():
+        geometry = shapely_wkb.loads(bytes.fromhex(entry["wkb"])) if entry["wkb"] else None
+        ranked = []
+        for tile in entry["tiles"]:
+            coverage, valid, score = score_fn(geometry, index["crs_wkt"], tile_metadata.get(tile))
+            ranked.append([tile, round(score, 3), round(coverage, 4), round(valid, 4)])
+        ranked.sort(key=lambda candidate: (-candidate[1], candidate[0]))
+        selection[u] = ranked
+
+    return selection
+
+
+def routed_index_fn(index, site_tiles):
+    """ Return a copy of a routing index with the sites routed to the given tiles only ({site key: [tiles]}). """
+    routed = {"version": index.get("version"), "tile_grid": index["tile_grid"], "crs_wkt": index["crs_wkt"],
+              "sites": {}}
+    for u, tiles in site_tiles.items():
+        if tiles:
+            routed["sites"][u] = dict(index["sites"][u], tiles=sorted(tiles))
+
+    return tile_routing.tiles_fn(routed)
+
+
+def selected_index_fn(index, selection, min_images=0):
+    """ Return the routing index of the winning tiles (and the runner up of the sites whose winner scores fewer than
+    min_images expected valid observations).
+
+    @param index: dictionary object (tile_routing routing index).
+    @param selection: dictionary object returned by select_fn.
+    @param min_images: float object containing the expected valid observations below which the runner up is kept.
+    @return selected: dictionary object (routing index).
+    """
+    site_tiles = {}
+    for u, ranked in selection.items():
+        candidates = [c for c in ranked if c[1] > 0] or ranked[:1]
+        tiles = [c[0] for c in candidates[:1]]
+        if candidates and candidates[0][1] < min_images and len(candidates) > 1:
+            tiles.append(candidates[1][0])
+        site_tiles[u] = tiles
+
+    selected = routed_index_fn(index, site_tiles)
+    overlap = sum(1 for ranked in selection.values() if len(ranked) > 1)
+    before = sum(len(ranked) for ranked in selection.values())
+    after = sum(len(tiles) for tiles in site_tiles.values())
+    logger.info("tile selection: %d sites in overlap zones, site x tile extractions %d -> %d", overlap, before, after)
+
+    return selected
+
+
+def record_counts_fn(results_dir):
+    """ Return {site name: non null records} counted from the step1_9 site csv files (the best tile of a site).
+
+    @param results_dir: string object containing the step1_9 zonal stats output directory.
+    @return record_counts: dictionary object.
+    """
+    record_counts = {}
+    for csv_path in sorted(glob.glob(os.path.join(results_dir, results_pattern))):
+        site_df = pd.read_csv(csv_path, usecols=["site", record_column])
+        for site, count in site_df.groupby(site_df["site"].astype(str))[record_column].count().items():
+            record_counts[site] = max(record_counts.get(site, 0), int(count))
+
+    logger.info("%d site series counted in %s", len(record_counts), results_dir)
+
+    return record_counts
+
+
+def fallback_index_fn(index, selection, selected, record_counts, min_records):
+    """ Return the routing index that re-routes the sparse sites to their next candidate tile.
+
+    @param index: dictionary object (tile_routing routing index).
+    @param selection: dictionary object returned by select_fn.
+    @param selected: dictionary object returned by selected_index_fn (the tiles already extracted).
+    @param record_counts: dictionary object {site name: number of non null records extracted} (record_counts_fn).
+    @param min_records: integer object containing the non null records below which a series is sparse.
+    @return fallback, affected: tuple object (routing index of the sparse sites and the sorted tiles to process).
+    """
+    site_tiles = {}
+    for u, ranked in selection.items():
+        if record_counts.get(index["sites"][u]["site"], 0) >= min_records:
+            continue
+        done = set(selected["sites"].get(u, {}).get("tiles", []))
+        remaining = [c[0] for c in ranked if c[0] not in done]
+        if remaining:
+            site_tiles[u] = remaining[:1]
+
+    fallback = routed_index_fn(index, site_tiles)
+    logger.info("tile fallback: %d sparse sites re-routed to %d tiles", len(site_tiles), len(fallback["tiles"]))
+
+    return fallback, sorted(fallback["tiles"])
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description="Select the Landsat tile each site is extracted from (routing index of the winning tiles).")
+
+    p.add_argument('--index', help="The path to the routing index json file (tile_routing).", required=True)
+
+    p.add_argument('--lists', default=None, help="The directory housing the tile image list csv files.")
+
+    p.add_argument('--output', help="The path of the selected (or fallback) routing index json file.", required=True)
+
+    p.add_argument('--fallback', default=None,
+                   help="The path to the selected routing index of an extracted run: re-route its sparse sites")
+
+    p.add_argument('--results', default=None,
+                   help="The directory housing the step1_9 site csv files of the run (with --fallback)")
+
+    p.add_argument('--min_records', type=int, default=10,
+                   help="Enter the non null records below which a site series is sparse (with --fallback)")
+
+    p.add_argument('--min_images', type=float, default=0.0,
+                   help="Enter the expected valid observations below which the runner up tile is also kept")
+
+    p.add_argument('--sample_images', type=int, default=12,
+                   help="Enter the images sampled per tile for the valid fraction map")
+
+    p.add_argument('-n', '--no_data', type=float, default=None,
+                   help="Enter the no data value used when a file does not define one")
+
+    p.add_argument('--metadata_cache', default=raster_metadata.default_cache_path,
+                   help="The path of the raster metadata cache file ('off' for no cache file)")
+
+    p.add_argument('-l', '--log_file', help="The path of an optional log file (written in addition to the console)",
+                   default=None)
+
+    pipeline_logging.add_logging_args_fn(p)
+
+    return p.parse_args()
+
+
+def fallback_routine(cmd_args, index):
+    """ Write the fallback routing index of the sparse sites of an extracted run and print the affected tiles. """
+    if not cmd_args.results:
+        raise ValueError("--fallback needs the --results directory of the extracted run")
+
+    selected = tile_routing.load_fn(cmd_args.fallback)
+    if selected is None:
+        raise ValueError("No selected routing index: {0}".format(cmd_args.fallback))
+    with open(os.path.splitext(cmd_args.fallback)[0] + "_scores.json", "r") as scores:
+        selection = json.load(scores)
+
+    fallback, affected = fallback_index_fn(index, selection, selected, record_counts_fn(cmd_args.results),
+                                           cmd_args.min_records)
+    tile_routing.save_fn(fallback, cmd_args.output)
+    for tile in affected:
+        print(tile)
+
+
+def main_routine():
+    """ Score the candidate tiles, write the selected routing index and a score report beside it (or, with
+    --fallback, the fallback routing index). """
+    cmd_args = get_cmd_args_fn()
+    pipeline_logging.setup_logging_fn(cmd_args.quiet, cmd_args.verbose, cmd_args.log_file)
+
+    index = tile_routing.load_fn(cmd_args.index)
+    if index is None:
+        raise ValueError("No routing index: {0}".format(cmd_args.index))
+
+    if cmd_args.fallback:
+        fallback_routine(cmd_args, index)
+        return
+    if not cmd_args.lists:
+        raise ValueError("Enter --lists (the tile image list directory) or --fallback")
+
+    if cmd_args.metadata_cache != "off":
+        raster_metadata.load_cache_fn(cmd_args.metadata_cache)
+    tile_images = tile_images_fn(sorted(glob.glob(os.path.join(cmd_args.lists, "*.csv"))))
+    tile_metadata = tile_metadata_fn(tile_images, cmd_args.no_data, cmd_args.sample_images)
+    selection = select_fn(index, tile_metadata)
+    tile_routing.save_fn(selected_index_fn(index, selection, cmd_args.min_images), cmd_args.output)
+
+    with open(os.path.splitext(cmd_args.output)[0] + "_scores.json", "w") as output:
+        json.dump(selection, output, indent=1)
+    raster_metadata.save_cache_fn()
+
+
+if __name__ == "__main__":
+    main_routine()
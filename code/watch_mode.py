@@ -0,0 +1,546 @@
+#!/usr/bin/env python
+
+"""
+watch_mode.py
+=============
+
+Description: This script implements the --watch mode of step1_1: a resident process that notices the SILO grids and
+Landsat images landing under the met_analysis (and optionally the Landsat) root and extracts only the new images for
+the affected sites, rather than someone launching a full step1_1 run by hand.
+
+1. poll_fn polls the roots cheaply: the modification time of every directory is checked (one stat per directory) and a
+directory is listed again only when it changed (a file or sub-directory was added, removed or renamed). A new or
+replaced image is held until it is stable - its size and modification time unchanged for settle seconds - so that
+partially copied files are not read.
+
+2. The stable images are batched: a batch is extracted once no new image has arrived for batch_wait seconds (or the
+batch is batch_max seconds old).
+    met_analysis  - the new images of each product directory are listed and extracted by step1_8 for every site (the
+                    grids cover every site); the rows are merged into the per site series of the watch export
+                    directory ({export_dir}/watch_{met_ver}/{met_ver}/{directory}) and the seasonal aggregates,
+                    anomalies and antecedent windows of a cor directory are derived again from the merged series.
+    Landsat       - the new images of each tile (the tile code in the file name) are extracted by step1_9 for the
+                    sites routed to the tile only (tile_routing index) and merged into the per site tile series.
+
+3. The extracted images are recorded in {export_dir}/watch_{met_ver}/watch_state.json with their file key, so a
+restarted watch extracts only the images it has not seen (the first start catches up every image). The images of a
+failed kind (met or Landsat) are logged and retried at the next batch, the other kind is recorded. Between polls the
+process sleeps (near zero CPU).
+
+4. The sites are buffered once when the watch starts (restart the watch to add or change sites). The state also keeps
+a hash per site (site_hashes_fn: the buffered geometry of the met sites and the geometry and tiles of the routed
+Landsat sites) and of the whole site set; when the set changed, catch_up_fn extracts the images already extracted for
+the new or changed sites only, and their series are written again rather than merged. Removed sites are logged, their
+series are left in place.
+
+    python step1_1_initiate_fractional_cover_zonal_stats_pipeline.py -d sites.csv -x export_dir --watch
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import re
+import json
+import time
+import hashlib
+import shutil
+import warnings
+import lazy_imports
+import image_catalog
+import raster_metadata
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("watch")
+
+pd = lazy_imports.lazy_module_fn("pandas")
+
+watch_version = 2
+
+# the WRS2 tile code in a Landsat file name (i.e. l8olre_098075_m_20000101_....img -> '098075').
+tile_pattern = re.compile(r"_(\d{6})_")
+
+
+def new_state_fn():
+    """ Return an empty watch state. """
+    return {"version": watch_version, "done": {}, "sites": {}, "site_hash": None, "dirs": {}, "pending": {},
+            "batch": {}, "batch_since": None, "last_arrival": None}
+
+
+def load_state_fn(state_path):
+    """ Return the watch state saved at state_path (the extracted images and site hashes), or an empty state. """
+    state = new_state_fn()
+    if os.path.isfile(state_path):
+        try:
+            with open(state_path, "r") as state_file:
+                saved = json.load(state_file)
+            if saved.get("version") == watch_version:
+                state.update(done=saved["done"], sites=saved["sites"], site_hash=saved["site_hash"])
+        except ValueError:
+            logger.warning("The watch state could not be read, every image will be extracted: %s", state_path)
+
+    return state
+
+
+def save_state_fn(state, state_path):
+    """ Write the extracted images and site hashes of the watch state (temporary file + rename). """
+    temp_path = state_path + ".tmp"
+    with open(temp_path, "w") as output:
+        json.dump({"version": watch_version, "done": state["done"], "sites": state["sites"],
+                   "site_hash": state["site_hash"]}, output)
+    os.replace(temp_path, state_path)
+
+
+def scan_fn(directory, extension, state, candidates):
+    """ Add the new or replaced images of a directory tree to candidates {path: file key}; a directory is listed only
+    when its modification time changed since the last poll.
+
+    @param directory: string object containing the directory path.
+    @param extension: string object containing the image file extension.
+    @param state: dictionary object (watch state, "dirs" holds [mtime, sub-directories] per listed directory).
+    @param candidates: dictionary object updated in place.
+    """
+    try:
+        mtime = os.stat(directory).st_mtime
+    except OSError:
+        state["dirs"].pop(directory, None)
+        return
+
+    known = state["dirs"].get(directory)
+    if known is not None and known[0] == mtime:
+        for sub_dir in known[1]:
+            scan_fn(sub_dir, extension, state, candidates)
+        return
+
+    sub_dirs = []
+    for entry in os.scandir(directory):
+        if entry.is_dir():
+            sub_dirs.append(entry.path)
+        elif entry.name.endswith(extension):
+            stat = entry.stat()
+            key = [stat.st_mtime, stat.st_size]
+            if state["done"].get(entry.path) != key:
+                candidates[entry.path] = key
+    state["dirs"][directory] = [mtime, sorted(sub_dirs)]
+
+    for sub_dir in sorted(sub_dirs):
+        scan_fn(sub_dir, extension, state, candidates)
+
+
+def settle_fn(state, now, settle):
+    """ Return the pending images [path, kind] whose size and modification time have been unchanged for settle
+    seconds (removed from the pending images). """
+    ready = []
+    for path, (key, since, kind) in list(state["pending"].items()):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            del state["pending"][path]
+            continue
+        current = [stat.st_mtime, stat.st_size]
+        if current != key:
+            state["pending"][path] = [current, now, kind]
+        elif now - since >= settle:
+            ready.append([path, kind])
+            del state["pending"][path]
+
+    return sorted(ready)
+
+
+def poll_fn(roots, state, settle, now=None):
+    """ Poll the roots once and add the stable new images to the batch.
+
+    @param roots: list object containing [root directory, extension, kind] entries (kind 'met' or 'landsat').
+    @param state: dictionary object (watch state).
+    @param settle: float object containing the seconds an image must be unchanged before it is read.
+    @param now: float object containing the poll time (time.time() by default).
+    @return ready: list object containing the [path, kind] of the images added to the batch.
+    """
+    now = time.time() if now is None else now
+    for root, extension, kind in roots:
+        candidates = {}
+        scan_fn(root, extension, state, candidates)
+        for path, key in candidates.items():
+            if path not in state["pending"] and path not in state["batch"]:
+                state["pending"][path] = [key, now, kind]
+
+    ready = settle_fn(state, now, settle)
+    for path, kind in ready:
+        state["batch"][path] = kind
+    if ready:
+        state["last_arrival"] = now
+        if state["batch_since"] is None:
+            state["batch_since"] = now
+        logger.info("%d new images stable (%d in the batch, %d still copying)", len(ready), len(state["batch"]),
+                    len(state["pending"]))
+
+    return ready
+
+
+def batch_due_fn(state, now, batch_wait, batch_max):
+    """ Return True when the batch is due (no arrival for batch_wait seconds or the batch is batch_max seconds old). """
+    if not state["batch"]:
+        return False
+
+    return now - state["last_arrival"] >= batch_wait or now - state["batch_since"] >= batch_max
+
+
+def merge_series_fn(new_df, out_path, keys, sort_columns, dtype=None, replace=False):
+    """ Merge new rows into a per site series csv (the new row replaces an existing row with the same keys).
+
+    @param new_df: dataframe object containing the new rows of a site.
+    @param out_path: string object containing the series csv path (created when missing).
+    @param keys: list object containing the columns identifying a row.
+    @param sort_columns: list object containing the columns the series is sorted by.
+    @param dtype: dictionary object containing the column types read from the csv.
+    @param replace: boolean object, True writes the new rows in place of the series (a caught up site).
+    @return series_df: dataframe object containing the merged series.
+    """
+    if os.path.isfile(out_path) and not replace:
+        series_df = pd.concat([pd.read_csv(out_path, dtype=dtype), new_df], ignore_index=True, sort=False)
+        series_df = series_df.drop_duplicates(subset=keys, keep="last")
+    else:
+        series_df = new_df
+    series_df = series_df.sort_values(sort_columns, kind="mergesort")
+    series_df.to_csv(out_path, index=False)
+
+    return series_df
+
+
+def met_batch_fn(images, context):
+    """ Extract the new met images (step1_8, every site) and merge them into the per site series of each directory.
+
+    @param images: list object containing the new image paths.
+    @param context: dictionary object built by main_routine.
+    """
+    import step1_2_list_of_qld_grid_images
+    import step1_8_qld_grid_zonal_stats
+    import seasonal_aggregates
+    import climatology_anomalies
+    import antecedent_windows
+
+    directory_images = {}
+    for image_path in images:
+        directory_images.setdefault(os.path.dirname(image_path), []).append(image_path)
+
+    for in_dir, new_images in sorted(directory_images.items()):
+        product = image_catalog.product_fn(in_dir)
+        if product is None or product in context["skip_products"]:
+            continue
+
+        data_type = context["data_type_fn"](in_dir)
+        out_dir = os.path.join(context["watch_dir"], context["met_ver"], data_type)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        batch_dir = os.path.join(context["temp_dir"], data_type)
+        os.makedirs(batch_dir)
+
+        date_s, date_e = image_catalog.product_dict[product]
+        csv_list = step1_2_list_of_qld_grid_images.output_csv_fn(sorted(new_images), batch_dir, data_type)
+        new_df = step1_8_qld_grid_zonal_stats.main_routine(
+            in_dir, batch_dir, csv_list, data_type, batch_dir, context["qld_dict"], context["geo_df"],
+            context["met_ver"], context["shapefile_path"], date_s, date_e, context["image_workers"],
+            context["share_mode"], context["window_cache"], context["scales"])
+
+        site_frames = []
+        for site, site_df in new_df.groupby("site", sort=False):
+            out_path = os.path.join(out_dir, "{0}_{1}_zonal_stats.csv".format(str(site), data_type))
+            site_frames.append(merge_series_fn(site_df, out_path, ["ident", "im_name"], ["im_date", "im_name"],
+                                               {"site": str, "im_date": str, "im_name": str},
+                                               context["replace_series"]))
+        logger.info("%s: %d new images merged into %d site series (%s)", data_type, len(new_images),
+                    len(site_frames), out_dir)
+
+        if product != "cor" or not site_frames:
+            continue
+        # the derived products need the whole monthly series of the affected sites.
+        output_df = pd.concat(site_frames, ignore_index=True, sort=False)
+        if context["seasons"]:
+            seasonal_aggregates.main_routine(output_df, out_dir, data_type, context["seasons"])
+        if context["base_period"]:
+            climatology_anomalies.main_routine(output_df, out_dir, data_type, context["base_period"])
+        if context["window_list"]:
+            antecedent_windows.main_routine(output_df, context["visit_df"], out_dir, data_type,
+                                            context["window_list"], context["variable"])
+
+
+def landsat_batch_fn(images, context):
+    """ Extract the new Landsat images of each tile (step1_9, the sites routed to the tile only) and merge them into
+    the per site tile series.
+
+    @param images: list object containing the new image paths.
+    @param context: dictionary object built by main_routine.
+    """
+    import step1_9_reflectance_zonal_stats
+
+    index = context["routing_index"]
+    tile_images = {}
+    for image_path in images:
+        match = tile_pattern.search(os.path.basename(image_path))
+        tile = match.group(1) if match else None
+        if tile not in index["tiles"]:
+            logger.info("no sites routed to the tile of %s, not extracted", image_path)
+            continue
+        tile_images.setdefault(tile, []).append(image_path)
+
+    out_dir = os.path.join(context["watch_dir"], "landsat")
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    for tile, new_images in sorted(tile_images.items()):
+        batch_dir = os.path.join(context["temp_dir"], tile)
+        os.makedirs(batch_dir)
+        # step1_9 slices the tile code from the list path ({path}_{row} followed by 26 characters).
+        list_path = os.path.join(batch_dir, "{0}_{1}_watch_landsat_imagery.csv".format(tile[:3], tile[3:]))
+        with open(list_path, "w") as output:
+            output.writelines(image_path + "\n" for image_path in sorted(new_images))
+
+        results = step1_9_reflectance_zonal_stats.main_routine(batch_dir, None, context["no_data"], list_path,
+                                                                batch_dir, routing_index=index)
+        if results is None:
+            continue
+        new_df = results[0]
+        for site, site_df in new_df.groupby("site", sort=False):
+            out_path = os.path.join(out_dir, "{0}_{1}_fpc_zonal_stats.csv".format(str(site), tile))
+            merge_series_fn(site_df, out_path, ["uid", "ref_image"], ["year", "month", "day", "ref_image"],
+                            {"site": str, "ref_image": str, "year": str, "month": str, "day": str},
+                            context["replace_series"])
+        logger.info("tile %s: %d new images merged for %d routed sites (%s)", tile, len(new_images),
+                    len(index["tiles"][tile]), out_dir)
+
+
+def extract_fn(batch, context):
+    """ Extract {image path: kind} per root kind in a fresh temporary directory (removed afterwards).
+
+    @return failed: list object containing the kinds that failed (logged, the other kinds are still extracted).
+    """
+    if os.path.isdir(context["temp_dir"]):
+        shutil.rmtree(context["temp_dir"])
+    os.makedirs(context["temp_dir"])
+    failed = []
+    try:
+        for kind, batch_fn in (("met", met_batch_fn), ("landsat", landsat_batch_fn)):
+            images = sorted(path for path, k in batch.items() if k == kind)
+            if not images:
+                continue
+            try:
+                batch_fn(images, context)
+            except Exception:
+                logger.exception("watch %s batch of %d images failed", kind, len(images))
+                failed.append(kind)
+    finally:
+        shutil.rmtree(context["temp_dir"], ignore_errors=True)
+
+    return failed
+
+
+def process_batch_fn(state, context, state_path):
+    """ Extract the batch (per root kind), record the extracted images and clear them from the batch (the images of a
+    failed kind are kept for the next batch, the others are recorded). """
+    batch = dict(state["batch"])
+    start = time.time()
+    failed = extract_fn(batch, context)
+
+    for path, kind in batch.items():
+        if kind in failed:
+            continue
+        try:
+            stat = os.stat(path)
+            state["done"][path] = [stat.st_mtime, stat.st_size]
+        except OSError:
+            pass
+        del state["batch"][path]
+    if failed:
+        logger.warning("watch batch: the %s images are retried with the next batch", " and ".join(failed))
+        state["batch_since"] = state["last_arrival"] = time.time()
+    else:
+        state["batch_since"] = state["last_arrival"] = None
+    save_state_fn(state, state_path)
+    raster_metadata.save_cache_fn()
+    logger.info("watch batch of %d images extracted in %.1f s", sum(kind not in failed for kind in batch.values()),
+                time.time() - start)
+
+    return not failed
+
+
+def site_hashes_fn(geo_df, index=None):
+    """ Return the site hashes of the watch state.
+
+    @param geo_df: GeoDataFrame object containing the buffered sites (site_name attribute).
+    @param index: dictionary object (tile_routing routing index of the Landsat sites, None without --watch_landsat).
+    @return sites: dictionary object {"met": {site key: sha1 of the geometry wkb}, "landsat": {site key: sha1 of the
+    geometry wkb and tiles}} (the site keys of tile_routing.site_keys_fn).
+    """
+    import tile_routing
+
+    sites = {"met": {}, "landsat": {}}
+    for key, geometry in zip(tile_routing.site_keys_fn(geo_df["site_name"]), geo_df.geometry):
+        sites["met"][key] = hashlib.sha1(geometry.wkb).hexdigest()
+    if index is not None:
+        for key, entry in index["sites"].items():
+            route = "{0}|{1}".format(entry["wkb"], ",".join(entry["tiles"]))
+            sites["landsat"][key] = hashlib.sha1(route.encode("utf-8")).hexdigest()
+
+    return sites
+
+
+def site_context_fn(context, kind, keys):
+    """ Return a copy of the context restricted to the given sites of a root kind (their series written again). """
+    import tile_routing
+
+    if kind == "met":
+        geo_df = context["geo_df"]
+        geo_df = geo_df[[key in keys for key in tile_routing.site_keys_fn(geo_df["site_name"])]]
+        shapefile_path = os.path.join(context["watch_dir"], "sites", "catch_up_sites.shp")
+        geo_df.to_file(shapefile_path, driver="ESRI Shapefile")
+        return dict(context, geo_df=geo_df, shapefile_path=shapefile_path, replace_series=True)
+
+    index = context["routing_index"]
+    routed = dict(index, sites=dict((key, index["sites"][key]) for key in index["sites"] if key in keys))
+
+    return dict(context, routing_index=tile_routing.tiles_fn(routed), replace_series=True)
+
+
+def catch_up_fn(roots, state, context, state_path):
+    """ Extract the images already extracted for the sites added or changed since the state was saved (those sites
+    only) and record the site hashes; a failed catch up is logged and retried at the next start.
+
+    @param roots: list object containing [root directory, extension, kind] entries.
+    @param state: dictionary object (watch state).
+    @param context: dictionary object built by main_routine ("sites" holds site_hashes_fn).
+    @param state_path: string object containing the watch state path.
+    """
+    site_hash = hashlib.sha1(json.dumps(context["sites"], sort_keys=True).encode("utf-8")).hexdigest()
+    if state["site_hash"] == site_hash:
+        return
+
+    for root, extension, kind in roots:
+        saved, current = state["sites"].get(kind, {}), context["sites"][kind]
+        removed = [key for key in saved if key not in current]
+        if removed:
+            logger.info("%s: %d sites removed since the last run (their series are left in place)", kind,
+                        len(removed))
+        keys = set(key for key, value in current.items() if saved.get(key) != value)
+        prefix = os.path.join(root, "")
+        images = dict((path, kind) for path in state["done"] if path.startswith(prefix) and os.path.isfile(path))
+        if not keys or not images:
+            continue
+
+        start = time.time()
+        if extract_fn(images, site_context_fn(context, kind, keys)):
+            logger.warning("catch up of %d new or changed %s sites failed, retried at the next start", len(keys), kind)
+            return
+        logger.info("%s: %d new or changed sites caught up over %d extracted images in %.1f s", kind, len(keys),
+                    len(images), time.time() - start)
+
+    state["sites"], state["site_hash"] = context["sites"], site_hash
+    save_state_fn(state, state_path)
+
+
+def watch_fn(roots, context, state_path, interval=60.0, settle=120.0, batch_wait=300.0, batch_max=3600.0):
+    """ Poll the roots until interrupted, extracting each due batch of new images.
+
+    @param roots: list object containing [root directory, extension, kind] entries.
+    @param context: dictionary object built by main_routine.
+    @param state_path: string object containing the watch state path.
+    @param interval: float object containing the seconds between polls.
+    @param settle: float object containing the seconds an image must be unchanged before it is read.
+    @param batch_wait: float object containing the seconds without a new arrival before a batch is extracted.
+    @param batch_max: float object containing the maximum age of a batch in seconds.
+    """
+    state = load_state_fn(state_path)
+    catch_up_fn(roots, state, context, state_path)
+    logger.info("watching %s (%d images already extracted, poll every %.0f s)", ", ".join(r[0] for r in roots),
+                len(state["done"]), interval)
+    try:
+        while True:
+            poll_fn(roots, state, settle)
+            if batch_due_fn(state, time.time(), batch_wait, batch_max):
+                process_batch_fn(state, context, state_path)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info("watch stopped (%d images pending, %d in the batch)", len(state["pending"]), len(state["batch"]))
+
+
+def main_routine(cmd_args, qld_dict, skip_products, seasons, base_period, window_list, data_type_fn):
+    """ Buffer the sites once and watch the met_analysis (and Landsat) roots (step1_1 --watch).
+
+    @param cmd_args: argparse namespace object (step1_1 command arguments).
+    @param qld_dict: dictionary object containing the met variable values (step1_1).
+    @param skip_products: list object containing the products derived rather than read.
+    @param seasons: list object containing the seasons derived from the cor series.
+    @param base_period: climatology base period derived from the cor series.
+    @param window_list: list object containing the antecedent windows derived from the cor series.
+    @param data_type_fn: function object returning the output directory name of a product directory.
+    """
+    import step1_3_project_buffer
+    import tile_routing
+    import multi_scale
+
+    dict_values = qld_dict[cmd_args.met_ver]
+    watch_dir = os.path.join(cmd_args.export_dir, "watch_{0}".format(cmd_args.met_ver))
+    sites_dir = os.path.join(watch_dir, "sites")
+    if os.path.isdir(sites_dir):
+        shutil.rmtree(sites_dir)
+    os.makedirs(os.path.join(sites_dir, "buffer"))
+
+    raster_metadata.load_cache_fn(cmd_args.metadata_cache)
+    geo_df, crs_name, visit_df = step1_3_project_buffer.main_routine(cmd_args.data, sites_dir,
+                                                                     os.path.join(sites_dir, "buffer"))
+    geo_df.reset_index(drop=True, inplace=True)
+    geo_df['uid'] = geo_df.index + 1
+    shapefile_path = os.path.join(sites_dir, "biomass_1ha_all_sites.shp")
+    geo_df.to_file(shapefile_path, driver="ESRI Shapefile")
+
+    context = {"watch_dir": watch_dir, "temp_dir": os.path.join(watch_dir, "temp"), "met_ver": cmd_args.met_ver,
+               "qld_dict": qld_dict, "variable": dict_values[-1], "skip_products": skip_products,
+               "data_type_fn": data_type_fn, "geo_df": geo_df, "visit_df": visit_df, "shapefile_path": shapefile_path,
+               "seasons": seasons, "base_period": base_period, "window_list": window_list,
+               "image_workers": cmd_args.image_workers, "share_mode": cmd_args.share_mode,
+               "window_cache": cmd_args.window_cache, "scales": multi_scale.scales_fn(cmd_args.scales),
+               "no_data": int(cmd_args.no_data), "routing_index": None, "replace_series": False}
+
+    roots = [[os.path.join(cmd_args.met_analysis, "nt", dict_values[-1]), ".tif", "met"]]
+    if cmd_args.watch_landsat:
+        context["routing_index"] = tile_routing.load_fn(cmd_args.routing_index) if cmd_args.routing_index else None
+        if context["routing_index"] is None:
+            raise ValueError("--watch_landsat needs a --routing_index (tile_routing) to route the sites to the tiles")
+        roots.append([cmd_args.watch_landsat, cmd_args.landsat_extension, "landsat"])
+    context["sites"] = site_hashes_fn(geo_df, context["routing_index"])
+
+    watch_fn(roots, context, os.path.join(watch_dir, "watch_state.json"), cmd_args.watch_interval,
+             cmd_args.watch_settle, cmd_args.watch_batch, max(cmd_args.watch_batch, 3600.0))
+    raster_metadata.save_cache_fn()
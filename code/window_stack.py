@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+
+"""
+window_stack.py
+===============
+
+Description: This script keeps a local site-window extract cache, so that a new analysis of the same sites (other
+statistics, buffer sizes within the window margin, post-processing) reads the pixels around the sites from a compact
+memory mapped stack at memory speed rather than the whole grids from the share.
+
+1. update_fn resolves the zone footprints on the grid of a product directory (zonal_engine), groups them into site
+cluster windows (the footprint pixel boxes, padded by margin pixels and merged when they are within gap pixels) and
+reads only those windows of each catalog image (threads), storing one row per image (the window pixels, concatenated)
+in a memory mapped stack. Images added to the directory since the last run are appended; a changed image (modification
+time or size) is read again into its row. Zones reaching outside the stored windows rebuild the stack with the merged
+windows.
+
+    {window_cache}/{directory hash}/stack.json  - the grid, dtype, windows (col_off, row_off, width, height and row
+                                                  offset) and per image entry (path, file key, row, no data value).
+    {window_cache}/{directory hash}/stack.bin   - the pixel rows (n_images x row pixels, the stack dtype).
+
+Images on another grid or dtype than the stack, and unreadable images, are not stored (the caller reads them).
+
+2. zone_stats_fn computes the zonal statistics of a stored image from its stack row: the zone index (footprint pixel
+offsets on the full grid) is mapped once to the row offsets, so the statistics are identical to the full image
+extraction.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import json
+import hashlib
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import lazy_imports
+import run_metrics
+import run_profiler
+import zonal_engine
+import raster_metadata
+import pipeline_logging
+import geometry_provider
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("stack")
+
+np = lazy_imports.lazy_module_fn("numpy")
+rasterio = lazy_imports.lazy_module_fn("rasterio")
+rasterio_windows = lazy_imports.lazy_module_fn("rasterio.windows")
+
+stack_version = 1
+
+
+def stack_dir_fn(window_cache, in_dir):
+    """ Return the stack directory of a product directory within the window cache directory. """
+    key = hashlib.sha1(os.path.abspath(in_dir).encode("utf-8")).hexdigest()[:16]
+
+    return os.path.join(window_cache, key)
+
+
+def load_fn(stack_dir):
+    """ Return the stack description saved in stack_dir (None when there is no usable stack). """
+    stack_path = os.path.join(stack_dir, "stack.json")
+    if not os.path.isfile(stack_path):
+        return None
+
+    try:
+        with open(stack_path, "r") as stack_file:
+            stack = json.load(stack_file)
+    except ValueError:
+        logger.warning("The window stack description could not be read and will be rebuilt: %s", stack_path)
+        return None
+
+    return stack if stack.get("version") == stack_version else None
+
+
+def save_fn(stack, stack_dir):
+    """ Write the stack description (temporary file + rename, after the pixel rows). """
+    stack_path = os.path.join(stack_dir, "stack.json")
+    temp_path = stack_path + ".tmp"
+    with open(temp_path, "w") as output:
+        json.dump(dict((k, v) for k, v in stack.items() if not k.startswith("_")), output)
+    os.replace(temp_path, stack_path)
+
+
+def footprint_boxes_fn(zone_index, margin):
+    """ Return the pixel box [col_off, row_off, col_end, row_end] of each non empty footprint, padded by margin. """
+    width, height = zone_index["width"], zone_index["height"]
+    starts, offsets = zone_index["starts"], zone_index["offsets"]
+    boxes = []
+    for fp in range(zone_index["n_footprints"]):
+        indices = offsets[starts[fp]:starts[fp + 1]]
+        if indices.size == 0:
+            continue
+        rows, cols = indices // width, indices % width
+        boxes.append([max(int(cols.min()) - margin, 0), max(int(rows.min()) - margin, 0),
+                      min(int(cols.max()) + 1 + margin, width), min(int(rows.max()) + 1 + margin, height)])
+
+    return boxes
+
+
+def cluster_fn(boxes, gap):
+    """ Merge the pixel boxes that are within gap pixels of each other into site cluster windows.
+
+    @param boxes: list object containing [col_off, row_off, col_end, row_end] boxes.
+    @param gap: integer object containing the pixel distance below which boxes are merged.
+    @return windows: list object containing [col_off, row_off, width, height] windows (sorted).
+    """
+    clusters = [list(b) for b in boxes]
+    merged = True
+    while merged:
+        merged = False
+        clusters.sort()
+        result = []
+        for box in clusters:
+            for other in result:
+                if box[0] <= other[2] + gap and other[0] <= box[2] + gap and \
+                        box[1] <= other[3] + gap and other[1] <= box[3] + gap:
+                    other[:] = [min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]),
+                                max(box[3], other[3])]
+                    merged = True
+                    break
+            else:
+                result.append(box)
+        clusters = result
+
+    return [[c[0], c[1], c[2] - c[0], c[3] - c[1]] for c in sorted(clusters)]
+
+
+def row_offsets_fn(zone_index, windows):
+    """ Map the footprint pixel offsets of the full grid to the offsets within a stack row.
+
+    @return row_offsets: int64 numpy array (None when a footprint pixel is outside every window).
+    """
+    width = zone_index["width"]
+    offsets = zone_index["offsets"]
+    rows, cols = offsets // width, offsets % width
+    row_offsets = np.full(offsets.size, -1, dtype=np.int64)
+    for col_off, row_off, w, h, base in windows:
+        inside = (row_offsets < 0) & (cols >= col_off) & (cols < col_off + w) & (rows >= row_off) & \
+                 (rows < row_off + h)
+        row_offsets[inside] = base + (rows[inside] - row_off) * w + (cols[inside] - col_off)
+
+    return None if (row_offsets < 0).any() else row_offsets
+
+
+def grid_zone_index_fn(signature, zones, all_touched=True):
+    """ Return the zone index of the zones on a grid signature (crs wkt, transform, width, height). """
+    crs_wkt, transform, width, height = signature
+    geometries = geometry_provider.zone_geometries_fn(zones, crs_wkt, "window stack")
+
+    return zonal_engine.build_zone_index_fn(geometries, zones["uid"], zones["site"], rasterio.Affine(*transform),
+                                            width, height, all_touched=all_touched,
+                                            signature=(crs_wkt, tuple(transform), width, height))
+
+
+def read_row_fn(image_path, windows, dtype):
+    """ Read the windows of band 1 of an image and return them concatenated (one stack row). """
+    with rasterio.open(image_path) as srci:
+        parts = [srci.read(1, window=rasterio_windows.Window(c, r, w, h)).astype(dtype, copy=False).ravel()
+                 for c, r, w, h, _ in windows]
+    row = np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+    run_profiler.record_read_fn(row.nbytes)
+
+    return row
+
+
+def update_fn(window_cache, in_dir, image_list, shapefile_path, uid, zone_cache, default_nodata=None, margin=8,
+              gap=16, workers=4):
+    """ Bring the window stack of a product directory up to date with its images and zones.
+
+    @param window_cache: string object containing the window cache directory.
+    @param in_dir: string object containing the product directory.
+    @param image_list: list object containing the image paths of the directory.
+    @param shapefile_path: string object containing the path to the 1ha site shapefile.
+    @param uid: ODK 1ha dataframe feature (unique numeric identifier)
+    @param zone_cache: dictionary object reused across the images of a run (geometry_provider zones).
+    @param default_nodata: no data value used when the file does not define one.
+    @param margin: integer object containing the pixels added around each footprint.
+    @param gap: integer object containing the pixel distance below which site windows are merged.
+    @param workers: integer object containing the number of window reading threads.
+    @return stack: dictionary object (the stack description and its in memory zone mapping) or None.
+    """
+    zones = geometry_provider.zones_fn(shapefile_path, uid, zone_cache)
+    metadata = dict((image_path, raster_metadata.metadata_fn(image_path)) for image_path in image_list)
+    readable = [m for m in metadata.values() if m["ok"]]
+    if not readable:
+        return None
+
+    stack_dir = stack_dir_fn(window_cache, in_dir)
+    stack = load_fn(stack_dir)
+    signature = readable[0]["signature"]
+    if stack is not None and stack["signature"] != signature:
+        stack = None
+    zone_index = grid_zone_index_fn(stack["signature"] if stack else signature, zones)
+
+    boxes = footprint_boxes_fn(zone_index, margin)
+    windows = stack["windows"] if stack else []
+    row_offsets = row_offsets_fn(zone_index, windows) if stack else None
+    if row_offsets is None:
+        # new stack, or zones reaching outside the stored windows: merge the windows and read every image again.
+        if stack is not None:
+            logger.info("zones outside the stored windows, window stack rebuilt: %s", in_dir)
+            boxes += [[c, r, c + w, r + h] for c, r, w, h, _ in windows]
+        windows = []
+        base = 0
+        for c, r, w, h in cluster_fn(boxes, gap):
+            windows.append([c, r, w, h, base])
+            base += w * h
+        stack = {"version": stack_version, "in_dir": os.path.abspath(in_dir), "signature": signature,
+                 "dtype": readable[0]["dtype"], "windows": windows, "row_pixels": base, "images": {}, "n_rows": 0}
+        row_offsets = row_offsets_fn(zone_index, windows)
+        if os.path.exists(os.path.join(stack_dir, "stack.bin")):
+            os.remove(os.path.join(stack_dir, "stack.bin"))
+
+    pending = []
+    for image_path in image_list:
+        md = metadata[image_path]
+        entry = stack["images"].get(image_path)
+        hit = entry is not None and entry["key"] == md["key"]
+        run_metrics.cache_fn("window_stack", hit)
+        if hit or not md["ok"] or md["signature"] != stack["signature"] or md["dtype"] != stack["dtype"]:
+            continue
+        nodata = raster_metadata.nodata_fn(md, default_nodata)
+        if raster_metadata.all_nodata_fn(md, default_nodata):
+            stack["images"][image_path] = {"key": md["key"], "row": None, "nodata": nodata}
+            continue
+        row = entry["row"] if entry is not None and entry["row"] is not None else None
+        pending.append([image_path, md["key"], row, nodata])
+
+    if pending:
+        if not os.path.isdir(stack_dir):
+            os.makedirs(stack_dir)
+        dtype = np.dtype(stack["dtype"])
+        row_bytes = stack["row_pixels"] * dtype.itemsize
+        bin_path = os.path.join(stack_dir, "stack.bin")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor, \
+                open(bin_path, "r+b" if os.path.exists(bin_path) else "w+b") as output:
+            rows = executor.map(lambda item: read_row_fn(item[0], stack["windows"], dtype), pending)
+            for item, pixels in zip(pending, rows):
+                image_path, key, row, nodata = item
+                if row is None:
+                    row = stack["n_rows"]
+                    stack["n_rows"] += 1
+                output.seek(row * row_bytes)
+                output.write(pixels.tobytes())
+                stack["images"][image_path] = {"key": key, "row": row, "nodata": nodata}
+        save_fn(stack, stack_dir)
+        logger.info("window stack %s: %d images stored (%d windows, %.1f MB per 1000 images)", in_dir, len(pending),
+                    len(stack["windows"]), row_bytes * 1000 / 1048576.0)
+    elif not os.path.exists(os.path.join(stack_dir, "stack.json")):
+        if not os.path.isdir(stack_dir):
+            os.makedirs(stack_dir)
+        save_fn(stack, stack_dir)
+
+    stack["_dir"] = stack_dir
+    stack["_zone_index"] = dict(zone_index, offsets=row_offsets)
+
+    return stack
+
+
+def array_fn(stack):
+    """ Return the stack rows as a read only memory map (opened once per stack). """
+    array = stack.get("_array")
+    if array is None or array.shape[0] != stack["n_rows"]:
+        array = np.memmap(os.path.join(stack["_dir"], "stack.bin"), dtype=np.dtype(stack["dtype"]), mode="r",
+                          shape=(stack["n_rows"], stack["row_pixels"]))
+        stack["_array"] = array
+
+    return array
+
+
+def zone_stats_fn(stack, image_path, stats):
+    """ Return the zonal statistics of a stored image from its stack row (zone order).
+
+    @param stack: dictionary object returned by update_fn.
+    @param image_path: string object containing the image path.
+    @param stats: list object containing the statistics (zonal_engine.stats_list names).
+    @return zs: list object containing a statistics dictionary per zone, or None when the image is not stored.
+    """
+    entry = stack["images"].get(image_path) if stack else None
+    if entry is None:
+        return None
+
+    zone_index = stack["_zone_index"]
+    if entry["row"] is None:
+        # all no data (stored statistics): the statistics of an empty footprint.
+        empty = dict((stat, 0 if stat == "count" else None) for stat in stats)
+        return [empty] * zone_index["n_zones"]
+
+    return zonal_engine.zone_stats_fn(array_fn(stack)[entry["row"]], zone_index, entry["nodata"], stats=stats)
@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+
+"""
+work_queue.py
+=============
+
+Description: This script shards the step1_8 extraction across any number of worker processes on any number of hosts
+using a work queue on a shared file system, and merges the results so the per site outputs are byte identical to a
+single node run.
+
+1. enqueue_fn splits each directory image list into work units (directory x image chunk) and writes them to the
+queue directory:
+    queue.json                  - the ordered list of unit ids and the queue settings.
+    units/{unit_id}.json        - the unit (images, shapefile, date slices, no data default and nested scales).
+    leases/{unit_id}.{n}.lease  - the worker holding generation n of the unit lease (created exclusively, the file
+                                  mtime is the heartbeat; a released lease has an mtime of 0).
+    results/{unit_id}.json      - the unit zonal stats records (json lines, in image order).
+    done/{unit_id}.json         - the completion marker (written after the results).
+    failed/{unit_id}.*.json     - a failed attempt (the unit is retried until max_attempts).
+Unit ids are '{directory index:04d}_{chunk index:05d}', so sorting the ids restores the single node image order.
+An existing queue with the same units is resumed (completed units are not repeated).
+
+2. worker_fn (python work_queue.py --queue DIR) claims units until every unit is done: a unit never claimed, released
+or whose current lease has had no heartbeat for lease_timeout seconds is claimed by creating the next lease generation
+exclusively (O_EXCL), so when two workers break the same stale lease only one creates the generation. Lease files are
+not removed (the generations of a unit stay contiguous). A heartbeat thread touches the lease while the unit is
+processed.
+
+3. wait_fn (the coordinator, step1_1 --queue) waits for every unit to be done, publishing the progress through
+run_metrics, and merge_fn concatenates the results of a directory in unit order and writes the per site csv files
+with step1_8.clean_data_frame_fn (the nested scale columns included).
+
+A local directory with subprocess workers (step1_1 --queue DIR --queue_workers N) runs the same protocol on a single
+host.
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import warnings
+import run_metrics
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("queue")
+
+queue_sub_dir_list = ["units", "leases", "results", "done", "failed"]
+
+
+def worker_name_fn():
+    """ Return the name of this worker (host:pid). """
+    return "{0}:{1}".format(socket.gethostname(), os.getpid())
+
+
+def write_json_fn(path, obj):
+    """ Write a json file atomically (temporary file + rename) so readers never see a partial file. """
+    temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(temp_path, "w") as output:
+        json.dump(obj, output, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def read_json_fn(path):
+    """ Read a json file. """
+    with open(path, "r") as json_file:
+        return json.load(json_file)
+
+
+def unit_path_fn(queue_dir, sub_dir, unit_id, extension=".json"):
+    """ Return the path of a unit file in a queue sub-directory. """
+    return os.path.join(queue_dir, sub_dir, unit_id + extension)
+
+
+def enqueue_fn(queue_dir, directory_list, shapefile_path, uid, chunk_size=50, max_attempts=3, scales=None):
+    """ Split the directories into work units and write the queue.
+
+    @param queue_dir: string object containing the queue directory (on a file system shared by the workers).
+    @param directory_list: list object containing a dictionary per directory {"csv_list", "in_dir", "out_dir",
+        "data_type", "datesplit_s", "datesplit_e", "default_nodata"} in processing order.
+    @param shapefile_path: string object containing the path to the 1ha site shapefile (shared by the workers).
+    @param uid: ODK 1ha dataframe feature (unique numeric identifier)
+    @param chunk_size: integer object containing the number of images per unit.
+    @param max_attempts: integer object containing the number of attempts of a unit before the queue fails.
+    @param scales: list object containing the nested zone scales (multi_scale.scales_fn) extracted with each image.
+    @return unit_ids: list object containing the unit ids in order.
+    """
+    for sub_dir in queue_sub_dir_list:
+        if not os.path.isdir(os.path.join(queue_dir, sub_dir)):
+            os.makedirs(os.path.join(queue_dir, sub_dir))
+
+    unit_ids = []
+    resumed = 0
+    for d, directory in enumerate(directory_list):
+        with open(directory["csv_list"], "r") as imagery_list:
+            image_list = [image.rstrip() for image in imagery_list.readlines()]
+
+        for c, start in enumerate(range(0, len(image_list), chunk_size)):
+            unit_id = "{0:04d}_{1:05d}".format(d, c)
+            unit = {"unit_id": unit_id, "data_type": directory["data_type"], "in_dir": directory["in_dir"],
+                    "out_dir": directory["out_dir"], "datesplit_s": directory["datesplit_s"],
+                    "datesplit_e": directory["datesplit_e"], "default_nodata": directory["default_nodata"],
+                    "shapefile_path": shapefile_path, "uid": uid, "scales": scales or None,
+                    "images": image_list[start:start + chunk_size]}
+
+            # resume: an identical unit keeps its results, a changed unit is queued again.
+            unit_path = unit_path_fn(queue_dir, "units", unit_id)
+            if os.path.isfile(unit_path) and read_json_fn(unit_path) == unit:
+                resumed += os.path.isfile(unit_path_fn(queue_dir, "done", unit_id))
+            else:
+                for sub_dir in ["done", "results"]:
+                    if os.path.isfile(unit_path_fn(queue_dir, sub_dir, unit_id)):
+                        os.remove(unit_path_fn(queue_dir, sub_dir, unit_id))
+                write_json_fn(unit_path, unit)
+            unit_ids.append(unit_id)
+
+    write_json_fn(os.path.join(queue_dir, "queue.json"), {"units": unit_ids, "max_attempts": max_attempts,
+                                                          "chunk_size": chunk_size})
+    logger.info("%d work units queued (%d already done): %s", len(unit_ids), resumed, queue_dir)
+
+    return unit_ids
+
+
+def attempts_fn(queue_dir, unit_id):
+    """ Return the number of failed attempts of a unit. """
+    return len([f for f in os.listdir(os.path.join(queue_dir, "failed")) if f.startswith(unit_id + ".")])
+
+
+def lease_path_fn(queue_dir, unit_id, generation):
+    """ Return the path of a lease generation of a unit. """
+    return unit_path_fn(queue_dir, "leases", unit_id, ".{0}.lease".format(generation))
+
+
+def generation_fn(queue_dir, unit_id):
+    """ Return the current lease generation of a unit (-1 when the unit was never claimed). """
+    generation = -1
+    while os.path.isfile(lease_path_fn(queue_dir, unit_id, generation + 1)):
+        generation += 1
+
+    return generation
+
+
+def claim_fn(queue_dir, unit_id, lease_timeout):
+    """ Claim the lease of a unit (never claimed, released, or without a heartbeat for lease_timeout seconds) by
+    creating the next lease generation exclusively.
+
+    @return lease_path: string object containing the lease path of this worker, None when the unit is held.
+    """
+    generation = generation_fn(queue_dir, unit_id)
+    mtime = None
+    if generation >= 0:
+        try:
+            mtime = os.path.getmtime(lease_path_fn(queue_dir, unit_id, generation))
+        except OSError:
+            return None
+        if time.time() - mtime <= lease_timeout:
+            return None
+
+    # only one worker creates the next generation, however many found the lease stale.
+    lease_path = lease_path_fn(queue_dir, unit_id, generation + 1)
+    try:
+        fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError:
+        return None
+    with os.fdopen(fd, "w") as lease:
+        lease.write(worker_name_fn())
+    if mtime:
+        logger.warning("%s: stale lease broken (generation %d)", unit_id, generation + 1)
+
+    return lease_path
+
+
+def release_fn(lease_path):
+    """ Release a lease (its mtime is set to 0, so the next claim of the unit creates the next generation). """
+    try:
+        os.utime(lease_path, (0, 0))
+    except OSError:
+        pass
+
+
+class Heartbeat(object):
+    """ Touch a lease file every interval seconds while a unit is processed (use as a context manager).
+
+    @param lease_path: string object containing the path of the lease file.
+    @param interval: float object containing the seconds between heartbeats.
+    """
+
+    def __init__(self, lease_path, interval):
+        self.lease_path = lease_path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                os.utime(self.lease_path, None)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+
+
+def process_unit_fn(queue_dir, unit, zone_cache_dict):
+    """ Extract the zonal stats of a unit and write its results and completion marker.
+
+    @param queue_dir: string object containing the queue directory.
+    @param unit: dictionary object containing the unit (enqueue_fn).
+    @param zone_cache_dict: dictionary object {shapefile path: zone_cache} reused across the units of a worker.
+    """
+    import step1_8_qld_grid_zonal_stats
+
+    zone_cache = zone_cache_dict.setdefault(unit["shapefile_path"], {})
+    scales = unit.get("scales")
+    results_path = unit_path_fn(queue_dir, "results", unit["unit_id"])
+    temp_path = "{0}.{1}.tmp".format(results_path, os.getpid())
+    with open(temp_path, "w") as output:
+        for image_s in unit["images"]:
+            final_results = step1_8_qld_grid_zonal_stats.apply_zonal_stats_fn(
+                image_s, unit["shapefile_path"], unit["uid"], unit["datesplit_s"], unit["datesplit_e"], zone_cache,
+                unit["default_nodata"], scales)
+            for record in final_results:
+                output.write(json.dumps(record) + "\n")
+    os.replace(temp_path, results_path)
+
+    write_json_fn(unit_path_fn(queue_dir, "done", unit["unit_id"]),
+                  {"worker": worker_name_fn(), "images": len(unit["images"]), "finished": time.time()})
+
+
+def worker_fn(queue_dir, lease_timeout=120.0, heartbeat=30.0, poll=5.0):
+    """ Claim and process units until every unit of the queue is done (or has failed max_attempts times).
+
+    @param queue_dir: string object containing the queue directory.
+    @param lease_timeout: float object containing the seconds without a heartbeat before a lease is broken.
+    @param heartbeat: float object containing the seconds between lease heartbeats.
+    @param poll: float object containing the seconds between scans while other workers hold the remaining units.
+    @return processed: integer object containing the number of units processed by this worker.
+    """
+    queue = read_json_fn(os.path.join(queue_dir, "queue.json"))
+    zone_cache_dict = {}
+    processed = 0
+    while True:
+        pending = [u for u in queue["units"] if not os.path.isfile(unit_path_fn(queue_dir, "done", u))
+                   and attempts_fn(queue_dir, u) < queue["max_attempts"]]
+        if not pending:
+            break
+
+        claimed = lease_path = None
+        for unit_id in pending:
+            lease_path = claim_fn(queue_dir, unit_id, lease_timeout)
+            if lease_path:
+                # the unit may have completed between the scan and the claim.
+                if os.path.isfile(unit_path_fn(queue_dir, "done", unit_id)):
+                    release_fn(lease_path)
+                    continue
+                claimed = unit_id
+                break
+
+        if claimed is None:
+            time.sleep(poll)
+            continue
+
+        unit = read_json_fn(unit_path_fn(queue_dir, "units", claimed))
+        try:
+            with Heartbeat(lease_path, heartbeat):
+                process_unit_fn(queue_dir, unit, zone_cache_dict)
+            processed += 1
+            logger.info("%s: %d images done (%s)", claimed, len(unit["images"]), unit["data_type"])
+        except Exception as err:
+            logger.exception("%s: failed", claimed)
+            write_json_fn(os.path.join(queue_dir, "failed", "{0}.{1}_{2}.json".format(
+                claimed, worker_name_fn().replace(":", "_"), int(time.time() * 1000))),
+                {"worker": worker_name_fn(), "error": str(err)})
+        finally:
+            release_fn(lease_path)
+
+    logger.info("worker %s finished: %d units processed", worker_name_fn(), processed)
+
+    return processed
+
+
+def start_local_workers_fn(queue_dir, n_workers, verbose=False):
+    """ Start n local worker subprocesses on the queue (python work_queue.py --queue DIR).
+
+    @return processes: list object containing the subprocess.Popen objects.
+    """
+    command = [sys.executable, os.path.abspath(__file__), "--queue", queue_dir]
+    if verbose:
+        command.append("--verbose")
+
+    return [subprocess.Popen(command) for _ in range(n_workers)]
+
+
+def wait_fn(queue_dir, poll=5.0, processes=None):
+    """ Wait until every unit of the queue is done, publishing the image progress through run_metrics.
+
+    @param queue_dir: string object containing the queue directory.
+    @param poll: float object containing the seconds between scans of the done markers.
+    @param processes: list object containing local worker processes (the wait fails if they all exit early).
+    """
+    queue = read_json_fn(os.path.join(queue_dir, "queue.json"))
+    images_done = 0
+    summary = pipeline_logging.RateLimitedSummary(logger, "queue")
+    while True:
+        done = [u for u in queue["units"] if os.path.isfile(unit_path_fn(queue_dir, "done", u))]
+        images = sum(read_json_fn(unit_path_fn(queue_dir, "done", u))["images"] for u in done)
+        if images > images_done:
+            run_metrics.image_done_fn(images - images_done)
+            summary.add(images=images - images_done)
+            images_done = images
+        run_metrics.set_queue_fn("units", len(queue["units"]) - len(done))
+
+        if len(done) == len(queue["units"]):
+            break
+
+        failed = [u for u in queue["units"] if u not in done and attempts_fn(queue_dir, u) >= queue["max_attempts"]]
+        if failed:
+            raise RuntimeError("{0} work units failed {1} times (see {2}): {3}".format(
+                len(failed), queue["max_attempts"], os.path.join(queue_dir, "failed"), ", ".join(failed[:10])))
+
+        if processes and all(p.poll() is not None for p in processes):
+            raise RuntimeError("The local workers exited with {0} units outstanding.".format(
+                len(queue["units"]) - len(done)))
+
+        time.sleep(poll)
+
+    summary.emit()
+
+
+def merge_fn(queue_dir, data_type, out_dir):
+    """ Concatenate the results of a directory in unit order and write the per site csv files (as step1_8).
+
+    @param queue_dir: string object containing the queue directory.
+    @param data_type: string object containing the directory name (unit data_type).
+    @param out_dir: string object containing the output directory.
+    @return output_df: dataframe object (step1_8.clean_data_frame_fn).
+    """
+    import step1_8_qld_grid_zonal_stats
+
+    queue = read_json_fn(os.path.join(queue_dir, "queue.json"))
+    output_list = []
+    scales = None
+    for unit_id in sorted(queue["units"]):
+        unit = read_json_fn(unit_path_fn(queue_dir, "units", unit_id))
+        if unit["data_type"] != data_type:
+            continue
+        scales = unit.get("scales")
+        with open(unit_path_fn(queue_dir, "results", unit_id), "r") as results:
+            output_list.extend(json.loads(line) for line in results)
+
+    return step1_8_qld_grid_zonal_stats.clean_data_frame_fn(output_list, out_dir, data_type, scales)
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(description='''Process the work units of a zonal stats work queue (worker).''')
+
+    p.add_argument('--queue', help='The queue directory written by step1_1 --queue.', required=True)
+
+    p.add_argument('--lease_timeout', type=float, default=120.0,
+                   help='Enter the seconds without a heartbeat before a lease is broken.')
+
+    p.add_argument('--heartbeat', type=float, default=30.0, help='Enter the seconds between lease heartbeats.')
+
+    p.add_argument('-l', '--log_file', help="The path of an optional log file (written in addition to the console)",
+                   default=None)
+
+    pipeline_logging.add_logging_args_fn(p)
+
+    return p.parse_args()
+
+
+def main_routine():
+    """ Run a worker on the queue directory. """
+    cmd_args = get_cmd_args_fn()
+    pipeline_logging.setup_logging_fn(cmd_args.quiet, cmd_args.verbose, cmd_args.log_file)
+    worker_fn(cmd_args.queue, cmd_args.lease_timeout, cmd_args.heartbeat)
+
+
+if __name__ == "__main__":
+    main_routine()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+
+"""
+zonal_engine.py
+===============
+
+Description: This script computes zonal statistics from resolved pixel footprints, so that zones sharing a footprint
+are computed once per image.
+
+1. A zone's footprint is the set of flat pixel indices (and pixel weights) the zone covers on a raster grid. The grid
+is identified by its grid signature (crs, affine transform, width and height), so the footprints are resolved once
+per signature and reused by every image on that grid.
+
+2. build_zone_index_fn groups the zones by footprint - repeat visits to the same site and neighbouring sites within
+one 5 km SILO cell resolve to the same footprint - and returns a zone index:
+    offsets - int64 flat pixel indices of every unique footprint (concatenated).
+    starts - int64 start of each footprint within offsets (length n_footprints + 1).
+    weights - float32 pixel weights aligned with offsets (1.0 for the binary all_touched masks).
+    zone_fp - int32 footprint id of each zone.
+    uid / site - the uid and site_name of each zone.
+
+3. zone_stats_fn computes the statistics once per unique footprint (count, sum, mean, min, max, std and range are
+vectorised over all footprints with np.add.reduceat / np.minimum.reduceat; median and percentiles are computed per
+footprint) and fans the results out to every zone. The results match rasterstats.zonal_stats (no data and NaN pixels
+are excluded; a zone without valid pixels returns count 0 and None for the remaining statistics).
+
+
+Author: Rob McGregor
+email: Robert.Mcgregor@nt.gov.au
+Date: 19/10/2026
+Version: 1.0
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+"""
+
+# import modules
+from __future__ import print_function, division
+import math
+import warnings
+import lazy_imports
+import pipeline_logging
+
+warnings.filterwarnings("ignore")
+
+logger = pipeline_logging.get_logger_fn("engine")
+
+np = lazy_imports.lazy_module_fn("numpy")
+
+# the statistics (rasterstats names) calculated by the pipeline.
+stats_list = ['count', 'min', 'max', 'mean', 'median', 'std', 'percentile_25', 'percentile_50', 'percentile_75',
+              'percentile_95', 'percentile_99', 'range']
+
+
+def grid_signature_fn(srci):
+    """ Return the grid signature of an open raster (crs, affine transform, width, height).
+
+    @param srci: open rasterio dataset.
+    @return signature: tuple object identifying the raster grid.
+    """
+    crs = srci.crs.to_wkt() if srci.crs else ""
+
+    return crs, tuple(srci.transform)[:6], srci.width, srci.height
+
+
+def zone_footprint_fn(geometry, transform, width, height, all_touched=True):
+    """ Resolve the flat pixel indices of a geometry on a raster grid.
+
+    The geometry is rasterised within its (padded) bounding window only, which returns the same pixels as
+    rasterising it against the whole grid.
+
+    @param geometry: shapely geometry (or geo-interface mapping) in the crs of the grid.
+    @param transform: affine transform of the grid.
+    @param width: integer object containing the number of grid columns.
+    @param height: integer object containing the number of grid rows.
+    @param all_touched: boolean object, if True all pixels touched by the geometry are included.
+    @return indices: int64 numpy array containing the sorted flat pixel indices (row * width + col).
+    """
+    from rasterio import features, windows
+    from shapely.geometry import shape
+
+    geom = geometry if geometry is None or hasattr(geometry, "bounds") else shape(geometry)
+    if geom is None or geom.is_empty:
+        return np.zeros(0, dtype=np.int64)
+
+    window = windows.from_bounds(*geom.bounds, transform=transform)
+    row_off = int(math.floor(min(window.row_off, window.row_off + window.height))) - 1
+    col_off = int(math.floor(min(window.col_off, window.col_off + window.width))) - 1
+    row_end = int(math.ceil(max(window.row_off, window.row_off + window.height))) + 1
+    col_end = int(math.ceil(max(window.col_off, window.col_off + window.width))) + 1
+
+    row_off, col_off = max(0, row_off), max(0, col_off)
+    row_end, col_end = min(height, row_end), min(width, col_end)
+    if row_end <= row_off or col_end <= col_off:
+        return np.zeros(0, dtype=np.int64)
+
+    local = windows.Window(col_off, row_off, col_end - col_off, row_end - row_off)
+    mask = features.geometry_mask([geom], out_shape=(int(local.height), int(local.width)),
+                                  transform=windows.transform(local, transform), all_touched=all_touched,
+                                  invert=True)
+    rows, cols = np.nonzero(mask)
+
+    return ((rows + row_off).astype(np.int64) * width + (cols + col_off)).astype(np.int64)
+
+
+def build_zone_index_fn(geometries, uids, sites, transform, width, height, all_touched=True, signature=None):
+    """ Resolve every zone footprint on a grid and group the zones that share a footprint.
+
+    @param geometries: list object containing the zone geometries (in the crs of the grid).
+    @param uids: list object containing the uid of each zone.
+    @param sites: list object containing the site_name of each zone.
+    @param transform: affine transform of the grid.
+    @param width: integer object containing the number of grid columns.
+    @param height: integer object containing the number of grid rows.
+    @param all_touched: boolean object passed to the rasterisation.
+    @param signature: tuple object containing the grid signature (stored with the index).
+    @return zone_index: dictionary object (see the module description).
+    """
+    footprint_dict = {}
+    footprint_list = []
+    zone_fp = np.zeros(len(geometries), dtype=np.int32)
+
+    for z, geometry in enumerate(geometries):
+        indices = zone_footprint_fn(geometry, transform, width, height, all_touched)
+        weights = np.ones(indices.size, dtype=np.float32)
+        key = indices.tobytes() + b"|" + weights.tobytes()
+        fp = footprint_dict.get(key)
+        if fp is None:
+            fp = len(footprint_list)
+            footprint_dict[key] = fp
+            footprint_list.append([indices, weights])
+        zone_fp[z] = fp
+
+    lengths = np.array([f[0].size for f in footprint_list], dtype=np.int64)
+    starts = np.zeros(len(footprint_list) + 1, dtype=np.int64)
+    starts[1:] = np.cumsum(lengths)
+    if footprint_list:
+        offsets = np.concatenate([f[0] for f in footprint_list]).astype(np.int64)
+        weights = np.concatenate([f[1] for f in footprint_list]).astype(np.float32)
+    else:
+        offsets = np.zeros(0, dtype=np.int64)
+        weights = np.zeros(0, dtype=np.float32)
+
+    zone_index = {"offsets": offsets, "starts": starts, "weights": weights, "zone_fp": zone_fp,
+                  "uid": np.asarray(uids), "site": np.asarray(sites), "n_zones": len(geometries),
+                  "n_footprints": len(footprint_list), "width": width, "height": height,
+                  "signature": signature}
+
+    logger.debug("zone index: %d zones resolved to %d unique footprints", len(geometries), len(footprint_list))
+
+    return zone_index
+
+
+def footprint_stats_fn(array, zone_index, nodata, stats=None):
+    """ Compute the statistics once per unique footprint.
+
+    @param array: 2D numpy array containing the raster band (shape height x width of the zone index grid).
+    @param zone_index: dictionary object returned by build_zone_index_fn.
+    @param nodata: no data value (None if the raster has no no data value).
+    @param stats: list object containing the statistics (rasterstats names) - default stats_list.
+    @return fp_stats: list object containing a statistics dictionary per footprint.
+    """
+    stats = stats_list if stats is None else stats
+    n_fp = zone_index["n_footprints"]
+    if n_fp == 0:
+        return []
+
+    starts = zone_index["starts"]
+    values = array.ravel()[zone_index["offsets"]]
+    weights = zone_index["weights"]
+
+    valid = np.ones(values.size, dtype=bool)
+    if nodata is not None:
+        valid &= values != nodata
+    if np.issubdtype(values.dtype, np.floating):
+        valid &= ~np.isnan(values)
+
+    # empty footprints (zones outside the grid) are excluded from reduceat, which requires non-empty segments.
+    lengths = np.diff(starts)
+    non_empty = lengths > 0
+    seg_starts = starts[:-1][non_empty]
+
+    values_f = values.astype(np.float64)
+    w = np.where(valid, weights, 0.0).astype(np.float64)
+    count = np.zeros(n_fp, dtype=np.int64)
+    wsum = np.zeros(n_fp)
+    vsum = np.zeros(n_fp)
+    vsq = np.zeros(n_fp)
+    vmin = np.full(n_fp, np.nan)
+    vmax = np.full(n_fp, np.nan)
+    if seg_starts.size:
+        count[non_empty] = np.add.reduceat(valid.astype(np.int64), seg_starts)
+        wsum[non_empty] = np.add.reduceat(w, seg_starts)
+        vsum[non_empty] = np.add.reduceat(w * np.where(valid, values_f, 0.0), seg_starts)
+        if "min" in stats or "range" in stats:
+            vmin[non_empty] = np.minimum.reduceat(np.where(valid, values_f, np.inf), seg_starts)
+        if "max" in stats or "range" in stats:
+            vmax[non_empty] = np.maximum.reduceat(np.where(valid, values_f, -np.inf), seg_starts)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = vsum / wsum
+        if "std" in stats and seg_starts.size:
+            deviation = np.where(valid, values_f - np.repeat(mean, lengths), 0.0)
+            vsq[non_empty] = np.add.reduceat(w * deviation * deviation, seg_starts)
+        std = np.sqrt(vsq / wsum)
+
+    order_stats = [s for s in stats if s == "median" or s.startswith("percentile_")]
+
+    fp_stats = []
+    for fp in range(n_fp):
+        compressed = None
+        if order_stats and count[fp]:
+            segment = slice(starts[fp], starts[fp + 1])
+            compressed = values[segment][valid[segment]]
+        fp_stats.append(feature_stats_fn(stats, count[fp], vmin[fp], vmax[fp], mean[fp], vsum[fp], std[fp],
+                                         compressed))
+
+    return fp_stats
+
+
+def feature_stats_fn(stats, count, vmin, vmax, mean, vsum, std, compressed=None):
+    """ Return the statistics dictionary of a footprint from its reduced values.
+
+    @param stats: list object containing the statistics (rasterstats names).
+    @param count: integer object containing the number of valid pixels.
+    @param vmin, vmax, mean, vsum, std: float objects containing the reduced values of the valid pixels.
+    @param compressed: numpy array containing the valid pixel values (needed by the median and percentiles).
+    @return feature_stats: dictionary object (count 0 and None for the remaining statistics without valid pixels).
+    """
+    if count == 0:
+        feature_stats = {stat: None for stat in stats}
+        if "count" in stats:
+            feature_stats["count"] = 0
+        return feature_stats
+
+    feature_stats = {}
+    for stat in stats:
+        if stat == "count":
+            feature_stats[stat] = int(count)
+        elif stat == "min":
+            feature_stats[stat] = float(vmin)
+        elif stat == "max":
+            feature_stats[stat] = float(vmax)
+        elif stat == "mean":
+            feature_stats[stat] = float(mean)
+        elif stat == "sum":
+            feature_stats[stat] = float(vsum)
+        elif stat == "std":
+            feature_stats[stat] = float(std)
+        elif stat == "range":
+            feature_stats[stat] = float(vmax) - float(vmin)
+
+    for stat in stats:
+        if stat == "median" or stat.startswith("percentile_"):
+            q = 50.0 if stat == "median" else float(stat.split("_", 1)[1])
+            feature_stats[stat] = float(np.percentile(compressed, q))
+
+    return feature_stats
+
+
+def zone_stats_fn(array, zone_index, nodata, stats=None):
+    """ Compute the statistics per unique footprint and fan them out to every zone (zone_index order).
+
+    The zones that share a footprint share the same statistics dictionary (treat the results as read only).
+
+    @param array: 2D numpy array containing the raster band.
+    @param zone_index: dictionary object returned by build_zone_index_fn.
+    @param nodata: no data value (None if the raster has no no data value).
+    @param stats: list object containing the statistics (rasterstats names) - default stats_list.
+    @return zs: list object containing a statistics dictionary per zone.
+    """
+    fp_stats = footprint_stats_fn(array, zone_index, nodata, stats)
+
+    return [fp_stats[fp] for fp in zone_index["zone_fp"]]